@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la compression des colonnes JSON : taille de la base et latences
+
+Pour chaque format (texte clair, zlib, zstd si disponible) : copie de instance/pvs.db,
+recompression de toutes les lignes (recompress_json.py), VACUUM, puis mesure dans un
+processus neuf (JSON_COMPRESSION positionné) des lectures GET /load-pv et des
+sauvegardes POST /save.
+
+Usage :
+    python benchmark_json_compression.py
+    python benchmark_json_compression.py --iterations 500 --level 9
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+
+from json_codec import FORMAT_MARKERS, _zstd, register_sqlite_functions
+from recompress_json import recompress_table, format_size
+from stress_sqlite import percentile
+
+SOURCE_DB = Path(__file__).parent / 'instance' / 'pvs.db'
+SAMPLE_PV_COUNT = 50
+
+
+def _measure(iterations, seed, queue):
+    """Processus de mesure : importe l'application puis enchaîne lectures et sauvegardes."""
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+        from setup_db import db, PV
+
+    with server.app.app_context():
+        rows = PV.query.order_by(PV.date_mise_a_jour.desc()).limit(SAMPLE_PV_COUNT).all()
+        pv_forms = {pv.id: dict(pv.get_data().get('form_data', {}), chantier=pv.chantier) for pv in rows}
+        db.session.remove()
+
+    client = server.app.test_client()
+    rng = random.Random(seed)
+    pv_ids = list(pv_forms)
+    results = {'read': [], 'write': [], 'errors': 0}
+
+    for i in range(iterations):
+        pv_id = rng.choice(pv_ids)
+
+        started = time.perf_counter()
+        response = client.get(f'/load-pv/{pv_id}')
+        results['read'].append(time.perf_counter() - started)
+        results['errors'] += response.status_code != 200
+
+        payload = dict(pv_forms[pv_id], pv_id=pv_id)
+        payload['observations_reception'] = f"Benchmark {i}"
+        started = time.perf_counter()
+        response = client.post('/save', json=payload)
+        results['write'].append(time.perf_counter() - started)
+        results['errors'] += response.status_code != 200
+
+    queue.put(results)
+
+
+def run_format(algorithm, args):
+    """
+    Prépare une copie de la base au format donné et mesure taille et latences.
+
+    Returns:
+        dict: Résumé (taille JSON, taille fichier, latences)
+    """
+    label = algorithm or 'texte'
+    workdir = Path(tempfile.mkdtemp(prefix='bench_json_'))
+    db_path = workdir / 'pvs.db'
+
+    source = sqlite3.connect(SOURCE_DB)
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    register_sqlite_functions(conn)
+    json_bytes = 0
+    for table in ('pvs', 'pv_versions'):
+        stats = recompress_table(conn, table, algorithm, batch_size=500, pause=0)
+        json_bytes += stats['bytes_after']
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    file_bytes = db_path.stat().st_size
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['JSON_COMPRESSION'] = algorithm
+    os.environ['MAIL_SENDER_ENABLED'] = '0'
+    os.environ['DRAFT_BUFFER_ENABLED'] = '0'  # Chaque /save mesuré écrit en base (pas de tampon en mémoire)
+    if args.level is not None:
+        os.environ['JSON_COMPRESSION_LEVEL'] = str(args.level)
+
+    print(f"\n🔄 Format {label} : {args.iterations} lecture(s) et sauvegarde(s)...")
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(args.iterations, args.seed, queue))
+    process.start()
+    results = queue.get()
+    process.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        'format': label,
+        'json_bytes': json_bytes,
+        'file_bytes': file_bytes,
+        'read_p50_ms': median(results['read']) * 1000,
+        'read_p95_ms': percentile(results['read'], 0.95) * 1000,
+        'write_p50_ms': median(results['write']) * 1000,
+        'write_p95_ms': percentile(results['write'], 0.95) * 1000,
+        'errors': results['errors'],
+    }
+
+    status = '✅' if not summary['errors'] else '❌'
+    print(f"{status} JSON stocké : {format_size(json_bytes)}, fichier pvs.db : {format_size(file_bytes)}")
+    print(f"   Lecture  p50/p95 : {summary['read_p50_ms']:.2f} / {summary['read_p95_ms']:.2f} ms")
+    print(f"   Écriture p50/p95 : {summary['write_p50_ms']:.2f} / {summary['write_p95_ms']:.2f} ms")
+    if summary['errors']:
+        print(f"   ⚠️  {summary['errors']} réponse(s) en erreur")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la compression des colonnes JSON')
+    parser.add_argument('--iterations', type=int, default=200, help='Lectures et sauvegardes par format')
+    parser.add_argument('--level', type=int, default=None, help='Niveau de compression (défaut par algorithme)')
+    parser.add_argument('--seed', type=int, default=42, help='Graine du tirage des PV')
+    args = parser.parse_args()
+
+    if not SOURCE_DB.exists():
+        print(f"❌ Erreur : La base de données {SOURCE_DB} n'existe pas.")
+        sys.exit(2)
+
+    formats = [''] + [name for name in FORMAT_MARKERS if name != 'zstd' or _zstd is not None]
+    if _zstd is None:
+        print("ℹ️  zstd indisponible (pip install zstandard) : format ignoré")
+
+    summaries = [run_format(algorithm, args) for algorithm in formats]
+
+    baseline = summaries[0]
+    print("\n📊 Comparaison (référence : texte clair)")
+    print(f"   {'Format':<8} {'JSON':>10} {'Fichier':>10} {'Lecture p50':>12} {'Écriture p50':>13}")
+    for summary in summaries:
+        ratio = baseline['json_bytes'] / summary['json_bytes'] if summary['json_bytes'] else 1.0
+        print(f"   {summary['format']:<8} {format_size(summary['json_bytes']):>10} "
+              f"{format_size(summary['file_bytes']):>10} {summary['read_p50_ms']:>9.2f} ms "
+              f"{summary['write_p50_ms']:>10.2f} ms   (ratio {ratio:.1f}x)")
+
+    if any(summary['errors'] for summary in summaries):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmark de génération PDF sur des PV réalistes
+
+Scénarios : PV réception seule ou complet, avec 0, 5, 20 ou 50 photos et signatures.
+Pour chaque scénario (exécuté dans un processus dédié pour isoler la mémoire) :
+- optimisation des images (media.py)
+- rendu du template Jinja
+- mise en page WeasyPrint (write_pdf)
+- pic de mémoire (RSS) et taille du PDF
+
+Les résultats sont enregistrés en JSON pour comparer deux exécutions et signaler les régressions.
+
+Usage :
+    python benchmark_pdf.py                                  # benchmarks/pdf_<date>.json
+    python benchmark_pdf.py --runs 5 --photos 0,20
+    python benchmark_pdf.py --compare benchmarks/reference.json --threshold 0.15
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from statistics import mean, median
+
+BENCHMARK_DIR = Path(__file__).parent / 'benchmarks'
+DEFAULT_PHOTO_COUNTS = [0, 5, 20, 50]
+DEFAULT_PV_TYPES = ['reception', 'complet']
+
+# Métriques comparées entre deux exécutions
+TIME_METRICS = ['image_optimisation', 'template', 'write_pdf', 'total']
+SIZE_METRICS = ['pdf_bytes', 'peak_rss_mb']
+# En dessous de cet écart absolu (secondes), une variation de durée n'est pas une régression
+MIN_TIME_DELTA = 0.005
+
+
+def make_photo(seed, size=(800, 600)):
+    """
+    Photo de chantier type, telle que la produit le navigateur
+    (réduite à 800 px, JPEG qualité 0.85).
+
+    Returns:
+        str: data URI JPEG
+    """
+    import base64
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    tint = Image.new('RGB', size, tuple(rng.randint(60, 200) for _ in range(3)))
+    image = Image.blend(image, tint, 0.5)
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randint(0, size[0]), rng.randint(0, size[1])
+        w, h = rng.randint(40, 300), rng.randint(40, 200)
+        draw.rectangle([x, y, x + w, y + h], fill=tuple(rng.randint(0, 255) for _ in range(3)))
+
+    noise = Image.effect_noise(size, 30).convert('RGB')
+    image = Image.blend(image.filter(ImageFilter.GaussianBlur(2)), noise, 0.15)
+
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return f"data:image/jpeg;base64,{base64.b64encode(output.getvalue()).decode('ascii')}"
+
+
+def make_signature(seed, size=(600, 200)):
+    """
+    Signature manuscrite type (canvas transparent, trait noir).
+
+    Returns:
+        str: data URI PNG
+    """
+    import base64
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for _ in range(3):
+        points = [(rng.randint(20, size[0] - 20), rng.randint(30, size[1] - 30)) for _ in range(8)]
+        points.sort()
+        draw.line(points, fill=(0, 0, 0, 255), width=3, joint='curve')
+
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return f"data:image/png;base64,{base64.b64encode(output.getvalue()).decode('ascii')}"
+
+
+def build_fixture(pv_type, photo_count, seed=42):
+    """
+    Construit les données d'un PV à partir des générateurs de reset_and_generate_pv.py.
+
+    Args:
+        pv_type: 'reception' (réception seule) ou 'complet'
+        photo_count: Nombre de photos réparties sur les postes d'inspection
+        seed: Graine aléatoire (fixtures identiques d'une exécution à l'autre)
+
+    Returns:
+        dict: Données du formulaire (variables du template)
+    """
+    from reset_and_generate_pv import (generate_form_data, MATERIELS, CHANTIERS,
+                                       CONDUCTEURS, ENTREPRISES, RESPONSABLES)
+    from media import PHOTO_BASE_FIELDS
+
+    random.seed(seed)
+    form_data = generate_form_data(MATERIELS[0], CHANTIERS[0], CONDUCTEURS[0], ENTREPRISES[0],
+                                   RESPONSABLES[0], datetime(2025, 11, 3), pv_type)
+
+    # Signatures réalistes à la place du pixel fourni par le générateur
+    form_data['signature_reception'] = make_signature(seed)
+    if pv_type == 'complet':
+        form_data['signature_retour'] = make_signature(seed + 1)
+
+    sides = ('_reception', '_retour') if pv_type == 'complet' else ('_reception',)
+    fields = [f for f in PHOTO_BASE_FIELDS if f.endswith(sides)]
+    for field in PHOTO_BASE_FIELDS:
+        form_data[f'photo_{field}'] = []
+    for i in range(photo_count):
+        form_data[f'photo_{fields[i % len(fields)]}'].append(make_photo(seed * 1000 + i))
+
+    form_data['date_generation'] = '03/11/2025 10:00'
+    form_data['version_info'] = {'number': 1, 'date': '03/11/2025 10:00'}
+    return form_data
+
+
+def _peak_rss_mb():
+    """Pic de mémoire résidente du processus (None si non disponible, ex. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _summary(durations):
+    return {
+        'median': round(median(durations), 4),
+        'mean': round(mean(durations), 4),
+        'min': round(min(durations), 4),
+        'max': round(max(durations), 4)
+    }
+
+
+def _run_case(pv_type, photo_count, runs, queue):
+    """Exécuté dans un processus dédié : mesure un scénario et renvoie ses résultats."""
+    try:
+        from media import optimize_form_images, PHOTO_BASE_FIELDS
+        from pdf_render import PDFRenderEngine
+
+        fixture = build_fixture(pv_type, photo_count)
+        input_bytes = len(json.dumps(fixture))
+        engine = PDFRenderEngine()
+        rss_baseline = _peak_rss_mb()
+
+        timings = {metric: [] for metric in TIME_METRICS}
+        pdf_bytes = b''
+        # Première itération exclue (chauffe des caches Pango/fontconfig et du pool d'images)
+        for iteration in range(runs + 1):
+            context = copy.deepcopy(fixture)
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # Journal par soumission inutile ici
+                optimize_form_images(context, PHOTO_BASE_FIELDS)
+            t_images = time.perf_counter()
+            html_content = engine.render_html(context)
+            t_template = time.perf_counter()
+            pdf_bytes = engine.write_pdf(html_content)
+            t_pdf = time.perf_counter()
+
+            if iteration:
+                timings['image_optimisation'].append(t_images - start)
+                timings['template'].append(t_template - t_images)
+                timings['write_pdf'].append(t_pdf - t_template)
+                timings['total'].append(t_pdf - start)
+
+        peak = _peak_rss_mb()
+        queue.put({
+            'pv_type': pv_type,
+            'photos': photo_count,
+            'runs': runs,
+            **{metric: _summary(values) for metric, values in timings.items()},
+            'input_bytes': input_bytes,
+            'pdf_bytes': len(pdf_bytes),
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+            'rss_growth_mb': round(peak - rss_baseline, 1) if peak is not None else None
+        })
+    except Exception as e:
+        queue.put({'pv_type': pv_type, 'photos': photo_count, 'error': f"{type(e).__name__}: {e}"})
+
+
+def _environment():
+    """Versions et machine, pour interpréter une comparaison entre deux exécutions."""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+    for module in ('weasyprint', 'PIL'):
+        try:
+            info[module] = __import__(module).__version__
+        except Exception:
+            info[module] = None
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        info['git_commit'] = None
+    return info
+
+
+def run_benchmark(photo_counts=DEFAULT_PHOTO_COUNTS, pv_types=DEFAULT_PV_TYPES, runs=3):
+    """
+    Exécute tous les scénarios, chacun dans un processus neuf.
+
+    Returns:
+        dict: Résultats (environnement + un bloc par scénario)
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'cases': {}
+    }
+
+    print(f"📊 Benchmark PDF : {len(photo_counts) * len(pv_types)} scénario(s), {runs} rendu(s) chacun")
+    for pv_type in pv_types:
+        for photo_count in photo_counts:
+            name = f"{pv_type}_{photo_count}_photos"
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_case, args=(pv_type, photo_count, runs, queue))
+            process.start()
+            case = queue.get()
+            process.join()
+            results['cases'][name] = case
+
+            if 'error' in case:
+                print(f"   ❌ {name:24} {case['error']}")
+            else:
+                rss = f"{case['peak_rss_mb']:.0f} Mo" if case['peak_rss_mb'] is not None else 'n/d'
+                print(f"   ✓ {name:24} images {case['image_optimisation']['median'] * 1000:6.0f} ms | "
+                      f"template {case['template']['median'] * 1000:5.0f} ms | "
+                      f"write_pdf {case['write_pdf']['median'] * 1000:6.0f} ms | "
+                      f"PDF {case['pdf_bytes'] / 1024:6.0f} Ko | RSS {rss}")
+    return results
+
+
+def compare_results(current, baseline, threshold=0.15):
+    """
+    Compare deux exécutions et liste les régressions (médianes, taille du PDF, pic RSS).
+
+    Args:
+        current: Résultats de run_benchmark()
+        baseline: Résultats de référence (JSON chargé)
+        threshold: Hausse relative tolérée (0.15 = +15 %)
+
+    Returns:
+        list: Régressions (dict scénario / métrique / avant / après / variation)
+    """
+    regressions = []
+    print(f"\n🔍 Comparaison avec la référence du {baseline.get('created_at', '?')} "
+          f"(commit {baseline.get('environment', {}).get('git_commit') or '?'}, seuil +{threshold * 100:.0f} %)")
+
+    for name, case in current['cases'].items():
+        reference = baseline.get('cases', {}).get(name)
+        if not reference or 'error' in case or 'error' in reference:
+            continue
+        for metric in TIME_METRICS + SIZE_METRICS:
+            if metric in TIME_METRICS:
+                before, after = reference[metric]['median'], case[metric]['median']
+                significant = after - before > MIN_TIME_DELTA
+            else:
+                before, after = reference.get(metric), case.get(metric)
+                significant = True
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change > threshold and significant:
+                regressions.append({'case': name, 'metric': metric, 'before': before,
+                                    'after': after, 'change': round(change, 3)})
+
+    if regressions:
+        for r in regressions:
+            print(f"   ⚠️  {r['case']:24} {r['metric']:20} {r['before']} → {r['after']} (+{r['change'] * 100:.0f} %)")
+    else:
+        print("   ✅ Aucune régression détectée")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de génération PDF')
+    parser.add_argument('--runs', type=int, default=3, help='Rendus mesurés par scénario')
+    parser.add_argument('--photos', default=','.join(map(str, DEFAULT_PHOTO_COUNTS)),
+                        help='Nombres de photos (séparés par des virgules)')
+    parser.add_argument('--types', default=','.join(DEFAULT_PV_TYPES), help='reception, complet')
+    parser.add_argument('--output', help='Fichier JSON de résultats (défaut : benchmarks/pdf_<date>.json)')
+    parser.add_argument('--compare', help='Fichier JSON de référence')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Hausse tolérée avant alerte')
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        photo_counts=[int(n) for n in args.photos.split(',') if n.strip()],
+        pv_types=[t.strip() for t in args.types.split(',') if t.strip()],
+        runs=args.runs
+    )
+
+    output = Path(args.output) if args.output else BENCHMARK_DIR / f"pdf_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\n💾 Résultats enregistrés dans {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        regressions = compare_results(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Vérification de la reprise de l'auto-sauvegarde après un brouillon perdu (écriture différée)
+
+Sur une copie de instance/pvs.db, le script vérifie qu'un PV reste modifiable par PATCH /save/<id>
+quand la révision réservée pour un brouillon n'est jamais écrite :
+- brouillon abandonné à l'écriture (erreur forcée dans le thread d'écriture) : /load-pv
+  répond 503 (Retry-After) au lieu de servir l'état en base comme s'il était à jour, la
+  révision réservée est rendue, le PATCH suivant sur la révision de /load-pv est accepté,
+- réservation sans brouillon (worker arrêté avec des brouillons en attente) : refusée en 409
+  tant qu'un brouillon peut encore être écrit, rendue au-delà de DRAFT_FLUSH_TIMEOUT,
+- même réservation perdue sans écriture différée (écriture directe du PATCH).
+
+Code de sortie 1 en cas d'échec.
+
+Usage :
+    python check_draft_recovery.py
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SOURCE_DB = Path(__file__).parent / 'instance' / 'pvs.db'
+FLUSH_TIMEOUT = 1.0
+
+
+def main():
+    if not SOURCE_DB.exists():
+        print(f"❌ Erreur : La base de données {SOURCE_DB} n'existe pas.")
+        sys.exit(2)
+
+    workdir = Path(tempfile.mkdtemp(prefix='draft_recovery_'))
+    db_path = workdir / 'pvs.db'
+    source = sqlite3.connect(SOURCE_DB)
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['MAIL_SENDER_ENABLED'] = '0'
+    os.environ['DRAFT_BUFFER_ENABLED'] = '1'
+    os.environ['DRAFT_FLUSH_TIMEOUT'] = str(FLUSH_TIMEOUT)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+        from setup_db import db, PV
+
+    client = server.app.test_client()
+    drafts = server.get_draft_buffer()
+    failures = []
+
+    def check(condition, message):
+        print(f"{'✅' if condition else '❌'} {message}")
+        if not condition:
+            failures.append(message)
+
+    def revisions(pv_id):
+        with server.app.app_context():
+            pv = db.session.get(PV, pv_id)
+            state = (pv.revision, pv.revision_reservee)
+            db.session.remove()
+        return state
+
+    def patch(pv_id, base_revision, changes):
+        return client.patch(f'/save/{pv_id}', json={'base_revision': base_revision, 'set': changes})
+
+    def load(pv_id):
+        response = client.get(f'/load-pv/{pv_id}')
+        return response, (response.get_json() or {}).get('pv_data', {})
+
+    try:
+        created = client.post('/save', json={'chantier': 'Vérification reprise des brouillons'}).get_json()
+        pv_id = created['pv_id']
+
+        # 1. Brouillon abandonné à l'écriture
+        apply_draft = drafts.apply_draft
+
+        def failing_apply(pv, form_data, update_vgp, revision):
+            raise RuntimeError('échec forcé')
+
+        drafts.apply_draft = failing_apply
+        response = patch(pv_id, created['revision'], {'observations': 'perdu'})
+        check(response.status_code == 200, f"PATCH accepté dans le tampon : HTTP {response.status_code}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            response, data = load(pv_id)
+        drafts.apply_draft = apply_draft
+        check(response.status_code == 503 and response.headers.get('Retry-After'),
+              f"Brouillon abandonné : /load-pv HTTP {response.status_code}, "
+              f"Retry-After {response.headers.get('Retry-After')}")
+        revision, reserved = revisions(pv_id)
+        check(revision == reserved,
+              f"Brouillon abandonné : révision réservée rendue (revision {revision}, réservée {reserved})")
+
+        response, data = load(pv_id)
+        response = patch(pv_id, data.get('revision'), {'observations': 'repris'})
+        check(response.status_code == 200,
+              f"PATCH sur la révision de /load-pv après l'abandon : HTTP {response.status_code}")
+        response, data = load(pv_id)
+        check(data.get('form_data', {}).get('observations') == 'repris',
+              "Modification reprise écrite en base")
+
+        # 2. Réservation sans brouillon (worker arrêté)
+        with server.app.app_context():
+            server.reserve_pv_revision(pv_id)
+        response, data = load(pv_id)
+        base_revision = data.get('revision')
+        response = patch(pv_id, base_revision, {'observations': 'trop tôt'})
+        check(response.status_code == 409, f"Réservation récente : PATCH refusé (HTTP {response.status_code})")
+        time.sleep(FLUSH_TIMEOUT + 0.2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = patch(pv_id, base_revision, {'observations': 'après délai'})
+        check(response.status_code == 200,
+              f"Réservation perdue au-delà de {FLUSH_TIMEOUT:g} s : PATCH accepté (HTTP {response.status_code})")
+        server.flush_drafts(pv_id)
+
+        # 3. Réservation perdue, écriture directe (sans tampon)
+        with server.app.app_context():
+            server.reserve_pv_revision(pv_id)
+        time.sleep(FLUSH_TIMEOUT + 0.2)
+        response, data = load(pv_id)
+        server.get_draft_buffer, get_draft_buffer = (lambda: None), server.get_draft_buffer
+        try:
+            response = patch(pv_id, data.get('revision'), {'observations': 'écriture directe'})
+        finally:
+            server.get_draft_buffer = get_draft_buffer
+        revision, reserved = revisions(pv_id)
+        check(response.status_code == 200 and revision == reserved == response.get_json().get('revision'),
+              f"Sans tampon : PATCH accepté malgré la réservation perdue (HTTP {response.status_code}, "
+              f"revision {revision})")
+    finally:
+        drafts.stop()
+        with server.app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\n❌ {len(failures)} vérification(s) en échec")
+        sys.exit(1)
+    print("\n✅ Auto-sauvegarde reprise après chaque brouillon perdu")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Contrôle du volume lu en base par endpoint (non-régression du chargement différé)
+
+Les colonnes JSON (pvs.data, pv_versions.data) sont différées : seuls load_pv, load_pv_version,
+submit, save, download_pdf et l'export les chargent. Ce script appelle chaque endpoint sur une
+copie de instance/pvs.db et mesure, pour chaque requête HTTP :
+- le nombre de requêtes SQL,
+- le nombre de lignes et d'octets renvoyés par SQLite,
+- si une colonne data est lue.
+
+Il échoue (code de sortie 1) si un endpoint dépasse son budget ou lit le JSON sans en avoir besoin.
+
+Usage :
+    python check_query_budget.py
+    python check_query_budget.py --verbose     # affiche aussi les requêtes SQL
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+SOURCE_DB = Path(__file__).parent / 'instance' / 'pvs.db'
+DATA_COLUMN = re.compile(r'\b(pvs|pv_versions)\.data\b')
+
+# Budget par endpoint : (requêtes SQL hors BEGIN/COMMIT, lignes, octets, lecture du JSON autorisée)
+# Les endpoints de métadonnées ne doivent jamais lire data ; les octets sont mesurés sur la base fournie.
+BUDGETS = {
+    'GET /list-pv': (4, 60, 20_000, False),
+    'GET /search': (5, 60, 20_000, False),
+    'GET /facets': (8, 1_100, 60_000, False),
+    'GET /vgp/summary': (2, 2, 500, False),
+    'GET /vgp/items': (2, 60, 20_000, False),
+    'GET /pv-versions': (4, 30, 3_000, False),
+    'GET /load-pv': (4, 40, 2_000_000, True),
+    'GET /load-pv-version (courante)': (4, 40, 2_000_000, True),
+    'GET /load-pv-version (historique)': (5, 40, 2_000_000, True),
+    'POST /upload-vgp-document': (3, 2, 1_000, False),
+    'GET /vgp-document': (2, 2, 1_000, False),
+    'DELETE /delete-pv': (3, 2, 1_000, False),
+}
+
+
+class QueryMeter:
+    """Compteurs SQL d'une requête HTTP, alimentés par les événements SQLAlchemy."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.statements = []
+        self.rows = 0
+        self.bytes = 0
+
+    def row_factory(self, cursor, row):
+        """row_factory sqlite3 : compte chaque ligne renvoyée et sa taille."""
+        self.rows += 1
+        for value in row:
+            if isinstance(value, str):
+                self.bytes += len(value.encode('utf-8'))
+            elif isinstance(value, (bytes, memoryview)):
+                self.bytes += len(value)
+            elif value is not None:
+                self.bytes += 8
+        return row
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        dbapi_connection.row_factory = self.row_factory
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(('BEGIN', 'COMMIT', 'ROLLBACK')):
+            self.statements.append(statement)
+
+    @property
+    def reads_data(self):
+        return any(statement.lstrip().upper().startswith(('SELECT', 'WITH')) and DATA_COLUMN.search(statement)
+                   for statement in self.statements)
+
+
+def pick_fixtures(db_path):
+    """PV le plus versionné (lectures) et un autre PV (suppression)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        pv_id, version_courante = conn.execute(
+            "SELECT pvs.id, pvs.version_courante FROM pvs JOIN pv_versions ON pv_versions.pv_id = pvs.id "
+            "GROUP BY pvs.id ORDER BY COUNT(*) DESC, pvs.id LIMIT 1"
+        ).fetchone()
+        historical = conn.execute(
+            "SELECT MAX(version_number) FROM pv_versions WHERE pv_id = ? AND keyframe_version IS NOT NULL "
+            "AND keyframe_version != version_number", (pv_id,)
+        ).fetchone()[0] or 1
+        victim = conn.execute("SELECT id FROM pvs WHERE id != ? ORDER BY id LIMIT 1", (pv_id,)).fetchone()[0]
+        chantier = conn.execute("SELECT chantier FROM pvs WHERE id = ?", (pv_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    return pv_id, version_courante, historical, victim, chantier
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Volume lu en base par endpoint')
+    parser.add_argument('--verbose', action='store_true', help='Afficher les requêtes SQL')
+    args = parser.parse_args()
+
+    if not SOURCE_DB.exists():
+        print(f"❌ Erreur : La base de données {SOURCE_DB} n'existe pas.")
+        sys.exit(2)
+
+    workdir = Path(tempfile.mkdtemp(prefix='query_budget_'))
+    db_path = workdir / 'pvs.db'
+    source = sqlite3.connect(SOURCE_DB)
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    pv_id, version_courante, historical, victim, chantier = pick_fixtures(db_path)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['MAIL_SENDER_ENABLED'] = '0'
+    uploaded = []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+        from setup_db import db
+    from sqlalchemy import event
+
+    meter = QueryMeter()
+    with server.app.app_context():
+        event.listen(db.engine, 'checkout', meter.on_checkout)
+        event.listen(db.engine, 'before_cursor_execute', meter.on_execute)
+    client = server.app.test_client()
+
+    word = chantier.split()[-1]
+    calls = [
+        ('GET /list-pv', lambda: client.get('/list-pv?limit=50')),
+        ('GET /search', lambda: client.get(f'/search?q={word}&limit=50')),
+        ('GET /facets', lambda: client.get('/facets')),
+        ('GET /vgp/summary', lambda: client.get('/vgp/summary')),
+        ('GET /vgp/items', lambda: client.get('/vgp/items?status=valid&limit=50')),
+        ('GET /pv-versions', lambda: client.get(f'/pv-versions/{pv_id}')),
+        ('GET /load-pv', lambda: client.get(f'/load-pv/{pv_id}')),
+        ('GET /load-pv-version (courante)', lambda: client.get(f'/load-pv-version/{pv_id}/{version_courante}')),
+        ('GET /load-pv-version (historique)', lambda: client.get(f'/load-pv-version/{pv_id}/{historical}')),
+        ('POST /upload-vgp-document', lambda: client.post(
+            f'/upload-vgp-document/{pv_id}',
+            data={'vgp_document': (io.BytesIO(b'%PDF-1.4\n%%EOF\n'), 'vgp.pdf')},
+            content_type='multipart/form-data')),
+        ('GET /vgp-document', lambda: client.get(f'/vgp-document/{pv_id}')),
+        ('DELETE /delete-pv', lambda: client.delete(f'/delete-pv/{victim}')),
+    ]
+
+    failures = []
+    print(f"🔎 Volume lu par endpoint (PV {pv_id[:8]}, {version_courante} version(s))\n")
+    print(f"   {'Endpoint':<34} {'SQL':>4} {'Lignes':>7} {'Octets':>10}  JSON")
+    try:
+        for name, call in calls:
+            meter.reset()
+            response = call()
+            if name == 'POST /upload-vgp-document' and response.status_code == 200:
+                uploaded.append(Path(response.get_json()['document_path']))
+            max_statements, max_rows, max_bytes, data_allowed = BUDGETS[name]
+
+            problems = []
+            if response.status_code >= 400:
+                problems.append(f"HTTP {response.status_code}")
+            if len(meter.statements) > max_statements:
+                problems.append(f"{len(meter.statements)} requêtes > {max_statements}")
+            if meter.rows > max_rows:
+                problems.append(f"{meter.rows} lignes > {max_rows}")
+            if meter.bytes > max_bytes:
+                problems.append(f"{meter.bytes} octets > {max_bytes}")
+            if meter.reads_data and not data_allowed:
+                problems.append("colonne data lue")
+
+            status = '❌' if problems else '✅'
+            print(f"{status} {name:<34} {len(meter.statements):>4} {meter.rows:>7} {meter.bytes:>10}  "
+                  f"{'oui' if meter.reads_data else 'non'}")
+            for problem in problems:
+                print(f"   ⚠️  {problem}")
+            if args.verbose:
+                for statement in meter.statements:
+                    print(f"      {' '.join(statement.split())[:160]}")
+            if problems:
+                failures.append(name)
+    finally:
+        with server.app.app_context():
+            db.engine.dispose()
+        for path in uploaded:
+            path.unlink(missing_ok=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\n❌ {len(failures)} endpoint(s) hors budget")
+        sys.exit(1)
+    print("\n✅ Tous les endpoints respectent leur budget")
+
+
+if __name__ == '__main__':
+    main()
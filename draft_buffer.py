@@ -0,0 +1,395 @@
+"""
+Écriture différée des brouillons (auto-sauvegarde) : tampon en mémoire par PV
+
+- /save et PATCH /save/<id> sur un PV existant déposent le brouillon en mémoire et
+  répondent immédiatement : plusieurs sauvegardes du même PV entre deux vidages
+  n'en font qu'une (coalescence)
+- Un seul thread d'écriture vide le tampon toutes les DRAFT_FLUSH_INTERVAL secondes,
+  en une transaction pour tous les PV en attente (un verrou d'écriture, un fsync)
+- Vidage immédiat à la demande (flush_drafts) : avant /submit, /download-pdf, l'export
+  et toute lecture d'un PV, qui voit donc toujours son dernier brouillon
+- Borne de durabilité : un brouillon reste au plus DRAFT_FLUSH_INTERVAL secondes en mémoire
+  (vidage anticipé au-delà de DRAFT_MAX_PENDING PV en attente, vidage final à l'arrêt) ;
+  en cas d'arrêt brutal, le navigateur garde sa copie locale (localStorage)
+- Brouillon vérifié avant la réponse (check_draft) et écrit dans son propre point de
+  sauvegarde : un brouillon qui échoue malgré tout est abandonné et signalé (stats,
+  flush) sans bloquer les autres PV du lot, et sa révision réservée est rendue
+- Révisions réservées en base à la réception (UPDATE atomique de pvs.revision_reservee) :
+  deux workers n'annoncent jamais la même révision. Un PATCH n'est accepté que si sa
+  base_revision est la dernière attribuée et que son état est connu ici (brouillon local,
+  ou en base sans brouillon en attente ailleurs) ; sinon 409 et le client recharge le PV.
+  Une réservation jamais écrite (worker arrêté avec des brouillons en attente) est perdue
+  au-delà de DRAFT_FLUSH_TIMEOUT et rendue au PATCH suivant (release_revision)
+- Tampon propre à chaque processus : avec plusieurs workers gunicorn, un brouillon reçu
+  par un autre worker est visible au plus DRAFT_FLUSH_INTERVAL secondes plus tard. Un
+  brouillon dont une révision plus récente est déjà en base (envoi traité par un autre
+  worker) n'est pas écrit : son client reçoit 409 à la sauvegarde suivante
+"""
+
+from datetime import datetime
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+
+from setup_db import db, PV, write_transactions
+
+# Configuration (surchargeable par variables d'environnement)
+DRAFT_BUFFER_ENABLED = os.environ.get('DRAFT_BUFFER_ENABLED', '1') == '1'
+DRAFT_FLUSH_INTERVAL = float(os.environ.get('DRAFT_FLUSH_INTERVAL', '0.5'))
+DRAFT_MAX_PENDING = int(os.environ.get('DRAFT_MAX_PENDING', '200'))
+DRAFT_FLUSH_TIMEOUT = float(os.environ.get('DRAFT_FLUSH_TIMEOUT', '10'))
+
+
+class DraftValidationError(ValueError):
+    """Brouillon refusé avant d'être déposé dans le tampon (il ne pourrait pas être écrit)."""
+
+
+class PendingDraft:
+    """Dernier brouillon reçu pour un PV, en attente d'écriture."""
+
+    def __init__(self, pv_id, form_data, revision, update_vgp):
+        self.pv_id = pv_id
+        self.form_data = form_data
+        self.revision = revision  # Révision réservée en base et annoncée au client
+        self.update_vgp = update_vgp
+        self.received_at = datetime.utcnow()
+        self.writes = 1
+        self.status = 'pending'  # 'pending', puis 'written', 'superseded' ou 'failed'
+
+    def merge(self, form_data, revision, update_vgp):
+        """
+        Remplace le brouillon par une version plus récente (coalescence). Une version réservée
+        avant celle-ci mais déposée après (requêtes concurrentes) est ignorée.
+        """
+        if revision > self.revision:
+            self.form_data = form_data
+            self.revision = revision
+        self.update_vgp = self.update_vgp or update_vgp
+        self.received_at = datetime.utcnow()
+        self.writes += 1
+
+
+class DraftBuffer:
+    """Tampon des brouillons et thread d'écriture unique."""
+
+    def __init__(self, app, apply_draft, check_draft, release_revision):
+        """
+        Args:
+            app: Application Flask (contexte du thread d'écriture)
+            apply_draft: Fonction (pv, form_data, update_vgp, revision) qui écrit un brouillon dans un PV
+            check_draft: Fonction (form_data) qui lève DraftValidationError si le brouillon
+                ne peut pas être écrit
+            release_revision: Fonction (pv_id, revision) qui rend en base la révision réservée
+                d'un brouillon abandonné (sans effet si une révision plus récente a été réservée)
+        """
+        self.app = app
+        self.apply_draft = apply_draft
+        self.check_draft = check_draft
+        self.release_revision = release_revision
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._pending = {}
+        self._flushing = {}
+        self._stats = {
+            'received': 0,
+            'coalesced': 0,
+            'written': 0,
+            'superseded': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'failed': 0,
+            'errors': 0,
+            'last_flush_ms': None,
+            'last_error': None
+        }
+
+    def start(self):
+        self._worker = threading.Thread(target=self._run, name='draft-writer', daemon=True)
+        self._worker.start()
+        atexit.register(self.stop)
+        print(f"📝 Écriture différée des brouillons : vidage toutes les {DRAFT_FLUSH_INTERVAL:g}s")
+
+    def stop(self, timeout=DRAFT_FLUSH_TIMEOUT):
+        """Arrête le thread d'écriture après un dernier vidage."""
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _latest(self, pv_id):
+        """Brouillon le plus récent d'un PV (en attente, ou en cours d'écriture), à appeler sous verrou."""
+        return self._pending.get(pv_id) or self._flushing.get(pv_id)
+
+    def _add(self, pv_id, form_data, revision, update_vgp):
+        """Dépose un brouillon (nouvelle entrée ou coalescence), à appeler sous verrou."""
+        self._stats['received'] += 1
+        entry = self._pending.get(pv_id)
+        if entry is not None:
+            entry.merge(form_data, revision, update_vgp)
+            self._stats['coalesced'] += 1
+            return
+        self._pending[pv_id] = PendingDraft(pv_id, form_data, revision, update_vgp)
+        if len(self._pending) >= DRAFT_MAX_PENDING:
+            self._wake.set()
+
+    def put(self, pv_id, form_data, reserve_revision, update_vgp=False):
+        """
+        Dépose le form_data complet d'un PV existant (POST /save).
+
+        Args:
+            pv_id: Identifiant du PV
+            form_data: Données complètes du formulaire
+            reserve_revision: Fonction (base_revision=None) qui réserve en base la révision suivante
+                et la renvoie (None si le PV n'existe pas, ou si base_revision n'est plus la dernière)
+            update_vgp: Le brouillon fixe la date VGP
+
+        Returns:
+            int: Révision du brouillon, ou None si le PV n'existe pas (à créer directement)
+
+        Raises:
+            DraftValidationError: Brouillon impossible à écrire (rien n'est déposé)
+        """
+        self.check_draft(form_data)
+        revision = reserve_revision()
+        if revision is None:
+            return None
+        with self._cond:
+            self._add(pv_id, form_data, revision, update_vgp)
+        return revision
+
+    def patch(self, pv_id, base_revision, changes, removed, load_state, reserve_revision):
+        """
+        Fusionne des champs modifiés dans le dernier état connu d'un PV (PATCH /save/<id>).
+
+        Args:
+            pv_id: Identifiant du PV
+            base_revision: Révision sur laquelle s'appuient les modifications
+            changes: Champs modifiés {nom: valeur}
+            removed: Noms des champs supprimés
+            load_state: Fonction sans argument renvoyant (révision, révision réservée, form_data) en base,
+                ou None si le PV n'existe pas ; appelée seulement si aucun brouillon n'est en attente ici
+            reserve_revision: Voir put
+
+        Returns:
+            tuple: (statut 'ok' | 'conflict' | 'missing', révision courante, form_data fusionné)
+
+        Raises:
+            DraftValidationError: form_data fusionné impossible à écrire (rien n'est déposé)
+        """
+        with self._cond:
+            latest = self._latest(pv_id)
+            state = (latest.revision, latest.revision, latest.form_data) if latest is not None else None
+        if state is None:
+            state = load_state()
+            if state is None:
+                return 'missing', None, None
+
+        # L'état de base_revision doit être ici : une révision réservée au-delà de celle en base
+        # est un brouillon en attente dans un autre worker
+        revision, reserved, form_data = state
+        if base_revision != revision or base_revision != reserved:
+            return 'conflict', reserved, None
+
+        form_data = dict(form_data)
+        for field in removed:
+            form_data.pop(field, None)
+        form_data.update(changes)
+        self.check_draft(form_data)
+
+        # Réservation conditionnelle : une seule modification basée sur base_revision passe
+        revision = reserve_revision(base_revision)
+        if revision is None:
+            state = load_state()
+            return ('missing', None, None) if state is None else ('conflict', state[1], None)
+
+        update_vgp = 'vgp_date' in changes or 'vgp_date' in removed
+        with self._cond:
+            self._add(pv_id, form_data, revision, update_vgp)
+        return 'ok', revision, form_data
+
+    def discard(self, pv_id):
+        """Abandonne le brouillon en attente d'un PV (suppression du PV)."""
+        with self._cond:
+            self._pending.pop(pv_id, None)
+
+    def flush(self, pv_id=None, timeout=DRAFT_FLUSH_TIMEOUT):
+        """
+        Demande un vidage immédiat au thread d'écriture et attend qu'il soit fait.
+        À appeler avant tout accès à la base dans la requête (le thread d'écriture
+        doit pouvoir prendre le verrou d'écriture SQLite).
+
+        Args:
+            pv_id: Ne vider que si ce PV a un brouillon en attente (None = tous)
+            timeout: Attente maximale (secondes)
+
+        Returns:
+            bool: True si les brouillons concernés sont en base (écrits, ou dépassés par une
+                écriture plus récente) ; False si l'un d'eux a été abandonné sur erreur ou si
+                l'attente a expiré
+        """
+        with self._cond:
+            # Brouillons présents à l'appel : on attend leur sort, pas un nombre de cycles
+            entries = [entry for entries in (self._pending, self._flushing) for entry in entries.values()
+                       if pv_id is None or entry.pv_id == pv_id]
+            if not entries:
+                return True
+            self._wake.set()
+            done = self._cond.wait_for(lambda: all(entry.status != 'pending' for entry in entries), timeout)
+            return done and all(entry.status != 'failed' for entry in entries)
+
+    def _write(self, entry):
+        """
+        Écrit un brouillon dans son PV (dans la transaction du lot).
+
+        Returns:
+            bool: False si le brouillon est dépassé (PV supprimé, ou révision plus récente déjà en base)
+        """
+        pv = PV.query.options(db.undefer(PV.data)).get(entry.pv_id)
+        if pv is None or pv.revision >= entry.revision:
+            return False
+        self.apply_draft(pv, entry.form_data, entry.update_vgp, entry.revision)
+        return True
+
+    def _flush_batch(self):
+        """
+        Écrit tous les brouillons en attente en une transaction, chacun dans son point de
+        sauvegarde : un brouillon en erreur est abandonné sans annuler les autres.
+        """
+        with self._cond:
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+
+        outcomes = {}
+        errors = {}
+        failed = None
+        started = time.perf_counter()
+        if batch:
+            try:
+                for pv_id, entry in batch.items():
+                    try:
+                        with db.session.begin_nested():
+                            outcomes[pv_id] = 'written' if self._write(entry) else 'superseded'
+                    except Exception as e:
+                        outcomes[pv_id] = 'failed'
+                        errors[pv_id] = f"{type(e).__name__}: {e}"
+                        print(f"❌ Brouillon du PV {pv_id} abandonné : {errors[pv_id]}")
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                failed = f"{type(e).__name__}: {e}"
+                print(f"❌ Écriture des brouillons ({len(batch)} PV) : {failed}")
+            finally:
+                db.session.remove()
+
+        # Révisions des brouillons abandonnés rendues avant de réveiller les requêtes en attente :
+        # le PATCH suivant du client (409) repart de l'état en base
+        for pv_id, entry in batch.items():
+            if outcomes.get(pv_id) == 'failed':
+                try:
+                    self.release_revision(pv_id, entry.revision)
+                except Exception as e:
+                    print(f"⚠️ Révision {entry.revision} du PV {pv_id} non rendue : {e}")
+                finally:
+                    db.session.remove()
+
+        with self._cond:
+            self._flushing = {}
+            if failed:
+                # Échec de la transaction elle-même (base verrouillée, disque...) : réessai au
+                # prochain cycle des brouillons écrivables, sauf si un brouillon plus récent du
+                # même PV a été reçu entre-temps
+                for pv_id, entry in batch.items():
+                    newer = self._pending.get(pv_id)
+                    if outcomes.get(pv_id) == 'failed':
+                        entry.status = 'failed'
+                    elif newer is not None and newer.revision > entry.revision:
+                        newer.update_vgp = newer.update_vgp or entry.update_vgp
+                        entry.status = 'superseded'
+                    else:
+                        if newer is not None:
+                            entry.update_vgp = entry.update_vgp or newer.update_vgp
+                            newer.status = 'superseded'
+                        self._pending[pv_id] = entry
+                self._stats['errors'] += 1
+                self._stats['last_error'] = failed
+            elif batch:
+                for pv_id, entry in batch.items():
+                    entry.status = outcomes[pv_id]
+                written = sum(1 for outcome in outcomes.values() if outcome == 'written')
+                self._stats['written'] += written
+                self._stats['superseded'] += sum(1 for outcome in outcomes.values() if outcome == 'superseded')
+                self._stats['batches'] += 1
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+                self._stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            if errors:
+                self._stats['failed'] += len(errors)
+                self._stats['last_error'] = '; '.join(f"{pv_id}: {error}" for pv_id, error in errors.items())
+            self._cond.notify_all()
+
+    def _run(self):
+        # Le thread ne fait que des lectures suivies d'écritures : verrou d'écriture dès le BEGIN
+        with self.app.app_context(), write_transactions():
+            while not self._stop.is_set():
+                self._wake.wait(DRAFT_FLUSH_INTERVAL)
+                self._wake.clear()
+                try:
+                    self._flush_batch()
+                except Exception as e:
+                    print(f"Erreur du thread d'écriture des brouillons: {e}")
+            self._flush_batch()
+
+    def stats(self):
+        """
+        Retourne l'état du tampon et les compteurs d'écriture.
+
+        Returns:
+            dict: Brouillons en attente, reçus, fusionnés, écrits, dépassés, abandonnés sur erreur, lots
+        """
+        with self._cond:
+            oldest = min((entry.received_at for entry in self._pending.values()), default=None)
+            return {
+                'flush_interval': DRAFT_FLUSH_INTERVAL,
+                'pending': len(self._pending),
+                'oldest_pending_age_ms': (round((datetime.utcnow() - oldest).total_seconds() * 1000, 1)
+                                          if oldest else None),
+                **self._stats
+            }
+
+
+_buffer = None
+
+
+def start_draft_buffer(app, apply_draft, check_draft, release_revision):
+    """
+    Démarre le tampon des brouillons (une fois par processus).
+    Non démarré dans les processus enfants de multiprocessing (pool de rendu PDF).
+
+    Returns:
+        DraftBuffer ou None si désactivé
+    """
+    global _buffer
+    if _buffer is None and DRAFT_BUFFER_ENABLED and multiprocessing.parent_process() is None:
+        _buffer = DraftBuffer(app, apply_draft, check_draft, release_revision)
+        _buffer.start()
+    return _buffer
+
+
+def get_draft_buffer():
+    """Retourne l'instance démarrée (None si l'écriture différée est désactivée)."""
+    return _buffer
+
+
+def flush_drafts(pv_id=None):
+    """
+    Écrit en base les brouillons en attente (d'un PV, ou tous) avant de lire ou d'écrire le PV.
+
+    Returns:
+        bool: False si un brouillon concerné n'a pas pu être écrit (voir DraftBuffer.flush)
+    """
+    if _buffer is None:
+        return True
+    return _buffer.flush(pv_id)
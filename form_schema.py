@@ -0,0 +1,307 @@
+"""
+Schéma déclaratif du formulaire PV (/submit et /download-pdf)
+
+- Les champs du formulaire sont décrits une seule fois (nom, type, valeur par défaut)
+  et compilés à l'import : les deux routes produisent le même form_data
+- Les photos (photo_<poste>, photo_<poste>_<n>) sont réparties par poste en un seul
+  passage sur les clés du formulaire, au lieu d'un parcours complet par poste ;
+  les photos envoyées en binaire (request.files) sont gardées en flux (PhotoUpload)
+- Les valeurs sont contrôlées selon leur type (date, nombre, choix) sans être converties :
+  le form_data stocké et envoyé au rendu PDF garde les chaînes reçues. Une valeur inattendue
+  (compteur "1 234 h", carburant > 100, état saisi en texte libre...) est conservée comme
+  avant et signalée dans les logs ; seul un nombre non fini (inf, nan) est refusé
+"""
+
+from datetime import datetime
+import base64
+import math
+import re
+import time
+
+from media import PHOTO_BASE_FIELDS, SIGNATURE_FIELDS, PhotoUpload
+
+# Types de champ : valeur par défaut et contrôle de la valeur reçue
+ETAT_CHOICES = ('bon', 'defectueux')
+OUI_NON_CHOICES = ('oui', 'non')
+
+# (nom, type, valeur par défaut), dans l'ordre du form_data
+FORM_FIELDS = [
+    # Métadonnées
+    ('chantier', 'text', ''),
+    ('date_reception', 'date', ''),
+    ('date_retour', 'date', ''),
+    ('materiel_numero', 'text', ''),
+    ('materiel_type', 'text', ''),
+    ('fournisseur', 'text', ''),
+    ('responsable', 'text', ''),
+    ('email_destinataire', 'text', ''),
+    ('email_conducteur', 'list', None),  # Liste d'emails
+    ('email_entreprise', 'text', ''),
+
+    # Compteurs
+    ('compteur_reception', 'number', ''),
+    ('compteur_retour', 'number', ''),
+
+    # État - Réception
+    ('carrosserie_reception', 'etat', ''),
+    ('eclairage_reception', 'etat', ''),
+    ('pneumatiques_reception', 'etat', ''),
+    ('panier_reception', 'etat', ''),
+    ('flexibles_reception', 'etat', ''),
+    ('commandes_reception', 'etat', ''),
+    ('conformite_reception', 'etat', ''),
+    ('mobilites_reception', 'etat', ''),
+    ('nacelles_reception', 'etat', ''),
+    ('securite_reception', 'etat', ''),
+
+    # État - Retour
+    ('carrosserie_retour', 'etat', ''),
+    ('eclairage_retour', 'etat', ''),
+    ('pneumatiques_retour', 'etat', ''),
+    ('panier_retour', 'etat', ''),
+    ('flexibles_retour', 'etat', ''),
+    ('commandes_retour', 'etat', ''),
+    ('conformite_retour', 'etat', ''),
+    ('mobilites_retour', 'etat', ''),
+    ('nacelles_retour', 'etat', ''),
+    ('securite_retour', 'etat', ''),
+
+    # Fluides - Réception
+    ('carburant_reception', 'percent', ''),
+    ('fuite_moteur_reception', 'oui_non', 'non'),
+    ('fuite_hydraulique_reception', 'oui_non', 'non'),
+    ('fuite_gasoil_reception', 'oui_non', 'non'),
+
+    # Fluides - Retour
+    ('carburant_retour', 'percent', ''),
+    ('fuite_moteur_retour', 'oui_non', 'non'),
+    ('fuite_hydraulique_retour', 'oui_non', 'non'),
+    ('fuite_gasoil_retour', 'oui_non', 'non'),
+
+    # Observations
+    ('observations_reception', 'text', ''),
+    ('observations_retour', 'text', ''),
+]
+
+
+class FormValidationError(ValueError):
+    """Levée quand une valeur du formulaire est refusée (nombre non fini)."""
+
+    def __init__(self, field, value):
+        self.field = field
+        self.value = value
+        super().__init__(f"Valeur invalide pour le champ {field} : {value[:50]!r}")
+
+
+def _is_date(value):
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+
+def _parse_number(value):
+    """Nombre saisi (virgule décimale, espaces de milliers), ou None si la valeur n'en est pas un."""
+    try:
+        return float(value.replace(',', '.').replace(' ', '').replace('\u00a0', ''))
+    except ValueError:
+        return None
+
+
+def _is_number(value):
+    number = _parse_number(value)
+    return number is not None and math.isfinite(number) and number >= 0
+
+
+def _is_percent(value):
+    return _is_number(value) and _parse_number(value) <= 100
+
+
+def _is_non_finite(value):
+    number = _parse_number(value)
+    return number is not None and not math.isfinite(number)
+
+
+# Contrôle par type (appelé seulement sur une valeur non vide) : une valeur qui n'y répond pas
+# est conservée et signalée
+FIELD_CHECKS = {
+    'text': None,
+    'list': None,
+    'date': _is_date,
+    'number': _is_number,
+    'percent': _is_percent,
+    'etat': lambda value: value in ETAT_CHOICES,
+    'oui_non': lambda value: value in OUI_NON_CHOICES,
+}
+
+# Valeurs refusées (FormValidationError) : "inf", "nan", "1e999" ne sont pas des relevés
+FIELD_REJECTS = {
+    'number': _is_non_finite,
+    'percent': _is_non_finite,
+}
+
+
+def compile_schema(fields=FORM_FIELDS, photo_fields=PHOTO_BASE_FIELDS):
+    """
+    Compile le schéma : champs avec leur contrôle, et expression qui associe
+    une clé photo_... à son poste.
+
+    Args:
+        fields: Champs (nom, type, défaut)
+        photo_fields: Postes d'inspection pouvant recevoir des photos
+
+    Returns:
+        tuple: (champs [(nom, défaut, contrôle, refus, liste)], regex des clés photo)
+    """
+    compiled = []
+    for name, kind, default in fields:
+        if kind not in FIELD_CHECKS:
+            raise ValueError(f"Type de champ inconnu pour {name} : {kind}")
+        compiled.append((name, default, FIELD_CHECKS[kind], FIELD_REJECTS.get(kind), kind == 'list'))
+
+    # Les clés commencent par photo_<poste> (suivi ou non de _<n>). Aucun poste n'est le
+    # préfixe d'un autre : une clé correspond à un seul poste, comme avec startswith.
+    for field in photo_fields:
+        for other in photo_fields:
+            if other != field and other.startswith(field):
+                raise ValueError(f"Poste photo ambigu : {field} est le préfixe de {other}")
+    photo_key = re.compile('photo_(' + '|'.join(map(re.escape, photo_fields)) + ')')
+
+    return compiled, photo_key
+
+
+_FIELDS, _PHOTO_KEY = compile_schema()
+_PHOTO_KEYS = {field: f'photo_{field}' for field in PHOTO_BASE_FIELDS}
+
+
+def parse_form(form, files=None):
+    """
+    Construit le form_data d'une soumission (/submit, /download-pdf).
+
+    Args:
+        form: Champs du formulaire (request.form, MultiDict)
+        files: Fichiers envoyés (request.files) : signatures en PNG, photos en binaire
+
+    Returns:
+        dict: form_data (champs du schéma, signatures en data URI,
+            photo_<poste> = liste de data URI puis de PhotoUpload)
+
+    Raises:
+        FormValidationError: Valeur refusée (nombre non fini) ; les autres valeurs inattendues
+            sont conservées et signalées dans les logs
+    """
+    form_data = {}
+    for name, default, check, reject, is_list in _FIELDS:
+        if is_list:
+            form_data[name] = form.getlist(name)
+            continue
+        value = form.get(name, default)
+        if value:
+            if reject is not None and reject(value):
+                raise FormValidationError(name, value)
+            if check is not None and not check(value):
+                print(f"⚠️ Champ {name} : valeur inattendue {value[:50]!r} (conservée)")
+        form_data[name] = value
+
+    # Signatures : d'abord dans files (Blob envoyé par le JS), sinon dans form (data URI)
+    for key in SIGNATURE_FIELDS:
+        form_data[key] = ''
+        if files is not None and key in files:
+            sig_file = files[key]
+            if sig_file and sig_file.filename:
+                form_data[key] = f"data:image/png;base64,{base64.b64encode(sig_file.read()).decode('utf-8')}"
+        elif form.get(key):
+            form_data[key] = form.get(key)
+
+    # Photos (photo_carrosserie_reception_1, photo_carrosserie_reception_2...) : un seul passage
+    for photo_key in _PHOTO_KEYS.values():
+        form_data[photo_key] = []
+    for key in form.keys():
+        if key.startswith('photo_'):
+            match = _PHOTO_KEY.match(key)
+            if match:
+                photo_data = form.get(key, '')
+                if photo_data:
+                    form_data[_PHOTO_KEYS[match.group(1)]].append(photo_data)
+    if files is not None:
+        for key in files.keys():
+            if key.startswith('photo_'):
+                match = _PHOTO_KEY.match(key)
+                upload = files.get(key)
+                # Les champs fichier laissés vides arrivent sans nom de fichier
+                if match and upload and upload.filename:
+                    form_data[_PHOTO_KEYS[match.group(1)]].append(PhotoUpload(upload))
+
+    return form_data
+
+
+def _legacy_parse(form, photo_fields=PHOTO_BASE_FIELDS):
+    """Ancienne lecture (un get par champ puis, pour chaque poste, un parcours de toutes les clés)."""
+    form_data = {name: (form.getlist(name) if kind == 'list' else form.get(name, default))
+                 for name, kind, default in FORM_FIELDS}
+    for key in SIGNATURE_FIELDS:
+        form_data[key] = form.get(key, '')
+    for field in photo_fields:
+        photos = []
+        for key in form.keys():
+            if key.startswith(f'photo_{field}'):
+                photo_data = form.get(key, '')
+                if photo_data:
+                    photos.append(photo_data)
+        form_data[f'photo_{field}'] = photos if photos else []
+    return form_data
+
+
+def compare_parsers(total_keys=300, iterations=2000):
+    """
+    Compare l'ancienne lecture du formulaire et parse_form sur une soumission type
+    de total_keys clés (champs du schéma, photos réparties sur les postes, champs annexes).
+
+    Returns:
+        dict: Durée moyenne par soumission (µs) pour chaque lecture
+    """
+    from werkzeug.datastructures import MultiDict
+
+    items = []
+    for name, kind, default in FORM_FIELDS:
+        if kind == 'list':
+            items += [(name, 'conducteur@example.com'), (name, 'chef@example.com')]
+        elif kind == 'date':
+            items.append((name, '2026-10-18'))
+        elif kind in ('number', 'percent'):
+            items.append((name, '50'))
+        elif kind == 'etat':
+            items.append((name, 'bon'))
+        elif kind == 'oui_non':
+            items.append((name, 'non'))
+        else:
+            items.append((name, f'valeur {name}'))
+    items += [(key, 'data:image/png;base64,iVBORw0KGgo=') for key in SIGNATURE_FIELDS]
+    schema_keys = len({name for name, _ in items})
+    photo_count = (total_keys - schema_keys) * 2 // 3
+    for i in range(photo_count):
+        field = PHOTO_BASE_FIELDS[i % len(PHOTO_BASE_FIELDS)]
+        items.append((f'photo_{field}_{i // len(PHOTO_BASE_FIELDS) + 1}', 'blob:' + f'{i:064x}'))
+    items += [(f'extra_{i}', 'x') for i in range(total_keys - schema_keys - photo_count)]
+    form = MultiDict(items)
+
+    if parse_form(form) != _legacy_parse(form):
+        raise AssertionError("parse_form et l'ancienne lecture ne produisent pas le même form_data")
+
+    results = {'keys': len(form), 'photos': photo_count}
+    for label, parse in (('avant', _legacy_parse), ('apres', parse_form)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse(form)
+        results[label] = round((time.perf_counter() - start) / iterations * 1e6, 1)
+
+    print(f"📝 Formulaire de {results['keys']} clés ({photo_count} photos), {iterations} lectures")
+    for label in ('avant', 'apres'):
+        print(f"   {label:6} : {results[label]:8.1f} µs par soumission")
+    print(f"   gain   : x{results['avant'] / results['apres']:.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    compare_parsers()
@@ -136,6 +136,7 @@ def generate_pv_data(index, vgp_scenario):
         'responsable': responsable,
         'fournisseur': fournisseur,
         'materiel_type': materiel_type,
+        'materiel_numero': materiel_numero,
         'date_reception': date_reception,
         'date_retour': date_retour if has_retour else None,
         'statut': statut,
@@ -193,6 +194,7 @@ def main():
                 responsable=pv_data['responsable'],
                 fournisseur=pv_data['fournisseur'],
                 materiel_type=pv_data['materiel_type'],
+                materiel_numero=pv_data['materiel_numero'],
                 date_reception=pv_data['date_reception'],
                 date_retour=pv_data['date_retour'],
                 statut=pv_data['statut'],
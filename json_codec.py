@@ -0,0 +1,157 @@
+"""
+Compression des colonnes JSON (pvs.data, pv_versions.data)
+
+Le JSON des formulaires est très répétitif (noms de champs, valeurs 'bon' / 'non'...).
+Avec JSON_COMPRESSION activé, il est stocké compressé dans la même colonne :
+- Valeur texte (str) : JSON en clair (lignes anciennes, compression désactivée, JSON court)
+- Valeur binaire (BLOB) : 1 octet de format (FORMAT_MARKERS) suivi du JSON UTF-8 compressé
+
+Les deux formes coexistent : la lecture reconnaît le format de chaque ligne.
+zlib fait partie de la bibliothèque standard ; zstd utilise compression.zstd (Python 3.14+)
+ou le paquet optionnel zstandard.
+"""
+
+import os
+import zlib
+
+try:
+    from compression import zstd as _zstd  # Python 3.14+
+
+    def _zstd_compress(raw, level):
+        return _zstd.compress(raw, level)
+
+    def _zstd_decompress(raw):
+        return _zstd.decompress(raw)
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def _zstd_compress(raw, level):
+            return _zstd.ZstdCompressor(level=level).compress(raw)
+
+        def _zstd_decompress(raw):
+            return _zstd.ZstdDecompressor().decompress(raw)
+    except ImportError:
+        _zstd = None
+
+# Configuration (surchargeable par variables d'environnement)
+# JSON_COMPRESSION : '' (désactivé, par défaut), 'zlib' ou 'zstd'
+JSON_COMPRESSION = os.environ.get('JSON_COMPRESSION', '').strip().lower()
+JSON_COMPRESSION_LEVEL = os.environ.get('JSON_COMPRESSION_LEVEL', '')
+JSON_COMPRESSION_MIN_BYTES = int(os.environ.get('JSON_COMPRESSION_MIN_BYTES', '256'))
+
+# Premier octet des valeurs binaires : algorithme utilisé
+FORMAT_MARKERS = {
+    'zlib': b'\x01',
+    'zstd': b'\x02',
+}
+DEFAULT_LEVELS = {
+    'zlib': 6,
+    'zstd': 3,
+}
+
+if JSON_COMPRESSION == 'zstd' and _zstd is None:
+    print("⚠️  JSON_COMPRESSION=zstd : module zstd indisponible (pip install zstandard), zlib utilisé")
+    JSON_COMPRESSION = 'zlib'
+elif JSON_COMPRESSION and JSON_COMPRESSION not in FORMAT_MARKERS:
+    print(f"⚠️  JSON_COMPRESSION={JSON_COMPRESSION} inconnu (zlib ou zstd), compression désactivée")
+    JSON_COMPRESSION = ''
+
+
+def compress_bytes(raw, algorithm, level=None):
+    """
+    Compresse des octets et ajoute le marqueur de format.
+
+    Args:
+        raw: Octets à compresser
+        algorithm: 'zlib' ou 'zstd'
+        level: Niveau de compression (niveau par défaut de l'algorithme si None)
+
+    Returns:
+        bytes: Marqueur + données compressées
+    """
+    level = DEFAULT_LEVELS[algorithm] if level is None else level
+    if algorithm == 'zstd':
+        if _zstd is None:
+            raise RuntimeError("Compression zstd indisponible (pip install zstandard)")
+        return FORMAT_MARKERS['zstd'] + _zstd_compress(raw, level)
+    return FORMAT_MARKERS['zlib'] + zlib.compress(raw, level)
+
+
+def encode_json_text(json_text, algorithm=None, level=None):
+    """
+    Valeur à stocker pour un texte JSON selon la configuration.
+
+    Args:
+        json_text: JSON sérialisé
+        algorithm: Algorithme (JSON_COMPRESSION si None, '' pour du texte en clair)
+        level: Niveau de compression (JSON_COMPRESSION_LEVEL si None)
+
+    Returns:
+        str ou bytes: Texte en clair, ou valeur compressée si elle est plus petite
+    """
+    algorithm = JSON_COMPRESSION if algorithm is None else algorithm
+    if json_text is None or not algorithm:
+        return json_text
+
+    raw = json_text.encode('utf-8')
+    if len(raw) < JSON_COMPRESSION_MIN_BYTES:
+        return json_text
+
+    if level is None and JSON_COMPRESSION_LEVEL:
+        level = int(JSON_COMPRESSION_LEVEL)
+    compressed = compress_bytes(raw, algorithm, level)
+    return compressed if len(compressed) < len(raw) else json_text
+
+
+def decode_json_text(value):
+    """
+    Texte JSON d'une valeur stockée (en clair ou compressée).
+
+    Args:
+        value: Valeur lue dans la colonne (str, bytes ou None)
+
+    Returns:
+        str: JSON sérialisé (None si la valeur est None)
+
+    Raises:
+        ValueError: Si le format binaire est inconnu ou l'algorithme indisponible
+    """
+    if value is None or isinstance(value, str):
+        return value
+
+    value = bytes(value)
+    marker, payload = value[:1], value[1:]
+    if marker == FORMAT_MARKERS['zlib']:
+        return zlib.decompress(payload).decode('utf-8')
+    if marker == FORMAT_MARKERS['zstd']:
+        if _zstd is None:
+            raise ValueError("Données compressées en zstd : module zstd indisponible (pip install zstandard)")
+        return _zstd_decompress(payload).decode('utf-8')
+    # BLOB sans marqueur : JSON UTF-8 brut
+    return value.decode('utf-8')
+
+
+def is_compressed(value):
+    """True si la valeur stockée est au format compressé."""
+    return isinstance(value, (bytes, memoryview)) and bytes(value[:1]) in FORMAT_MARKERS.values()
+
+
+def _sqlite_json_text(value):
+    """Fonction SQL pv_json : JSON en clair d'une colonne, NULL si illisible."""
+    try:
+        return decode_json_text(value)
+    except Exception:
+        return None
+
+
+def register_sqlite_functions(connection):
+    """
+    Déclare la fonction SQL pv_json(data) sur une connexion sqlite3 : les triggers de l'index
+    plein texte l'utilisent pour lire les observations dans un JSON éventuellement compressé.
+    À appeler sur toute connexion qui modifie la table pvs (application et scripts de migration).
+
+    Args:
+        connection: Connexion sqlite3
+    """
+    connection.create_function('pv_json', 1, _sqlite_json_text, deterministic=True)
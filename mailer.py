@@ -0,0 +1,381 @@
+"""
+Envoi des emails en arrière-plan depuis l'outbox persistante (table email_outbox)
+
+- La requête HTTP enregistre le message puis répond immédiatement
+- Un ou plusieurs threads d'envoi réutilisent leur connexion SMTP authentifiée
+  d'un message à l'autre (fermée après une période d'inactivité)
+- Échec temporaire : nouvel essai avec délai exponentiel ; échec définitif
+  (adresse refusée, erreur 5xx) : statut failed
+- Prise en charge atomique d'un message : plusieurs workers gunicorn peuvent
+  envoyer en parallèle sans doublon
+"""
+
+from datetime import datetime, timedelta
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import multiprocessing
+import os
+import random
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from setup_db import db, EmailOutbox, write_transactions, read_transactions
+
+# Configuration (surchargeable par variables d'environnement)
+MAIL_SENDER_ENABLED = os.environ.get('MAIL_SENDER_ENABLED', '1') == '1'
+MAIL_SENDER_THREADS = int(os.environ.get('MAIL_SENDER_THREADS', '1'))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', '6'))
+MAIL_BACKOFF_BASE = float(os.environ.get('MAIL_BACKOFF_BASE', '30'))
+MAIL_BACKOFF_MAX = float(os.environ.get('MAIL_BACKOFF_MAX', '3600'))
+MAIL_POLL_INTERVAL = float(os.environ.get('MAIL_POLL_INTERVAL', '5'))
+MAIL_IDLE_TIMEOUT = float(os.environ.get('MAIL_IDLE_TIMEOUT', '60'))
+MAIL_SMTP_TIMEOUT = float(os.environ.get('MAIL_SMTP_TIMEOUT', '30'))
+# Un message resté « sending » plus longtemps (processus arrêté en cours d'envoi) est repris
+MAIL_CLAIM_TIMEOUT = float(os.environ.get('MAIL_CLAIM_TIMEOUT', '300'))
+
+
+def smtp_settings(config):
+    """
+    Normalise la configuration SMTP (fichier config/smtp_config.json).
+
+    Clés optionnelles, utiles pour un serveur local de test :
+    - smtp_starttls (défaut : true, sauf port 465 qui utilise SSL direct)
+    - smtp_auth (défaut : true) ; false = pas de login
+
+    Returns:
+        dict: Paramètres de connexion
+    """
+    port = int(config.get('smtp_port', 587))
+    return {
+        'server': config.get('smtp_server', ''),
+        'port': port,
+        'username': config.get('smtp_username', ''),
+        'password': config.get('smtp_password', ''),
+        'from_name': config.get('smtp_from_name', 'Centrale Lyon Conseil'),
+        'from_address': config.get('smtp_from_address') or config.get('smtp_username', ''),
+        'ssl': port == 465,
+        'starttls': bool(config.get('smtp_starttls', port != 465)),
+        'auth': bool(config.get('smtp_auth', True))
+    }
+
+
+def is_configured(settings):
+    """Indique si l'envoi est possible avec ces paramètres."""
+    if not settings['server'] or not settings['from_address']:
+        return False
+    return not settings['auth'] or bool(settings['username'] and settings['password'])
+
+
+def enqueue_email(recipients, subject, body, attachment_name=None, attachment=None,
+                  pv_id=None, version_number=None):
+    """
+    Ajoute un message à l'outbox (dans la transaction en cours : valider avec db.session.commit()).
+
+    Args:
+        recipients: Liste d'adresses
+        subject: Sujet
+        body: Corps du message (texte)
+        attachment_name: Nom du fichier joint
+        attachment: Contenu du PDF
+        pv_id: PV concerné
+        version_number: Version du PV envoyée
+
+    Returns:
+        EmailOutbox: Entrée créée
+    """
+    entry = EmailOutbox(
+        pv_id=pv_id,
+        version_number=version_number,
+        recipients=','.join(recipients),
+        subject=subject,
+        body=body,
+        attachment_name=attachment_name,
+        attachment=attachment,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(entry)
+    return entry
+
+
+def build_message(entry, settings):
+    """Construit le message MIME d'une entrée de l'outbox."""
+    msg = MIMEMultipart()
+    msg['From'] = f"{settings['from_name']} <{settings['from_address']}>"
+    msg['To'] = ', '.join(r for r in entry.recipients.split(',') if r)
+    msg['Subject'] = entry.subject
+    msg.attach(MIMEText(entry.body, 'plain', 'utf-8'))
+
+    if entry.attachment:
+        pdf_attachment = MIMEApplication(entry.attachment, _subtype='pdf')
+        pdf_attachment.add_header('Content-Disposition', 'attachment', filename=entry.attachment_name)
+        msg.attach(pdf_attachment)
+    return msg
+
+
+def is_permanent_error(error):
+    """Erreur définitive : inutile de réessayer (adresses refusées, réponse 5xx hors authentification)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False  # Identifiants corrigeables depuis l'interface
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def backoff_delay(attempts):
+    """Délai avant le prochain essai (exponentiel, plafonné, avec une légère gigue)."""
+    delay = min(MAIL_BACKOFF_MAX, MAIL_BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.9, 1.1)
+
+
+class SMTPSession:
+    """
+    Connexion SMTP authentifiée réutilisée d'un message à l'autre.
+    Reconnexion si les paramètres changent, si le serveur a fermé la connexion
+    ou après MAIL_IDLE_TIMEOUT secondes d'inactivité.
+    """
+
+    def __init__(self, stats):
+        self._conn = None
+        self._key = None
+        self._last_used = 0
+        self._stats = stats
+
+    def get(self, settings):
+        key = tuple(sorted(settings.items()))
+        if self._conn is not None:
+            idle = time.monotonic() - self._last_used
+            if key != self._key or idle > MAIL_IDLE_TIMEOUT:
+                self.close()
+            else:
+                try:
+                    self._conn.noop()
+                    self._stats['connections_reused'] += 1
+                    return self._conn
+                except smtplib.SMTPException:
+                    self.close()
+                except OSError:
+                    self.close()
+
+        if settings['ssl']:
+            conn = smtplib.SMTP_SSL(settings['server'], settings['port'], timeout=MAIL_SMTP_TIMEOUT,
+                                    context=ssl.create_default_context())
+        else:
+            conn = smtplib.SMTP(settings['server'], settings['port'], timeout=MAIL_SMTP_TIMEOUT)
+            if settings['starttls']:
+                conn.starttls(context=ssl.create_default_context())
+        try:
+            if settings['auth']:
+                conn.login(settings['username'], settings['password'])
+        except Exception:
+            conn.close()
+            raise
+
+        self._conn = conn
+        self._key = key
+        self._stats['connections_opened'] += 1
+        return conn
+
+    def touch(self):
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._conn is not None and time.monotonic() - self._last_used > MAIL_IDLE_TIMEOUT:
+            self.close()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+        self._conn = None
+        self._key = None
+
+
+class MailSender:
+    """Threads d'envoi de l'outbox (un par connexion SMTP)."""
+
+    def __init__(self, app, config_loader, threads=MAIL_SENDER_THREADS):
+        self.app = app
+        self.config_loader = config_loader
+        self.threads = max(1, threads)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'sent': 0,
+            'retried': 0,
+            'failed': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'last_error': None
+        }
+
+    def start(self):
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._run, name=f'mail-sender-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"📧 Envoi des emails en arrière-plan : {self.threads} thread(s)")
+
+    def notify(self):
+        """Réveille les threads d'envoi (message ajouté à l'outbox)."""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _claim(self, token):
+        """
+        Prend en charge le prochain message dû, en une seule requête UPDATE (atomique sous SQLite).
+
+        Returns:
+            EmailOutbox ou None
+        """
+        now = datetime.utcnow()
+        result = db.session.execute(text("""
+            UPDATE email_outbox
+            SET status = 'sending', claimed_by = :token, claimed_at = :now, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= :now)
+                   OR (status = 'sending' AND claimed_at < :stale)
+                ORDER BY next_attempt_at, id
+                LIMIT 1
+            )
+        """), {'token': token, 'now': now, 'stale': now - timedelta(seconds=MAIL_CLAIM_TIMEOUT)})
+        db.session.commit()
+        if not result.rowcount:
+            return None
+        # Lecture sans verrou d'écriture : la transaction est terminée avant l'envoi (voir _deliver)
+        with read_transactions():
+            return EmailOutbox.query.filter_by(claimed_by=token, status='sending').first()
+
+    def _deliver(self, entry, session):
+        """
+        Envoie une entrée et enregistre le résultat.
+        Aucune transaction n'est ouverte pendant l'échange SMTP (jusqu'à MAIL_SMTP_TIMEOUT secondes) :
+        le résultat est enregistré ensuite dans une transaction d'écriture courte.
+        """
+        settings = smtp_settings(self.config_loader())
+        recipients = [r for r in entry.recipients.split(',') if r]
+        message = build_message(entry, settings) if is_configured(settings) else None
+        db.session.commit()
+        try:
+            if message is None:
+                raise RuntimeError("Configuration email non configurée")
+            conn = session.get(settings)
+            conn.send_message(message, to_addrs=recipients)
+            session.touch()
+        except Exception as e:
+            session.close()
+            permanent = is_permanent_error(e) or entry.attempts >= MAIL_MAX_ATTEMPTS
+            entry.last_error = f"{type(e).__name__}: {e}"
+            entry.claimed_by = None
+            if permanent:
+                entry.status = 'failed'
+            else:
+                entry.status = 'pending'
+                entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_delay(entry.attempts))
+            db.session.commit()
+            with self._lock:
+                self._stats['failed' if permanent else 'retried'] += 1
+                self._stats['last_error'] = entry.last_error
+            print(f"❌ Email {entry.id} ({', '.join(recipients)}) : {entry.last_error}"
+                  f"{'' if permanent else f' — nouvel essai à {entry.next_attempt_at:%H:%M:%S}'}")
+            return
+
+        now = datetime.utcnow()
+        entry.status = 'sent'
+        entry.date_envoi = now
+        entry.last_error = None
+        entry.claimed_by = None
+        if entry.pv_id:
+            # Requête directe : ne pas modifier date_mise_a_jour du PV
+            db.session.execute(text("UPDATE pvs SET date_dernier_envoi = :now WHERE id = :pv_id"),
+                               {'now': now, 'pv_id': entry.pv_id})
+        db.session.commit()
+        with self._lock:
+            self._stats['sent'] += 1
+        print(f"✅ Email {entry.id} envoyé à {', '.join(recipients)}")
+
+    def _run(self):
+        token_prefix = f"{os.getpid()}-{threading.get_ident()}"
+        session = SMTPSession(self._stats)
+        # Écritures du thread (prise en charge, résultat) en BEGIN IMMEDIATE ; la lecture de l'entrée
+        # prise en charge est en BEGIN simple et terminée avant l'échange SMTP
+        with self.app.app_context(), write_transactions():
+            while not self._stop.is_set():
+                entry = None
+                try:
+                    entry = self._claim(f"{token_prefix}-{uuid.uuid4().hex[:8]}")
+                    if entry is not None:
+                        self._deliver(entry, session)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Erreur du thread d'envoi des emails: {e}")
+                    self._stop.wait(MAIL_POLL_INTERVAL)
+                finally:
+                    db.session.remove()
+
+                if entry is None:
+                    session.close_if_idle()
+                    self._wake.wait(MAIL_POLL_INTERVAL)
+                    self._wake.clear()
+            session.close()
+
+    def stats(self):
+        """
+        Retourne l'état de l'outbox et les compteurs d'envoi.
+
+        Returns:
+            dict: Messages par statut, envois, réessais, connexions ouvertes / réutilisées
+        """
+        counts = dict(db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+                      .group_by(EmailOutbox.status).all())
+        with self._lock:
+            return {
+                'threads': self.threads,
+                'outbox': {status: counts.get(status, 0) for status in ('pending', 'sending', 'sent', 'failed')},
+                **self._stats
+            }
+
+
+_sender = None
+
+
+def start_mail_sender(app, config_loader):
+    """
+    Démarre l'envoi en arrière-plan (une fois par processus).
+    Non démarré dans les processus enfants de multiprocessing (pool de rendu PDF).
+
+    Returns:
+        MailSender ou None si désactivé
+    """
+    global _sender
+    if _sender is None and MAIL_SENDER_ENABLED and multiprocessing.parent_process() is None:
+        _sender = MailSender(app, config_loader)
+        _sender.start()
+    return _sender
+
+
+def get_mail_sender():
+    """Retourne l'instance démarrée (None si l'envoi en arrière-plan est désactivé)."""
+    return _sender
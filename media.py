@@ -0,0 +1,543 @@
+"""
+Traitement des images (photos d'inspection et signatures) avant génération PDF
+
+- Photos : le JPEG reste du JPEG. Décodage en mode « draft » (réduction directe
+  par le décodeur), orientation EXIF appliquée, réencodage seulement si nécessaire
+- Signatures : PNG en palette de gris (ou 1 bit), fond blanc
+- Les images d'une même soumission sont traitées en parallèle (Pillow libère le GIL)
+- Photos envoyées en binaire (multipart) : lues depuis le fichier temporaire de Werkzeug,
+  sans copie Base64 ; la mémoire des images décodées d'une requête est plafonnée
+  (MEDIA_REQUEST_MEMORY_MB), les photos en data URI restent acceptées
+- Chaque image produit ses métriques : octets en entrée / sortie, durée
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from contextlib import contextmanager, nullcontext
+import base64
+import binascii
+import hashlib
+import io
+import os
+import threading
+import time
+
+# Configuration (surchargeable par variables d'environnement)
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', str(min(4, os.cpu_count() or 1))))
+MEDIA_PHOTO_MAX_SIZE = int(os.environ.get('MEDIA_PHOTO_MAX_SIZE', '800'))
+MEDIA_PHOTO_QUALITY = int(os.environ.get('MEDIA_PHOTO_QUALITY', '80'))
+MEDIA_SIGNATURE_MAX_WIDTH = int(os.environ.get('MEDIA_SIGNATURE_MAX_WIDTH', '400'))
+# 2 couleurs = PNG 1 bit, sinon palette de niveaux de gris (traits anti-crénelés)
+MEDIA_SIGNATURE_COLORS = int(os.environ.get('MEDIA_SIGNATURE_COLORS', '16'))
+# Plafond de la mémoire des images en cours de traitement pour une requête
+MEDIA_REQUEST_MEMORY_MB = int(os.environ.get('MEDIA_REQUEST_MEMORY_MB', '64'))
+
+SIGNATURE_FIELDS = ('signature_reception', 'signature_retour')
+
+# Postes d'inspection pouvant recevoir des photos (photo_<poste>_<n> dans le formulaire)
+PHOTO_BASE_FIELDS = ['carrosserie_reception', 'carrosserie_retour',
+                     'eclairage_reception', 'eclairage_retour',
+                     'pneumatiques_reception', 'pneumatiques_retour',
+                     'panier_reception', 'panier_retour',
+                     'flexibles_reception', 'flexibles_retour',
+                     'commandes_reception', 'commandes_retour',
+                     'conformite_reception', 'conformite_retour',
+                     'mobilites_reception', 'mobilites_retour',
+                     'nacelles_reception', 'nacelles_retour',
+                     'securite_reception', 'securite_retour',
+                     'fuite_reception', 'fuite_retour',
+                     'carburant_reception', 'carburant_retour',
+                     'observation_reception', 'observation_retour']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Pool de threads partagé par les requêtes du processus (créé à la demande)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, MEDIA_WORKERS),
+                                           thread_name_prefix='media')
+        return _executor
+
+
+def decode_data_uri(data_uri):
+    """
+    Décode une image data:image/...;base64,...
+
+    Args:
+        data_uri: Chaîne data URI (ou Base64 brut)
+
+    Returns:
+        tuple: (type MIME, octets de l'image)
+    """
+    mime = ''
+    encoded = data_uri
+    if ',' in data_uri:
+        header, encoded = data_uri.split(',', 1)
+        if header.startswith('data:'):
+            mime = header[5:].split(';', 1)[0]
+    return mime, base64.b64decode(encoded)
+
+
+def encode_data_uri(mime, data):
+    """Encode des octets d'image en data URI Base64."""
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+class PhotoUpload:
+    """
+    Photo reçue en binaire (partie multipart), lue depuis le flux de Werkzeug
+    (fichier temporaire au-delà de 500 Ko) sans être chargée en mémoire.
+    L'empreinte SHA-256 est calculée par blocs à la réception : elle identifie la photo
+    dans la clé du cache PDF (str) à la place de son contenu.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, upload):
+        """
+        Args:
+            upload: FileStorage de request.files
+        """
+        self.stream = upload.stream
+        self.mimetype = upload.mimetype or 'image/jpeg'
+        digest = hashlib.sha256()
+        self.size = 0
+        self.stream.seek(0)
+        for chunk in iter(lambda: self.stream.read(self.CHUNK_SIZE), b''):
+            digest.update(chunk)
+            self.size += len(chunk)
+        self.stream.seek(0)
+        self.sha256 = digest.hexdigest()
+
+    def open(self):
+        """Flux positionné au début de la photo."""
+        self.stream.seek(0)
+        return self.stream
+
+    def read(self):
+        return self.open().read()
+
+    def to_data_uri(self):
+        """Photo d'origine en data URI (stockage sans traitement)."""
+        return encode_data_uri(self.mimetype, self.read())
+
+    def __str__(self):
+        return f'upload:{self.sha256}'
+
+
+class MemoryBudget:
+    """
+    Plafond de mémoire partagé par les images d'une requête traitées en parallèle.
+    Une image attend que les précédentes aient libéré leur part ; une image plus grosse
+    que le plafond est traitée seule.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = max(1, limit_bytes)
+        self.used = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, amount):
+        amount = min(amount, self.limit)
+        with self._cond:
+            if self.used + amount > self.limit:
+                self.waits += 1
+            self._cond.wait_for(lambda: self.used + amount <= self.limit)
+            self.used += amount
+            self.peak = max(self.peak, self.used)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.used -= amount
+                self._cond.notify_all()
+
+
+def _pixel_bytes(image):
+    """Taille du tampon de pixels décodé (au moins 3 octets par pixel : conversion RGB)."""
+    return image.size[0] * image.size[1] * max(3, len(image.getbands()))
+
+
+def _exif_orientation(image):
+    """Retourne l'orientation EXIF (1 = aucune rotation)."""
+    try:
+        return image.getexif().get(0x0112, 1) or 1
+    except Exception:
+        return 1
+
+
+def process_photo(source, max_size=MEDIA_PHOTO_MAX_SIZE, quality=MEDIA_PHOTO_QUALITY, budget=None):
+    """
+    Prépare une photo d'inspection pour le PDF.
+
+    Un JPEG déjà assez petit et correctement orienté est conservé tel quel,
+    sans décodage complet ni réencodage.
+
+    Args:
+        source: Photo au format data URI, ou PhotoUpload (envoi binaire, lu en flux)
+        max_size: Plus grand côté autorisé en pixels
+        quality: Qualité JPEG en cas de réencodage
+        budget: MemoryBudget de la requête (None = pas de plafond)
+
+    Returns:
+        tuple: (data URI résultante, métriques dict)
+    """
+    start = time.perf_counter()
+    if isinstance(source, PhotoUpload):
+        mime, raw, size_in = source.mimetype, None, source.size
+        image = Image.open(source.open())
+    else:
+        mime, raw = decode_data_uri(source)
+        size_in = len(raw)
+        image = Image.open(io.BytesIO(raw))
+    format_in = image.format or mime
+    orientation = _exif_orientation(image)
+
+    def original():
+        """Photo d'origine : (data URI, octets)."""
+        if raw is not None:
+            return source, raw
+        data = source.read()
+        return encode_data_uri(Image.MIME.get(image.format, mime), data), data
+
+    if (image.format == 'JPEG' and max(image.size) <= max_size and orientation == 1):
+        with budget.reserve(size_in * 2) if budget else nullcontext():
+            output_uri, data_out = original()
+        action = 'conservée'
+    else:
+        if image.format == 'JPEG':
+            # Le décodeur JPEG réduit directement par 1/2, 1/4 ou 1/8
+            image.draft('RGB', (max_size, max_size))
+
+        # Pixels décodés (deux copies au plus : rotation EXIF, conversion) et photo d'origine
+        with budget.reserve(size_in + 2 * _pixel_bytes(image)) if budget else nullcontext():
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+            data_out = output.getvalue()
+            action = 'réencodée'
+
+            if format_in == 'JPEG' and orientation == 1 and len(data_out) >= size_in:
+                # Redimensionnement sans gain : garder l'original
+                (output_uri, data_out), action = original(), 'conservée'
+            else:
+                output_uri = encode_data_uri('image/jpeg', data_out)
+
+    return output_uri, {
+        'kind': 'photo',
+        'source': 'binaire' if raw is None else 'base64',
+        'format_in': format_in,
+        'format_out': 'JPEG' if action == 'réencodée' else format_in,
+        'action': action,
+        'bytes_in': size_in,
+        'bytes_out': len(data_out),
+        'time': round(time.perf_counter() - start, 4)
+    }
+
+
+def process_signature(data_uri, max_width=MEDIA_SIGNATURE_MAX_WIDTH, colors=MEDIA_SIGNATURE_COLORS):
+    """
+    Convertit une signature (canvas PNG) en PNG palette sur fond blanc.
+
+    Args:
+        data_uri: Signature au format data URI
+        max_width: Largeur maximale en pixels
+        colors: Nombre de niveaux de gris (2 = PNG 1 bit)
+
+    Returns:
+        tuple: (data URI résultante, métriques dict)
+    """
+    start = time.perf_counter()
+    mime, raw = decode_data_uri(data_uri)
+    image = Image.open(io.BytesIO(raw))
+    format_in = image.format or mime
+
+    if image.width > max_width:
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_width, image.height))
+        ratio = max_width / image.width
+        image = image.resize((max_width, max(1, int(image.height * ratio))), Image.Resampling.LANCZOS)
+
+    # Le canvas est transparent : aplatir sur blanc puis passer en niveaux de gris
+    rgba = image.convert('RGBA')
+    background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+    gray = Image.alpha_composite(background, rgba).convert('L')
+
+    if colors <= 2:
+        image = gray.point(lambda value: 255 if value > 160 else 0, mode='1')
+    else:
+        image = gray.quantize(colors=colors)
+
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    data_out = output.getvalue()
+
+    return encode_data_uri('image/png', data_out), {
+        'kind': 'signature',
+        'format_in': format_in,
+        'format_out': 'PNG-1' if colors <= 2 else f'PNG-P{colors}',
+        'action': 'réencodée',
+        'bytes_in': len(raw),
+        'bytes_out': len(data_out),
+        'time': round(time.perf_counter() - start, 4)
+    }
+
+
+def _safe_process(process_fn, source):
+    """Exécute un traitement ; en cas d'image illisible, l'original est conservé."""
+    try:
+        return process_fn(source)
+    except (OSError, ValueError, binascii.Error, Image.DecompressionBombError) as e:
+        print(f"Erreur lors du traitement de l'image: {e}")
+        if isinstance(source, PhotoUpload):
+            source = source.to_data_uri()
+        return source, {
+            'kind': 'signature' if process_fn is process_signature else 'photo',
+            'action': 'erreur',
+            'error': str(e),
+            'bytes_in': len(source),
+            'bytes_out': len(source),
+            'time': 0
+        }
+
+
+def optimize_form_images(form_data, photo_fields):
+    """
+    Traite en parallèle toutes les photos et signatures d'une soumission.
+    form_data est modifié en place : les photos reçues en binaire deviennent des data URI.
+
+    Args:
+        form_data: Données du formulaire (photo_<poste> = liste de data URI ou PhotoUpload)
+        photo_fields: Postes d'inspection (sans le préfixe photo_)
+
+    Returns:
+        dict: Rapport (nombre d'images, octets en entrée / sortie, durée, pic mémoire, détail par image)
+    """
+    start = time.perf_counter()
+    budget = MemoryBudget(MEDIA_REQUEST_MEMORY_MB * 1024 * 1024)
+    photo_fn = lambda source: process_photo(source, budget=budget)
+    tasks = []  # (clé, index dans la liste ou None, traitement, data URI ou PhotoUpload)
+
+    for key in SIGNATURE_FIELDS:
+        if form_data.get(key):
+            tasks.append((key, None, process_signature, form_data[key]))
+
+    for field in photo_fields:
+        photo_key = f'photo_{field}'
+        photos = [photo for photo in (form_data.get(photo_key) or []) if photo]
+        form_data[photo_key] = photos
+        for index, photo in enumerate(photos):
+            tasks.append((photo_key, index, photo_fn, photo))
+
+    if len(tasks) > 1:
+        executor = _get_executor()
+        results = list(executor.map(lambda task: _safe_process(task[2], task[3]), tasks))
+    else:
+        results = [_safe_process(task[2], task[3]) for task in tasks]
+
+    images = []
+    for (key, index, _, _), (data_uri, metrics) in zip(tasks, results):
+        if index is None:
+            form_data[key] = data_uri
+        else:
+            form_data[key][index] = data_uri
+        metrics['field'] = key if index is None else f'{key}[{index}]'
+        images.append(metrics)
+
+    report = {
+        'count': len(images),
+        'bytes_in': sum(m['bytes_in'] for m in images),
+        'bytes_out': sum(m['bytes_out'] for m in images),
+        'time': round(time.perf_counter() - start, 4),
+        'memory_peak': budget.peak,
+        'memory_waits': budget.waits,
+        'images': images
+    }
+    if images:
+        print(f"🖼️ {report['count']} image(s) : {report['bytes_in'] / 1024:.0f} Ko → "
+              f"{report['bytes_out'] / 1024:.0f} Ko en {report['time'] * 1000:.0f} ms")
+    return report
+
+
+def resolve_uploads(form_data, photo_fields):
+    """
+    Remplace les photos reçues en binaire et non traitées (PDF servi depuis le cache)
+    par leur data URI d'origine, avant l'enregistrement du PV.
+
+    Args:
+        form_data: Données du formulaire (modifiées en place)
+        photo_fields: Postes d'inspection (sans le préfixe photo_)
+    """
+    for field in photo_fields:
+        photos = form_data.get(f'photo_{field}') or []
+        for index, photo in enumerate(photos):
+            if isinstance(photo, PhotoUpload):
+                photos[index] = photo.to_data_uri()
+
+
+def _legacy_optimize(data_uri):
+    """Ancien traitement (optimize_signature) : PNG optimisé, 400 px de large, en série."""
+    _, raw = decode_data_uri(data_uri)
+    image = Image.open(io.BytesIO(raw))
+    if image.width > 400:
+        ratio = 400 / image.width
+        image = image.resize((400, int(image.height * ratio)), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format='PNG', optimize=True)
+    return encode_data_uri('image/png', output.getvalue())
+
+
+def compare_pipelines(photo_count=12):
+    """
+    Compare l'ancien traitement et le pipeline actuel sur une soumission type
+    (photos JPEG 800x600 issues du navigateur, une photo 3000x4000 orientée EXIF, 2 signatures).
+
+    Returns:
+        dict: Durée et taille totale des images pour chaque traitement
+    """
+    from PIL import ImageDraw, ImageFilter
+
+    def jpeg_uri(image, quality=85, exif=None):
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=quality, **({'exif': exif} if exif else {}))
+        return encode_data_uri('image/jpeg', output.getvalue())
+
+    def sample_photo(size):
+        base = Image.linear_gradient('L').resize(size).convert('RGB')
+        noise = Image.effect_noise(size, 24).convert('RGB').filter(ImageFilter.GaussianBlur(1))
+        return Image.blend(base, noise, 0.4)
+
+    fields = ['carrosserie_reception', 'eclairage_reception', 'pneumatiques_retour', 'panier_retour']
+    form_data = {}
+    for i in range(photo_count):
+        form_data.setdefault(f'photo_{fields[i % len(fields)]}', []).append(jpeg_uri(sample_photo((800, 600))))
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Photo prise en portrait, à pivoter de 90°
+    form_data[f'photo_{fields[0]}'].append(jpeg_uri(sample_photo((4000, 3000)), quality=92, exif=exif.tobytes()))
+
+    for key in SIGNATURE_FIELDS:
+        signature = Image.new('RGBA', (600, 200), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(signature)
+        draw.line([(20, 150), (120, 40), (220, 160), (340, 50), (560, 140)], fill=(0, 0, 0, 255), width=4)
+        output = io.BytesIO()
+        signature.save(output, format='PNG')
+        form_data[key] = encode_data_uri('image/png', output.getvalue())
+
+    def total_bytes(data):
+        values = [data[k] for k in SIGNATURE_FIELDS]
+        values += [photo for f in fields for photo in data[f'photo_{f}']]
+        return sum(len(decode_data_uri(v)[1]) for v in values)
+
+    bytes_in = total_bytes(form_data)
+
+    legacy = {key: (list(value) if isinstance(value, list) else value) for key, value in form_data.items()}
+    start = time.perf_counter()
+    for key in SIGNATURE_FIELDS:
+        legacy[key] = _legacy_optimize(legacy[key])
+    for field in fields:
+        legacy[f'photo_{field}'] = [_legacy_optimize(photo) for photo in legacy[f'photo_{field}']]
+    legacy_time = time.perf_counter() - start
+
+    _get_executor()  # Création du pool hors mesure
+    current = {key: (list(value) if isinstance(value, list) else value) for key, value in form_data.items()}
+    report = optimize_form_images(current, fields)
+
+    results = {
+        'images': report['count'],
+        'bytes_in': bytes_in,
+        'avant': {'time': round(legacy_time, 3), 'bytes_out': total_bytes(legacy)},
+        'apres': {'time': report['time'], 'bytes_out': report['bytes_out']}
+    }
+
+    print(f"📷 {results['images']} images, {bytes_in / 1024:.0f} Ko en entrée")
+    for label in ('avant', 'apres'):
+        print(f"   {label:6} : {results[label]['time'] * 1000:7.0f} ms, "
+              f"{results[label]['bytes_out'] / 1024:7.0f} Ko en sortie")
+    for metrics in report['images']:
+        print(f"   - {metrics['field']:35} {metrics['action']:10} "
+              f"{metrics['bytes_in'] / 1024:6.0f} Ko → {metrics['bytes_out'] / 1024:6.0f} Ko "
+              f"en {metrics['time'] * 1000:5.1f} ms")
+    return results
+
+
+def compare_upload_sources(photo_count=8):
+    """
+    Compare la mémoire Python d'une soumission dont les photos arrivent en data URI Base64
+    (champs de formulaire) ou en binaire (parties multipart écrites par Werkzeug dans un
+    fichier temporaire au-delà de 500 Ko). Mesure tracemalloc : chaînes et octets Python,
+    hors tampons de pixels Pillow (plafonnés par MEDIA_REQUEST_MEMORY_MB).
+
+    Returns:
+        dict: Pic mémoire (octets) et durée pour chaque mode d'envoi
+    """
+    import tempfile
+    import tracemalloc
+    from werkzeug.datastructures import FileStorage
+
+    base = Image.effect_noise((3000, 2000), 40).convert('RGB')
+    output = io.BytesIO()
+    base.save(output, format='JPEG', quality=90)
+    photo = output.getvalue()
+    del base, output
+
+    def base64_form():
+        return {'photo_carrosserie_reception': [encode_data_uri('image/jpeg', photo) for _ in range(photo_count)]}
+
+    def binary_form():
+        uploads = []
+        for _ in range(photo_count):
+            stream = tempfile.SpooledTemporaryFile(max_size=500 * 1024, mode='w+b')
+            stream.write(photo)
+            uploads.append(PhotoUpload(FileStorage(stream, 'photo.jpg', content_type='image/jpeg')))
+        return {'photo_carrosserie_reception': uploads}
+
+    _get_executor()  # Création du pool hors mesure
+    results = {'photos': photo_count, 'bytes_in': len(photo) * photo_count}
+    for label, build in (('base64', base64_form), ('binaire', binary_form)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        form_data = build()
+        report = optimize_form_images(form_data, ['carrosserie_reception'])
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[label] = {'peak': peak, 'time': round(elapsed, 3), 'bytes_out': report['bytes_out']}
+        del form_data
+
+    print(f"📷 {photo_count} photos 3000x2000, {results['bytes_in'] / 1024:.0f} Ko en entrée")
+    for label in ('base64', 'binaire'):
+        print(f"   {label:8} : pic mémoire Python {results[label]['peak'] / 1024 / 1024:6.1f} Mo, "
+              f"{results[label]['time'] * 1000:6.0f} ms, {results[label]['bytes_out'] / 1024:5.0f} Ko en sortie")
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Comparaison des traitements d\'images')
+    parser.add_argument('--uploads', action='store_true',
+                        help='Comparer la mémoire des envois Base64 et binaires')
+    args = parser.parse_args()
+
+    if args.uploads:
+        compare_upload_sources()
+    else:
+        compare_pipelines()
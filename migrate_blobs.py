@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Script de migration : Externaliser les photos et signatures dans la table blobs
+
+Les images (data URI Base64) stockées dans pvs.data et pv_versions.data sont
+remplacées par des références blob:<sha256>. Une image identique (même PV sur
+plusieurs versions, ou plusieurs PV) n'est stockée qu'une seule fois.
+"""
+
+import sqlite3
+import json
+from datetime import datetime
+from pathlib import Path
+
+from setup_db import extract_blobs, collect_blob_refs, search_index_rebuild_statements
+from json_codec import encode_json_text, decode_json_text, register_sqlite_functions
+
+DB_PATH = Path(__file__).parent / 'instance' / 'pvs.db'
+
+
+def format_size(size):
+    """Formate une taille en octets pour l'affichage."""
+    for unit in ('o', 'Ko', 'Mo', 'Go'):
+        if size < 1024 or unit == 'Go':
+            return f"{size:.1f} {unit}" if unit != 'o' else f"{size} {unit}"
+        size /= 1024
+
+
+def migrate():
+    print("🔄 Migration : Externalisation des images dans la table blobs...")
+
+    size_before = DB_PATH.stat().st_size
+    conn = sqlite3.connect(DB_PATH)
+    register_sqlite_functions(conn)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash VARCHAR(64) PRIMARY KEY,
+                mime VARCHAR(100) NOT NULL,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                date_creation DATETIME NOT NULL
+            )
+        """)
+
+        blob_bytes_before = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        json_before = 0
+        json_after = 0
+        images_found = 0
+        rows_updated = 0
+
+        for table in ('pvs', 'pv_versions'):
+            cursor.execute(f"SELECT rowid, data FROM {table}")
+            for rowid, stored in cursor.fetchall():
+                data = decode_json_text(stored)
+                json_before += len(data.encode('utf-8'))
+                try:
+                    data_dict = json.loads(data)
+                except (json.JSONDecodeError, TypeError):
+                    json_after += len(data.encode('utf-8'))
+                    continue
+
+                data_dict, blobs = extract_blobs(data_dict)
+                if not blobs:
+                    json_after += len(data.encode('utf-8'))
+                    continue
+
+                images_found += len(blobs)
+                for digest, (mime, raw) in blobs.items():
+                    conn.execute(
+                        "INSERT OR IGNORE INTO blobs (hash, mime, size, data, date_creation) VALUES (?, ?, ?, ?, ?)",
+                        (digest, mime, len(raw), raw, datetime.utcnow())
+                    )
+
+                new_data = json.dumps(data_dict, ensure_ascii=False)
+                json_after += len(new_data.encode('utf-8'))
+                conn.execute(f"UPDATE {table} SET data = ? WHERE rowid = ?", (encode_json_text(new_data), rowid))
+                rows_updated += 1
+
+        # Supprimer les images qui ne sont plus référencées (PV supprimés)
+        referenced = set()
+        for table in ('pvs', 'pv_versions'):
+            for (data,) in conn.execute(f"SELECT data FROM {table}"):
+                try:
+                    collect_blob_refs(json.loads(decode_json_text(data)), referenced)
+                except (json.JSONDecodeError, TypeError, ValueError):
+                    pass
+        orphans = [row[0] for row in conn.execute("SELECT hash FROM blobs") if row[0] not in referenced]
+        conn.executemany("DELETE FROM blobs WHERE hash = ?", [(h,) for h in orphans])
+
+        conn.commit()
+
+        blob_count, blob_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+
+        # Rendre l'espace libéré au système de fichiers
+        conn.execute("VACUUM")
+
+        # VACUUM peut renuméroter les rowid de pvs, utilisés par l'index plein texte
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pvs_fts'").fetchone():
+            for statement in search_index_rebuild_statements():
+                conn.execute(statement)
+            conn.commit()
+        size_after = DB_PATH.stat().st_size
+
+        print("✅ Migration terminée avec succès !")
+        print(f"   - {rows_updated} ligne(s) réécrite(s) (PV et versions)")
+        print(f"   - {images_found} image(s) rencontrée(s), {blob_count} image(s) unique(s) en base")
+        if orphans:
+            print(f"   - {len(orphans)} image(s) orpheline(s) supprimée(s)")
+
+        print("\n📊 Espace récupéré :")
+        print(f"   JSON (pvs + pv_versions) : {format_size(json_before)} → {format_size(json_after)}")
+        print(f"   Table blobs              : {format_size(blob_bytes_before)} → {format_size(blob_bytes)}")
+        print(f"   Total données            : {format_size(json_before + blob_bytes_before)} → "
+              f"{format_size(json_after + blob_bytes)}")
+        print(f"   Fichier pvs.db           : {format_size(size_before)} → {format_size(size_after)} "
+              f"({format_size(max(0, size_before - size_after))} récupérés)")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erreur lors de la migration : {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    migrate()
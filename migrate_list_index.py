@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Script de migration : Index composite pour la pagination de /list-pv
+
+/list-pv trie par (date_mise_a_jour DESC, id DESC) et reprend chaque page après
+le curseur (date_mise_a_jour, id) < (?, ?). L'index composite permet à SQLite de
+se positionner directement sur le curseur au lieu de parcourir les pages précédentes.
+"""
+
+import sqlite3
+from pathlib import Path
+
+DB_PATH = Path(__file__).parent / 'instance' / 'pvs.db'
+
+LIST_QUERY = """
+    SELECT id FROM pvs
+    WHERE (date_mise_a_jour, id) < (?, ?)
+    ORDER BY date_mise_a_jour DESC, id DESC
+    LIMIT 51
+"""
+
+
+def migrate():
+    if not DB_PATH.exists():
+        print(f"❌ Erreur : La base de données {DB_PATH} n'existe pas.")
+        return False
+
+    print(f"📦 Migration de l'index de pagination : {DB_PATH}")
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        existing = {row[1] for row in conn.execute("PRAGMA index_list(pvs)")}
+        if 'ix_pvs_date_mise_a_jour_id' in existing:
+            print("ℹ️  L'index 'ix_pvs_date_mise_a_jour_id' existe déjà")
+        else:
+            print("➕ Création de l'index 'ix_pvs_date_mise_a_jour_id'...")
+            conn.execute("CREATE INDEX ix_pvs_date_mise_a_jour_id ON pvs (date_mise_a_jour, id)")
+            conn.execute("ANALYZE pvs")
+            conn.commit()
+            print("✅ Index créé")
+
+        # Vérifier que la requête de pagination utilise bien l'index
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {LIST_QUERY}", ('9999-12-31', '')).fetchall()
+        print("\n📊 Plan de la requête de pagination :")
+        for row in plan:
+            print(f"   {row[-1]}")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erreur lors de la migration : {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Script de migration : Colonne materiel_numero et remplissage des colonnes de la liste
+
+/list-pv ne lit plus la colonne JSON (data) : tous les champs affichés dans la
+liste doivent être présents dans les colonnes SQL. Ce script ajoute la colonne
+indexée materiel_numero et la remplit, ainsi que les colonnes indexées restées
+vides, à partir du form_data de chaque PV.
+"""
+
+import sqlite3
+import json
+from pathlib import Path
+
+from setup_db import PV
+from json_codec import decode_json_text, register_sqlite_functions
+
+DB_PATH = Path(__file__).parent / 'instance' / 'pvs.db'
+
+# Colonnes pour lesquelles /list-pv se rabattait sur form_data quand elles étaient vides
+FALLBACK_COLUMNS = (
+    'conducteur_email', 'responsable', 'fournisseur', 'materiel_type',
+    'date_reception', 'date_retour',
+)
+
+
+def migrate():
+    if not DB_PATH.exists():
+        print(f"❌ Erreur : La base de données {DB_PATH} n'existe pas.")
+        return False
+
+    print(f"📦 Migration materiel_numero de la base de données : {DB_PATH}")
+
+    conn = sqlite3.connect(DB_PATH)
+    register_sqlite_functions(conn)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(pvs)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'materiel_numero' not in columns:
+            print("➕ Ajout de la colonne 'materiel_numero'...")
+            cursor.execute("ALTER TABLE pvs ADD COLUMN materiel_numero VARCHAR(100)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_pvs_materiel_numero ON pvs (materiel_numero)")
+            print("✅ Colonne 'materiel_numero' ajoutée avec index")
+        else:
+            print("ℹ️  La colonne 'materiel_numero' existe déjà")
+
+        # Remplissage à partir du JSON (une seule lecture de data par PV)
+        select_columns = ', '.join(('materiel_numero',) + FALLBACK_COLUMNS)
+        cursor.execute(f"SELECT id, data, {select_columns} FROM pvs")
+        rows = cursor.fetchall()
+
+        updated = 0
+        for pv_id, data, *current in rows:
+            try:
+                data_dict = json.loads(decode_json_text(data))
+            except (json.JSONDecodeError, TypeError, ValueError):
+                continue
+
+            form_data = data_dict.get('form_data', data_dict)
+            indexed_fields = PV.extract_indexed_fields(form_data)
+
+            changes = {}
+            for column, value in zip(('materiel_numero',) + FALLBACK_COLUMNS, current):
+                if not value and indexed_fields.get(column):
+                    changes[column] = indexed_fields[column]
+
+            if changes:
+                assignments = ', '.join(f"{column} = ?" for column in changes)
+                cursor.execute(f"UPDATE pvs SET {assignments} WHERE id = ?", (*changes.values(), pv_id))
+                updated += 1
+
+        conn.commit()
+
+        print("✅ Migration terminée avec succès !")
+        print(f"   - {len(rows)} PV analysé(s), {updated} PV complété(s)")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erreur lors de la migration : {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    migrate()
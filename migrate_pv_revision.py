@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Script de migration : Colonne revision des PV
+
+L'auto-sauvegarde envoie seulement les champs modifiés (PATCH /save/<id>) avec la
+révision sur laquelle ils s'appuient. Chaque écriture du JSON d'un PV incrémente
+pvs.revision ; une modification basée sur une révision dépassée est refusée (409).
+
+pvs.revision_reservee est la dernière révision attribuée : l'écriture différée des
+brouillons la réserve en base à leur réception (deux workers n'annoncent jamais la
+même révision), pvs.revision la rattrape à leur écriture. pvs.date_reservation date la
+dernière réservation : au-delà de DRAFT_FLUSH_TIMEOUT sans écriture, elle est perdue.
+"""
+
+import sqlite3
+from pathlib import Path
+
+DB_PATH = Path(__file__).parent / 'instance' / 'pvs.db'
+
+
+def migrate():
+    if not DB_PATH.exists():
+        print(f"❌ Erreur : La base de données {DB_PATH} n'existe pas.")
+        return False
+
+    print(f"📦 Migration revision de la base de données : {DB_PATH}")
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(pvs)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'revision' not in columns:
+            print("➕ Ajout de la colonne 'revision'...")
+            cursor.execute("ALTER TABLE pvs ADD COLUMN revision INTEGER NOT NULL DEFAULT 1")
+            conn.commit()
+            print("✅ Colonne 'revision' ajoutée (révision 1 pour les PV existants)")
+        else:
+            print("ℹ️  La colonne 'revision' existe déjà")
+
+        if 'revision_reservee' not in columns:
+            print("➕ Ajout de la colonne 'revision_reservee'...")
+            cursor.execute("ALTER TABLE pvs ADD COLUMN revision_reservee INTEGER NOT NULL DEFAULT 1")
+            cursor.execute("UPDATE pvs SET revision_reservee = revision")
+            conn.commit()
+            print("✅ Colonne 'revision_reservee' ajoutée (égale à revision pour les PV existants)")
+        else:
+            print("ℹ️  La colonne 'revision_reservee' existe déjà")
+
+        if 'date_reservation' not in columns:
+            print("➕ Ajout de la colonne 'date_reservation'...")
+            cursor.execute("ALTER TABLE pvs ADD COLUMN date_reservation DATETIME")
+            conn.commit()
+            print("✅ Colonne 'date_reservation' ajoutée")
+        else:
+            print("ℹ️  La colonne 'date_reservation' existe déjà")
+
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erreur lors de la migration : {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    migrate()
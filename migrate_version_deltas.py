@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Script de migration : Historique des versions stocké en diffs JSON
+
+Chaque version de pv_versions contenait le snapshot complet du PV. Après migration,
+seule une version sur VERSION_KEYFRAME_INTERVAL (keyframe) garde le snapshot complet ;
+les autres ne contiennent que le diff par rapport à la version précédente.
+La colonne keyframe_version indique la première version de chaque chaîne.
+
+Le script est relançable : les versions déjà converties sont reconstruites puis
+réencodées (utile après un changement de VERSION_KEYFRAME_INTERVAL).
+"""
+
+import sqlite3
+import json
+from pathlib import Path
+
+from setup_db import json_diff, json_patch, search_index_rebuild_statements, VERSION_KEYFRAME_INTERVAL
+from json_codec import encode_json_text, decode_json_text, register_sqlite_functions
+
+DB_PATH = Path(__file__).parent / 'instance' / 'pvs.db'
+
+
+def format_size(size):
+    """Formate une taille en octets pour l'affichage."""
+    for unit in ('o', 'Ko', 'Mo', 'Go'):
+        if size < 1024 or unit == 'Go':
+            return f"{size:.1f} {unit}" if unit != 'o' else f"{size} {unit}"
+        size /= 1024
+
+
+def stored_size(value):
+    """Taille stockée d'une valeur de la colonne data (texte UTF-8 ou BLOB compressé)."""
+    return len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+
+
+def decode_versions(rows):
+    """
+    Reconstruit les snapshots complets des versions d'un PV.
+
+    Args:
+        rows: Lignes (id, version_number, data, keyframe_version) triées par version
+
+    Returns:
+        dict: Snapshot par numéro de version (None si le JSON est illisible)
+    """
+    snapshots = {}
+    for _, version_number, data, keyframe_version in rows:
+        try:
+            value = json.loads(decode_json_text(data))
+            if keyframe_version is None or keyframe_version == version_number:
+                snapshots[version_number] = value
+            else:
+                snapshots[version_number] = json_patch(snapshots[version_number - 1], value)
+        except (json.JSONDecodeError, TypeError, KeyError, ValueError):
+            snapshots[version_number] = None
+    return snapshots
+
+
+def encode_versions(rows, snapshots):
+    """
+    Encode les versions d'un PV en keyframes et diffs (même règle que PVVersion.set_data).
+
+    Returns:
+        list: (id, data, keyframe_version) pour chaque version
+    """
+    encoded = []
+    chain_start = None
+    for row_id, version_number, data, _ in rows:
+        snapshot = snapshots[version_number]
+        previous = snapshots.get(version_number - 1)
+
+        if snapshot is None:
+            # JSON illisible : conservé tel quel, la chaîne repart à la version suivante
+            encoded.append((row_id, data, version_number))
+            chain_start = None
+        elif (previous is not None and chain_start is not None
+              and version_number - chain_start < VERSION_KEYFRAME_INTERVAL):
+            diff = json.dumps(json_diff(previous, snapshot), ensure_ascii=False)
+            encoded.append((row_id, encode_json_text(diff), chain_start))
+        else:
+            chain_start = version_number
+            encoded.append((row_id, encode_json_text(json.dumps(snapshot, ensure_ascii=False)), version_number))
+    return encoded
+
+
+def migrate():
+    if not DB_PATH.exists():
+        print(f"❌ Erreur : La base de données {DB_PATH} n'existe pas.")
+        return False
+
+    print(f"🔄 Migration : Historique des versions en diffs (keyframe toutes les {VERSION_KEYFRAME_INTERVAL} versions)...")
+
+    size_before = DB_PATH.stat().st_size
+    conn = sqlite3.connect(DB_PATH)
+    register_sqlite_functions(conn)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(pv_versions)")
+        columns = [row[1] for row in cursor.fetchall()]
+
+        if 'keyframe_version' not in columns:
+            print("➕ Ajout de la colonne 'keyframe_version'...")
+            cursor.execute("ALTER TABLE pv_versions ADD COLUMN keyframe_version INTEGER")
+            print("✅ Colonne 'keyframe_version' ajoutée")
+        else:
+            print("ℹ️  La colonne 'keyframe_version' existe déjà")
+
+        pv_ids = [row[0] for row in cursor.execute("SELECT DISTINCT pv_id FROM pv_versions")]
+
+        bytes_before = 0
+        bytes_after = 0
+        versions_count = 0
+        keyframes = 0
+        rows_updated = 0
+
+        for pv_id in pv_ids:
+            rows = cursor.execute(
+                "SELECT id, version_number, data, keyframe_version FROM pv_versions "
+                "WHERE pv_id = ? ORDER BY version_number", (pv_id,)
+            ).fetchall()
+
+            snapshots = decode_versions(rows)
+            encoded = encode_versions(rows, snapshots)
+
+            # Contrôle avant écriture : le nouvel encodage redonne exactement les mêmes snapshots
+            check_rows = [(row_id, row[1], data, keyframe)
+                          for row, (row_id, data, keyframe) in zip(rows, encoded)]
+            if decode_versions(check_rows) != snapshots:
+                raise RuntimeError(f"Reconstruction incorrecte des versions du PV {pv_id}")
+
+            for row, (row_id, data, keyframe) in zip(rows, encoded):
+                versions_count += 1
+                bytes_before += stored_size(row[2])
+                bytes_after += stored_size(data)
+                if keyframe == row[1]:
+                    keyframes += 1
+                if data != row[2] or keyframe != row[3]:
+                    cursor.execute(
+                        "UPDATE pv_versions SET data = ?, keyframe_version = ? WHERE id = ?",
+                        (data, keyframe, row_id)
+                    )
+                    rows_updated += 1
+
+        conn.commit()
+
+        # Rendre l'espace libéré au système de fichiers (base en WAL : reporter le VACUUM dans le fichier)
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        # VACUUM peut renuméroter les rowid de pvs, utilisés par l'index plein texte
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pvs_fts'").fetchone():
+            for statement in search_index_rebuild_statements():
+                conn.execute(statement)
+            conn.commit()
+        size_after = DB_PATH.stat().st_size
+
+        print("✅ Migration terminée avec succès !")
+        print(f"   - {versions_count} version(s) de {len(pv_ids)} PV, {keyframes} keyframe(s)")
+        print(f"   - {rows_updated} version(s) réécrite(s)")
+
+        ratio = bytes_before / bytes_after if bytes_after else 1.0
+        print("\n📊 Taille de l'historique :")
+        print(f"   JSON pv_versions : {format_size(bytes_before)} → {format_size(bytes_after)} "
+              f"(ratio {ratio:.1f}x)")
+        print(f"   Fichier pvs.db   : {format_size(size_before)} → {format_size(size_after)}")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erreur lors de la migration : {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,268 @@
+"""
+Cache des PDF générés pour l'application PV Matériel Loué
+
+Le PDF d'un PV inchangé est identique d'un téléchargement à l'autre :
+- Clé = hash stable des données du formulaire (hors date_generation) + version du template
+- Niveau mémoire borné en octets, éviction LRU
+- Niveau disque optionnel (PDF_CACHE_DIR), partagé entre les workers gunicorn
+- Les requêtes identiques simultanées sont regroupées : un seul rendu est exécuté
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+import hashlib
+import json
+import os
+import threading
+
+# Configuration (surchargeable par variables d'environnement)
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', '')
+PDF_CACHE_DISK_MAX_BYTES = int(os.environ.get('PDF_CACHE_DISK_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Fichiers dont dépend le rendu : toute modification invalide le cache
+TEMPLATE_FILES = [
+    Path(__file__).parent / 'templates' / 'pdf_template.html',
+    Path(__file__).parent / 'static' / 'pdf_style.css',
+]
+
+# Champs exclus de la clé (varient à chaque appel sans changer le contenu du PV)
+EXCLUDED_KEY_FIELDS = {'date_generation'}
+
+_template_version = None
+_template_mtimes = None
+_template_lock = threading.Lock()
+
+
+def template_version():
+    """
+    Retourne l'empreinte des fichiers de template (recalculée si un fichier change).
+
+    Returns:
+        str: Hash court du contenu des templates
+    """
+    global _template_version, _template_mtimes
+    mtimes = tuple(f.stat().st_mtime if f.exists() else 0 for f in TEMPLATE_FILES)
+    with _template_lock:
+        if mtimes != _template_mtimes:
+            digest = hashlib.sha256()
+            for f in TEMPLATE_FILES:
+                if f.exists():
+                    digest.update(f.read_bytes())
+            _template_version = digest.hexdigest()[:16]
+            _template_mtimes = mtimes
+        return _template_version
+
+
+def make_cache_key(form_data):
+    """
+    Calcule la clé de cache d'un PV.
+
+    Args:
+        form_data: Données du formulaire (avant optimisation des images)
+
+    Returns:
+        str: Empreinte SHA-256 hexadécimale
+    """
+    payload = {k: v for k, v in form_data.items() if k not in EXCLUDED_KEY_FIELDS}
+    # La date de version suit date_mise_a_jour (modifiée à chaque sauvegarde) : seul le numéro compte
+    if isinstance(payload.get('version_info'), dict):
+        payload['version_info'] = payload['version_info'].get('number')
+    digest = hashlib.sha256(template_version().encode('ascii'))
+    digest.update(json.dumps(payload, sort_keys=True, ensure_ascii=False,
+                             separators=(',', ':'), default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PDFCache:
+    """
+    Cache LRU de PDF à deux niveaux (mémoire + disque optionnel)
+    avec déduplication des rendus simultanés (single-flight).
+    """
+
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES, cache_dir=PDF_CACHE_DIR,
+                 disk_max_bytes=PDF_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        # Métriques
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._disk_evictions = 0
+
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.pdf"
+
+    def _get_memory(self, key):
+        """Lecture mémoire (appelée avec le verrou)."""
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+
+    def _put_memory(self, key, data):
+        """Insertion mémoire avec éviction LRU (appelée avec le verrou)."""
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def _get_disk(self, key):
+        """Lecture du niveau disque (None si absent ou désactivé)."""
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # Marquer comme récemment utilisé
+            return data
+        except OSError:
+            return None
+
+    def _put_disk(self, key, data):
+        """Écriture atomique sur disque puis éviction des fichiers les plus anciens."""
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Erreur d'écriture du cache PDF: {e}")
+            return
+
+        try:
+            files = [(f.stat().st_mtime, f.stat().st_size, f) for f in self.cache_dir.glob('*.pdf')]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, f in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                f.unlink()
+                total -= size
+                with self._lock:
+                    self._disk_evictions += 1
+            except OSError:
+                pass
+
+    def get(self, key):
+        """
+        Cherche un PDF dans le cache (mémoire puis disque).
+
+        Returns:
+            bytes ou None
+        """
+        with self._lock:
+            data = self._get_memory(key)
+            if data is not None:
+                self._hits += 1
+                return data
+
+        data = self._get_disk(key)
+        if data is not None:
+            with self._lock:
+                self._disk_hits += 1
+                self._put_memory(key, data)
+        return data
+
+    def put(self, key, data):
+        """Ajoute un PDF au cache."""
+        with self._lock:
+            self._put_memory(key, data)
+        self._put_disk(key, data)
+
+    def get_or_render(self, key, render_fn):
+        """
+        Retourne le PDF en cache ou le génère une seule fois,
+        même si plusieurs requêtes identiques arrivent en même temps.
+
+        Args:
+            key: Clé calculée par make_cache_key()
+            render_fn: Fonction sans argument qui génère le PDF
+
+        Returns:
+            tuple: (pdf_bytes, hit: bool)
+        """
+        data = self.get(key)
+        if data is not None:
+            return data, True
+
+        with self._lock:
+            # Un rendu concurrent a pu se terminer entre-temps
+            data = self._get_memory(key)
+            if data is not None:
+                self._hits += 1
+                return data, True
+            future = self._inflight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._misses += 1
+                leader = True
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            data = render_fn()
+            self.put(key, data)
+            future.set_result(data)
+            return data, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            dict: Succès, échecs, évictions, occupation
+        """
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses + self._coalesced
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'disk_enabled': bool(self.cache_dir),
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'evictions': self._evictions,
+                'disk_evictions': self._disk_evictions,
+                'hit_rate': round((lookups - self._misses) / lookups, 3) if lookups else 0,
+                'template_version': template_version()
+            }
+
+
+# Cache partagé par les requêtes du processus
+pdf_cache = PDFCache()
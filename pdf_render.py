@@ -0,0 +1,584 @@
+"""
+Pool de rendu PDF pour l'application PV Matériel Loué
+
+Le rendu WeasyPrint est exécuté dans des processus dédiés :
+- Le thread de requête ne fait qu'attendre le résultat (ou est refusé immédiatement)
+- File d'attente bornée : au-delà, la requête reçoit "serveur occupé, réessayez dans X s"
+- Les processus sont recyclés après N rendus pour borner la croissance mémoire de WeasyPrint
+- Un rendu qui dépasse le délai libère son emplacement ; s'il a déjà commencé, le pool est
+  remplacé et le processus bloqué arrêté dès que les autres rendus de l'ancien pool sont finis
+- Les ressources /static et data: sont résolues localement, sans requête HTTP vers le serveur
+- Chaque processus garde un moteur de rendu (CSS pré-analysé, polices, template Jinja compilé)
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit, unquote
+import mimetypes
+import multiprocessing
+import threading
+import math
+import os
+import time
+
+# Configuration (surchargeable par variables d'environnement)
+RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', '2'))
+RENDER_MAX_TASKS_PER_CHILD = int(os.environ.get('PDF_RENDER_MAX_TASKS', '50'))
+RENDER_QUEUE_SIZE = int(os.environ.get('PDF_RENDER_QUEUE_SIZE', '8'))
+RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', '60'))
+
+# Répertoire des ressources statiques (logos) servies directement depuis le disque
+STATIC_DIR = Path(__file__).parent / 'static'
+TEMPLATES_DIR = Path(__file__).parent / 'templates'
+PDF_TEMPLATE = 'pdf_template.html'
+PDF_STYLESHEET = STATIC_DIR / 'pdf_style.css'
+
+# URL de base fixe : les chemins /static/... y sont résolus puis interceptés par le fetcher
+RENDER_BASE_URL = 'http://localhost/'
+
+
+class RenderPoolBusy(Exception):
+    """Levée quand la file de rendu est pleine."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Génération PDF saturée, réessayez dans {retry_after} s")
+
+
+# Cache mémoire des fichiers statiques : chemin -> (mtime, contenu)
+_static_cache = {}
+
+# Compteurs du fetcher (par processus de rendu, remontés au pool après chaque rendu)
+_fetch_stats = Counter()
+
+
+def local_url_fetcher(url):
+    """
+    Fetcher WeasyPrint qui ne passe jamais par le réseau.
+
+    - data: : décodé en mémoire par le fetcher par défaut de WeasyPrint
+    - /static/... : lu depuis le disque (mémorisé, invalidé si le fichier change)
+    - tout le reste : refusé (WeasyPrint ignore alors la ressource)
+
+    Args:
+        url: URL absolue demandée par WeasyPrint
+
+    Returns:
+        dict: Réponse au format attendu par WeasyPrint
+    """
+    if url.startswith('data:'):
+        from weasyprint import default_url_fetcher
+        _fetch_stats['data_uri'] += 1
+        return default_url_fetcher(url)
+
+    path = unquote(urlsplit(url).path)
+    if path.startswith('/static/'):
+        file_path = (STATIC_DIR / path[len('/static/'):]).resolve()
+        if STATIC_DIR.resolve() not in file_path.parents or not file_path.is_file():
+            _fetch_stats['refused'] += 1
+            raise ValueError(f"Ressource statique introuvable : {path}")
+
+        mtime = file_path.stat().st_mtime
+        cached = _static_cache.get(file_path)
+        if cached and cached[0] == mtime:
+            _fetch_stats['static_memo'] += 1
+            content = cached[1]
+        else:
+            content = file_path.read_bytes()
+            _static_cache[file_path] = (mtime, content)
+            _fetch_stats['static_disk'] += 1
+
+        return {
+            'string': content,
+            'mime_type': mimetypes.guess_type(str(file_path))[0] or 'application/octet-stream',
+            'redirected_url': url
+        }
+
+    _fetch_stats['refused'] += 1
+    raise ValueError(f"Ressource externe refusée lors du rendu PDF : {url}")
+
+
+class PDFRenderEngine:
+    """
+    Moteur de rendu créé une fois par processus.
+
+    Conserve ce qui ne dépend pas du PV : feuille de style pré-analysée,
+    configuration des polices partagée et template Jinja compilé.
+    Chaque rendu ne fait plus que la mise en page du contenu du PV.
+    """
+
+    def __init__(self):
+        from jinja2 import Environment, FileSystemLoader
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.font_config = FontConfiguration()
+        self.stylesheets = [
+            CSS(filename=str(PDF_STYLESHEET), font_config=self.font_config,
+                url_fetcher=local_url_fetcher)
+        ]
+        # Même échappement automatique que render_template() de Flask pour les .html
+        self.jinja_env = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)), autoescape=True)
+        self.template = self.jinja_env.get_template(PDF_TEMPLATE)
+
+    def render_html(self, context):
+        """
+        Génère le HTML du PV (la feuille de style est fournie à part).
+
+        Args:
+            context: Données du formulaire (variables du template)
+        """
+        return self.template.render(**context, stylesheet_preloaded=True)
+
+    def write_pdf(self, html_content):
+        """
+        Met en page le HTML avec les ressources partagées du moteur.
+
+        Returns:
+            bytes: Contenu binaire du PDF
+        """
+        from weasyprint import HTML
+
+        return HTML(string=html_content, base_url=RENDER_BASE_URL,
+                    url_fetcher=local_url_fetcher).write_pdf(
+            stylesheets=self.stylesheets, font_config=self.font_config)
+
+    def render(self, context):
+        """Génère le PDF complet d'un PV à partir de ses données."""
+        return self.write_pdf(self.render_html(context))
+
+
+_engine = None
+
+
+def get_engine():
+    """Retourne le moteur de rendu du processus courant (créé au premier appel)."""
+    global _engine
+    if _engine is None:
+        _engine = PDFRenderEngine()
+    return _engine
+
+
+def _init_worker():
+    """Initialise le moteur dès le démarrage d'un processus de rendu."""
+    try:
+        get_engine()
+    except Exception as e:
+        # Sera retenté (et l'erreur remontée) au premier rendu
+        print(f"Erreur lors de l'initialisation du moteur PDF: {e}")
+
+
+def _render_worker(context):
+    """
+    Exécuté dans un processus du pool : génère le PDF d'un PV.
+
+    Args:
+        context: Données du formulaire (variables du template)
+
+    Returns:
+        tuple: (pdf_bytes, métriques du rendu : durée et compteurs du fetcher)
+    """
+    engine = get_engine()
+
+    _fetch_stats.clear()
+    start = time.perf_counter()
+    pdf_bytes = engine.render(context)
+    return pdf_bytes, {
+        'render_time': time.perf_counter() - start,
+        'fetches': dict(_fetch_stats)
+    }
+
+
+class RenderPool:
+    """
+    Pool de processus de rendu avec file d'attente bornée et métriques.
+
+    Le nombre de rendus acceptés simultanément (en cours + en attente) est
+    limité à workers + queue_size ; au-delà, submit() lève RenderPoolBusy.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, max_tasks_per_child=RENDER_MAX_TASKS_PER_CHILD,
+                 queue_size=RENDER_QUEUE_SIZE, timeout=RENDER_TIMEOUT):
+        self.workers = max(1, workers)
+        self.max_tasks_per_child = max_tasks_per_child
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+
+        self._executor = self._create_executor()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._tasks = {}  # Future renvoyée -> rendu en cours (voir submit)
+        self._running = {}  # Pool -> rendus non abandonnés qui y sont soumis
+        self._retired = {}  # Pool recyclé -> ses processus, arrêtés quand il n'a plus de rendu
+
+        # Métriques
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._render_time_total = 0.0
+        self._render_time_max = 0.0
+        self._render_time_last = 0.0
+        self._wall_time_total = 0.0
+        self._wall_time_max = 0.0
+        self._fetches = Counter()
+        self._timeouts = 0
+        self._recycled = 0
+
+    def _create_executor(self):
+        """Crée le pool de processus ('spawn' : requis par max_tasks_per_child, sûr sous gunicorn)."""
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            max_tasks_per_child=self.max_tasks_per_child or None,
+            initializer=_init_worker
+        )
+
+    def _retry_after(self):
+        """Estime le délai (secondes) avant qu'un emplacement se libère."""
+        with self._lock:
+            avg = self._render_time_total / self._completed if self._completed else 2.0
+            backlog = self._in_flight / self.workers
+        return max(1, math.ceil(avg * backlog))
+
+    def submit(self, fn, *args, wait=0):
+        """
+        Soumet un rendu au pool.
+
+        Args:
+            fn: Fonction (importable) exécutée dans le processus de rendu ;
+                doit retourner (résultat, métriques) avec métriques['render_time']
+            *args: Arguments sérialisables de la fonction
+            wait: Secondes d'attente maximale d'un emplacement libre (0 = refus immédiat)
+
+        Returns:
+            Future: Résultat du rendu (le résultat seul, sans la durée)
+
+        Raises:
+            RenderPoolBusy: Si la file d'attente est pleine
+        """
+        if not self._slots.acquire(blocking=wait > 0, timeout=wait if wait > 0 else None):
+            with self._lock:
+                self._rejected += 1
+            raise RenderPoolBusy(self._retry_after())
+
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+            self._submitted += 1
+            executor = self._executor
+
+        task = {'submitted_at': submitted_at, 'released': False}
+        try:
+            try:
+                inner = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # Un processus de rendu est mort (OOM, crash natif) : recréer le pool
+                executor = self._replace_broken(executor)
+                inner = executor.submit(fn, *args)
+        except Exception:
+            self._release_task(task, None)
+            raise
+
+        outer = Future()
+        task.update(inner=inner, executor=executor)
+        with self._lock:
+            self._tasks[outer] = task
+            self._running.setdefault(executor, set()).add(inner)
+
+        def _done(future):
+            with self._lock:
+                self._tasks.pop(outer, None)
+                self._running.get(executor, set()).discard(future)
+            try:
+                result, metrics = future.result()
+            except Exception as e:
+                self._release_task(task, None)
+                outer.set_exception(e)
+            else:
+                self._release_task(task, metrics)
+                outer.set_result(result)
+            self._reap()
+
+        inner.add_done_callback(_done)
+        return outer
+
+    def _replace_broken(self, broken):
+        """
+        Remplace un pool cassé (une seule fois si plusieurs requêtes le constatent) et l'arrête.
+
+        Returns:
+            ProcessPoolExecutor: Pool courant
+        """
+        with self._lock:
+            replaced = self._executor is broken
+            if replaced:
+                self._executor = self._create_executor()
+            executor = self._executor
+        if replaced:
+            broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    def cancel(self, future):
+        """
+        Abandonne un rendu dont le délai est dépassé. Retiré de la file s'il n'a pas commencé ;
+        sinon son emplacement est libéré tout de suite et le pool est recyclé : les nouveaux
+        rendus partent sur un pool neuf, l'ancien finit ses autres rendus puis ses processus
+        (dont celui qui est bloqué) sont arrêtés.
+
+        Args:
+            future: Future renvoyée par submit() ou render_async()
+        """
+        with self._lock:
+            task = self._tasks.pop(future, None)
+            if task is None:
+                return  # Déjà terminé
+            self._timeouts += 1
+        if task['inner'].cancel() or task['inner'].done():
+            return  # _done libère l'emplacement
+
+        executor = task['executor']
+        with self._lock:
+            self._running.get(executor, set()).discard(task['inner'])
+            recycle = self._executor is executor
+            if recycle:
+                self._executor = self._create_executor()
+                self._retired[executor] = list((executor._processes or {}).values())
+                self._recycled += 1
+        self._release_task(task, None)
+        if recycle:
+            executor.shutdown(wait=False)
+        self._reap()
+
+    def _reap(self):
+        """Arrête les processus des pools recyclés qui n'ont plus de rendu en cours (hors rendus abandonnés)."""
+        with self._lock:
+            idle = [executor for executor in self._retired if not self._running.get(executor)]
+            processes = [process for executor in idle for process in self._retired.pop(executor)]
+            for executor in idle:
+                self._running.pop(executor, None)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def _release_task(self, task, metrics):
+        """Libère l'emplacement d'un rendu une seule fois (fin du rendu, ou abandon sur délai)."""
+        with self._lock:
+            if task['released']:
+                return
+            task['released'] = True
+        self._release(task['submitted_at'], metrics)
+
+    def _release(self, submitted_at, metrics):
+        """Libère un emplacement et enregistre les métriques du rendu."""
+        wall_time = time.perf_counter() - submitted_at
+        with self._lock:
+            self._in_flight -= 1
+            if metrics is None:
+                self._failed += 1
+            else:
+                render_time = metrics['render_time']
+                self._fetches.update(metrics.get('fetches', {}))
+                self._completed += 1
+                self._render_time_total += render_time
+                self._render_time_last = render_time
+                self._render_time_max = max(self._render_time_max, render_time)
+                self._wall_time_total += wall_time
+                self._wall_time_max = max(self._wall_time_max, wall_time)
+        self._slots.release()
+
+    def render_async(self, context, wait=0):
+        """
+        Soumet le rendu d'un PV sans attendre le résultat.
+
+        Args:
+            context: Données du formulaire (sérialisables, transmises au processus de rendu)
+            wait: Secondes d'attente maximale d'un emplacement libre (0 = refus immédiat)
+
+        Returns:
+            Future: bytes du PDF
+
+        Raises:
+            RenderPoolBusy: Si la file d'attente est pleine
+        """
+        return self.submit(_render_worker, context, wait=wait)
+
+    def render(self, context):
+        """
+        Génère le PDF d'un PV dans le pool et attend le résultat.
+
+        Args:
+            context: Données du formulaire (sérialisables, transmises au processus de rendu)
+
+        Raises:
+            RenderPoolBusy: Si la file d'attente est pleine
+            TimeoutError: Si le rendu dépasse le délai configuré
+        """
+        future = self.render_async(context)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.cancel(future)
+            raise TimeoutError(f"Génération PDF trop longue (> {self.timeout:.0f} s)")
+
+    def stats(self):
+        """
+        Retourne les métriques du pool.
+
+        Returns:
+            dict: Taille du pool, profondeur de file et durées de rendu
+        """
+        with self._lock:
+            completed = self._completed
+            return {
+                'workers': self.workers,
+                'max_tasks_per_child': self.max_tasks_per_child,
+                'queue_size': self.queue_size,
+                'in_flight': self._in_flight,
+                'queued': max(0, self._in_flight - self.workers),
+                'submitted': self._submitted,
+                'completed': completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'render_time': {
+                    'last': round(self._render_time_last, 3),
+                    'avg': round(self._render_time_total / completed, 3) if completed else 0,
+                    'max': round(self._render_time_max, 3)
+                },
+                'wall_time': {
+                    'avg': round(self._wall_time_total / completed, 3) if completed else 0,
+                    'max': round(self._wall_time_max, 3)
+                },
+                'url_fetcher': {
+                    'served_locally': sum(self._fetches[k] for k in ('static_disk', 'static_memo', 'data_uri')),
+                    **dict(self._fetches)
+                }
+            }
+
+    def shutdown(self):
+        """Arrête les processus de rendu (et ceux des pools recyclés)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            retired, self._retired = self._retired, {}
+        for processes in retired.values():
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+
+# Un pool par processus serveur (créé à la demande, après le fork de gunicorn)
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """
+    Retourne le pool de rendu du processus courant (créé au premier appel).
+
+    Returns:
+        RenderPool: Pool partagé par les requêtes de ce processus
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = RenderPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _sample_context(photo_count=6):
+    """
+    Construit un PV représentatif (formulaire complet, signatures, photos JPEG 800x600).
+
+    Args:
+        photo_count: Nombre de photos à répartir sur les postes d'inspection
+    """
+    import base64
+    import io
+    import random
+    from datetime import datetime
+    from PIL import Image
+    from reset_and_generate_pv import (generate_form_data, MATERIELS, CHANTIERS,
+                                       CONDUCTEURS, ENTREPRISES, RESPONSABLES)
+
+    random.seed(42)
+    form_data = generate_form_data(MATERIELS[0], CHANTIERS[0], CONDUCTEURS[0], ENTREPRISES[0],
+                                   RESPONSABLES[0], datetime(2025, 11, 3), 'complet')
+
+    photo_fields = ['carrosserie_reception', 'eclairage_reception', 'pneumatiques_retour',
+                    'panier_retour', 'commandes_reception', 'securite_retour']
+    for i in range(photo_count):
+        image = Image.effect_noise((800, 600), 64).convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        uri = f"data:image/jpeg;base64,{base64.b64encode(output.getvalue()).decode('ascii')}"
+        form_data.setdefault(f'photo_{photo_fields[i % len(photo_fields)]}', []).append(uri)
+
+    form_data['date_generation'] = datetime(2025, 11, 3, 10, 0).strftime('%d/%m/%Y %H:%M')
+    form_data['version_info'] = {'number': 1, 'date': form_data['date_generation']}
+    return form_data
+
+
+def compare_render_modes(runs=5, photo_count=6):
+    """
+    Mesure le gain du moteur partagé sur un PV représentatif.
+
+    - Avant : template + feuille de style inline analysés et polices initialisées à chaque rendu
+    - Après : PDFRenderEngine (CSS, polices et template préparés une seule fois)
+
+    Returns:
+        dict: Durées moyennes (secondes) des deux modes
+    """
+    from statistics import mean, median
+    from weasyprint import HTML
+
+    context = _sample_context(photo_count)
+    naive_template = PDFRenderEngine().jinja_env.get_template(PDF_TEMPLATE)
+
+    def naive_render():
+        html_content = naive_template.render(**context, stylesheet_preloaded=False)
+        return HTML(string=html_content, base_url=RENDER_BASE_URL,
+                    url_fetcher=local_url_fetcher).write_pdf()
+
+    engine_start = time.perf_counter()
+    engine = PDFRenderEngine()
+    engine_init = time.perf_counter() - engine_start
+
+    # Premier rendu de chaque mode exclu (chauffe des caches Pango/fontconfig)
+    naive_render()
+    engine.render(context)
+
+    results = {}
+    for label, fn in (('avant', naive_render), ('apres', lambda: engine.render(context))):
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - start)
+        results[label] = {'mean': mean(durations), 'median': median(durations)}
+
+    print(f"📊 Rendu d'un PV représentatif ({photo_count} photos, {runs} rendus par mode)")
+    print(f"   Initialisation du moteur (une fois par processus) : {engine_init * 1000:.0f} ms")
+    for label, r in results.items():
+        print(f"   {label:6s} : moyenne {r['mean'] * 1000:.0f} ms - médiane {r['median'] * 1000:.0f} ms")
+    saving = results['avant']['mean'] - results['apres']['mean']
+    print(f"   Gain par rendu : {saving * 1000:.0f} ms ({saving / results['avant']['mean'] * 100:.0f} %)")
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    try:
+        import weasyprint  # noqa: F401
+    except OSError as e:
+        # Bibliothèques système de WeasyPrint (Pango, HarfBuzz) absentes : aucune mesure possible
+        print(f"❌ WeasyPrint ne peut pas être chargé : {e}")
+        print("   Installer Pango (paquet libpango-1.0-0 sous Debian/Ubuntu) puis relancer la mesure.")
+        sys.exit(2)
+    compare_render_modes(runs=int(sys.argv[1]) if len(sys.argv) > 1 else 5)
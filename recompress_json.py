@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Recompression des colonnes JSON (pvs.data, pv_versions.data) en arrière-plan
+
+Convertit les lignes existantes au format configuré (JSON_COMPRESSION, voir json_codec.py),
+ou les remet en texte clair avec --algorithm none. Le traitement avance par petits lots,
+chacun dans sa propre transaction courte, avec une pause entre deux lots : il peut tourner
+pendant que l'application est en service (les requêtes ne sont bloquées que le temps d'un lot).
+
+Les lignes déjà au bon format ne sont pas réécrites : la commande peut être interrompue
+et relancée à tout moment.
+
+Usage :
+    JSON_COMPRESSION=zlib python recompress_json.py
+    python recompress_json.py --algorithm zstd --batch-size 100 --pause 0.05
+    python recompress_json.py --algorithm none          # retour au texte clair
+    python recompress_json.py --vacuum                  # rendre l'espace libéré au disque
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from json_codec import (
+    JSON_COMPRESSION, FORMAT_MARKERS, encode_json_text, decode_json_text, register_sqlite_functions
+)
+from setup_db import SQLITE_BUSY_TIMEOUT_MS, search_index_rebuild_statements
+
+DB_PATH = Path(__file__).parent / 'instance' / 'pvs.db'
+TABLES = ('pvs', 'pv_versions')
+
+
+def format_size(size):
+    """Formate une taille en octets pour l'affichage."""
+    for unit in ('o', 'Ko', 'Mo', 'Go'):
+        if size < 1024 or unit == 'Go':
+            return f"{size:.1f} {unit}" if unit != 'o' else f"{size} {unit}"
+        size /= 1024
+
+
+def stored_size(value):
+    """Taille stockée d'une valeur de la colonne data (texte UTF-8 ou BLOB compressé)."""
+    return len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+
+
+def recompress_table(conn, table, algorithm, batch_size, pause):
+    """
+    Réécrit les lignes d'une table dont le format diffère de la cible.
+
+    Args:
+        conn: Connexion sqlite3 (autocommit, pv_json déclarée)
+        table: 'pvs' ou 'pv_versions'
+        algorithm: 'zlib', 'zstd' ou '' (texte clair)
+        batch_size: Lignes lues par transaction
+        pause: Pause entre deux lots (secondes)
+
+    Returns:
+        dict: Compteurs (lignes, réécrites, erreurs, octets avant/après)
+    """
+    stats = {'rows': 0, 'rewritten': 0, 'errors': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_rowid = 0
+
+    while True:
+        # Verrou d'écriture dès le début du lot : aucune lecture ne voit un lot à moitié converti
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT rowid, data FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            ).fetchall()
+
+            for rowid, stored in rows:
+                stats['rows'] += 1
+                stats['bytes_before'] += stored_size(stored)
+                try:
+                    target = encode_json_text(decode_json_text(stored), algorithm=algorithm)
+                except Exception as e:
+                    print(f"   ⚠️  {table} rowid {rowid} illisible, ignoré : {e}")
+                    stats['errors'] += 1
+                    stats['bytes_after'] += stored_size(stored)
+                    continue
+
+                stats['bytes_after'] += stored_size(target)
+                if target != stored:
+                    conn.execute(f"UPDATE {table} SET data = ? WHERE rowid = ?", (target, rowid))
+                    stats['rewritten'] += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if len(rows) < batch_size:
+            return stats
+        last_rowid = rows[-1][0]
+        time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompression des colonnes JSON (pvs, pv_versions)')
+    parser.add_argument('--algorithm', default=JSON_COMPRESSION or 'zlib',
+                        choices=['none', *FORMAT_MARKERS],
+                        help='Format cible (défaut : JSON_COMPRESSION, sinon zlib)')
+    parser.add_argument('--batch-size', type=int, default=200, help='Lignes par transaction')
+    parser.add_argument('--pause', type=float, default=0.02, help='Pause entre deux lots (secondes)')
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM final (bloque la base pendant l'opération)")
+    parser.add_argument('--db', default=str(DB_PATH), help='Base SQLite à traiter')
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    if not db_path.exists():
+        print(f"❌ Erreur : La base de données {db_path} n'existe pas.")
+        sys.exit(2)
+
+    algorithm = '' if args.algorithm == 'none' else args.algorithm
+    print(f"🗜️  Recompression JSON ({args.algorithm}) de {db_path}, lots de {args.batch_size}...")
+
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    register_sqlite_functions(conn)
+    size_before = db_path.stat().st_size
+
+    try:
+        for table in TABLES:
+            started = time.perf_counter()
+            stats = recompress_table(conn, table, algorithm, args.batch_size, args.pause)
+            ratio = stats['bytes_before'] / stats['bytes_after'] if stats['bytes_after'] else 1.0
+            print(f"✅ {table} : {stats['rewritten']}/{stats['rows']} ligne(s) réécrite(s) "
+                  f"en {time.perf_counter() - started:.1f}s, "
+                  f"{format_size(stats['bytes_before'])} → {format_size(stats['bytes_after'])} (ratio {ratio:.1f}x)")
+            if stats['errors']:
+                print(f"   ⚠️  {stats['errors']} ligne(s) illisible(s) laissée(s) telle(s) quelle(s)")
+
+        if args.vacuum:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            # VACUUM peut renuméroter les rowid de pvs, utilisés par l'index plein texte
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pvs_fts'").fetchone():
+                conn.execute("BEGIN IMMEDIATE")
+                for statement in search_index_rebuild_statements():
+                    conn.execute(statement)
+                conn.execute("COMMIT")
+            print(f"📦 Fichier pvs.db : {format_size(size_before)} → {format_size(db_path.stat().st_size)}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -260,6 +260,7 @@ def main():
                     responsable=indexed_fields.get('responsable'),
                     fournisseur=indexed_fields.get('fournisseur'),
                     materiel_type=indexed_fields.get('materiel_type'),
+                    materiel_numero=indexed_fields.get('materiel_numero'),
                     date_reception=indexed_fields.get('date_reception'),
                     date_retour=indexed_fields.get('date_retour'),
                     statut=indexed_fields.get('statut'),
@@ -5,8 +5,8 @@ France Montage - Groupe Briand
 Architecture stateless avec génération PDF en mémoire et envoi SMTP.
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from weasyprint import HTML, CSS
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, Response, stream_with_context
+from werkzeug.datastructures import MultiDict
 import io
 import smtplib
 from email.mime.multipart import MIMEMultipart
@@ -14,21 +14,41 @@ from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 import os
 import base64
-from PIL import Image
-from datetime import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
 import json
 import uuid
 from pathlib import Path
+from concurrent.futures import wait as wait_futures, FIRST_COMPLETED
+import time
+import zipfile
 
 # Import SQLAlchemy et modèle PV
-from setup_db import db, PV, PVVersion, init_db
+from setup_db import (
+    db, PV, PVVersion, EmailOutbox, init_db, get_change_counter, get_sqlite_pragmas,
+    build_search_query, SEARCH_INDEX_COLUMNS, read_transactions, write_transactions, Blob, hydrate_blobs,
+    collect_blob_refs, BLOB_MIME_TYPES
+)
+
+# Pool de rendu PDF (processus dédiés, file bornée)
+from pdf_render import get_render_pool, RenderPoolBusy
+from pdf_cache import pdf_cache, make_cache_key
+from media import optimize_form_images, resolve_uploads, PHOTO_BASE_FIELDS
+from form_schema import parse_form, FormValidationError
+from uploads import create_upload, get_upload, write_chunk, UploadError, UPLOAD_CHUNK_SIZE, UPLOAD_CHUNK_MAX
+from mailer import start_mail_sender, get_mail_sender, enqueue_email, smtp_settings, is_configured
+from draft_buffer import start_draft_buffer, get_draft_buffer, flush_drafts, DraftValidationError, DRAFT_FLUSH_TIMEOUT, DRAFT_FLUSH_INTERVAL
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-key-change-in-production')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Limite 16MB pour protection DoS
+# Limite de taille des requêtes (protection DoS). Les photos envoyées en binaire sont écrites
+# par Werkzeug dans des fichiers temporaires : seules les photos en Base64 restent en mémoire
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', '64')) * 1024 * 1024
 
 # Configuration SQLAlchemy
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pvs.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///pvs.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialiser la base de données
@@ -71,85 +91,211 @@ SMTP_USERNAME = smtp_config.get('smtp_username', '')
 SMTP_PASSWORD = smtp_config.get('smtp_password', '')
 SMTP_FROM_NAME = smtp_config.get('smtp_from_name', 'Centrale Lyon Conseil')
 
+# Envoi des emails de l'outbox en arrière-plan
+start_mail_sender(app, load_smtp_config)
+
+# Pagination de la liste des PV (/list-pv)
+LIST_PV_PAGE_SIZE = int(os.environ.get('LIST_PV_PAGE_SIZE', '50'))
+LIST_PV_MAX_PAGE_SIZE = int(os.environ.get('LIST_PV_MAX_PAGE_SIZE', '500'))
+
+# Filtres exacts acceptés par /list-pv (colonnes indexées de PV)
+LIST_PV_FILTERS = {
+    'chantier': PV.chantier,
+    'responsable': PV.responsable,
+    'fournisseur': PV.fournisseur,
+    'materiel_type': PV.materiel_type,
+    'statut': PV.statut,
+    'date_reception': PV.date_reception,
+    'vgp_date': PV.vgp_date,
+}
+
+# Index plein texte (table virtuelle FTS5 créée par setup_db, hors modèles)
+PV_SEARCH_INDEX = db.table('pvs_fts', db.column('pv_id'))
+
+# Filtres par plage de dates (YYYY-MM-DD, bornes incluses)
+LIST_PV_RANGE_FILTERS = {
+    'date_reception': PV.date_reception,
+    'date_retour': PV.date_retour,
+    'vgp_date': PV.vgp_date,
+}
+
+# Liste des emails conducteur d'un PV sous la forme ",a@x.fr,b@y.fr," (recherche d'un email exact)
+CONDUCTEUR_EMAIL_LIST = db.literal(',') + db.func.replace(db.func.lower(PV.conducteur_email), ' ', '') + ','
+
+# Champs des listes déroulantes calculés par /facets (valeurs distinctes et nombre de PV)
+# email_conducteur est traité à part : la colonne contient plusieurs emails séparés par des virgules
+FACET_FIELDS = {
+    'chantier': PV.chantier,
+    'materiel_numero': PV.materiel_numero,
+    'materiel_type': PV.materiel_type,
+    'responsable': PV.responsable,
+    'fournisseur': PV.fournisseur,
+    'statut': PV.statut,
+}
+FACETS_MAX_VALUES = int(os.environ.get('FACETS_MAX_VALUES', '1000'))
+FACETS_CACHE_SIZE = int(os.environ.get('FACETS_CACHE_SIZE', '128'))
 
-def optimize_signature(base64_string):
+# Validité d'une VGP et délai d'alerte avant échéance (en jours)
+VGP_VALIDITY_DAYS = int(os.environ.get('VGP_VALIDITY_DAYS', '180'))
+VGP_WARNING_DAYS = int(os.environ.get('VGP_WARNING_DAYS', '21'))
+VGP_STATUSES = ('expired', 'warning', 'valid', 'none')
+
+# Résultats de /facets par paramètres d'URL, valables tant que le compteur de pvs ne change pas
+_facets_cache = OrderedDict()
+_facets_cache_lock = threading.Lock()
+
+
+
+def make_etag(*parts):
     """
-    Optimise une signature Base64 pour réduire la taille du PDF.
+    Calcule un ETag fort à partir des éléments qui déterminent une réponse.
     
     Args:
-        base64_string: Chaîne Base64 de l'image (format data:image/png;base64,...)
+        *parts: Valeurs (dates de mise à jour, numéros de version, compteurs...)
         
     Returns:
-        Chaîne Base64 optimisée
+        str: Empreinte SHA-1 (sans guillemets)
     """
-    try:
-        # Extraire les données Base64 (supprimer le préfixe data:image/png;base64,)
-        if ',' in base64_string:
-            header, encoded = base64_string.split(',', 1)
-        else:
-            encoded = base64_string
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def not_modified_response(etag):
+    """
+    Réponse 304 si le client possède déjà cette version (en-tête If-None-Match).
+    
+    Args:
+        etag: ETag courant de la ressource
         
-        # Décoder l'image
-        image_data = base64.b64decode(encoded)
-        image = Image.open(io.BytesIO(image_data))
+    Returns:
+        Response 304, ou None si la réponse complète doit être envoyée
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def etag_response(payload, etag):
+    """
+    Réponse JSON accompagnée de son ETag (le client revalide à chaque appel).
+    
+    Args:
+        payload: Dictionnaire à sérialiser
+        etag: ETag de la ressource
+    """
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def pv_etag(pv_id, kind):
+    """
+    ETag d'une ressource dérivée d'un PV, à partir de ses seules colonnes de mise à jour
+    (la colonne JSON n'est pas lue).
+    
+    Args:
+        pv_id: Identifiant du PV
+        kind: Type de ressource ('pv', 'versions'...)
         
-        # Redimensionner si trop large (max 400px de large)
-        if image.width > 400:
-            ratio = 400 / image.width
-            new_size = (400, int(image.height * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
+    Returns:
+        tuple: (etag, version_courante), ou (None, None) si le PV n'existe pas
+    """
+    state = db.session.query(
+        PV.date_mise_a_jour, PV.version_courante, PV.date_dernier_envoi
+    ).filter(PV.id == pv_id).first()
+    if state is None:
+        return None, None
+    return make_etag(kind, pv_id, *state), state.version_courante
+
+
+def render_pdf(form_data):
+    """
+    Génère le PDF dans le pool de rendu (hors du thread de requête).
+    Le template et la mise en page sont exécutés par le moteur du processus de rendu.
+    
+    Args:
+        form_data: Données du formulaire (variables du template pdf_template.html)
         
-        # Sauvegarder avec optimisation
-        output = io.BytesIO()
-        image.save(output, format='PNG', optimize=True)
-        output.seek(0)
+    Returns:
+        bytes: Contenu binaire du PDF
         
-        # Ré-encoder en Base64
-        optimized_b64 = base64.b64encode(output.read()).decode('utf-8')
-        return f"data:image/png;base64,{optimized_b64}"
+    Raises:
+        RenderPoolBusy: Si la file de rendu est pleine
+    """
+    # Les images /static et data: sont résolues localement par le fetcher du pool
+    return get_render_pool().render(form_data)
+
+
+def render_busy_response(error):
+    """
+    Réponse 503 renvoyée quand la file de rendu PDF est pleine.
     
-    except Exception as e:
-        print(f"Erreur lors de l'optimisation de la signature: {e}")
-        return base64_string  # Retourner l'original en cas d'erreur
+    Args:
+        error: Exception RenderPoolBusy (contient le délai conseillé)
+    """
+    response = jsonify({
+        'success': False,
+        'message': f'Serveur de génération PDF occupé, réessayez dans {error.retry_after} s',
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 
-def send_email_with_pdf(pdf_bytes, recipients, chantier_name, date_reception):
+def drafts_pending_response():
     """
-    Envoie le PDF généré par email via SMTP.
+    Réponse 503 renvoyée quand le brouillon en attente d'un PV n'a pas pu être écrit avant
+    sa lecture (vidage trop long, ou brouillon abandonné sur erreur) : la base ne contient
+    pas la dernière sauvegarde annoncée au client.
+    """
+    retry_after = int(DRAFT_FLUSH_INTERVAL) + 1
+    response = jsonify({
+        'success': False,
+        'message': f'Dernière sauvegarde du PV pas encore enregistrée, réessayez dans {retry_after} s',
+        'retry_after': retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def wants_binary_pdf():
+    """
+    Négociation du format de réponse de /download-pdf.
+    
+    Returns:
+        bool: True si le client préfère application/pdf (en-tête Accept)
+              plutôt que l'ancien format JSON avec PDF en base64
+    """
+    best = request.accept_mimetypes.best_match(['application/json', 'application/pdf'])
+    return best == 'application/pdf'
+
+
+def queue_email_with_pdf(pdf_bytes, recipients, chantier_name, date_reception, pv_id=None, version_number=None):
+    """
+    Ajoute l'email du PV (PDF en pièce jointe) à l'outbox.
+    L'envoi SMTP est fait en arrière-plan par mailer.py ; valider avec db.session.commit().
     
     Args:
         pdf_bytes: Contenu binaire du PDF
         recipients: Liste d'adresses email des destinataires ou une seule adresse
         chantier_name: Nom du chantier (pour le sujet)
         date_reception: Date de réception (pour le nom de fichier)
+        pv_id: Identifiant du PV envoyé
+        version_number: Version du PV envoyée
         
     Returns:
-        tuple: (success: bool, message: str)
+        EmailOutbox: Entrée de l'outbox
     """
-    # Recharger la configuration SMTP depuis le fichier
-    config = load_smtp_config()
-    smtp_server = config.get('smtp_server', 'smtp.gmail.com')
-    smtp_port = config.get('smtp_port', 587)
-    smtp_username = config.get('smtp_username', '')
-    smtp_password = config.get('smtp_password', '')
-    smtp_from_name = config.get('smtp_from_name', 'Centrale Lyon Conseil')
-    
-    if not smtp_username or not smtp_password:
-        return False, """⚠️ Configuration email non configurée. Cliquez sur "⚙️ Configuration Email" en haut de la page pour activer l'envoi automatique par email."""
-    
     # Convertir en liste si c'est une seule adresse
     if isinstance(recipients, str):
         recipients = [recipients]
     
-    try:
-        # Construire le message MIME
-        msg = MIMEMultipart()
-        msg['From'] = f"{smtp_from_name} <{smtp_username}>"
-        msg['To'] = ', '.join(recipients)
-        msg['Subject'] = f"PV Matériel Loué - {chantier_name} - {date_reception}"
-        
-        # Corps du message
-        body = f"""
+    # Corps du message
+    body = f"""
 Bonjour,
 
 Veuillez trouver ci-joint le Procès-Verbal de matériel loué pour le chantier : {chantier_name}
@@ -161,29 +307,16 @@ Ce document a été généré automatiquement par l'application de gestion Franc
 Cordialement,
 L'équipe France Montage
         """
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Attacher le PDF
-        filename = f"PV_Materiel_{chantier_name.replace(' ', '_')}_{date_reception}.pdf"
-        pdf_attachment = MIMEApplication(pdf_bytes, _subtype='pdf')
-        pdf_attachment.add_header('Content-Disposition', 'attachment', filename=filename)
-        msg.attach(pdf_attachment)
-        
-        # Connexion au serveur SMTP et envoi
-        with smtplib.SMTP(smtp_server, smtp_port, timeout=10) as server:
-            server.starttls()  # Sécuriser la connexion
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
-        
-        recipients_str = ', '.join(recipients)
-        return True, f"Email envoyé avec succès à {recipients_str}"
     
-    except smtplib.SMTPAuthenticationError:
-        return False, "Erreur d'authentification SMTP. Vérifier les identifiants."
-    except smtplib.SMTPException as e:
-        return False, f"Erreur SMTP: {str(e)}"
-    except Exception as e:
-        return False, f"Erreur lors de l'envoi: {str(e)}"
+    return enqueue_email(
+        recipients,
+        subject=f"PV Matériel Loué - {chantier_name} - {date_reception}",
+        body=body,
+        attachment_name=f"PV_Materiel_{chantier_name.replace(' ', '_')}_{date_reception}.pdf",
+        attachment=pdf_bytes,
+        pv_id=pv_id,
+        version_number=version_number
+    )
 
 
 @app.route('/')
@@ -198,116 +331,31 @@ def submit():
     Traite la soumission du formulaire, génère le PDF et l'envoie par email.
     """
     try:
-        # Récupération des données du formulaire
-        form_data = {
-            # Métadonnées
-            'chantier': request.form.get('chantier', ''),
-            'date_reception': request.form.get('date_reception', ''),
-            'date_retour': request.form.get('date_retour', ''),
-            'materiel_numero': request.form.get('materiel_numero', ''),
-            'materiel_type': request.form.get('materiel_type', ''),
-            'fournisseur': request.form.get('fournisseur', ''),
-            'responsable': request.form.get('responsable', ''),
-            'email_destinataire': request.form.get('email_destinataire', ''),
-            'email_conducteur': request.form.getlist('email_conducteur'),  # Liste d'emails
-            'email_entreprise': request.form.get('email_entreprise', ''),
-            
-            # Compteurs
-            'compteur_reception': request.form.get('compteur_reception', ''),
-            'compteur_retour': request.form.get('compteur_retour', ''),
-            
-            # État - Réception
-            'carrosserie_reception': request.form.get('carrosserie_reception', ''),
-            'eclairage_reception': request.form.get('eclairage_reception', ''),
-            'pneumatiques_reception': request.form.get('pneumatiques_reception', ''),
-            'panier_reception': request.form.get('panier_reception', ''),
-            'flexibles_reception': request.form.get('flexibles_reception', ''),
-            'commandes_reception': request.form.get('commandes_reception', ''),
-            'conformite_reception': request.form.get('conformite_reception', ''),
-            'mobilites_reception': request.form.get('mobilites_reception', ''),
-            'nacelles_reception': request.form.get('nacelles_reception', ''),
-            'securite_reception': request.form.get('securite_reception', ''),
-            
-            # État - Retour
-            'carrosserie_retour': request.form.get('carrosserie_retour', ''),
-            'eclairage_retour': request.form.get('eclairage_retour', ''),
-            'pneumatiques_retour': request.form.get('pneumatiques_retour', ''),
-            'panier_retour': request.form.get('panier_retour', ''),
-            'flexibles_retour': request.form.get('flexibles_retour', ''),
-            'commandes_retour': request.form.get('commandes_retour', ''),
-            'conformite_retour': request.form.get('conformite_retour', ''),
-            'mobilites_retour': request.form.get('mobilites_retour', ''),
-            'nacelles_retour': request.form.get('nacelles_retour', ''),
-            'securite_retour': request.form.get('securite_retour', ''),
-            
-            # Fluides - Réception
-            'carburant_reception': request.form.get('carburant_reception', ''),
-            'fuite_moteur_reception': request.form.get('fuite_moteur_reception', 'non'),
-            'fuite_hydraulique_reception': request.form.get('fuite_hydraulique_reception', 'non'),
-            'fuite_gasoil_reception': request.form.get('fuite_gasoil_reception', 'non'),
-            
-            # Fluides - Retour
-            'carburant_retour': request.form.get('carburant_retour', ''),
-            'fuite_moteur_retour': request.form.get('fuite_moteur_retour', 'non'),
-            'fuite_hydraulique_retour': request.form.get('fuite_hydraulique_retour', 'non'),
-            'fuite_gasoil_retour': request.form.get('fuite_gasoil_retour', 'non'),
-            
-            # Observations
-            'observations_reception': request.form.get('observations_reception', ''),
-            'observations_retour': request.form.get('observations_retour', ''),
-            
-            # Signatures - vérifier d'abord dans files (envoi depuis JS), puis dans form (sauvegarde JSON)
-            'signature_reception': '',
-            'signature_retour': '',
-        }
+        # Brouillon en attente du PV écrit avant toute lecture (version, JSON existant)
+        if not flush_drafts(request.form.get('pv_id')):
+            return drafts_pending_response()
         
-        # Gérer les signatures qui peuvent venir de request.files (Blob) ou request.form (base64)
-        if 'signature_reception' in request.files:
-            sig_file = request.files['signature_reception']
-            if sig_file and sig_file.filename:
-                # Lire le fichier et le convertir en base64
-
-                sig_data = sig_file.read()
-                form_data['signature_reception'] = f"data:image/png;base64,{base64.b64encode(sig_data).decode('utf-8')}"
-        elif request.form.get('signature_reception'):
-            form_data['signature_reception'] = request.form.get('signature_reception', '')
-        
-        if 'signature_retour' in request.files:
-            sig_file = request.files['signature_retour']
-            if sig_file and sig_file.filename:
-                # Lire le fichier et le convertir en base64
-
-                sig_data = sig_file.read()
-                form_data['signature_retour'] = f"data:image/png;base64,{base64.b64encode(sig_data).decode('utf-8')}"
-        elif request.form.get('signature_retour'):
-            form_data['signature_retour'] = request.form.get('signature_retour', '')
-        
-        # Récupérer toutes les photos (qui peuvent avoir des noms comme photo_carrosserie_reception_1, photo_carrosserie_reception_2, etc.)
-        photo_base_fields = ['carrosserie_reception', 'carrosserie_retour',
-                             'eclairage_reception', 'eclairage_retour',
-                             'pneumatiques_reception', 'pneumatiques_retour',
-                             'panier_reception', 'panier_retour',
-                             'flexibles_reception', 'flexibles_retour',
-                             'commandes_reception', 'commandes_retour',
-                             'conformite_reception', 'conformite_retour',
-                             'mobilites_reception', 'mobilites_retour',
-                             'nacelles_reception', 'nacelles_retour',
-                             'securite_reception', 'securite_retour',
-                             'fuite_reception', 'fuite_retour',
-                             'carburant_reception', 'carburant_retour',
-                             'observation_reception', 'observation_retour']
-        
-        for field in photo_base_fields:
-            # Collecter toutes les photos pour ce champ
-            photos = []
-            for key in request.form.keys():
-                if key.startswith(f'photo_{field}'):
-                    photo_data = request.form.get(key, '')
-                    if photo_data:
-                        photos.append(photo_data)
-            
-            # Stocker la liste des photos
-            form_data[f'photo_{field}'] = photos if photos else []
+        # Lecture du formulaire (schéma compilé, photos réparties en un seul passage)
+        try:
+            form_data = parse_form(request.form, request.files)
+        except FormValidationError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('index'))
+        
+        # Lectures en BEGIN simple, transaction terminée avant l'optimisation des images et le rendu :
+        # le verrou d'écriture n'est pris que pour l'enregistrement du PV
+        pv_id = request.form.get('pv_id')
+        with read_transactions():
+            # Photos envoyées par morceaux : le formulaire ne contient que leur référence
+            form_data = hydrate_blobs(form_data)
+            version_courante = None
+            if pv_id:
+                version_courante = db.session.query(PV.version_courante).filter_by(id=pv_id).scalar()
+            db.session.commit()
+        
+        if collect_blob_refs(form_data):
+            flash('Une photo n\'a pas fini d\'être envoyée, réessayez dans quelques instants', 'danger')
+            return redirect(url_for('index'))
         
         # Validation des champs obligatoires
         if not form_data['chantier']:
@@ -318,34 +366,14 @@ def submit():
             flash('Au moins un email destinataire est obligatoire', 'danger')
             return redirect(url_for('index'))
         
-        # Optimiser les signatures si présentes
-        if form_data['signature_reception']:
-            form_data['signature_reception'] = optimize_signature(form_data['signature_reception'])
-        
-        if form_data['signature_retour']:
-            form_data['signature_retour'] = optimize_signature(form_data['signature_retour'])
-        
-        # Optimiser les photos si présentes
-        for field in photo_base_fields:
-            photo_key = f'photo_{field}'
-            if photo_key in form_data and form_data[photo_key]:
-                # Optimiser chaque photo dans la liste
-                optimized_photos = []
-                for photo in form_data[photo_key]:
-                    if photo:
-                        optimized_photos.append(optimize_signature(photo))
-                form_data[photo_key] = optimized_photos
+        # Optimiser photos et signatures (en parallèle)
+        optimize_form_images(form_data, PHOTO_BASE_FIELDS)
         
         # Ajouter la date de génération
         form_data['date_generation'] = datetime.now().strftime('%d/%m/%Y %H:%M')
         
-        # Récupérer la version courante ou créer la version 1
-        pv_id = request.form.get('pv_id')
-        version_number = 1
-        if pv_id:
-            existing_pv = PV.query.get(pv_id)
-            if existing_pv:
-                version_number = existing_pv.version_courante + 1
+        # Version courante + 1, ou version 1
+        version_number = version_courante + 1 if version_courante else 1
         
         # Ajouter les infos de version au template
         form_data['version_info'] = {
@@ -353,13 +381,13 @@ def submit():
             'date': datetime.now().strftime('%d/%m/%Y %H:%M')
         }
         
-        # Générer le HTML pour le PDF
-        html_content = render_template('pdf_template.html', **form_data)
+        # Vérifier la configuration email avant de générer le PDF
+        if not is_configured(smtp_settings(load_smtp_config())):
+            flash("""⚠️ Configuration email non configurée. Cliquez sur "⚙️ Configuration Email" en haut de la page pour activer l'envoi automatique par email.""", 'danger')
+            return redirect(url_for('index'))
         
-        # Générer le PDF en mémoire avec WeasyPrint
-        # Utiliser base_url pour permettre à WeasyPrint de résoudre les chemins relatifs des images
-        base_url = request.url_root
-        pdf_bytes = HTML(string=html_content, base_url=base_url).write_pdf()
+        # Générer le PDF dans le pool de rendu
+        pdf_bytes = render_pdf(form_data)
         
         # Préparer la liste des destinataires (tous les emails conducteur + email entreprise)
         recipients = [email.strip() for email in form_data.get('email_conducteur', []) if email.strip()]
@@ -367,122 +395,140 @@ def submit():
         if email_entreprise and email_entreprise not in recipients:
             recipients.append(email_entreprise)
         
-        # Envoyer le PDF par email
-        success, message = send_email_with_pdf(
-            pdf_bytes,
-            recipients,
-            form_data['chantier'],
-            form_data['date_reception'] or 'Non spécifiée'
-        )
+        # Sauvegarder le PV et mettre l'email en file d'envoi (même transaction)
+        pv_id = request.form.get('pv_id')
+        if not pv_id:
+            # Générer un nouvel ID si le PV n'en a pas
+            pv_id = str(uuid.uuid4())
         
-        if success:
-            flash(message, 'success')
-            
-            # Sauvegarder le PV après envoi réussi dans la base de données
-            pv_id = request.form.get('pv_id')
-            if not pv_id:
-                # Générer un nouvel ID si le PV n'en a pas
-                pv_id = str(uuid.uuid4())
+        try:
+            # Vérifier si le PV existe déjà
+            existing_pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
             
-            try:
-                # Vérifier si le PV existe déjà
-                existing_pv = PV.query.get(pv_id)
+            if existing_pv:
+                # Créer une nouvelle version avant la mise à jour
+                new_version_number = existing_pv.version_courante + 1
                 
-                if existing_pv:
-                    # Créer une nouvelle version avant la mise à jour
-                    new_version_number = existing_pv.version_courante + 1
-                    
-                    # Sauvegarder l'état actuel comme version
-                    version_data = existing_pv.get_data()
-                    version_data['version_info'] = {
-                        'number': existing_pv.version_courante,
-                        'date': datetime.now().isoformat(),
-                        'sent_to': ', '.join(recipients)
-                    }
-                    
-                    new_version = PVVersion(
-                        pv_id=pv_id,
-                        version_number=existing_pv.version_courante,
-                        data_dict=version_data,
-                        created_by='email_send',
-                        comment=f"Envoyé à {', '.join(recipients)}"
-                    )
-                    db.session.add(new_version)
-                    
-                    # Mise à jour d'un PV existant avec nouvelle version
-                    existing_pv.chantier = form_data['chantier']
-                    existing_pv.date_dernier_envoi = datetime.now()
-                    existing_pv.version_courante = new_version_number
-                    
-                    # Mettre à jour les champs indexés
-                    indexed_fields = PV.extract_indexed_fields(form_data)
-                    existing_pv.conducteur_email = indexed_fields.get('conducteur_email')
-                    existing_pv.entreprise_email = indexed_fields.get('entreprise_email')
-                    existing_pv.responsable = indexed_fields.get('responsable')
-                    existing_pv.fournisseur = indexed_fields.get('fournisseur')
-                    existing_pv.materiel_type = indexed_fields.get('materiel_type')
-                    existing_pv.date_reception = indexed_fields.get('date_reception')
-                    existing_pv.date_retour = indexed_fields.get('date_retour')
-                    existing_pv.statut = indexed_fields.get('statut')
-                    
-                    # Mettre à jour le JSON complet avec info de version
-                    pv_dict = existing_pv.get_data()
-                    pv_dict['form_data'] = form_data
-                    pv_dict['updated_at'] = datetime.now().isoformat()
-                    pv_dict['last_sent_date'] = datetime.now().isoformat()
-                    pv_dict['version_info'] = {
-                        'number': new_version_number,
+                # Sauvegarder l'état actuel comme version
+                version_data = existing_pv.get_data()
+                version_data['version_info'] = {
+                    'number': existing_pv.version_courante,
+                    'date': datetime.now().isoformat(),
+                    'sent_to': ', '.join(recipients)
+                }
+                
+                new_version = PVVersion(
+                    pv_id=pv_id,
+                    version_number=existing_pv.version_courante,
+                    data_dict=version_data,
+                    created_by='email_send',
+                    comment=f"Envoyé à {', '.join(recipients)}"
+                )
+                db.session.add(new_version)
+                
+                # Mise à jour d'un PV existant avec nouvelle version
+                existing_pv.chantier = form_data['chantier']
+                existing_pv.version_courante = new_version_number
+                
+                # Mettre à jour les champs indexés
+                indexed_fields = PV.extract_indexed_fields(form_data)
+                existing_pv.conducteur_email = indexed_fields.get('conducteur_email')
+                existing_pv.entreprise_email = indexed_fields.get('entreprise_email')
+                existing_pv.responsable = indexed_fields.get('responsable')
+                existing_pv.fournisseur = indexed_fields.get('fournisseur')
+                existing_pv.materiel_type = indexed_fields.get('materiel_type')
+                existing_pv.materiel_numero = indexed_fields.get('materiel_numero')
+                existing_pv.date_reception = indexed_fields.get('date_reception')
+                existing_pv.date_retour = indexed_fields.get('date_retour')
+                existing_pv.statut = indexed_fields.get('statut')
+                
+                # Mettre à jour le JSON complet avec info de version
+                pv_dict = existing_pv.get_data()
+                pv_dict['form_data'] = form_data
+                pv_dict['updated_at'] = datetime.now().isoformat()
+                pv_dict['last_sent_date'] = datetime.now().isoformat()
+                pv_dict['version_info'] = {
+                    'number': new_version_number,
+                    'date': datetime.now().isoformat(),
+                    'sent_to': ', '.join(recipients)
+                }
+                existing_pv.set_data(pv_dict)
+                
+            else:
+                # Créer un nouveau PV (Version 1)
+                indexed_fields = PV.extract_indexed_fields(form_data)
+                
+                pv_dict = {
+                    'id': pv_id,
+                    'chantier': form_data['chantier'],
+                    'created_at': datetime.now().isoformat(),
+                    'updated_at': datetime.now().isoformat(),
+                    'last_sent_date': datetime.now().isoformat(),
+                    'form_data': form_data,
+                    'version_info': {
+                        'number': 1,
                         'date': datetime.now().isoformat(),
                         'sent_to': ', '.join(recipients)
                     }
-                    existing_pv.set_data(pv_dict)
-                    
-                else:
-                    # Créer un nouveau PV (Version 1)
-                    indexed_fields = PV.extract_indexed_fields(form_data)
-                    
-                    pv_dict = {
-                        'id': pv_id,
-                        'chantier': form_data['chantier'],
-                        'created_at': datetime.now().isoformat(),
-                        'updated_at': datetime.now().isoformat(),
-                        'last_sent_date': datetime.now().isoformat(),
-                        'form_data': form_data,
-                        'version_info': {
-                            'number': 1,
-                            'date': datetime.now().isoformat(),
-                            'sent_to': ', '.join(recipients)
-                        }
-                    }
-                    
-                    new_pv = PV(
-                        id=pv_id,
-                        chantier=form_data['chantier'],
-                        data_dict=pv_dict,
-                        conducteur_email=indexed_fields.get('conducteur_email'),
-                        entreprise_email=indexed_fields.get('entreprise_email'),
-                        responsable=indexed_fields.get('responsable'),
-                        fournisseur=indexed_fields.get('fournisseur'),
-                        materiel_type=indexed_fields.get('materiel_type'),
-                        date_reception=indexed_fields.get('date_reception'),
-                        date_retour=indexed_fields.get('date_retour'),
-                        statut=indexed_fields.get('statut'),
-                        date_dernier_envoi=datetime.now()
-                    )
-                    db.session.add(new_pv)
-                
-                # Commit des changements
-                db.session.commit()
+                }
                 
-            except Exception as db_error:
-                db.session.rollback()
-                print(f"Erreur lors de la sauvegarde DB: {db_error}")
-                flash(f"Attention: email envoyé mais erreur de sauvegarde: {db_error}", 'warning')
-        else:
-            flash(message, 'danger')
+                new_pv = PV(
+                    id=pv_id,
+                    chantier=form_data['chantier'],
+                    data_dict=pv_dict,
+                    conducteur_email=indexed_fields.get('conducteur_email'),
+                    entreprise_email=indexed_fields.get('entreprise_email'),
+                    responsable=indexed_fields.get('responsable'),
+                    fournisseur=indexed_fields.get('fournisseur'),
+                    materiel_type=indexed_fields.get('materiel_type'),
+                    materiel_numero=indexed_fields.get('materiel_numero'),
+                    date_reception=indexed_fields.get('date_reception'),
+                    date_retour=indexed_fields.get('date_retour'),
+                    statut=indexed_fields.get('statut')
+                )
+                db.session.add(new_pv)
+            
+            # Email en file d'envoi, validé avec le PV
+            email = queue_email_with_pdf(
+                pdf_bytes,
+                recipients,
+                form_data['chantier'],
+                form_data['date_reception'] or 'Non spécifiée',
+                pv_id=pv_id,
+                version_number=version_number
+            )
+            
+            # Commit des changements
+            db.session.commit()
+            
+        except Exception as db_error:
+            db.session.rollback()
+            print(f"Erreur lors de la sauvegarde DB: {db_error}")
+            flash(f"Erreur lors de la sauvegarde du PV, email non envoyé: {db_error}", 'danger')
+            return redirect(url_for('index'))
+        
+        sender = get_mail_sender()
+        if sender:
+            sender.notify()
         
+        message = f"PV enregistré, envoi par email en cours à {', '.join(recipients)}"
+        
+        # Appel depuis le frontend : l'état de l'envoi est suivi via /email-status
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({
+                'success': True,
+                'message': message,
+                'pv_id': pv_id,
+                'email_id': email.id,
+                'status_url': url_for('email_status', pv_id=pv_id)
+            })
+        
+        flash(message, 'success')
         return redirect(url_for('index'))
     
+    except RenderPoolBusy as e:
+        return render_busy_response(e)
+    
     except Exception as e:
         flash(f'Erreur lors de la génération du PV: {str(e)}', 'danger')
         print(f"Erreur complète: {e}")
@@ -496,7 +542,64 @@ def health():
     """Endpoint de santé pour vérifier que l'application fonctionne."""
     return jsonify({
         'status': 'healthy',
-        'smtp_configured': bool(SMTP_USERNAME and SMTP_PASSWORD)
+        'smtp_configured': is_configured(smtp_settings(load_smtp_config())),
+        'database': get_sqlite_pragmas() if db.engine.dialect.name == 'sqlite' else db.engine.dialect.name
+    })
+
+
+@app.route('/email-status/<pv_id>')
+def email_status(pv_id):
+    """
+    État des envois email d'un PV (du plus récent au plus ancien), interrogé par le frontend.
+    """
+    emails = (EmailOutbox.query
+              .filter_by(pv_id=pv_id)
+              .order_by(EmailOutbox.date_creation.desc(), EmailOutbox.id.desc())
+              .all())
+    
+    # Dernier état connu pour chaque version envoyée
+    versions = {}
+    for email in emails:
+        versions.setdefault(str(email.version_number), email.status)
+    
+    return jsonify({
+        'success': True,
+        'pv_id': pv_id,
+        'status': emails[0].status if emails else None,
+        'versions': versions,
+        'emails': [email.to_dict() for email in emails]
+    })
+
+
+@app.route('/stats/email')
+def email_stats():
+    """Métriques de l'outbox et des threads d'envoi."""
+    sender = get_mail_sender()
+    return jsonify({
+        'success': True,
+        'enabled': sender is not None,
+        'sender': sender.stats() if sender else None
+    })
+
+
+@app.route('/stats/drafts')
+def draft_stats():
+    """Métriques de l'écriture différée des brouillons (en attente, fusionnés, écrits, lots)."""
+    drafts = get_draft_buffer()
+    return jsonify({
+        'success': True,
+        'enabled': drafts is not None,
+        'buffer': drafts.stats() if drafts else None
+    })
+
+
+@app.route('/stats/pdf')
+def pdf_stats():
+    """Métriques de génération PDF (pool de rendu, file d'attente, durées, cache)."""
+    return jsonify({
+        'success': True,
+        'render_pool': get_render_pool().stats(),
+        'cache': pdf_cache.stats()
     })
 
 
@@ -609,11 +712,155 @@ def test_smtp_config():
         }), 500
 
 
+def apply_draft_to_pv(pv, form_data, update_vgp, revision=None):
+    """
+    Écrit un brouillon (form_data complet) dans un PV existant : JSON et champs indexés.
+    Utilisé par /save, PATCH /save/<id> et le thread d'écriture différée.
+    
+    Args:
+        pv: PV chargé avec sa colonne data
+        form_data: Données complètes du formulaire
+        update_vgp: Mettre à jour la date VGP (présente ou retirée dans le brouillon)
+        revision: Révision réservée à la réception du brouillon (écriture différée), sinon nouvelle révision
+    """
+    pv.chantier = form_data.get('chantier', 'Sans nom')
+    
+    # Mettre à jour les champs indexés
+    indexed_fields = PV.extract_indexed_fields(form_data)
+    pv.conducteur_email = indexed_fields.get('conducteur_email')
+    pv.entreprise_email = indexed_fields.get('entreprise_email')
+    pv.responsable = indexed_fields.get('responsable')
+    pv.fournisseur = indexed_fields.get('fournisseur')
+    pv.materiel_type = indexed_fields.get('materiel_type')
+    pv.materiel_numero = indexed_fields.get('materiel_numero')
+    pv.date_reception = indexed_fields.get('date_reception')
+    pv.date_retour = indexed_fields.get('date_retour')
+    pv.statut = indexed_fields.get('statut')
+    
+    if update_vgp:
+        pv.vgp_date = form_data.get('vgp_date') or None
+    
+    # Mettre à jour explicitement la date de mise à jour (important pour l'affichage de la version courante)
+    pv.date_mise_a_jour = datetime.utcnow()
+    
+    # Mettre à jour le JSON complet
+    pv_dict = pv.get_data()
+    pv_dict['form_data'] = form_data
+    pv_dict['updated_at'] = datetime.now().isoformat()
+    pv.set_data(pv_dict, revision)
+
+
+def check_draft(form_data):
+    """
+    Vérifie qu'un brouillon peut être écrit dans un PV (nom du chantier, valeurs des champs indexés).
+    Appelée avant de répondre : avec l'écriture différée, une erreur au vidage ne serait
+    plus signalée au client.
+    
+    Args:
+        form_data: Données complètes du formulaire
+        
+    Raises:
+        DraftValidationError: Brouillon impossible à écrire
+    """
+    if not isinstance(form_data, dict):
+        raise DraftValidationError('Données du formulaire invalides')
+    if not isinstance(form_data.get('chantier', 'Sans nom'), str):
+        raise DraftValidationError('Nom du chantier invalide')
+    try:
+        indexed_fields = PV.extract_indexed_fields(form_data)
+    except (TypeError, ValueError) as e:
+        raise DraftValidationError(f'Données du formulaire invalides : {e}')
+    for name, value in indexed_fields.items():
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise DraftValidationError(f'Valeur invalide pour {name}')
+
+
+
+def reserve_pv_revision(pv_id, base_revision=None):
+    """
+    Réserve en base la révision suivante d'un PV pour un brouillon de l'écriture différée.
+    UPDATE ... RETURNING atomique : deux workers n'annoncent jamais la même révision.
+    Transaction courte, sans lecture du JSON.
+    
+    Args:
+        pv_id: Identifiant du PV
+        base_revision: Ne réserver que si c'est encore la dernière révision attribuée (PATCH)
+        
+    Returns:
+        int: Révision réservée, ou None (PV inexistant, ou base_revision dépassée)
+    """
+    query = db.update(PV).where(PV.id == pv_id)
+    if base_revision is not None:
+        query = query.where(PV.revision_reservee == base_revision)
+    query = query.values(revision_reservee=PV.revision_reservee + 1,
+                         date_reservation=datetime.utcnow()).returning(PV.revision_reservee)
+    with write_transactions():
+        revision = db.session.execute(query, execution_options={'synchronize_session': False}).scalar()
+        db.session.commit()
+    return revision
+
+
+def release_pv_revision(pv_id, revision):
+    """
+    Rend une révision réservée dont le brouillon ne sera pas écrit (abandonné sur erreur, ou
+    réservation perdue) : revision_reservee revient à revision, sauf si une révision plus
+    récente a été réservée entre-temps.
+    
+    Args:
+        pv_id: Identifiant du PV
+        revision: Révision réservée à rendre
+        
+    Returns:
+        bool: True si la réservation a été rendue
+    """
+    query = (db.update(PV).where(PV.id == pv_id, PV.revision_reservee == revision)
+             .values(revision_reservee=PV.revision))
+    with write_transactions():
+        released = db.session.execute(query, execution_options={'synchronize_session': False}).rowcount == 1
+        db.session.commit()
+    return released
+
+
+def revision_reservation_lost(pv):
+    """
+    Indique si la révision réservée d'un PV ne sera jamais écrite : réservée au-delà de
+    revision depuis plus de DRAFT_FLUSH_TIMEOUT secondes (worker arrêté avec des brouillons
+    en attente, réservation sans brouillon). Un brouillon en attente est écrit bien avant.
+    """
+    if pv.revision_reservee == pv.revision:
+        return False
+    return (pv.date_reservation is None
+            or datetime.utcnow() - pv.date_reservation > timedelta(seconds=DRAFT_FLUSH_TIMEOUT))
+
+
+# Écriture différée des brouillons (/save et PATCH /save/<id> sur un PV existant)
+start_draft_buffer(app, apply_draft_to_pv, check_draft, release_pv_revision)
+
+
+def load_pv_form_state(pv_id):
+    """
+    (révision, révision réservée, form_data) en base d'un PV (None s'il n'existe pas),
+    lus sans prendre le verrou d'écriture. Une réservation perdue est rendue au passage.
+    """
+    with read_transactions():
+        pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
+        state = (pv.revision, pv.revision_reservee, pv.get_data().get('form_data', {})) if pv else None
+        lost = pv is not None and revision_reservation_lost(pv)
+        db.session.commit()
+    if lost and release_pv_revision(pv_id, state[1]):
+        print(f"⚠️ Révision {state[1]} du PV {pv_id} réservée sans écriture : rendue")
+        state = (state[0], state[0], state[2])
+    return state
+
+
 @app.route('/save', methods=['POST'])
 def save_pv():
     """
     Sauvegarde un PV en cours de rédaction dans la base de données.
     Permet de reprendre l'édition plus tard.
+    
+    Un PV existant passe par le tampon d'écriture différée s'il est actif : la réponse
+    est immédiate et l'écriture en base suit au prochain vidage.
     """
     try:
         data = request.get_json()
@@ -622,36 +869,26 @@ def save_pv():
         pv_id = data.get('pv_id') or str(uuid.uuid4())
         chantier = data.get('chantier', 'Sans nom')
         
+        check_draft(data)
+        
+        drafts = get_draft_buffer()
+        if drafts is not None and data.get('pv_id'):
+            revision = drafts.put(pv_id, data, lambda: reserve_pv_revision(pv_id), update_vgp='vgp_date' in data)
+            if revision is not None:
+                return jsonify({
+                    'success': True,
+                    'message': f'PV "{chantier}" sauvegardé avec succès',
+                    'pv_id': pv_id,
+                    'chantier': chantier,
+                    'revision': revision
+                })
+        
         # Vérifier si le PV existe déjà
-        existing_pv = PV.query.get(pv_id)
+        existing_pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
         
         if existing_pv:
             # Mise à jour d'un PV existant
-            existing_pv.chantier = chantier
-            
-            # Mettre à jour les champs indexés
-            indexed_fields = PV.extract_indexed_fields(data)
-            existing_pv.conducteur_email = indexed_fields.get('conducteur_email')
-            existing_pv.entreprise_email = indexed_fields.get('entreprise_email')
-            existing_pv.responsable = indexed_fields.get('responsable')
-            existing_pv.fournisseur = indexed_fields.get('fournisseur')
-            existing_pv.materiel_type = indexed_fields.get('materiel_type')
-            existing_pv.date_reception = indexed_fields.get('date_reception')
-            existing_pv.date_retour = indexed_fields.get('date_retour')
-            existing_pv.statut = indexed_fields.get('statut')
-            
-            # Mettre à jour la date VGP si présente
-            if 'vgp_date' in data:
-                existing_pv.vgp_date = data.get('vgp_date') or None
-            
-            # Mettre à jour explicitement la date de mise à jour (important pour l'affichage de la version courante)
-            existing_pv.date_mise_a_jour = datetime.utcnow()
-            
-            # Mettre à jour le JSON complet
-            pv_dict = existing_pv.get_data()
-            pv_dict['form_data'] = data
-            pv_dict['updated_at'] = datetime.now().isoformat()
-            existing_pv.set_data(pv_dict)
+            apply_draft_to_pv(existing_pv, data, update_vgp='vgp_date' in data)
             
         else:
             # Créer un nouveau PV
@@ -675,6 +912,7 @@ def save_pv():
                 responsable=indexed_fields.get('responsable'),
                 fournisseur=indexed_fields.get('fournisseur'),
                 materiel_type=indexed_fields.get('materiel_type'),
+                materiel_numero=indexed_fields.get('materiel_numero'),
                 date_reception=indexed_fields.get('date_reception'),
                 date_retour=indexed_fields.get('date_retour'),
                 statut=indexed_fields.get('statut'),
@@ -682,73 +920,511 @@ def save_pv():
             )
             db.session.add(new_pv)
         
-        # Commit des changements
-        db.session.commit()
+        # Commit des changements
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': f'PV "{chantier}" sauvegardé avec succès',
+            'pv_id': pv_id,
+            'chantier': chantier,
+            'revision': (existing_pv or new_pv).revision
+        })
+    
+    except DraftValidationError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors de la sauvegarde: {str(e)}'
+        }), 500
+
+
+@app.route('/save/<pv_id>', methods=['PATCH'])
+def save_pv_fields(pv_id):
+    """
+    Sauvegarde incrémentale d'un PV existant (auto-sauvegarde) : seuls les champs modifiés
+    sont envoyés et fusionnés dans le form_data stocké.
+    
+    Corps JSON :
+        base_revision : révision sur laquelle s'appuient les modifications (revision de /load-pv ou /save)
+        set : champs modifiés ou ajoutés {nom: valeur}
+        unset : noms des champs supprimés (photos retirées, signatures effacées...)
+    
+    Répond 409 avec la révision courante si le PV a été modifié depuis base_revision.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        changes = data.get('set') or {}
+        removed = data.get('unset') or []
+        
+        if not isinstance(changes, dict) or not isinstance(removed, list) or 'base_revision' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'Requête invalide (base_revision, set et unset attendus)'
+            }), 400
+        
+        drafts = get_draft_buffer()
+        if drafts is not None:
+            status, revision, form_data = drafts.patch(
+                pv_id, data['base_revision'], changes, removed, lambda: load_pv_form_state(pv_id),
+                lambda base_revision: reserve_pv_revision(pv_id, base_revision))
+            if status == 'ok':
+                return jsonify({
+                    'success': True,
+                    'pv_id': pv_id,
+                    'chantier': form_data.get('chantier', 'Sans nom'),
+                    'revision': revision,
+                    'fields': len(changes) + len(removed)
+                })
+        else:
+            pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
+            if not pv:
+                status = 'missing'
+            else:
+                # Révision réservée au-delà : brouillon en attente dans un worker avec écriture
+                # différée, sauf réservation perdue (set_data passe alors au-delà)
+                revision = pv.revision if revision_reservation_lost(pv) else pv.revision_reservee
+                status = 'ok' if data['base_revision'] == pv.revision == revision else 'conflict'
+        
+        if status == 'missing':
+            return jsonify({
+                'success': False,
+                'message': 'PV introuvable'
+            }), 404
+        
+        if status == 'conflict':
+            return jsonify({
+                'success': False,
+                'message': 'Le PV a été modifié entre-temps',
+                'revision': revision
+            }), 409
+        
+        form_data = dict(pv.get_data().get('form_data', {}))
+        for field in removed:
+            form_data.pop(field, None)
+        form_data.update(changes)
+        check_draft(form_data)
+        
+        # Champs indexés recalculés sur le form_data fusionné
+        apply_draft_to_pv(pv, form_data, update_vgp='vgp_date' in changes or 'vgp_date' in removed)
+        
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'pv_id': pv_id,
+            'chantier': pv.chantier,
+            'revision': pv.revision,
+            'fields': len(changes) + len(removed)
+        })
+    
+    except DraftValidationError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors de la sauvegarde: {str(e)}'
+        }), 500
+
+
+def page_limit(args):
+    """
+    Taille de page demandée (paramètre limit), bornée à LIST_PV_MAX_PAGE_SIZE.
+    
+    Args:
+        args: Paramètres d'URL
+    """
+    try:
+        limit = int(args.get('limit', LIST_PV_PAGE_SIZE))
+    except ValueError:
+        limit = LIST_PV_PAGE_SIZE
+    return max(1, min(limit, LIST_PV_MAX_PAGE_SIZE))
+
+
+def apply_list_filters(query, args, exclude=()):
+    """
+    Applique à une requête sur PV les filtres de LIST_PV_FILTERS, LIST_PV_RANGE_FILTERS
+    et le filtre email_conducteur (PV dont la liste d'emails contient l'un des emails donnés).
+    
+    Args:
+        query: Requête SQLAlchemy sur PV
+        args: Paramètres d'URL
+        exclude: Noms de filtres exacts à ignorer (facette en cours de calcul)
+        
+    Returns:
+        tuple: (requête filtrée, dictionnaire des filtres appliqués)
+    """
+    filters = {}
+    
+    for name, column in LIST_PV_FILTERS.items():
+        if name in exclude:
+            continue
+        values = [v for v in args.getlist(name) if v != '']
+        if values:
+            query = query.filter(column == values[0] if len(values) == 1 else column.in_(values))
+            filters[name] = values if len(values) > 1 else values[0]
+    
+    for name, column in LIST_PV_RANGE_FILTERS.items():
+        if args.get(f'{name}_from'):
+            query = query.filter(column >= args[f'{name}_from'])
+            filters[f'{name}_from'] = args[f'{name}_from']
+        if args.get(f'{name}_to'):
+            query = query.filter(column <= args[f'{name}_to'])
+            filters[f'{name}_to'] = args[f'{name}_to']
+    
+    emails = [v.strip().lower() for v in args.getlist('email_conducteur') if v.strip()]
+    if emails and 'email_conducteur' not in exclude:
+        query = query.filter(db.or_(*(
+            db.func.instr(CONDUCTEUR_EMAIL_LIST, f',{email.replace(" ", "")},') > 0 for email in emails
+        )))
+        filters['email_conducteur'] = emails if len(emails) > 1 else emails[0]
+    
+    return query, filters
+
+
+def pv_list_item(pv):
+    """
+    Élément de liste d'un PV (cartes du frontend), construit à partir des seules colonnes SQL :
+    statut indique déjà la présence des signatures.
+    
+    Args:
+        pv: PV (la colonne data peut être différée)
+        
+    Returns:
+        dict: Champs affichés dans la liste
+    """
+    return {
+        'id': pv.id,
+        'chantier': pv.chantier,
+        'email_conducteur': pv.conducteur_email or '',
+        'responsable': pv.responsable or '',
+        'fournisseur': pv.fournisseur or '',
+        'materiel_numero': pv.materiel_numero or '',
+        'materiel_type': pv.materiel_type or '',
+        'date_reception': pv.date_reception or '',
+        'date_retour': pv.date_retour or '',
+        'created_at': pv.date_creation.isoformat() if pv.date_creation else '',
+        'updated_at': pv.date_mise_a_jour.isoformat() if pv.date_mise_a_jour else '',
+        'last_sent_date': pv.date_dernier_envoi.isoformat() if pv.date_dernier_envoi else None,
+        'completion_status': pv.statut,
+        'has_reception': pv.statut in ('complete', 'reception_only'),
+        'has_retour': pv.statut in ('complete', 'retour_only'),
+        'vgp_date': pv.vgp_date,
+        'vgp_document_path': pv.vgp_document_path,
+        'version_courante': pv.version_courante
+    }
+
+
+def encode_list_cursor(pv):
+    """
+    Encode la position du dernier PV d'une page (curseur opaque pour la page suivante).
+    
+    Args:
+        pv: Dernier PV renvoyé
+        
+    Returns:
+        str: Curseur Base64 (URL-safe) de (date_mise_a_jour, id)
+    """
+    payload = json.dumps([pv.date_mise_a_jour.isoformat(), pv.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_list_cursor(cursor):
+    """
+    Décode un curseur produit par encode_list_cursor.
+    
+    Args:
+        cursor: Curseur reçu du client
+        
+    Returns:
+        tuple: (date_mise_a_jour, id)
+        
+    Raises:
+        ValueError: Si le curseur est invalide
+    """
+    try:
+        date_str, pv_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(date_str), str(pv_id)
+    except Exception:
+        raise ValueError('Curseur de pagination invalide')
+
+
+@app.route('/list-pv', methods=['GET'])
+def list_pv():
+    """
+    Liste les PV sauvegardés, du plus récemment modifié au plus ancien, page par page.
+    
+    Paramètres d'URL (tous optionnels) :
+    - chantier, responsable, fournisseur, materiel_type, statut, date_reception, vgp_date :
+      égalité exacte (paramètre répétable pour plusieurs valeurs)
+    - email_conducteur : PV destinés à cet email (répétable)
+    - date_reception_from/_to, date_retour_from/_to, vgp_date_from/_to : plages de dates
+      (YYYY-MM-DD, incluses)
+    - limit : taille de page (LIST_PV_PAGE_SIZE par défaut, LIST_PV_MAX_PAGE_SIZE au maximum)
+    - cursor : valeur next_cursor de la page précédente
+    
+    La pagination se fait par clé (date_mise_a_jour, id) et non par OFFSET :
+    chaque page coûte le même prix quelle que soit sa position et la taille de la table.
+    """
+    try:
+        # La réponse ne dépend que des paramètres et du contenu de la table pvs
+        etag = make_etag('list-pv', get_change_counter('pvs'), request.query_string.decode('utf-8'))
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        limit = page_limit(request.args)
+        
+        # La colonne JSON (data, chargement différé) n'est jamais lue pour la liste
+        query, filters = apply_list_filters(PV.query, request.args)
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                cursor_date, cursor_id = decode_list_cursor(cursor)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+            # Suite stricte de la page précédente (ordre décroissant sur (date, id))
+            # (comparaison de tuples : parcours direct de l'index ix_pvs_date_mise_a_jour_id)
+            query = query.filter(db.tuple_(PV.date_mise_a_jour, PV.id) < (cursor_date, cursor_id))
+        
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        pvs = query.order_by(PV.date_mise_a_jour.desc(), PV.id.desc()).limit(limit + 1).all()
+        has_more = len(pvs) > limit
+        pvs = pvs[:limit]
+        
+        pv_list = [pv_list_item(pv) for pv in pvs]
+        
+        return etag_response({
+            'success': True,
+            'pv_list': pv_list,
+            'limit': limit,
+            'filters': filters,
+            'has_more': has_more,
+            'next_cursor': encode_list_cursor(pvs[-1]) if has_more else None
+        }, etag)
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors du chargement de la liste: {str(e)}'
+        }), 500
+
+
+@app.route('/search', methods=['GET'])
+def search_pv():
+    """
+    Recherche plein texte dans les PV (index FTS5 pvs_fts), résultats classés par pertinence.
+    
+    Champs indexés : chantier, numéro et type de matériel, responsable, fournisseur,
+    emails et observations (réception et retour). Chaque mot est cherché comme préfixe,
+    sans tenir compte des accents ni de la casse ("beton lyo" trouve "Béton Lyon").
+    
+    Paramètres d'URL :
+    - q : texte recherché (obligatoire)
+    - limit, offset : pagination des résultats
+    - mêmes filtres que /list-pv (chantier, statut, date_reception_from...)
+    """
+    try:
+        fts_query = build_search_query(request.args.get('q', ''))
+        if not fts_query:
+            return jsonify({
+                'success': False,
+                'message': 'Texte de recherche manquant'
+            }), 400
+        
+        etag = make_etag('search', get_change_counter('pvs'), request.query_string.decode('utf-8'))
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        limit = page_limit(request.args)
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            offset = 0
+        
+        # bm25 : plus la valeur est basse, plus le PV est pertinent
+        weights = ', '.join(str(weight) for _, weight in SEARCH_INDEX_COLUMNS)
+        rank = db.literal_column(f'bm25(pvs_fts, 0.0, {weights})')
+        
+        query = (PV.query
+                 .join(PV_SEARCH_INDEX, PV_SEARCH_INDEX.c.pv_id == PV.id)
+                 .filter(db.literal_column('pvs_fts').op('MATCH')(fts_query)))
+        query, filters = apply_list_filters(query, request.args)
+        
+        pvs = query.order_by(rank, PV.date_mise_a_jour.desc()).offset(offset).limit(limit + 1).all()
+        has_more = len(pvs) > limit
+        pvs = pvs[:limit]
         
-        return jsonify({
+        return etag_response({
             'success': True,
-            'message': f'PV "{chantier}" sauvegardé avec succès',
-            'pv_id': pv_id,
-            'chantier': chantier
-        })
+            'query': request.args.get('q', ''),
+            'pv_list': [pv_list_item(pv) for pv in pvs],
+            'limit': limit,
+            'offset': offset,
+            'filters': filters,
+            'has_more': has_more,
+            'next_offset': offset + limit if has_more else None
+        }, etag)
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({
             'success': False,
-            'message': f'Erreur lors de la sauvegarde: {str(e)}'
+            'message': f'Erreur lors de la recherche: {str(e)}'
         }), 500
 
 
-@app.route('/list-pv', methods=['GET'])
-def list_pv():
+def facet_counts(query, column):
     """
-    Liste tous les PV sauvegardés depuis la base de données.
+    Valeurs distinctes non vides d'une colonne et nombre de PV pour chacune (GROUP BY).
+    
+    Args:
+        query: Requête filtrée sur PV (renvoyant la colonne)
+        column: Colonne regroupée
+        
+    Returns:
+        list: [{'value': ..., 'count': ...}], les plus fréquentes d'abord
     """
-    try:
-        # Requête SQL avec tri par date de mise à jour
-        pvs = PV.query.order_by(PV.date_mise_a_jour.desc()).all()
-        
-        pv_list = []
-        for pv in pvs:
-            # Récupérer le JSON complet
-            pv_dict = pv.get_data()
-            form_data = pv_dict.get('form_data', {})
-            
-            # Déterminer l'état de complétion
-            has_reception = bool(form_data.get('signature_reception'))
-            has_retour = bool(form_data.get('signature_retour'))
-            
-            pv_list.append({
-                'id': pv.id,
-                'chantier': pv.chantier,
-                'email_conducteur': pv.conducteur_email or form_data.get('email_conducteur', ''),
-                'responsable': pv.responsable or form_data.get('responsable', ''),
-                'fournisseur': pv.fournisseur or form_data.get('fournisseur', ''),
-                'materiel_numero': form_data.get('materiel_numero', ''),
-                'materiel_type': pv.materiel_type or form_data.get('materiel_type', ''),
-                'date_reception': pv.date_reception or form_data.get('date_reception', ''),
-                'date_retour': pv.date_retour or form_data.get('date_retour', ''),
-                'created_at': pv.date_creation.isoformat() if pv.date_creation else '',
-                'updated_at': pv.date_mise_a_jour.isoformat() if pv.date_mise_a_jour else '',
-                'last_sent_date': pv.date_dernier_envoi.isoformat() if pv.date_dernier_envoi else None,
-                'completion_status': pv.statut,
-                'has_reception': has_reception,
-                'has_retour': has_retour,
-                'vgp_date': pv.vgp_date,
-                'vgp_document_path': pv.vgp_document_path,
-                'version_courante': pv.version_courante
-            })
+    count = db.func.count(PV.id)
+    rows = (query.add_columns(count)
+            .filter(column.isnot(None), column != '')
+            .group_by(column)
+            .order_by(count.desc(), column)
+            .limit(FACETS_MAX_VALUES)
+            .all())
+    return [{'value': value, 'count': total} for value, total in rows]
+
+
+def email_facet_counts(query):
+    """
+    Emails conducteur distincts et nombre de PV pour chacun.
+    
+    La colonne conducteur_email contient une liste séparée par des virgules : elle est
+    découpée en SQL par une CTE récursive (un email par ligne) avant le GROUP BY.
+    
+    Args:
+        query: Requête filtrée sur PV (sans colonne)
         
-        return jsonify({
-            'success': True,
-            'pv_list': pv_list
-        })
+    Returns:
+        list: [{'value': ..., 'count': ...}], les plus fréquents d'abord
+    """
+    seed = (query.add_columns(PV.id.label('pv_id'),
+                              db.literal('').label('email'),
+                              (PV.conducteur_email + ',').label('rest'))
+            .filter(PV.conducteur_email.isnot(None), PV.conducteur_email != ''))
+    split = seed.cte('conducteur_emails', recursive=True)
+    separator = db.func.instr(split.c.rest, ',')
+    split = split.union_all(db.select(
+        split.c.pv_id,
+        db.func.lower(db.func.trim(db.func.substr(split.c.rest, 1, separator - 1))),
+        db.func.substr(split.c.rest, separator + 1)
+    ).where(split.c.rest != ''))
+    
+    count = db.func.count(db.distinct(split.c.pv_id))
+    rows = (db.session.query(split.c.email, count)
+            .filter(split.c.email != '')
+            .group_by(split.c.email)
+            .order_by(count.desc(), split.c.email)
+            .limit(FACETS_MAX_VALUES)
+            .all())
+    return [{'value': value, 'count': total} for value, total in rows]
+
+
+def compute_facets(args):
+    """
+    Calcule les facettes demandées. Chaque facette respecte tous les filtres actifs
+    sauf le sien, pour que la liste déroulante propose toujours les autres valeurs.
+    
+    Args:
+        args: Paramètres d'URL (filtres de /list-pv, q, fields)
+        
+    Returns:
+        dict: Facettes par champ et filtres appliqués
+    """
+    requested = [name for name in args.get('fields', '').split(',') if name]
+    fields = requested or list(FACET_FIELDS) + ['email_conducteur']
+    fts_query = build_search_query(args.get('q', ''))
+    
+    def base_query(*columns):
+        query = db.session.query(*columns).select_from(PV)
+        if fts_query:
+            query = (query.join(PV_SEARCH_INDEX, PV_SEARCH_INDEX.c.pv_id == PV.id)
+                     .filter(db.literal_column('pvs_fts').op('MATCH')(fts_query)))
+        return query
+    
+    facets = {}
+    for name in fields:
+        if name == 'email_conducteur':
+            query, _ = apply_list_filters(base_query(), args, exclude=(name,))
+            facets[name] = email_facet_counts(query)
+        elif name in FACET_FIELDS:
+            column = FACET_FIELDS[name]
+            query, _ = apply_list_filters(base_query(column), args, exclude=(name,))
+            facets[name] = facet_counts(query, column)
+    
+    _, filters = apply_list_filters(PV.query, args)
+    if fts_query:
+        filters['q'] = args.get('q')
+    return {'facets': facets, 'filters': filters}
+
+
+@app.route('/facets', methods=['GET'])
+def get_facets():
+    """
+    Valeurs distinctes et nombre de PV par champ, pour les listes déroulantes de filtre
+    et les suggestions du formulaire.
+    
+    Paramètres d'URL (tous optionnels) :
+    - fields : champs demandés, séparés par des virgules (chantier, materiel_numero,
+      materiel_type, responsable, fournisseur, statut, email_conducteur ; tous par défaut)
+    - mêmes filtres que /list-pv, et q : texte recherché (index plein texte)
+    
+    Le résultat est gardé en mémoire jusqu'à la prochaine écriture dans la table pvs.
+    """
+    try:
+        change_counter = get_change_counter('pvs')
+        query_string = request.query_string.decode('utf-8')
+        etag = make_etag('facets', change_counter, query_string)
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        with _facets_cache_lock:
+            entry = _facets_cache.get(query_string)
+            if entry and entry[0] == change_counter:
+                _facets_cache.move_to_end(query_string)
+                return etag_response(entry[1], etag)
+        
+        payload = dict(success=True, **compute_facets(request.args))
+        
+        with _facets_cache_lock:
+            _facets_cache[query_string] = (change_counter, payload)
+            _facets_cache.move_to_end(query_string)
+            while len(_facets_cache) > FACETS_CACHE_SIZE:
+                _facets_cache.popitem(last=False)
+        
+        return etag_response(payload, etag)
     
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Erreur lors du chargement de la liste: {str(e)}'
+            'message': f'Erreur lors du calcul des filtres: {str(e)}'
         }), 500
 
 
@@ -756,23 +1432,32 @@ def list_pv():
 def load_pv(pv_id):
     """
     Charge un PV spécifique depuis la base de données.
+    Répond 304 sans lire le JSON si le client possède déjà cette version (If-None-Match).
     """
     try:
-        pv = PV.query.get(pv_id)
+        if not flush_drafts(pv_id):
+            return drafts_pending_response()
+        etag, _ = pv_etag(pv_id, 'pv')
         
-        if not pv:
+        if not etag:
             return jsonify({
                 'success': False,
                 'message': 'PV introuvable'
             }), 404
         
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
+        
         # Convertir en format compatible avec l'ancien système
         pv_data = pv.to_dict()
         
-        return jsonify({
+        return etag_response({
             'success': True,
             'pv_data': pv_data
-        })
+        }, etag)
     
     except Exception as e:
         return jsonify({
@@ -788,6 +1473,10 @@ def delete_pv(pv_id):
     Note: Accepte POST et DELETE pour compatibilité avec le frontend.
     """
     try:
+        drafts = get_draft_buffer()
+        if drafts is not None:
+            drafts.discard(pv_id)
+        
         pv = PV.query.get(pv_id)
         
         if not pv:
@@ -829,114 +1518,51 @@ def delete_pv(pv_id):
 def download_pdf():
     """
     Génère et télécharge le PDF du PV sans l'envoyer par email.
+    
+    Format de réponse négocié par l'en-tête Accept :
+    - application/pdf : PDF binaire (Content-Disposition, en-tête X-PV-Id)
+    - sinon (anciens clients) : JSON avec le PDF encodé en base64
     """
     try:
-        # Récupération des données du formulaire (même logique que submit)
-        form_data = {
-            # Métadonnées
-            'chantier': request.form.get('chantier', ''),
-            'date_reception': request.form.get('date_reception', ''),
-            'date_retour': request.form.get('date_retour', ''),
-            'materiel_numero': request.form.get('materiel_numero', ''),
-            'materiel_type': request.form.get('materiel_type', ''),
-            'fournisseur': request.form.get('fournisseur', ''),
-            'responsable': request.form.get('responsable', ''),
-            'email_destinataire': request.form.get('email_destinataire', ''),
-            'email_conducteur': request.form.getlist('email_conducteur'),  # Liste d'emails
-            
-            # Compteurs
-            'compteur_reception': request.form.get('compteur_reception', ''),
-            'compteur_retour': request.form.get('compteur_retour', ''),
-            
-            # État - Réception
-            'carrosserie_reception': request.form.get('carrosserie_reception', ''),
-            'eclairage_reception': request.form.get('eclairage_reception', ''),
-            'pneumatiques_reception': request.form.get('pneumatiques_reception', ''),
-            'panier_reception': request.form.get('panier_reception', ''),
-            'flexibles_reception': request.form.get('flexibles_reception', ''),
-            'commandes_reception': request.form.get('commandes_reception', ''),
-            'conformite_reception': request.form.get('conformite_reception', ''),
-            'mobilites_reception': request.form.get('mobilites_reception', ''),
-            'nacelles_reception': request.form.get('nacelles_reception', ''),
-            'securite_reception': request.form.get('securite_reception', ''),
-            
-            # État - Retour
-            'carrosserie_retour': request.form.get('carrosserie_retour', ''),
-            'eclairage_retour': request.form.get('eclairage_retour', ''),
-            'pneumatiques_retour': request.form.get('pneumatiques_retour', ''),
-            'panier_retour': request.form.get('panier_retour', ''),
-            'flexibles_retour': request.form.get('flexibles_retour', ''),
-            'commandes_retour': request.form.get('commandes_retour', ''),
-            'conformite_retour': request.form.get('conformite_retour', ''),
-            'mobilites_retour': request.form.get('mobilites_retour', ''),
-            'nacelles_retour': request.form.get('nacelles_retour', ''),
-            'securite_retour': request.form.get('securite_retour', ''),
-            
-            # Fluides - Réception
-            'carburant_reception': request.form.get('carburant_reception', ''),
-            'fuite_moteur_reception': request.form.get('fuite_moteur_reception', 'non'),
-            'fuite_hydraulique_reception': request.form.get('fuite_hydraulique_reception', 'non'),
-            'fuite_gasoil_reception': request.form.get('fuite_gasoil_reception', 'non'),
-            
-            # Fluides - Retour
-            'carburant_retour': request.form.get('carburant_retour', ''),
-            'fuite_moteur_retour': request.form.get('fuite_moteur_retour', 'non'),
-            'fuite_hydraulique_retour': request.form.get('fuite_hydraulique_retour', 'non'),
-            'fuite_gasoil_retour': request.form.get('fuite_gasoil_retour', 'non'),
-            
-            # Observations
-            'observations_reception': request.form.get('observations_reception', ''),
-            'observations_retour': request.form.get('observations_retour', ''),
+        # Brouillon en attente du PV écrit avant toute lecture (version, JSON existant)
+        if not flush_drafts(request.form.get('pv_id')):
+            return drafts_pending_response()
+        
+        # Lecture du formulaire (même schéma que submit)
+        try:
+            form_data = parse_form(request.form, request.files)
+        except FormValidationError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        # Lectures en BEGIN simple, transaction terminée avant le rendu :
+        # le verrou d'écriture n'est pris que pour l'enregistrement du PV
+        pv_id = request.form.get('pv_id')
+        with read_transactions():
+            # Photos envoyées par morceaux : le formulaire ne contient que leur référence
+            form_data = hydrate_blobs(form_data)
             
-            # Signatures - vérifier d'abord dans files (envoi depuis JS), puis dans form (sauvegarde JSON)
-            'signature_reception': '',
-            'signature_retour': '',
-        }
+            # Version du PV affichée sur le PDF
+            version_info = {
+                'number': 1,
+                'date': datetime.now().strftime('%d/%m/%Y %H:%M')
+            }
+            if pv_id:
+                existing_pv_for_version = PV.query.get(pv_id)
+                if existing_pv_for_version:
+                    version_info = {
+                        'number': existing_pv_for_version.version_courante,
+                        'date': existing_pv_for_version.date_mise_a_jour.strftime('%d/%m/%Y %H:%M') if existing_pv_for_version.date_mise_a_jour else datetime.now().strftime('%d/%m/%Y %H:%M')
+                    }
+            db.session.commit()
         
-        # Gérer les signatures qui peuvent venir de request.files (Blob) ou request.form (base64)
-        if 'signature_reception' in request.files:
-            sig_file = request.files['signature_reception']
-            if sig_file and sig_file.filename:
-                # Lire le fichier et le convertir en base64
-
-                sig_data = sig_file.read()
-                form_data['signature_reception'] = f"data:image/png;base64,{base64.b64encode(sig_data).decode('utf-8')}"
-        elif request.form.get('signature_reception'):
-            form_data['signature_reception'] = request.form.get('signature_reception', '')
-        
-        if 'signature_retour' in request.files:
-            sig_file = request.files['signature_retour']
-            if sig_file and sig_file.filename:
-                # Lire le fichier et le convertir en base64
-
-                sig_data = sig_file.read()
-                form_data['signature_retour'] = f"data:image/png;base64,{base64.b64encode(sig_data).decode('utf-8')}"
-        elif request.form.get('signature_retour'):
-            form_data['signature_retour'] = request.form.get('signature_retour', '')
-        
-        # Récupérer toutes les photos
-        photo_base_fields = ['carrosserie_reception', 'carrosserie_retour',
-                             'eclairage_reception', 'eclairage_retour',
-                             'pneumatiques_reception', 'pneumatiques_retour',
-                             'panier_reception', 'panier_retour',
-                             'flexibles_reception', 'flexibles_retour',
-                             'commandes_reception', 'commandes_retour',
-                             'conformite_reception', 'conformite_retour',
-                             'mobilites_reception', 'mobilites_retour',
-                             'nacelles_reception', 'nacelles_retour',
-                             'securite_reception', 'securite_retour',
-                             'fuite_reception', 'fuite_retour',
-                             'carburant_reception', 'carburant_retour',
-                             'observation_reception', 'observation_retour']
-        
-        for field in photo_base_fields:
-            photos = []
-            for key in request.form.keys():
-                if key.startswith(f'photo_{field}'):
-                    photo_data = request.form.get(key, '')
-                    if photo_data:
-                        photos.append(photo_data)
-            form_data[f'photo_{field}'] = photos if photos else []
+        if collect_blob_refs(form_data):
+            return jsonify({
+                'success': False,
+                'message': 'Une photo n\'a pas fini d\'être envoyée, réessayez dans quelques instants'
+            }), 409
         
         # Validation du champ obligatoire
         if not form_data['chantier']:
@@ -945,52 +1571,26 @@ def download_pdf():
                 'message': 'Le chantier est obligatoire'
             }), 400
         
-        # Optimiser les signatures si présentes
-        if form_data['signature_reception']:
-            form_data['signature_reception'] = optimize_signature(form_data['signature_reception'])
+        form_data['version_info'] = version_info
         
-        if form_data['signature_retour']:
-            form_data['signature_retour'] = optimize_signature(form_data['signature_retour'])
-        
-        # Optimiser les photos si présentes
-        for field in photo_base_fields:
-            photo_key = f'photo_{field}'
-            if photo_key in form_data and form_data[photo_key]:
-                optimized_photos = []
-                for photo in form_data[photo_key]:
-                    if photo:
-                        optimized_photos.append(optimize_signature(photo))
-                form_data[photo_key] = optimized_photos
+        # Clé de cache calculée sur les données reçues, avant optimisation des images
+        cache_key = make_cache_key(form_data)
         
         # Ajouter la date de génération
         form_data['date_generation'] = datetime.now().strftime('%d/%m/%Y %H:%M')
         
-        # Récupérer la version du PV pour l'afficher sur le PDF
-        pv_id = request.form.get('pv_id')
-        if pv_id:
-            existing_pv_for_version = PV.query.get(pv_id)
-            if existing_pv_for_version:
-                form_data['version_info'] = {
-                    'number': existing_pv_for_version.version_courante,
-                    'date': existing_pv_for_version.date_mise_a_jour.strftime('%d/%m/%Y %H:%M') if existing_pv_for_version.date_mise_a_jour else datetime.now().strftime('%d/%m/%Y %H:%M')
-                }
-            else:
-                form_data['version_info'] = {
-                    'number': 1,
-                    'date': datetime.now().strftime('%d/%m/%Y %H:%M')
-                }
-        else:
-            form_data['version_info'] = {
-                'number': 1,
-                'date': datetime.now().strftime('%d/%m/%Y %H:%M')
-            }
+        def generate_pdf():
+            # Optimiser photos et signatures (en parallèle)
+            optimize_form_images(form_data, PHOTO_BASE_FIELDS)
+            
+            # Générer le PDF dans le pool de rendu
+            return render_pdf(form_data)
         
-        # Générer le HTML pour le PDF
-        html_content = render_template('pdf_template.html', **form_data)
+        # PV inchangé : PDF servi depuis le cache (un seul rendu pour des clics simultanés)
+        pdf_bytes, cache_hit = pdf_cache.get_or_render(cache_key, generate_pdf)
         
-        # Générer le PDF en mémoire avec WeasyPrint
-        base_url = request.url_root
-        pdf_bytes = HTML(string=html_content, base_url=base_url).write_pdf()
+        # PDF servi depuis le cache : photos binaires non traitées, stockées telles quelles
+        resolve_uploads(form_data, PHOTO_BASE_FIELDS)
         
         # Créer un nom de fichier sécurisé
         chantier_safe = "".join(c for c in form_data['chantier'] if c.isalnum() or c in (' ', '-', '_')).strip()
@@ -1016,7 +1616,7 @@ def download_pdf():
         # Sauvegarder le PV avant le téléchargement dans la base de données
         try:
             # Vérifier si le PV existe déjà
-            existing_pv = PV.query.get(pv_id)
+            existing_pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
             
             if existing_pv:
                 # Mise à jour d'un PV existant
@@ -1029,6 +1629,7 @@ def download_pdf():
                 existing_pv.responsable = indexed_fields.get('responsable')
                 existing_pv.fournisseur = indexed_fields.get('fournisseur')
                 existing_pv.materiel_type = indexed_fields.get('materiel_type')
+                existing_pv.materiel_numero = indexed_fields.get('materiel_numero')
                 existing_pv.date_reception = indexed_fields.get('date_reception')
                 existing_pv.date_retour = indexed_fields.get('date_retour')
                 existing_pv.statut = indexed_fields.get('statut')
@@ -1061,6 +1662,7 @@ def download_pdf():
                     responsable=indexed_fields.get('responsable'),
                     fournisseur=indexed_fields.get('fournisseur'),
                     materiel_type=indexed_fields.get('materiel_type'),
+                    materiel_numero=indexed_fields.get('materiel_numero'),
                     date_reception=indexed_fields.get('date_reception'),
                     date_retour=indexed_fields.get('date_retour'),
                     statut=indexed_fields.get('statut')
@@ -1075,16 +1677,32 @@ def download_pdf():
             print(f"Erreur lors de la sauvegarde DB: {db_error}")
             # Continuer quand même pour retourner le PDF
         
-        # Retourner le PDF en base64 pour le téléchargement côté client
+        # Client récent (Accept: application/pdf) : PDF binaire transmis directement
+        if wants_binary_pdf():
+            response = send_file(
+                io.BytesIO(pdf_bytes),
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name=filename
+            )
+            response.headers['X-PV-Id'] = pv_id
+            response.headers['X-PDF-Cache'] = 'hit' if cache_hit else 'miss'
+            return response
+        
+        # Anciens clients : PDF en base64 dans une réponse JSON
         pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
         
         return jsonify({
             'success': True,
             'pdf_data': pdf_base64,
             'filename': filename,
-            'pv_id': pv_id
+            'pv_id': pv_id,
+            'cached': cache_hit
         })
     
+    except RenderPoolBusy as e:
+        return render_busy_response(e)
+    
     except Exception as e:
         print(f"Erreur lors de la génération du PDF: {e}")
         import traceback
@@ -1095,6 +1713,227 @@ def download_pdf():
         }), 500
 
 
+def build_pdf_context(pv):
+    """
+    Prépare les données de rendu PDF d'un PV enregistré.
+    
+    Les brouillons (/save) stockent les photos à plat (photo_<poste>_<horodatage>),
+    alors que le template attend une liste par poste : on les regroupe ici.
+    
+    Args:
+        pv: Instance PV
+        
+    Returns:
+        dict: Variables du template pdf_template.html
+    """
+    pv_dict = pv.get_data(hydrate=True)
+    stored = pv_dict.get('form_data', pv_dict)
+    context = dict(stored)
+    
+    for field in PHOTO_BASE_FIELDS:
+        photo_key = f'photo_{field}'
+        photos = list(stored[photo_key]) if isinstance(stored.get(photo_key), list) else []
+        for key in sorted(stored.keys()):
+            value = stored[key]
+            if key.startswith(photo_key) and isinstance(value, str) and value.startswith('data:image/'):
+                photos.append(value)
+        context[photo_key] = photos
+    
+    if isinstance(context.get('email_conducteur'), str):
+        context['email_conducteur'] = [e.strip() for e in context['email_conducteur'].split(',') if e.strip()]
+    
+    context['version_info'] = {
+        'number': pv.version_courante,
+        'date': pv.date_mise_a_jour.strftime('%d/%m/%Y %H:%M') if pv.date_mise_a_jour else ''
+    }
+    return context
+
+
+class ZipStream:
+    """
+    Tampon d'écriture non positionnable pour zipfile : les octets écrits
+    sont transmis au client au fil de l'eau par le générateur de réponse.
+    """
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def pop(self):
+        """Retourne et vide les octets écrits depuis le dernier appel."""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+@app.route('/export-pdf-zip', methods=['GET', 'POST'])
+def export_pdf_zip():
+    """
+    Exporte plusieurs PV en PDF dans une archive ZIP diffusée en streaming.
+    
+    Sélection (JSON, formulaire ou paramètres d'URL) :
+    - ids : liste d'identifiants (ou chaîne séparée par des virgules)
+    - sinon les filtres de /list-pv (apply_list_filters) ; date_from et date_to restent
+      acceptés pour date_reception_from et date_reception_to
+    
+    Les PDF sont générés en parallèle dans le pool de rendu et ajoutés à l'archive
+    dès qu'ils sont prêts ; manifest.json (dernier fichier) détaille chaque PV. Un rendu
+    qui dépasse le délai du pool est abandonné et noté en erreur dans le manifeste.
+    """
+    if not flush_drafts():
+        return drafts_pending_response()
+    params = request.get_json(silent=True)
+    if isinstance(params, dict):
+        # Corps JSON : valeurs simples ou listes, lues comme des paramètres d'URL répétés
+        params = MultiDict([(key, value) for key, values in params.items()
+                            for value in (values if isinstance(values, list) else [values])])
+    else:
+        params = request.values.copy()
+    for alias, name in (('date_from', 'date_reception_from'), ('date_to', 'date_reception_to')):
+        if params.get(alias) and not params.get(name):
+            params[name] = params[alias]
+    
+    ids = params.getlist('ids')
+    if len(ids) == 1 and isinstance(ids[0], str):
+        ids = [i.strip() for i in ids[0].split(',') if i.strip()]
+    
+    query = db.session.query(PV.id)
+    if ids:
+        query = query.filter(PV.id.in_(ids))
+        selection = {'ids': ids}
+    else:
+        query, selection = apply_list_filters(query, params)
+    
+    # Route en POST : lectures en BEGIN simple, sans verrou d'écriture pendant les rendus et la diffusion
+    with read_transactions():
+        pv_ids = [row.id for row in query.order_by(PV.date_mise_a_jour.desc()).all()]
+        db.session.commit()
+    
+    if not pv_ids:
+        return jsonify({
+            'success': False,
+            'message': 'Aucun PV ne correspond à la sélection'
+        }), 404
+    
+    def generate():
+        pool = get_render_pool()
+        stream = ZipStream()
+        archive = zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED)
+        manifest = {
+            'generated_at': datetime.now().isoformat(),
+            'selection': selection,
+            'total': len(pv_ids),
+            'succeeded': 0,
+            'failed': 0,
+            'items': []
+        }
+        used_names = set()
+        pending = {}
+        remaining = list(pv_ids)
+        
+        def add_result(item, pdf_bytes=None, error=None):
+            item['position'] = len(manifest['items']) + 1
+            if error is None:
+                name = item['filename']
+                suffix = 2
+                while name in used_names:
+                    name = item['filename'].replace('.pdf', f'_{suffix}.pdf')
+                    suffix += 1
+                used_names.add(name)
+                item.update({'filename': name, 'status': 'ok', 'size': len(pdf_bytes)})
+                archive.writestr(name, pdf_bytes)
+                manifest['succeeded'] += 1
+            else:
+                item.update({'filename': None, 'status': 'error', 'error': str(error)})
+                manifest['failed'] += 1
+            manifest['items'].append(item)
+        
+        while remaining or pending:
+            # Garder autant de rendus en vol que de processus de rendu
+            while remaining and len(pending) < pool.workers:
+                pv_id = remaining.pop(0)
+                with read_transactions():
+                    pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
+                if not pv:
+                    add_result({'pv_id': pv_id}, error='PV introuvable')
+                    continue
+                
+                chantier_safe = "".join(c for c in pv.chantier if c.isalnum() or c in (' ', '-', '_')).strip()
+                item = {
+                    'pv_id': pv.id,
+                    'chantier': pv.chantier,
+                    'version': pv.version_courante,
+                    'filename': f"PV_{chantier_safe}_{pv.id[:8]}.pdf"
+                }
+                try:
+                    context = build_pdf_context(pv)
+                    cache_key = make_cache_key(context)
+                    context['date_generation'] = datetime.now().strftime('%d/%m/%Y %H:%M')
+                    
+                    cached = pdf_cache.get(cache_key)
+                    if cached is not None:
+                        item['cached'] = True
+                        add_result(item, cached)
+                        continue
+                    
+                    optimize_form_images(context, PHOTO_BASE_FIELDS)
+                    
+                    item['cached'] = False
+                    future = pool.render_async(context, wait=pool.timeout)
+                    pending[future] = (item, cache_key, time.perf_counter())
+                except Exception as e:
+                    add_result(item, error=e)
+                finally:
+                    # Libérer le JSON du PV avant de passer au suivant
+                    db.session.expunge(pv)
+            
+            # Fin de la transaction de lecture avant l'attente des rendus et l'envoi au client
+            db.session.commit()
+            
+            if pending:
+                # Attente bornée par le délai du premier rendu lancé : un rendu bloqué ne fige pas l'export
+                deadline = min(started for _, _, started in pending.values()) + pool.timeout
+                done, _ = wait_futures(list(pending), timeout=max(0, deadline - time.perf_counter()),
+                                       return_when=FIRST_COMPLETED)
+                for future in [f for f in pending if f not in done
+                               and time.perf_counter() - pending[f][2] >= pool.timeout]:
+                    item, _, started = pending.pop(future)
+                    pool.cancel(future)
+                    item['render_time'] = round(time.perf_counter() - started, 3)
+                    add_result(item, error=f'Génération PDF trop longue (> {pool.timeout:g} s)')
+                for future in done:
+                    item, cache_key, started = pending.pop(future)
+                    item['render_time'] = round(time.perf_counter() - started, 3)
+                    try:
+                        pdf_bytes = future.result()
+                    except Exception as e:
+                        add_result(item, error=e)
+                    else:
+                        pdf_cache.put(cache_key, pdf_bytes)
+                        add_result(item, pdf_bytes)
+            
+            chunk = stream.pop()
+            if chunk:
+                yield chunk
+        
+        manifest['finished_at'] = datetime.now().isoformat()
+        archive.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        archive.close()
+        yield stream.pop()
+    
+    archive_name = f"PV_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=archive_name)
+    response.headers['X-PV-Count'] = str(len(pv_ids))
+    return response
+
+
 @app.route('/upload-vgp-document/<pv_id>', methods=['POST'])
 def upload_vgp_document(pv_id):
     """
@@ -1197,7 +2036,6 @@ def download_vgp_document(pv_id):
                 'message': 'Fichier introuvable'
             }), 404
         
-        from flask import send_file
         return send_file(
             str(doc_path),
             mimetype='application/pdf',
@@ -1212,20 +2050,281 @@ def download_vgp_document(pv_id):
         }), 500
 
 
+def upload_error_response(error):
+    """Réponse JSON d'une erreur d'envoi par morceaux (avec la position à partir de laquelle reprendre)."""
+    payload = {'success': False, 'message': error.message}
+    if error.offset is not None:
+        payload['offset'] = error.offset
+    return jsonify(payload), error.status_code
+
+
+@app.route('/uploads', methods=['POST'])
+def start_upload():
+    """
+    Ouvre l'envoi par morceaux d'une photo (reprenable après une coupure réseau).
+    
+    Corps JSON : size (octets), sha256 (empreinte de la photo complète), mime (image/...)
+    Réponse : upload_id, offset (position à partir de laquelle envoyer), chunk_size conseillée,
+    complete et ref (blob:<sha256>) si la photo est déjà sur le serveur.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session = create_upload(data.get('sha256'), data.get('size'), data.get('mime'))
+        return jsonify({'success': True, 'chunk_size': UPLOAD_CHUNK_SIZE, **session.to_dict()})
+    
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors de l\'envoi: {str(e)}'
+        }), 500
+
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Position confirmée d'un envoi (reprise après une coupure)."""
+    try:
+        return jsonify({'success': True, **get_upload(upload_id).to_dict()})
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """
+    Reçoit un morceau de photo (corps brut).
+    
+    En-têtes : Upload-Offset (position du morceau, obligatoire), X-Chunk-SHA256 (facultatif)
+    Réponse : offset confirmé ; complete et ref après le dernier morceau vérifié.
+    409 avec l'offset du serveur si la position ne correspond pas (morceau perdu ou rejoué),
+    413 si le morceau dépasse UPLOAD_CHUNK_MAX (refusé avant la lecture du corps).
+    """
+    try:
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None or offset < 0:
+            return jsonify({
+                'success': False,
+                'message': 'En-tête Upload-Offset manquant'
+            }), 400
+        
+        if request.content_length is not None and request.content_length > UPLOAD_CHUNK_MAX:
+            return jsonify({
+                'success': False,
+                'message': f'Morceau trop grand (maximum {UPLOAD_CHUNK_MAX} octets)'
+            }), 413
+        
+        # Lecture bornée même sans Content-Length (transfert chunked) : un morceau trop grand
+        # est refusé par write_chunk sans être lu en entier
+        data = request.stream.read(UPLOAD_CHUNK_MAX + 1)
+        session = write_chunk(upload_id, offset, data, request.headers.get('X-Chunk-SHA256'))
+        return jsonify({'success': True, **session.to_dict()})
+    
+    except UploadError as e:
+        db.session.rollback()
+        return upload_error_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors de l\'envoi: {str(e)}'
+        }), 500
+
+
+@app.route('/blobs/<blob_hash>', methods=['GET'])
+def get_blob(blob_hash):
+    """
+    Image de la table blobs (aperçu d'une photo référencée par blob:<sha256>).
+    Le contenu ne change jamais pour un hash donné : mise en cache permanente (304 seulement
+    si le blob existe encore, pas d'octets lus dans ce cas).
+    """
+    mime = db.session.query(Blob.mime).filter_by(hash=blob_hash).scalar()
+    if mime not in BLOB_MIME_TYPES:
+        # Blob supprimé, ou type non matriciel (SVG enregistré avant le filtrage) jamais servi depuis l'origine du site
+        return jsonify({
+            'success': False,
+            'message': 'Image introuvable'
+        }), 404
+    
+    cached = not_modified_response(blob_hash)
+    if cached:
+        return cached
+    
+    data = db.session.query(Blob.data).filter_by(hash=blob_hash).scalar()
+    response = Response(data, mimetype=mime)
+    response.set_etag(blob_hash)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    # Contenu fourni par les clients : type imposé, aucun script ni ressource si ouvert directement
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+
+def vgp_status_conditions(today):
+    """
+    Conditions SQL de chaque statut VGP, exprimées comme des plages sur la colonne indexée
+    vgp_date (YYYY-MM-DD) : les bornes sont calculées une fois, la colonne n'est pas transformée.
+    
+    - expired : échéance (vgp_date + VGP_VALIDITY_DAYS) dépassée
+    - warning : échéance dans moins de VGP_WARNING_DAYS jours
+    - valid   : échéance plus lointaine
+    - none    : pas de date de VGP
+    
+    Args:
+        today: Date de référence
+        
+    Returns:
+        dict: Condition SQLAlchemy par statut
+    """
+    expired_before = (today - timedelta(days=VGP_VALIDITY_DAYS)).isoformat()
+    warning_until = (today - timedelta(days=VGP_VALIDITY_DAYS - VGP_WARNING_DAYS)).isoformat()
+    has_date = db.and_(PV.vgp_date.isnot(None), PV.vgp_date != '')
+    return {
+        'expired': db.and_(has_date, PV.vgp_date < expired_before),
+        'warning': db.and_(PV.vgp_date >= expired_before, PV.vgp_date <= warning_until),
+        'valid': PV.vgp_date > warning_until,
+        'none': db.not_(has_date),
+    }
+
+
+def vgp_etag(kind, today):
+    """ETag d'une réponse VGP : contenu de pvs, date du jour et fenêtres configurées."""
+    return make_etag(kind, get_change_counter('pvs'), today, VGP_VALIDITY_DAYS, VGP_WARNING_DAYS,
+                     request.query_string.decode('utf-8'))
+
+
+@app.route('/vgp/summary', methods=['GET'])
+def vgp_summary():
+    """
+    Nombre de PV par statut VGP (bandeau d'alerte et compteurs de l'administration VGP).
+    
+    Une seule requête d'agrégation sur vgp_date : aucune ligne de PV n'est transférée.
+    """
+    try:
+        today = date.today()
+        etag = vgp_etag('vgp-summary', today)
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        conditions = vgp_status_conditions(today)
+        counts = db.session.query(*(
+            db.func.count(db.case((conditions[status], 1))) for status in VGP_STATUSES
+        )).one()
+        
+        return etag_response({
+            'success': True,
+            'counts': dict(zip(VGP_STATUSES, counts)),
+            'validity_days': VGP_VALIDITY_DAYS,
+            'warning_days': VGP_WARNING_DAYS,
+            'today': today.isoformat()
+        }, etag)
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors du calcul des statuts VGP: {str(e)}'
+        }), 500
+
+
+@app.route('/vgp/items', methods=['GET'])
+def vgp_items():
+    """
+    PV d'un statut VGP, avec leur date d'échéance et le nombre de jours restants.
+    
+    Paramètres d'URL :
+    - status : expired, warning, valid ou none (obligatoire)
+    - limit, offset : pagination des résultats
+    
+    Les PV datés sont triés par date de VGP (les plus urgents d'abord),
+    les PV sans VGP du plus récemment modifié au plus ancien.
+    """
+    try:
+        status = request.args.get('status', '')
+        if status not in VGP_STATUSES:
+            return jsonify({
+                'success': False,
+                'message': f"Statut VGP invalide (attendu : {', '.join(VGP_STATUSES)})"
+            }), 400
+        
+        today = date.today()
+        etag = vgp_etag('vgp-items', today)
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        limit = page_limit(request.args)
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            offset = 0
+        
+        # Échéance et jours restants calculés par SQLite sur les lignes renvoyées
+        expiry_date = db.func.date(PV.vgp_date, f'+{VGP_VALIDITY_DAYS} days')
+        days_remaining = db.cast(
+            db.func.julianday(expiry_date) - db.func.julianday(today.isoformat()), db.Integer
+        )
+        
+        query = (db.session.query(PV, expiry_date, days_remaining)
+                 .filter(vgp_status_conditions(today)[status]))
+        if status == 'none':
+            query = query.order_by(PV.date_mise_a_jour.desc(), PV.id.desc())
+        else:
+            query = query.order_by(PV.vgp_date, PV.id)
+        
+        rows = query.offset(offset).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        items = []
+        for pv, pv_expiry_date, pv_days_remaining in rows:
+            item = pv_list_item(pv)
+            item['vgp_status'] = status
+            item['vgp_expiry_date'] = pv_expiry_date if status != 'none' else None
+            item['vgp_days_remaining'] = pv_days_remaining if status != 'none' else None
+            items.append(item)
+        
+        return etag_response({
+            'success': True,
+            'status': status,
+            'items': items,
+            'limit': limit,
+            'offset': offset,
+            'has_more': has_more,
+            'next_offset': offset + limit if has_more else None
+        }, etag)
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors du chargement des PV VGP: {str(e)}'
+        }), 500
+
+
 @app.route('/pv-versions/<pv_id>', methods=['GET'])
 def get_pv_versions(pv_id):
     """
     Récupère la liste de toutes les versions d'un PV.
+    Chaque nouvelle version met à jour le PV : son état sert d'ETag.
     """
     try:
-        pv = PV.query.get(pv_id)
+        if not flush_drafts(pv_id):
+            return drafts_pending_response()
+        etag, _ = pv_etag(pv_id, 'versions')
         
-        if not pv:
+        if not etag:
             return jsonify({
                 'success': False,
                 'message': 'PV introuvable'
             }), 404
         
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
+        pv = PV.query.get(pv_id)
+        
         # Récupérer toutes les versions
         versions = PVVersion.query.filter_by(pv_id=pv_id).order_by(PVVersion.version_number.desc()).all()
         
@@ -1249,12 +2348,12 @@ def get_pv_versions(pv_id):
         }
         versions_list.insert(0, current_version)
         
-        return jsonify({
+        return etag_response({
             'success': True,
             'pv_id': pv_id,
             'current_version': pv.version_courante,
             'versions': versions_list
-        })
+        }, etag)
     
     except Exception as e:
         return jsonify({
@@ -1267,45 +2366,62 @@ def get_pv_versions(pv_id):
 def load_pv_version(pv_id, version_number):
     """
     Charge une version spécifique d'un PV.
+    Répond 304 sans lire le JSON si le client possède déjà cette version (If-None-Match).
     """
     try:
-        pv = PV.query.get(pv_id)
+        if not flush_drafts(pv_id):
+            return drafts_pending_response()
+        etag, version_courante = pv_etag(pv_id, f'version-{version_number}')
         
-        if not pv:
+        if not etag:
             return jsonify({
                 'success': False,
                 'message': 'PV introuvable'
             }), 404
         
+        if version_number != version_courante:
+            # Les versions historiques ne changent plus : l'ETag ne dépend que de leur ligne
+            version_state = db.session.query(PVVersion.id, PVVersion.date_creation).filter_by(
+                pv_id=pv_id, version_number=version_number
+            ).first()
+            
+            if not version_state:
+                return jsonify({
+                    'success': False,
+                    'message': f'Version {version_number} introuvable'
+                }), 404
+            
+            etag = make_etag('version', pv_id, version_number, *version_state)
+        
+        cached = not_modified_response(etag)
+        if cached:
+            return cached
+        
         # Si c'est la version courante
-        if version_number == pv.version_courante:
+        if version_number == version_courante:
+            pv = PV.query.options(db.undefer(PV.data)).get(pv_id)
             pv_dict = pv.to_dict()
             pv_dict['version_number'] = pv.version_courante
             pv_dict['is_current_version'] = True
-            return jsonify({
+            return etag_response({
                 'success': True,
                 'pv': pv_dict
-            })
+            }, etag)
         
         # Sinon, chercher dans les versions historiques
-        version = PVVersion.query.filter_by(pv_id=pv_id, version_number=version_number).first()
-        
-        if not version:
-            return jsonify({
-                'success': False,
-                'message': f'Version {version_number} introuvable'
-            }), 404
+        version = (PVVersion.query.options(db.undefer(PVVersion.data))
+                   .filter_by(pv_id=pv_id, version_number=version_number).first())
         
-        version_data = version.get_data()
+        version_data = version.get_data(hydrate=True)
         version_data['version_number'] = version.version_number
         version_data['is_current_version'] = False
         version_data['version_date'] = version.date_creation.strftime('%d/%m/%Y %H:%M')
         version_data['version_comment'] = version.comment
         
-        return jsonify({
+        return etag_response({
             'success': True,
             'pv': version_data
-        })
+        }, etag)
     
     except Exception as e:
         return jsonify({
@@ -5,28 +5,234 @@ Pour l'application de gestion de Procès-Verbaux de Matériel Loué
 Architecture hybride :
 - Colonnes SQL pour les champs de recherche fréquents
 - Colonne JSON pour conserver la structure complète sans casser le frontend
+- Table blobs pour les photos et signatures (le JSON ne contient que des références)
 """
 
+from contextlib import contextmanager
+from flask import has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+import base64
+import binascii
+import hashlib
 import json
+import os
+import re
+import threading
+import time
+
+from json_codec import encode_json_text, decode_json_text, register_sqlite_functions
+
+# Préfixe des références vers la table blobs (blob:<sha256>)
+BLOB_REF_PREFIX = 'blob:'
+
+# Types d'image acceptés dans la table blobs (servis tels quels par /blobs/<sha256>) : formats
+# matriciels uniquement, une image SVG peut contenir du script
+BLOB_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
+# Profil SQLite de production (WAL, plusieurs workers gunicorn) ; SQLITE_PRODUCTION_MODE=0 pour le comportement par défaut
+SQLITE_PRODUCTION_MODE = os.environ.get('SQLITE_PRODUCTION_MODE', '1') == '1'
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '10000'))
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000'))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', '5'))
+SQLITE_MAX_OVERFLOW = int(os.environ.get('SQLITE_MAX_OVERFLOW', '10'))
+
+# Méthodes HTTP dont la transaction écrit : BEGIN IMMEDIATE (verrou d'écriture dès le début)
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Transactions forcées en BEGIN IMMEDIATE hors requête HTTP (voir write_transactions)
+_transaction_mode = threading.local()
+
+# Index plein texte des PV (FTS5) : colonnes indexées, poids de classement bm25 (même ordre)
+SEARCH_INDEX_COLUMNS = (
+    ('chantier', 10.0),
+    ('materiel_numero', 8.0),
+    ('materiel_type', 4.0),
+    ('responsable', 4.0),
+    ('fournisseur', 4.0),
+    ('emails', 2.0),
+    ('observations', 1.0),
+)
+
+# Historique des versions : une version complète (keyframe) toutes les N versions, des diffs JSON entre les deux
+VERSION_KEYFRAME_INTERVAL = max(1, int(os.environ.get('VERSION_KEYFRAME_INTERVAL', '10')))
+
+# Tables dont chaque modification (INSERT/UPDATE/DELETE) incrémente un compteur dans change_counters
+CHANGE_COUNTER_TABLES = ('pvs',)
 
 # Instance SQLAlchemy (sera initialisée dans server.py)
 db = SQLAlchemy()
 
 
+class CompressedJSONText(TypeDecorator):
+    """
+    Colonne JSON (texte) compressée de manière transparente selon JSON_COMPRESSION (json_codec.py).
+    
+    Le modèle lit et écrit toujours du texte JSON ; la base contient du texte en clair
+    ou un BLOB compressé (SQLite conserve les BLOB tels quels dans une colonne TEXT,
+    aucune modification du schéma n'est nécessaire).
+    """
+    
+    impl = db.Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        return encode_json_text(value)
+    
+    def process_result_value(self, value, dialect):
+        return decode_json_text(value)
+
+
+class Blob(db.Model):
+    """
+    Image (photo ou signature) stockée une seule fois, identifiée par le SHA-256 de son contenu.
+    Les PV et leurs versions y font référence : une image identique n'est jamais dupliquée.
+    """
+    
+    __tablename__ = 'blobs'
+    
+    hash = db.Column(db.String(64), primary_key=True)  # SHA-256 hexadécimal
+    mime = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # Octets bruts (non Base64)
+    date_creation = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def to_data_uri(self):
+        """Retourne l'image au format data URI attendu par le frontend et le template PDF."""
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+    
+    def __repr__(self):
+        return f'<Blob {self.hash[:12]} {self.mime} {self.size} o>'
+
+
+def extract_blobs(value, blobs=None):
+    """
+    Remplace les images data:image/...;base64 par des références blob:<sha256>.
+    Fonction pure (sans accès base) : utilisée par les modèles et par migrate_blobs.py.
+    Seuls les types de BLOB_MIME_TYPES sont extraits, les autres restent dans le JSON.
+    
+    Args:
+        value: Structure JSON (dict, liste, chaîne...)
+        blobs: Dictionnaire à compléter {hash: (mime, octets)}
+        
+    Returns:
+        tuple: (structure avec références, dictionnaire des blobs extraits)
+    """
+    if blobs is None:
+        blobs = {}
+    
+    if isinstance(value, dict):
+        return {k: extract_blobs(v, blobs)[0] for k, v in value.items()}, blobs
+    if isinstance(value, list):
+        return [extract_blobs(v, blobs)[0] for v in value], blobs
+    if isinstance(value, str) and value.startswith('data:image/') and ';base64,' in value:
+        header, encoded = value.split(',', 1)
+        mime = header[5:].split(';', 1)[0].lower()
+        if mime not in BLOB_MIME_TYPES:
+            return value, blobs  # Type non servi par /blobs (SVG...) : conservé tel quel
+        try:
+            raw = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, ValueError):
+            return value, blobs  # Donnée invalide : conservée telle quelle
+        digest = hashlib.sha256(raw).hexdigest()
+        blobs[digest] = (mime, raw)
+        return BLOB_REF_PREFIX + digest, blobs
+    return value, blobs
+
+
+def collect_blob_refs(value, refs=None):
+    """
+    Liste les hash référencés (blob:<sha256>) dans une structure JSON.
+    
+    Returns:
+        set: Hash SHA-256 référencés
+    """
+    if refs is None:
+        refs = set()
+    if isinstance(value, dict):
+        for v in value.values():
+            collect_blob_refs(v, refs)
+    elif isinstance(value, list):
+        for v in value:
+            collect_blob_refs(v, refs)
+    elif isinstance(value, str) and value.startswith(BLOB_REF_PREFIX):
+        refs.add(value[len(BLOB_REF_PREFIX):])
+    return refs
+
+
+def store_blobs(data_dict):
+    """
+    Externalise les images d'un dictionnaire dans la table blobs.
+    Seules les images absentes de la table sont écrites.
+    
+    Args:
+        data_dict: Données du PV (avec data URI)
+        
+    Returns:
+        dict: Données avec références blob:<sha256>
+    """
+    data_dict, blobs = extract_blobs(data_dict)
+    if blobs:
+        existing = {row[0] for row in db.session.query(Blob.hash).filter(Blob.hash.in_(list(blobs)))}
+        missing = [
+            {'hash': digest, 'mime': mime, 'size': len(raw), 'data': raw, 'date_creation': datetime.utcnow()}
+            for digest, (mime, raw) in blobs.items() if digest not in existing
+        ]
+        if missing:
+            # INSERT OR IGNORE : une requête concurrente peut insérer la même image
+            db.session.execute(sqlite_insert(Blob).values(missing).on_conflict_do_nothing())
+    return data_dict
+
+
+def hydrate_blobs(value):
+    """
+    Remplace les références blob:<sha256> par les data URI correspondantes (une seule requête).
+    
+    Args:
+        value: Structure JSON avec références
+        
+    Returns:
+        Structure avec data URI (référence conservée si le blob est introuvable)
+    """
+    refs = collect_blob_refs(value)
+    if not refs:
+        return value
+    uris = {blob.hash: blob.to_data_uri() for blob in Blob.query.filter(Blob.hash.in_(list(refs)))}
+    
+    def replace(item):
+        if isinstance(item, dict):
+            return {k: replace(v) for k, v in item.items()}
+        if isinstance(item, list):
+            return [replace(v) for v in item]
+        if isinstance(item, str) and item.startswith(BLOB_REF_PREFIX):
+            return uris.get(item[len(BLOB_REF_PREFIX):], item)
+        return item
+    
+    return replace(value)
+
+
 class PV(db.Model):
     """
     Modèle PV (Procès-Verbal) avec architecture hybride.
     
-    Colonnes SQL indexées pour les recherches rapides :
-    - id, date_creation, chantier, emails, statut
+    Colonnes SQL indexées pour les recherches rapides et la liste des PV :
+    - id, date_creation, chantier, emails, statut, matériel (type et numéro)
     
     Colonne JSON pour conserver toute la structure complexe :
-    - data (contient form_data avec tous les champs, photos, signatures)
+    - data (contient form_data avec tous les champs ; photos et signatures
+      sous forme de références blob:<sha256> vers la table blobs)
     """
     
     __tablename__ = 'pvs'
+    __table_args__ = (
+        # Tri et pagination par clé de /list-pv : ORDER BY date_mise_a_jour DESC, id DESC
+        db.Index('ix_pvs_date_mise_a_jour_id', 'date_mise_a_jour', 'id'),
+    )
     
     # Colonnes indexées pour recherches fréquentes
     id = db.Column(db.String(36), primary_key=True)  # UUID
@@ -40,6 +246,7 @@ class PV(db.Model):
     responsable = db.Column(db.String(200), index=True)
     fournisseur = db.Column(db.String(200), index=True)
     materiel_type = db.Column(db.String(200), index=True)
+    materiel_numero = db.Column(db.String(100), index=True)
     
     # Dates de réception/retour pour filtrage
     date_reception = db.Column(db.String(20), index=True)  # Format YYYY-MM-DD
@@ -54,17 +261,29 @@ class PV(db.Model):
     # Version courante du PV
     version_courante = db.Column(db.Integer, nullable=False, default=1, index=True)
     
+    # Révision du JSON, incrémentée à chaque écriture (contrôle des modifications par champ)
+    revision = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # Dernière révision attribuée (>= revision) : les brouillons de l'écriture différée la réservent
+    # en base à leur réception, revision ne la rattrape qu'à leur écriture
+    revision_reservee = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # Date de la dernière réservation : une réservation plus ancienne que DRAFT_FLUSH_TIMEOUT et
+    # toujours au-delà de revision est perdue (worker arrêté avec des brouillons en attente)
+    date_reservation = db.Column(db.DateTime, nullable=True)
+    
     # VGP (Vérification Générale Périodique) - Contrôle technique des engins
     vgp_date = db.Column(db.String(20), nullable=True, index=True)  # Format YYYY-MM-DD
     vgp_document_path = db.Column(db.Text, nullable=True)  # Chemin vers le PDF de conformité
     
     # Colonne JSON contenant TOUTES les données du PV
     # Cela évite de créer des dizaines de tables et garde la compatibilité avec le frontend
-    data = db.Column(db.Text, nullable=False)  # Stockage JSON en texte
+    # Chargement différé : lue seulement par les requêtes qui utilisent le JSON (options(db.undefer(PV.data)))
+    data = db.deferred(db.Column(CompressedJSONText, nullable=False))  # Stockage JSON (compressé si JSON_COMPRESSION)
     
     def __init__(self, id, chantier, data_dict, conducteur_email=None, entreprise_email=None, 
                  responsable=None, fournisseur=None, materiel_type=None, 
-                 date_reception=None, date_retour=None, statut='empty', 
+                 materiel_numero=None, date_reception=None, date_retour=None, statut='empty', 
                  date_dernier_envoi=None, date_creation=None, date_mise_a_jour=None,
                  vgp_date=None, vgp_document_path=None):
         """
@@ -79,6 +298,7 @@ class PV(db.Model):
             responsable: Nom du responsable
             fournisseur: Nom du fournisseur
             materiel_type: Type de matériel
+            materiel_numero: Numéro du matériel
             date_reception: Date de réception (format YYYY-MM-DD)
             date_retour: Date de retour (format YYYY-MM-DD)
             statut: État de complétion du PV
@@ -95,6 +315,7 @@ class PV(db.Model):
         self.responsable = responsable
         self.fournisseur = fournisseur
         self.materiel_type = materiel_type
+        self.materiel_numero = materiel_numero
         self.date_reception = date_reception
         self.date_retour = date_retour
         self.statut = statut
@@ -107,30 +328,40 @@ class PV(db.Model):
         self.date_creation = date_creation or now
         self.date_mise_a_jour = date_mise_a_jour or now
         
-        # Stocker le JSON complet
-        self.data = json.dumps(data_dict, ensure_ascii=False)
+        # Stocker le JSON complet (images externalisées dans la table blobs)
+        self.data = json.dumps(store_blobs(data_dict), ensure_ascii=False)
     
-    def get_data(self):
+    def get_data(self, hydrate=False):
         """
         Récupère le dictionnaire Python depuis le JSON stocké.
         
+        Args:
+            hydrate: Remplacer les références blob:<sha256> par les images (data URI)
+        
         Returns:
             dict: Données complètes du PV
         """
         try:
-            return json.loads(self.data)
+            data_dict = json.loads(self.data)
         except (json.JSONDecodeError, TypeError):
             return {}
+        return hydrate_blobs(data_dict) if hydrate else data_dict
     
-    def set_data(self, data_dict):
+    def set_data(self, data_dict, revision=None):
         """
-        Met à jour la colonne JSON avec un nouveau dictionnaire.
+        Met à jour la colonne JSON avec un nouveau dictionnaire et fixe sa révision.
         
         Args:
             data_dict: Dictionnaire Python à stocker
+            revision: Révision déjà réservée (brouillon de l'écriture différée) ; par défaut,
+                nouvelle révision après toutes celles attribuées
         """
-        self.data = json.dumps(data_dict, ensure_ascii=False)
+        self.data = json.dumps(store_blobs(data_dict), ensure_ascii=False)
         self.date_mise_a_jour = datetime.utcnow()
+        if revision is None:
+            revision = max(self.revision or 1, self.revision_reservee or 1) + 1
+        self.revision = revision
+        self.revision_reservee = max(self.revision_reservee or 1, revision)
     
     def to_dict(self):
         """
@@ -139,7 +370,7 @@ class PV(db.Model):
         Returns:
             dict: Structure identique aux anciens fichiers JSON
         """
-        data_dict = self.get_data()
+        data_dict = self.get_data(hydrate=True)
         
         return {
             'id': self.id,
@@ -147,6 +378,7 @@ class PV(db.Model):
             'created_at': self.date_creation.isoformat() if self.date_creation else None,
             'updated_at': self.date_mise_a_jour.isoformat() if self.date_mise_a_jour else None,
             'last_sent_date': self.date_dernier_envoi.isoformat() if self.date_dernier_envoi else None,
+            'revision': self.revision,
             'form_data': data_dict.get('form_data', data_dict)  # Compatibilité avec ancienne structure
         }
     
@@ -186,6 +418,7 @@ class PV(db.Model):
             'responsable': form_data.get('responsable', ''),
             'fournisseur': form_data.get('fournisseur', ''),
             'materiel_type': form_data.get('materiel_type', ''),
+            'materiel_numero': form_data.get('materiel_numero', ''),
             'date_reception': form_data.get('date_reception', ''),
             'date_retour': form_data.get('date_retour', ''),
             'statut': statut,
@@ -197,10 +430,63 @@ class PV(db.Model):
         return f'<PV {self.id} - {self.chantier} ({self.statut})>'
 
 
+def json_diff(old, new):
+    """
+    Différence entre deux dictionnaires JSON (les sous-dictionnaires sont comparés récursivement,
+    les listes et les valeurs simples sont remplacées en entier).
+    
+    Args:
+        old: Dictionnaire de départ
+        new: Dictionnaire d'arrivée
+        
+    Returns:
+        dict: {'set': {clé: valeur}, 'sub': {clé: diff}, 'del': [clés]} (sections vides omises)
+    """
+    diff = {}
+    for key, value in new.items():
+        if key not in old:
+            diff.setdefault('set', {})[key] = value
+        elif old[key] != value:
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                diff.setdefault('sub', {})[key] = json_diff(old[key], value)
+            else:
+                diff.setdefault('set', {})[key] = value
+    removed = [key for key in old if key not in new]
+    if removed:
+        diff['del'] = removed
+    return diff
+
+
+def json_patch(base, diff):
+    """
+    Applique un diff produit par json_diff (base n'est pas modifié).
+    
+    Args:
+        base: Dictionnaire de départ
+        diff: Différence à appliquer
+        
+    Returns:
+        dict: Dictionnaire d'arrivée
+    """
+    result = dict(base)
+    for key in diff.get('del', ()):
+        result.pop(key, None)
+    result.update(diff.get('set', {}))
+    for key, sub_diff in diff.get('sub', {}).items():
+        result[key] = json_patch(result.get(key) or {}, sub_diff)
+    return result
+
+
 class PVVersion(db.Model):
     """
     Modèle pour stocker les versions historiques des PV.
     Chaque envoi par email crée une nouvelle version.
+    
+    Stockage par diff : seule la version keyframe_version d'une chaîne contient le snapshot complet,
+    les suivantes contiennent le diff JSON (json_diff) par rapport à la version précédente.
+    Une nouvelle keyframe est écrite toutes les VERSION_KEYFRAME_INTERVAL versions, ce qui borne
+    le nombre de lignes lues pour reconstruire une version. keyframe_version NULL : snapshot
+    complet (versions antérieures à la migration).
     """
     
     __tablename__ = 'pv_versions'
@@ -209,23 +495,67 @@ class PVVersion(db.Model):
     pv_id = db.Column(db.String(36), db.ForeignKey('pvs.id', ondelete='CASCADE'), nullable=False, index=True)
     version_number = db.Column(db.Integer, nullable=False)
     date_creation = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
-    data = db.Column(db.Text, nullable=False)  # Snapshot JSON du PV à ce moment
+    data = db.deferred(db.Column(CompressedJSONText, nullable=False))  # Snapshot JSON (keyframe) ou diff, chargement différé
+    keyframe_version = db.Column(db.Integer, nullable=True)  # Première version de la chaîne de diffs
     created_by = db.Column(db.String(100), default='system')
     comment = db.Column(db.Text, nullable=True)  # Ex: "Envoyé par email à..."
     
     def __init__(self, pv_id, version_number, data_dict, created_by='system', comment=None):
         self.pv_id = pv_id
         self.version_number = version_number
-        self.data = json.dumps(data_dict, ensure_ascii=False)
         self.created_by = created_by
         self.comment = comment
+        self.set_data(data_dict)
+    
+    @property
+    def is_keyframe(self):
+        """True si la ligne contient le snapshot complet."""
+        return self.keyframe_version is None or self.keyframe_version == self.version_number
+    
+    def set_data(self, data_dict):
+        """
+        Enregistre le snapshot, sous forme de diff par rapport à la version précédente
+        si elle existe et que la chaîne n'a pas atteint VERSION_KEYFRAME_INTERVAL versions.
+        """
+        data_dict = store_blobs(data_dict)
+        
+        previous = PVVersion.query.options(db.undefer(PVVersion.data)).filter_by(
+            pv_id=self.pv_id, version_number=self.version_number - 1
+        ).first()
+        if previous is not None:
+            chain_start = previous.version_number if previous.is_keyframe else previous.keyframe_version
+            if self.version_number - chain_start < VERSION_KEYFRAME_INTERVAL:
+                previous_data = previous.get_data()
+                if previous_data:
+                    self.keyframe_version = chain_start
+                    self.data = json.dumps(json_diff(previous_data, data_dict), ensure_ascii=False)
+                    return
+        
+        self.keyframe_version = self.version_number
+        self.data = json.dumps(data_dict, ensure_ascii=False)
     
-    def get_data(self):
-        """Récupère le dictionnaire Python depuis le JSON stocké."""
+    def get_data(self, hydrate=False):
+        """
+        Récupère le dictionnaire Python de la version (images résolues si hydrate).
+        Une version stockée en diff est reconstruite depuis sa keyframe (une seule requête).
+        """
         try:
-            return json.loads(self.data)
-        except (json.JSONDecodeError, TypeError):
+            if self.is_keyframe:
+                data_dict = json.loads(self.data)
+            else:
+                chain = (db.session.query(PVVersion.version_number, PVVersion.data)
+                         .filter(PVVersion.pv_id == self.pv_id,
+                                 PVVersion.version_number >= self.keyframe_version,
+                                 PVVersion.version_number < self.version_number)
+                         .order_by(PVVersion.version_number)
+                         .all())
+                data_dict = json.loads(chain[0].data)
+                for row in chain[1:]:
+                    data_dict = json_patch(data_dict, json.loads(row.data))
+                data_dict = json_patch(data_dict, json.loads(self.data))
+        except (json.JSONDecodeError, TypeError, IndexError):
             return {}
+        return hydrate_blobs(data_dict) if hydrate else data_dict
     
     def to_dict(self):
         """Convertit la version en dictionnaire."""
@@ -236,27 +566,416 @@ class PVVersion(db.Model):
             'date_creation': self.date_creation.isoformat() if self.date_creation else None,
             'created_by': self.created_by,
             'comment': self.comment,
-            'data': self.get_data()
+            'data': self.get_data(hydrate=True)
         }
     
     def __repr__(self):
         return f'<PVVersion {self.pv_id} v{self.version_number}>'
 
 
+class EmailOutbox(db.Model):
+    """
+    File d'envoi des emails (outbox persistante).
+    La requête enregistre le message ; l'envoi SMTP est fait par mailer.py en arrière-plan.
+    
+    Statuts : pending (en attente / nouvel essai planifié), sending (pris en charge),
+    sent (remis au serveur SMTP), failed (abandonné)
+    """
+    
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    pv_id = db.Column(db.String(36), db.ForeignKey('pvs.id', ondelete='CASCADE'), nullable=True, index=True)
+    version_number = db.Column(db.Integer, nullable=True)
+    
+    # Message
+    recipients = db.Column(db.Text, nullable=False)  # Adresses séparées par des virgules
+    subject = db.Column(db.String(500), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attachment_name = db.Column(db.String(300), nullable=True)
+    attachment = db.Column(db.LargeBinary, nullable=True)  # PDF
+    
+    # Suivi de l'envoi
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(100), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    date_creation = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    date_envoi = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        """Convertit l'entrée en dictionnaire (sans la pièce jointe)."""
+        return {
+            'id': self.id,
+            'pv_id': self.pv_id,
+            'version_number': self.version_number,
+            'recipients': [r for r in (self.recipients or '').split(',') if r],
+            'subject': self.subject,
+            'attachment_name': self.attachment_name,
+            'attachment_size': len(self.attachment) if self.attachment else 0,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
+            'date_envoi': self.date_envoi.isoformat() if self.date_envoi else None
+        }
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status} ({self.attempts} essai(s))>'
+
+
+class UploadSession(db.Model):
+    """
+    Envoi d'une photo par morceaux, reprenable après une coupure réseau (uploads.py).
+    Les octets reçus sont écrits dans un fichier partiel ; received est la position confirmée
+    au client. Une fois complète et vérifiée (SHA-256), la photo rejoint la table blobs
+    et le formulaire y fait référence (blob:<sha256>).
+    
+    Statuts : pending (en cours), complete (photo dans blobs)
+    """
+    
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(36), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)  # Empreinte annoncée par le client
+    mime = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    date_creation = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_mise_a_jour = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                                 onupdate=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """État de l'envoi renvoyé au client (position à partir de laquelle reprendre)."""
+        return {
+            'upload_id': self.id,
+            'size': self.size,
+            'offset': self.received,
+            'complete': self.status == 'complete',
+            'ref': BLOB_REF_PREFIX + self.sha256 if self.status == 'complete' else None
+        }
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id[:8]} {self.received}/{self.size} {self.status}>'
+
+
+class ChangeCounter(db.Model):
+    """
+    Compteur de modifications d'une table, incrémenté par des triggers SQLite.
+    Sert de validateur (ETag) pour les réponses qui dépendent de toute la table.
+    """
+    
+    __tablename__ = 'change_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)  # Nom de la table surveillée
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ChangeCounter {self.name}={self.value}>'
+
+
+def install_change_counters():
+    """
+    Crée (si besoin) les compteurs et les triggers de CHANGE_COUNTER_TABLES.
+    Les triggers comptent aussi les écritures SQL brutes (hors ORM).
+    """
+    # Valeur initiale horodatée : une base recréée ne reprend pas des valeurs déjà vues par les clients
+    initial_value = int(time.time() * 1000)
+    
+    for table in CHANGE_COUNTER_TABLES:
+        db.session.execute(
+            text("INSERT OR IGNORE INTO change_counters (name, value) VALUES (:name, :value)"),
+            {'name': table, 'value': initial_value}
+        )
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            db.session.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{operation.lower()}_counter
+                AFTER {operation} ON {table}
+                BEGIN
+                    UPDATE change_counters SET value = value + 1 WHERE name = '{table}';
+                END
+            """))
+    db.session.commit()
+
+
+def _search_index_values(prefix=''):
+    """
+    Expressions SQL des colonnes de pvs_fts pour une ligne de pvs.
+    
+    Args:
+        prefix: 'NEW.' dans un trigger, '' dans un SELECT sur pvs
+        
+    Returns:
+        str: Liste d'expressions (rowid, pv_id puis SEARCH_INDEX_COLUMNS)
+    """
+    # pv_json (json_codec.register_sqlite_functions) : JSON en clair, que la colonne soit compressée ou non
+    document = f"pv_json({prefix}data)"
+    
+    def observation(field):
+        return (f"COALESCE(json_extract({document}, '$.form_data.{field}'), "
+                f"json_extract({document}, '$.{field}'), '')")
+    
+    # json_valid : une ligne au JSON invalide est indexée sans ses observations au lieu de faire échouer l'écriture
+    observations = (f"CASE WHEN json_valid({document}) THEN "
+                    f"{observation('observations_reception')} || ' ' || {observation('observations_retour')} "
+                    f"ELSE '' END")
+    return ', '.join([
+        f"{prefix}rowid",
+        f"{prefix}id",
+        f"{prefix}chantier",
+        f"{prefix}materiel_numero",
+        f"{prefix}materiel_type",
+        f"{prefix}responsable",
+        f"{prefix}fournisseur",
+        f"COALESCE({prefix}conducteur_email, '') || ' ' || COALESCE({prefix}entreprise_email, '')",
+        observations,
+    ])
+
+
+def search_index_statements():
+    """
+    Instructions SQL de création de l'index plein texte pvs_fts et des triggers qui le
+    synchronisent avec pvs (insertion, modification des champs indexés, suppression).
+    
+    L'index utilise le rowid de pvs ; la colonne pv_id sert aux jointures.
+    Accents et casse sont ignorés (unicode61 remove_diacritics 2), préfixes de 2 et 3 lettres indexés.
+    
+    Returns:
+        list: Instructions SQL idempotentes
+    """
+    columns = ', '.join(name for name, _ in SEARCH_INDEX_COLUMNS)
+    watched = 'chantier, materiel_numero, materiel_type, responsable, fournisseur, conducteur_email, entreprise_email, data'
+    insert_new = f"INSERT INTO pvs_fts (rowid, pv_id, {columns}) VALUES ({_search_index_values('NEW.')});"
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS pvs_fts USING fts5(
+                pv_id UNINDEXED, {columns},
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_pvs_fts_insert AFTER INSERT ON pvs
+            BEGIN {insert_new} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_pvs_fts_update AFTER UPDATE OF {watched} ON pvs
+            BEGIN DELETE FROM pvs_fts WHERE rowid = OLD.rowid; {insert_new} END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_pvs_fts_delete AFTER DELETE ON pvs
+            BEGIN DELETE FROM pvs_fts WHERE rowid = OLD.rowid; END""",
+    ]
+
+
+def search_index_rebuild_statements():
+    """
+    Instructions SQL qui reconstruisent entièrement pvs_fts depuis pvs
+    (création de l'index sur une base existante, ou après un VACUUM qui renumérote les rowid).
+    
+    Returns:
+        list: Instructions SQL
+    """
+    columns = ', '.join(name for name, _ in SEARCH_INDEX_COLUMNS)
+    return [
+        "DELETE FROM pvs_fts",
+        f"INSERT INTO pvs_fts (rowid, pv_id, {columns}) SELECT {_search_index_values()} FROM pvs",
+    ]
+
+
+def install_search_index():
+    """
+    Crée (si besoin) l'index plein texte, le remplit s'il vient d'être créé,
+    et (re)crée ses triggers pour qu'ils suivent toujours la définition courante.
+    """
+    existed = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pvs_fts'")
+    ).scalar()
+    
+    for trigger in ('trg_pvs_fts_insert', 'trg_pvs_fts_update', 'trg_pvs_fts_delete'):
+        db.session.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    for statement in search_index_statements():
+        db.session.execute(text(statement))
+    
+    if not existed:
+        for statement in search_index_rebuild_statements():
+            db.session.execute(text(statement))
+        count = db.session.execute(text("SELECT COUNT(*) FROM pvs_fts")).scalar()
+        print(f"🔎 Index de recherche créé ({count} PV indexé(s))")
+    db.session.commit()
+
+
+def build_search_query(terms):
+    """
+    Convertit une saisie libre en requête FTS5 : chaque mot devient un préfixe,
+    tous les mots doivent être présents. La syntaxe FTS5 de l'utilisateur est neutralisée.
+    
+    Args:
+        terms: Texte saisi (ex. "grue lyon")
+        
+    Returns:
+        str: Requête MATCH (ex. '"grue"* "lyon"*'), vide si aucun mot
+    """
+    words = re.findall(r'\w+', terms or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def get_change_counter(table):
+    """
+    Retourne la valeur courante du compteur de modifications d'une table.
+    
+    Args:
+        table: Nom de la table (présente dans CHANGE_COUNTER_TABLES)
+        
+    Returns:
+        int: Valeur du compteur (None si absent)
+    """
+    return db.session.execute(
+        text("SELECT value FROM change_counters WHERE name = :name"), {'name': table}
+    ).scalar()
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    """Déclare les fonctions SQL de l'application (json_codec) sur chaque nouvelle connexion."""
+    register_sqlite_functions(dbapi_connection)
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    Applique les pragmas de production à chaque nouvelle connexion SQLite.
+    
+    Args:
+        dbapi_connection: Connexion sqlite3
+        connection_record: Enregistrement du pool (non utilisé)
+    """
+    # Les transactions sont ouvertes explicitement dans _begin_sqlite_transaction
+    dbapi_connection.isolation_level = None
+    
+    cursor = dbapi_connection.cursor()
+    # busy_timeout d'abord : le passage en WAL attend si un autre worker tient un verrou
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _begin_sqlite_transaction(connection):
+    """
+    Ouvre la transaction SQLite.
+    
+    Dans une requête d'écriture (POST, PUT, PATCH, DELETE), BEGIN IMMEDIATE prend le verrou
+    d'écriture dès le début : une transaction qui lit puis écrit (sauvegarde d'un PV existant)
+    attend alors son tour via busy_timeout au lieu d'échouer en « database is locked »
+    lorsqu'un autre worker a écrit entre-temps. Les lectures restent en BEGIN simple
+    et ne bloquent jamais en mode WAL.
+    
+    Args:
+        connection: Connexion SQLAlchemy
+    """
+    if getattr(_transaction_mode, 'read_only', False):
+        connection.exec_driver_sql("BEGIN")
+    elif getattr(_transaction_mode, 'immediate', False) or (
+            has_request_context() and request.method in WRITE_METHODS):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        connection.exec_driver_sql("BEGIN")
+
+
+@contextmanager
+def write_transactions():
+    """
+    Ouvre en BEGIN IMMEDIATE les transactions du thread courant pendant le bloc.
+    Pour les traitements qui écrivent hors requête HTTP (création du schéma, envoi des emails).
+    """
+    previous = getattr(_transaction_mode, 'immediate', False)
+    _transaction_mode.immediate = True
+    try:
+        yield
+    finally:
+        _transaction_mode.immediate = previous
+
+
+@contextmanager
+def read_transactions():
+    """
+    Ouvre en BEGIN simple les transactions du thread courant pendant le bloc, même dans une
+    requête d'écriture. Pour une requête d'écriture qui ne fait que lire (brouillon déposé
+    dans le tampon d'écriture différée), ou pour la phase de lecture d'une opération longue
+    (rendu PDF, export, envoi SMTP) : la transaction est validée avant le traitement long, et
+    l'enregistrement qui suit ouvre une nouvelle transaction en BEGIN IMMEDIATE. Le verrou
+    d'écriture n'est ainsi jamais gardé pendant le traitement.
+    """
+    previous = getattr(_transaction_mode, 'read_only', False)
+    _transaction_mode.read_only = True
+    try:
+        yield
+    finally:
+        _transaction_mode.read_only = previous
+
+
+def get_sqlite_pragmas():
+    """
+    Retourne les pragmas effectifs d'une connexion du pool (vérification au démarrage, /health).
+    
+    Returns:
+        dict: journal_mode, synchronous, busy_timeout, cache_size, mmap_size, temp_store
+    """
+    synchronous_names = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+    temp_store_names = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+    pragmas = {}
+    with db.engine.connect() as connection:
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store'):
+            pragmas[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    pragmas['synchronous'] = synchronous_names.get(pragmas['synchronous'], pragmas['synchronous'])
+    pragmas['temp_store'] = temp_store_names.get(pragmas['temp_store'], pragmas['temp_store'])
+    return pragmas
+
+
 def init_db(app):
     """
     Initialise la base de données avec l'application Flask.
     À appeler au démarrage de l'application.
     
+    Avec SQLITE_PRODUCTION_MODE (par défaut), chaque connexion est configurée en WAL
+    avec busy_timeout, cache et mmap, et le pool est dimensionné pour plusieurs threads.
+    
     Args:
         app: Instance Flask
     """
+    is_sqlite = app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite')
+    
+    if SQLITE_PRODUCTION_MODE and is_sqlite:
+        engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        engine_options.setdefault('pool_size', SQLITE_POOL_SIZE)
+        engine_options.setdefault('max_overflow', SQLITE_MAX_OVERFLOW)
+        engine_options.setdefault('pool_timeout', 30)
+        connect_args = engine_options.setdefault('connect_args', {})
+        connect_args.setdefault('timeout', SQLITE_BUSY_TIMEOUT_MS / 1000)
+        connect_args.setdefault('check_same_thread', False)
+    
     db.init_app(app)
     
     with app.app_context():
+        if is_sqlite:
+            # Fonction pv_json utilisée par les triggers de l'index plein texte
+            event.listen(db.engine, 'connect', _register_sqlite_functions)
+        if SQLITE_PRODUCTION_MODE and is_sqlite:
+            event.listen(db.engine, 'connect', _configure_sqlite_connection)
+            event.listen(db.engine, 'begin', _begin_sqlite_transaction)
+        
         # Créer toutes les tables si elles n'existent pas
-        db.create_all()
+        # (plusieurs workers peuvent démarrer en même temps : verrou d'écriture dès le début)
+        with write_transactions():
+            db.create_all()
+            install_change_counters()
+            if is_sqlite:
+                install_search_index()
         print("✅ Base de données initialisée avec succès")
+        
+        if is_sqlite:
+            pragmas = get_sqlite_pragmas()
+            print("🗄️  SQLite : " + ', '.join(f"{name}={value}" for name, value in pragmas.items()))
+            if SQLITE_PRODUCTION_MODE and pragmas['journal_mode'] != 'wal':
+                print("⚠️  Le mode WAL n'a pas pu être activé (système de fichiers réseau ?)")
 
 
 def get_db_stats():
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Simulation d'une connexion de chantier instable pour l'envoi des photos par morceaux (/uploads)
+
+Sur une copie de instance/pvs.db, un client envoie des photos JPEG par morceaux au travers
+d'une connexion qui :
+- perd des requêtes avant qu'elles n'atteignent le serveur,
+- perd des réponses après que le serveur a écrit le morceau (le client renvoie un morceau
+  déjà écrit : 409, puis reprise à la position du serveur),
+- altère des morceaux en route (empreinte X-Chunk-SHA256 invalide : 400).
+
+Le client applique le même protocole que static/script.js (reprise à la position confirmée
+par GET /uploads/<id> après chaque échec). Le script vérifie ensuite :
+- que chaque photo est acquittée avec sa référence blob:<sha256> et que /blobs/<sha256>
+  renvoie exactement les octets envoyés,
+- qu'un envoi interrompu (page fermée) reprend à la position confirmée,
+- qu'une photo déjà reçue est acquittée sans transfert,
+- qu'un PV qui référence les photos est enregistré et rendu par /download-pdf.
+
+Il affiche les tentatives et le surcoût en octets ; code de sortie 1 en cas d'échec.
+
+Usage :
+    python simulate_flaky_upload.py
+    python simulate_flaky_upload.py --photos 10 --drop-rate 0.3 --corrupt-rate 0.1 --seed 7
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+SOURCE_DB = Path(__file__).parent / 'instance' / 'pvs.db'
+
+
+class ConnectionLost(Exception):
+    """Requête ou réponse perdue (coupure réseau simulée)."""
+
+
+class FlakyConnection:
+    """Client de test Flask derrière une connexion qui perd et altère des requêtes."""
+
+    def __init__(self, client, rng, drop_rate, corrupt_rate):
+        self.client = client
+        self.rng = rng
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.stats = {'requests': 0, 'lost_requests': 0, 'lost_responses': 0,
+                      'corrupted': 0, 'bytes_sent': 0}
+
+    def request(self, method, url, body=None, **kwargs):
+        self.stats['requests'] += 1
+        if self.rng.random() < self.drop_rate / 2:
+            self.stats['lost_requests'] += 1
+            raise ConnectionLost(f'{method} {url} : requête perdue')
+
+        if body is not None:
+            self.stats['bytes_sent'] += len(body)
+            if self.rng.random() < self.corrupt_rate:
+                # Un octet altéré en route, l'en-tête X-Chunk-SHA256 reste celui du client
+                corrupted = bytearray(body)
+                corrupted[self.rng.randrange(len(corrupted))] ^= 0xFF
+                body = bytes(corrupted)
+                self.stats['corrupted'] += 1
+            kwargs['data'] = body
+
+        response = self.client.open(url, method=method, **kwargs)
+        if self.rng.random() < self.drop_rate / 2:
+            self.stats['lost_responses'] += 1
+            raise ConnectionLost(f'{method} {url} : réponse perdue')
+        return response
+
+
+def upload_photo(conn, data, mime='image/jpeg', max_attempts=50, stop_after=None):
+    """
+    Envoie une photo par morceaux (même protocole que uploadPhotoResumable dans script.js).
+
+    Args:
+        conn: FlakyConnection
+        data: Octets de la photo
+        mime: Type MIME
+        max_attempts: Échecs consécutifs tolérés
+        stop_after: Abandonne après ce nombre de morceaux acquittés (page fermée)
+
+    Returns:
+        dict: Dernier état renvoyé par le serveur, et nombre d'échecs rencontrés
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    failures = total_failures = 0
+
+    def retry(call):
+        nonlocal failures, total_failures
+        while True:
+            try:
+                response = call()
+                if response.status_code < 500:
+                    return response
+            except ConnectionLost:
+                pass
+            failures += 1
+            total_failures += 1
+            if failures >= max_attempts:
+                raise RuntimeError('trop d\'échecs consécutifs')
+
+    state = retry(lambda: conn.request('POST', '/uploads', json={
+        'sha256': sha256, 'size': len(data), 'mime': mime})).get_json()
+    if not state['success']:
+        raise RuntimeError(state['message'])
+    upload_id, chunk_size, offset = state['upload_id'], state['chunk_size'], state['offset']
+    started_at = offset
+    acked = 0
+
+    while not state.get('complete'):
+        if stop_after is not None and acked >= stop_after:
+            break
+        chunk = data[offset:offset + chunk_size]
+        try:
+            response = conn.request('PUT', f'/uploads/{upload_id}', body=chunk, headers={
+                'Content-Type': 'application/octet-stream',
+                'Upload-Offset': str(offset),
+                'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()
+            })
+            state = response.get_json()
+            if response.status_code == 404:
+                raise RuntimeError(state['message'])
+            if response.status_code != 200:
+                raise ConnectionLost(state['message'])
+            offset = state['offset']
+            failures = 0
+            acked += 1
+        except ConnectionLost:
+            failures += 1
+            total_failures += 1
+            if failures >= max_attempts:
+                raise RuntimeError('trop d\'échecs consécutifs')
+            # Reprise à la position confirmée par le serveur
+            state = retry(lambda: conn.request('GET', f'/uploads/{upload_id}')).get_json()
+            offset = state['offset']
+
+    return {**state, 'sha256': sha256, 'started_at': started_at, 'failures': total_failures}
+
+
+def make_photo(rng, width=1600, height=1200):
+    """Photo JPEG de test (bruit : peu compressible, comme une photo de chantier)."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (width, height), rng.randbytes(width * height * 3)).save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Envoi par morceaux sur une connexion instable')
+    parser.add_argument('--photos', type=int, default=5, help='Nombre de photos envoyées')
+    parser.add_argument('--chunk-size', type=int, default=64 * 1024, help='Taille des morceaux (octets)')
+    parser.add_argument('--drop-rate', type=float, default=0.2, help='Probabilité de perte par requête')
+    parser.add_argument('--corrupt-rate', type=float, default=0.05, help='Probabilité d\'altération d\'un morceau')
+    parser.add_argument('--seed', type=int, default=42, help='Graine du générateur aléatoire')
+    args = parser.parse_args()
+
+    if not SOURCE_DB.exists():
+        print(f"❌ Erreur : La base de données {SOURCE_DB} n'existe pas.")
+        sys.exit(2)
+
+    workdir = Path(tempfile.mkdtemp(prefix='flaky_upload_'))
+    db_path = workdir / 'pvs.db'
+    source = sqlite3.connect(SOURCE_DB)
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['MAIL_SENDER_ENABLED'] = '0'
+    os.environ['UPLOAD_TMP_DIR'] = str(workdir / 'uploads')
+    os.environ['UPLOAD_CHUNK_SIZE'] = str(args.chunk_size)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+        from setup_db import db
+
+    rng = random.Random(args.seed)
+    client = server.app.test_client()
+    conn = FlakyConnection(client, rng, args.drop_rate, args.corrupt_rate)
+    failures = []
+
+    def check(condition, message):
+        print(f"{'✅' if condition else '❌'} {message}")
+        if not condition:
+            failures.append(message)
+
+    try:
+        photos = [make_photo(rng) for _ in range(args.photos)]
+        total_bytes = sum(len(photo) for photo in photos)
+        print(f"📶 {args.photos} photos ({total_bytes / 1024:.0f} Ko), morceaux de {args.chunk_size // 1024} Ko, "
+              f"perte {args.drop_rate:.0%}, altération {args.corrupt_rate:.0%}\n")
+
+        # 1. Envois complets sur la connexion instable
+        refs = []
+        for index, photo in enumerate(photos, 1):
+            state = upload_photo(conn, photo)
+            refs.append(state.get('ref'))
+            served = client.get(f"/blobs/{state['sha256']}").get_data()
+            check(state.get('complete') and state.get('ref') == f"blob:{state['sha256']}" and served == photo,
+                  f"Photo {index} : acquittée et identique ({state['failures']} échec(s) surmonté(s))")
+
+        # 2. Page fermée au milieu d'un envoi, puis reprise (nouvelle session du navigateur)
+        photo = make_photo(rng)
+        reliable = FlakyConnection(client, rng, 0, 0)
+        partial = upload_photo(reliable, photo, stop_after=2)
+        resumed = upload_photo(reliable, photo)
+        check(resumed['upload_id'] == partial['upload_id'] and resumed['started_at'] == partial['offset'] > 0
+              and resumed.get('complete'),
+              f"Reprise après fermeture : à l'octet {resumed['started_at']} sur {len(photo)}")
+
+        # 3. Photo déjà reçue : acquittée sans transfert
+        again = upload_photo(reliable, photos[0])
+        check(again.get('complete') and again['started_at'] == len(photos[0]),
+              'Photo déjà reçue : acquittée sans transfert')
+
+        # 4. PV qui référence les photos envoyées
+        form = {'chantier': 'Simulation connexion instable', 'email_conducteur': 'conducteur@example.com'}
+        for index, ref in enumerate(refs, 1):
+            form[f'photo_carrosserie_reception_{index}'] = ref
+        response = client.post('/download-pdf', data=form, headers={'Accept': 'application/pdf'})
+        check(response.status_code == 200 and response.mimetype == 'application/pdf',
+              f"/download-pdf avec {len(refs)} référence(s) : HTTP {response.status_code}")
+        pending = dict(form, photo_panier_retour_1='blob:' + '0' * 64)
+        response = client.post('/download-pdf', data=pending)
+        check(response.status_code == 409, f"/download-pdf avec une photo non reçue : HTTP {response.status_code}")
+
+        stats = conn.stats
+        overhead = stats['bytes_sent'] - total_bytes
+        print(f"\n📊 {stats['requests']} requêtes : {stats['lost_requests']} perdues, "
+              f"{stats['lost_responses']} réponses perdues, {stats['corrupted']} morceaux altérés")
+        print(f"   Octets envoyés : {stats['bytes_sent'] / 1024:.0f} Ko pour {total_bytes / 1024:.0f} Ko "
+              f"(surcoût {overhead / total_bytes:.1%})")
+    finally:
+        with server.app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        print(f"\n❌ {len(failures)} vérification(s) en échec")
+        sys.exit(1)
+    print("\n✅ Envoi par morceaux robuste aux coupures")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Serveur SMTP local de test (sans dépendance) pour l'outbox email
+
+Enregistre chaque message reçu dans un fichier .eml et peut simuler des pannes
+pour vérifier les nouveaux essais, ou un relais lent (--delay). Configuration correspondante (config/smtp_config.json) :
+
+    {"smtp_server": "127.0.0.1", "smtp_port": 8025, "smtp_starttls": false,
+     "smtp_auth": false, "smtp_from_address": "pv@localhost"}
+
+Usage :
+    python smtp_local.py [--port 8025] [--dir outbox_local] [--fail-rate 0.3] [--delay 5]
+"""
+
+import argparse
+import random
+import socketserver
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Sous-ensemble du protocole SMTP utilisé par smtplib (EHLO, MAIL, RCPT, DATA, NOOP, RSET, QUIT)."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        server.stats['connections'] += 1
+        self.reply('220 localhost ESMTP test server')
+        mail_from, rcpt_to = None, []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250-localhost' if verb == 'EHLO' else '250 localhost')
+                if verb == 'EHLO':
+                    self.reply('250 8BITMIME')
+            elif verb == 'MAIL':
+                mail_from, rcpt_to = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                rcpt_to.append(command[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+
+                # Relais lent : réponse au message retardée
+                if server.delay:
+                    time.sleep(server.delay)
+                if random.random() < server.fail_rate:
+                    server.stats['refused'] += 1
+                    self.reply('451 Simulated failure, try again later')
+                else:
+                    server.stats['received'] += 1
+                    name = f"{datetime.now():%Y%m%d_%H%M%S_%f}.eml"
+                    (server.output_dir / name).write_bytes(b''.join(data))
+                    print(f"📨 {mail_from} → {', '.join(rcpt_to)} ({sum(len(c) for c in data)} o) : {name}")
+                    self.reply('250 OK')
+                mail_from, rcpt_to = None, []
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                mail_from, rcpt_to = None, []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, output_dir, fail_rate=0.0, delay=0.0):
+        super().__init__(address, SMTPHandler)
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.stats = {'connections': 0, 'received': 0, 'refused': 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serveur SMTP local de test')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--dir', default='outbox_local', help='Répertoire des messages reçus')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Proportion de messages refusés (451)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Délai avant la réponse à chaque message (secondes)')
+    args = parser.parse_args()
+
+    with LocalSMTPServer((args.host, args.port), args.dir, args.fail_rate, args.delay) as server:
+        print(f"🚀 SMTP de test sur {args.host}:{args.port} (messages dans {args.dir}/)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\n📊 {server.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -22,9 +22,20 @@ let isAutoSaving = false;
 let hasUnsavedChanges = false;
 const AUTO_SAVE_DELAY = 1000; // 1 seconde pour les champs texte
 
+// Sauvegarde incrémentale : état du formulaire connu du serveur et sa révision
+// (null tant que le PV n'a pas été chargé ou sauvegardé en entier)
+let lastSavedFormData = null;
+let currentPVRevision = null;
+// Conflits (409) successifs avant de repasser par une sauvegarde complète
+const REBASE_MAX_ATTEMPTS = 3;
+const REBASE_RETRY_DELAY_MS = 1000;
+
 // Champs avec historique
 const HISTORY_FIELDS = ['chantier', 'email_conducteur', 'email_entreprise', 'materiel_numero', 'materiel_type', 'fournisseur', 'responsable'];
 
+// Champs dont les suggestions viennent aussi de la base de données (facettes du serveur)
+const SELECT2_FACET_FIELDS = ['chantier', 'email_conducteur', 'materiel_numero', 'materiel_type', 'fournisseur', 'responsable'];
+
 // Initialisation au chargement du DOM
 document.addEventListener('DOMContentLoaded', function() {
     initializeSignaturePads();
@@ -947,6 +958,16 @@ function handlePhotoUpload(input) {
                 // Insérer avant l'input file
                 container.insertBefore(photoItem, input);
                 
+                // Envoi par morceaux en arrière-plan : le formulaire référencera la photo envoyée
+                // (la data URI reste en place tant que l'envoi n'est pas terminé)
+                const hiddenInput = photoItem.querySelector('input[type="hidden"]');
+                uploadPhotoResumable(base64Data).then(ref => {
+                    if (ref && hiddenInput.isConnected && hiddenInput.value === base64Data) {
+                        hiddenInput.value = ref;
+                        scheduleAutoSave();
+                    }
+                });
+                
                 // Mettre à jour l'aperçu dans la colonne Élément
                 const fieldName = input.dataset.field?.replace('_reception', '').replace('_retour', '');
                 const pvType = input.dataset.field?.includes('_reception') ? 'reception' : 'retour';
@@ -1046,6 +1067,116 @@ function removePhoto(previewId, button) {
     }
 }
 
+/**
+ * Indique si une valeur de champ photo est une image (data URI ou référence blob:<sha256>)
+ */
+function isPhotoValue(value) {
+    return typeof value === 'string' && (value.startsWith('data:image/') || /^blob:[0-9a-f]{64}$/.test(value));
+}
+
+/**
+ * Adresse affichable d'une photo (les références blob:<sha256> sont servies par /blobs/<sha256>)
+ */
+function photoSrc(value) {
+    return value.startsWith('blob:') ? `/blobs/${value.substring(5)}` : value;
+}
+
+const UPLOAD_MAX_ATTEMPTS = 8;
+
+async function sha256Hex(buffer) {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+/**
+ * Envoie une photo par morceaux, avec reprise après coupure réseau (/uploads).
+ * Chaque morceau est envoyé à la position confirmée par le serveur ; en cas d'échec
+ * (réseau, 409, morceau altéré), la position est relue puis l'envoi reprend de là.
+ *
+ * @param {string} dataUri - Photo optimisée (data URI)
+ * @returns {Promise<string|null>} Référence blob:<sha256>, ou null si l'envoi a échoué
+ */
+async function uploadPhotoResumable(dataUri) {
+    // crypto.subtle n'existe qu'en HTTPS (ou localhost) : sinon la photo reste en data URI
+    if (!window.crypto || !crypto.subtle) return null;
+    
+    try {
+        const blob = await fetch(dataUri).then(r => r.blob());
+        const buffer = await blob.arrayBuffer();
+        const sha256 = await sha256Hex(buffer);
+        
+        const startResponse = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sha256: sha256, size: blob.size, mime: blob.type })
+        });
+        let state = await startResponse.json();
+        if (!state.success) return null;
+        
+        const uploadId = state.upload_id;
+        const chunkSize = state.chunk_size;
+        let offset = state.offset;
+        let failures = 0;
+        
+        while (!state.complete) {
+            try {
+                const chunk = buffer.slice(offset, offset + chunkSize);
+                const response = await fetch(`/uploads/${uploadId}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Upload-Offset': String(offset),
+                        'X-Chunk-SHA256': await sha256Hex(chunk)
+                    },
+                    body: chunk
+                });
+                state = await response.json();
+                if (response.status === 404 || response.status === 413) return null;
+                if (!response.ok) throw new Error(state.message);
+                offset = state.offset;
+                failures = 0;
+            } catch (error) {
+                if (++failures >= UPLOAD_MAX_ATTEMPTS) return null;
+                await new Promise(resolve => setTimeout(resolve, Math.min(30000, 500 * 2 ** failures)));
+                // Reprise à la position confirmée par le serveur (morceau perdu ou acquittement perdu)
+                try {
+                    state = await fetch(`/uploads/${uploadId}`).then(r => r.json());
+                    if (!state.success) return null;
+                    offset = state.offset;
+                } catch (resyncError) {
+                    state = { complete: false };
+                }
+            }
+        }
+        return state.ref;
+    } catch (error) {
+        console.warn('Envoi par morceaux impossible, photo conservée en data URI:', error);
+        return null;
+    }
+}
+
+/**
+ * Envoie les photos en binaire (parties multipart) plutôt qu'en data URI Base64 :
+ * le serveur les lit depuis un fichier temporaire, sans copie Base64 en mémoire,
+ * et la requête est environ 25 % plus légère.
+ * Les champs fichier vides (sélection déjà traitée) sont retirés.
+ *
+ * @param {FormData} formData - FormData construit depuis le formulaire (modifié en place)
+ */
+async function sendPhotosAsBinary(formData) {
+    for (const [key, value] of Array.from(formData.entries())) {
+        if (!key.startsWith('photo_')) continue;
+
+        if (typeof value === 'string' && value.startsWith('data:image/')) {
+            const blob = await fetch(value).then(r => r.blob());
+            const extension = blob.type === 'image/png' ? 'png' : 'jpg';
+            formData.set(key, blob, `${key}.${extension}`);
+        } else if (value instanceof File && !value.name && value.size === 0) {
+            formData.delete(key);
+        }
+    }
+}
+
 /**
  * Initialise la gestion des PV sauvegardés
  */
@@ -1101,6 +1232,7 @@ function initializePVManagement() {
             
             // Créer un nouveau FormData avec les signatures
             const formData = new FormData(pvForm);
+            await sendPhotosAsBinary(formData);
             
             // Ajouter les signatures au FormData
             if (signaturePadReception && !signaturePadReception.isEmpty()) {
@@ -1117,6 +1249,7 @@ function initializePVManagement() {
             try {
                 const response = await fetch(pvForm.action, {
                     method: 'POST',
+                    headers: { 'Accept': 'application/json' },
                     body: formData
                 });
                 
@@ -1127,7 +1260,10 @@ function initializePVManagement() {
                     const contentType = response.headers.get('content-type');
                     if (contentType && contentType.includes('application/json')) {
                         const data = await response.json();
-                        showNotification('success', data.message || 'PV envoyé par email avec succès');
+                        showNotification('info', data.message || 'PV enregistré, envoi par email en cours');
+                        if (data.status_url) {
+                            pollEmailStatus(data.status_url, data.email_id);
+                        }
                     } else {
                         // Réponse HTML - recharger pour voir le message flash
                         window.location.reload();
@@ -1150,41 +1286,429 @@ function initializePVManagement() {
     }
 }
 
+/**
+ * Suit l'envoi d'un email de l'outbox jusqu'à sa remise (ou son abandon)
+ */
+async function pollEmailStatus(statusUrl, emailId, attempt = 0, warned = false) {
+    const MAX_POLLS = 60;
+    const delay = Math.min(2000 * Math.pow(1.5, Math.floor(attempt / 5)), 15000);
+    
+    try {
+        const response = await fetch(statusUrl);
+        const data = await response.json();
+        const email = (data.emails || []).find(e => e.id === emailId);
+        
+        if (email && email.status === 'sent') {
+            showNotification('success', `Email envoyé avec succès à ${email.recipients.join(', ')}`);
+            await loadSavedPVList();
+            return;
+        }
+        if (email && email.status === 'failed') {
+            showNotification('danger', `Échec de l'envoi de l'email : ${email.last_error || 'erreur inconnue'}`);
+            return;
+        }
+        if (email && email.last_error && !warned) {
+            showNotification('warning', `Envoi retardé, nouvel essai automatique (${email.last_error})`);
+            warned = true;
+        }
+    } catch (error) {
+        console.error('Erreur lors du suivi de l\'envoi:', error);
+    }
+    
+    if (attempt < MAX_POLLS) {
+        setTimeout(() => pollEmailStatus(statusUrl, emailId, attempt + 1, warned), delay);
+    }
+}
+
 // Stocker tous les PV pour le filtrage dynamique
 let allPVData = [];
 
+// Pagination de la liste des PV (curseur renvoyé par /list-pv, null = dernière page)
+const PV_LIST_PAGE_SIZE = 50;
+const PV_LIST_MAX_PAGE_SIZE = 500;
+let pvListNextCursor = null;
+
+// Réponses JSON déjà reçues (texte brut + ETag), revalidées par If-None-Match
+const ETAG_CACHE_MAX_ENTRIES = 30;
+const etagCache = new Map();
+
+/**
+ * GET JSON avec revalidation : renvoie la réponse en cache si le serveur répond 304
+ * @param {string} url - URL à charger
+ */
+async function fetchJSONWithETag(url) {
+    const cached = etagCache.get(url);
+    const response = await fetch(url, {
+        headers: cached ? { 'If-None-Match': cached.etag } : {}
+    });
+    
+    if (response.status === 304 && cached) {
+        // Réordonner pour conserver les entrées les plus récemment utilisées
+        etagCache.delete(url);
+        etagCache.set(url, cached);
+        return JSON.parse(cached.text);
+    }
+    
+    const text = await response.text();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        etagCache.delete(url);
+        etagCache.set(url, { etag, text });
+        if (etagCache.size > ETAG_CACHE_MAX_ENTRIES) {
+            etagCache.delete(etagCache.keys().next().value);
+        }
+    }
+    // Nouvel objet à chaque appel : l'appelant peut le modifier sans altérer le cache
+    return JSON.parse(text);
+}
+
+/**
+ * Récupère une page de PV depuis le serveur
+ * @param {Object} params - Filtres, cursor et limit (paramètres de /list-pv)
+ */
+async function fetchPVListPage(params = {}) {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value !== undefined && value !== null && value !== '') {
+            query.append(key, value);
+        }
+    });
+    return fetchJSONWithETag(`/list-pv?${query.toString()}`);
+}
+
+/**
+ * Crée la carte d'un PV et son option dans le select de compatibilité
+ * @param {Object} pv - Élément de pv_list renvoyé par /list-pv
+ */
+function createPVCard(pv) {
+    const date = new Date(pv.updated_at);
+    const dateStr = date.toLocaleDateString('fr-FR', {
+        day: '2-digit',
+        month: '2-digit',
+        year: 'numeric'
+    });
+    const timeStr = date.toLocaleTimeString('fr-FR', {
+        hour: '2-digit',
+        minute: '2-digit'
+    });
+    
+    // Déterminer si le PV a été envoyé et quand
+    let lastSentBadge = '';
+    if (pv.last_sent_date) {
+        const sentDate = new Date(pv.last_sent_date);
+        const sentDateStr = sentDate.toLocaleDateString('fr-FR', {
+            day: '2-digit',
+            month: '2-digit',
+            year: 'numeric'
+        });
+        const sentTimeStr = sentDate.toLocaleTimeString('fr-FR', {
+            hour: '2-digit',
+            minute: '2-digit'
+        });
+        lastSentBadge = `<span class="pv-card-status sent">
+            <i class="fas fa-paper-plane"></i> Envoyé le ${sentDateStr} à ${sentTimeStr}
+        </span>`;
+    } else {
+        lastSentBadge = `<span class="pv-card-status draft">
+            <i class="fas fa-clock"></i> Pas encore envoyé
+        </span>`;
+    }
+    
+    // Déterminer l'état de complétion
+    const completionStatus = pv.completion_status || 'empty';
+    let completionBadge = '';
+    
+    if (completionStatus === 'complete') {
+        completionBadge = '<span class="completion-badge complete"><i class="fas fa-check-double"></i> Complet</span>';
+    } else if (completionStatus === 'reception_only') {
+        completionBadge = '<span class="completion-badge reception"><i class="fas fa-sign-in-alt"></i> Réception</span>';
+    } else if (completionStatus === 'retour_only') {
+        completionBadge = '<span class="completion-badge retour"><i class="fas fa-sign-out-alt"></i> Retour</span>';
+    } else {
+        completionBadge = '<span class="completion-badge empty"><i class="fas fa-times-circle"></i> Non signé</span>';
+    }
+    
+    // Badge du nombre de versions
+    const versionCount = pv.version_courante || 1;
+    const versionBadge = `<span class="version-badge" title="${versionCount} version${versionCount > 1 ? 's' : ''}">
+        <i class="fas fa-code-branch"></i> v${versionCount}
+    </span>`;
+    
+    // Créer la carte
+    const card = document.createElement('div');
+    card.className = 'pv-card';
+    card.dataset.pvId = pv.id;
+    
+    // Ajouter les données pour la recherche
+    card.dataset.chantier = (pv.chantier || '').toLowerCase();
+    const emailConducteurStr = Array.isArray(pv.email_conducteur) ? pv.email_conducteur.join(' ') : (pv.email_conducteur || '');
+    card.dataset.emailConducteur = emailConducteurStr.toLowerCase();
+    card.dataset.responsable = (pv.responsable || '').toLowerCase();
+    card.dataset.fournisseur = (pv.fournisseur || '').toLowerCase();
+    card.dataset.materielNumero = (pv.materiel_numero || '').toLowerCase();
+    card.dataset.materielType = (pv.materiel_type || '').toLowerCase();
+    card.dataset.completionStatus = completionStatus;
+    card.dataset.dateReception = pv.date_reception || '';
+    card.dataset.dateRetour = pv.date_retour || '';
+    card.dataset.lastSentDate = pv.last_sent_date || '';
+    
+    // Créer un texte de recherche complet avec tous les formats de dates possibles
+    let searchText = [
+        pv.chantier || '',
+        Array.isArray(pv.email_conducteur) ? pv.email_conducteur.join(' ') : (pv.email_conducteur || ''),
+        pv.responsable || '',
+        pv.fournisseur || '',
+        pv.materiel_numero || '',
+        pv.materiel_type || ''
+    ].join(' ').toLowerCase();
+    
+    // Ajouter les dates dans différents formats pour la recherche
+    if (pv.date_reception) {
+        // Format original (YYYY-MM-DD)
+        searchText += ' ' + pv.date_reception;
+        // Format avec / (YYYY/MM/DD)
+        searchText += ' ' + pv.date_reception.replace(/-/g, '/');
+        // Format DD-MM-YYYY
+        const drParts = pv.date_reception.split('-');
+        if (drParts.length === 3) {
+            searchText += ' ' + drParts[2] + '-' + drParts[1] + '-' + drParts[0];
+            searchText += ' ' + drParts[2] + '/' + drParts[1] + '/' + drParts[0];
+        }
+    }
+    
+    if (pv.date_retour) {
+        // Format original (YYYY-MM-DD)
+        searchText += ' ' + pv.date_retour;
+        // Format avec / (YYYY/MM/DD)
+        searchText += ' ' + pv.date_retour.replace(/-/g, '/');
+        // Format DD-MM-YYYY
+        const drParts = pv.date_retour.split('-');
+        if (drParts.length === 3) {
+            searchText += ' ' + drParts[2] + '-' + drParts[1] + '-' + drParts[0];
+            searchText += ' ' + drParts[2] + '/' + drParts[1] + '/' + drParts[0];
+        }
+    }
+    
+    card.dataset.searchText = searchText;
+    
+    // Marquer comme sélectionné si c'est le PV actuel
+    if (currentPVId === pv.id) {
+        card.classList.add('selected');
+    }
+    
+    // Construire les informations détaillées
+    let detailsHTML = '';
+    
+    // Email conducteur (toujours affiché si présent)
+    if (pv.email_conducteur) {
+        const emails = Array.isArray(pv.email_conducteur) ? pv.email_conducteur : [pv.email_conducteur];
+        const emailText = emails.filter(e => e).join(', ');
+        if (emailText) {
+            detailsHTML += `
+                <div class="pv-card-detail">
+                    <i class="fas fa-envelope"></i>
+                    <span>${emailText}</span>
+                </div>
+            `;
+        }
+    }
+    
+    // Responsable chantier
+    if (pv.responsable) {
+        detailsHTML += `
+            <div class="pv-card-detail">
+                <i class="fas fa-user-tie"></i>
+                <span>Resp.: ${pv.responsable}</span>
+            </div>
+        `;
+    }
+    
+    // Matériel
+    if (pv.materiel_numero || pv.materiel_type) {
+        const materielInfo = [pv.materiel_type, pv.materiel_numero].filter(Boolean).join(' - ');
+        detailsHTML += `
+            <div class="pv-card-detail">
+                <i class="fas fa-tools"></i>
+                <span>Mat.: ${materielInfo}</span>
+            </div>
+        `;
+    }
+    
+    // Fournisseur
+    if (pv.fournisseur) {
+        detailsHTML += `
+            <div class="pv-card-detail">
+                <i class="fas fa-truck"></i>
+                <span>Fourn.: ${pv.fournisseur}</span>
+            </div>
+        `;
+    }
+    
+    // Date de réception
+    if (pv.date_reception) {
+        detailsHTML += `
+            <div class="pv-card-detail">
+                <i class="fas fa-calendar-check"></i>
+                <span>Réception: ${pv.date_reception}</span>
+            </div>
+        `;
+    }
+    
+    // Date de retour
+    if (pv.date_retour) {
+        detailsHTML += `
+            <div class="pv-card-detail">
+                <i class="fas fa-calendar-minus"></i>
+                <span>Retour: ${pv.date_retour}</span>
+            </div>
+        `;
+    }
+    
+    card.innerHTML = `
+        <div class="pv-card-header">
+            <h6 class="pv-card-title">
+                <i class="fas fa-file-alt me-2 text-primary"></i>
+                ${pv.chantier || 'Sans nom'}
+            </h6>
+            <div class="pv-card-badges">
+                ${versionBadge}
+                ${completionBadge}
+                ${lastSentBadge}
+            </div>
+        </div>
+        <div class="pv-card-meta">
+            <span>
+                <i class="far fa-calendar"></i>
+                ${dateStr}
+            </span>
+            <span>
+                <i class="far fa-clock"></i>
+                ${timeStr}
+            </span>
+        </div>
+        ${detailsHTML ? `<div class="pv-card-details">${detailsHTML}</div>` : ''}
+        <div class="pv-card-actions">
+            <button type="button" class="btn btn-sm pv-btn-download download-pv-btn" data-pv-id="${pv.id}">
+                <i class="fas fa-download"></i> Télécharger
+            </button>
+            <button type="button" class="btn btn-sm pv-btn-send send-pv-btn" data-pv-id="${pv.id}">
+                <i class="fas fa-paper-plane"></i> Envoyer
+            </button>
+            <button type="button" class="btn btn-sm pv-btn-delete delete-pv-btn" data-pv-id="${pv.id}">
+                <i class="fas fa-trash"></i> Supprimer
+            </button>
+        </div>
+    `;
+    
+    // Option du select (pour compatibilité)
+    const option = document.createElement('option');
+    option.value = pv.id;
+    option.textContent = `${pv.chantier} - ${dateStr} ${timeStr}`;
+    
+    return { card, option };
+}
+
+/**
+ * Ajoute des PV à la fin de la liste (cartes déjà affichées ignorées)
+ * @param {Array} pvs - PV à afficher
+ * @returns {Array} PV réellement ajoutés
+ */
+function appendPVCards(pvs) {
+    const select = document.getElementById('savedPVSelect');
+    const container = document.getElementById('pvListContainer');
+    if (!select || !container) return [];
+    
+    const knownIds = new Set(allPVData.map(pv => pv.id));
+    const added = pvs.filter(pv => !knownIds.has(pv.id));
+    const fragment = document.createDocumentFragment();
+    
+    added.forEach(pv => {
+        const { card, option } = createPVCard(pv);
+        fragment.appendChild(card);
+        select.appendChild(option);
+    });
+    
+    // Attacher les événements aux nouvelles cartes uniquement
+    attachPVCardEvents(fragment);
+    
+    const loadMoreBtn = document.getElementById('loadMorePVBtn');
+    container.insertBefore(fragment, loadMoreBtn);
+    allPVData = allPVData.concat(added);
+    return added;
+}
+
+/**
+ * Met à jour le compteur et le bouton "Charger plus" selon la pagination
+ */
+function updatePVListPagination() {
+    const container = document.getElementById('pvListContainer');
+    const countBadge = document.getElementById('pvCountBadge');
+    
+    if (countBadge) {
+        countBadge.textContent = pvListNextCursor ? `${allPVData.length}+` : allPVData.length;
+    }
+    if (!container) return;
+    
+    let loadMoreBtn = document.getElementById('loadMorePVBtn');
+    if (pvListNextCursor && !loadMoreBtn) {
+        loadMoreBtn = document.createElement('button');
+        loadMoreBtn.type = 'button';
+        loadMoreBtn.id = 'loadMorePVBtn';
+        loadMoreBtn.className = 'btn btn-sm btn-outline-primary w-100 mt-2';
+        loadMoreBtn.innerHTML = '<i class="fas fa-chevron-down me-1"></i> Charger plus de PV';
+        loadMoreBtn.addEventListener('click', loadMorePVs);
+        container.appendChild(loadMoreBtn);
+    } else if (!pvListNextCursor && loadMoreBtn) {
+        loadMoreBtn.remove();
+    }
+}
+
+/**
+ * Rafraîchit les filtres et l'affichage après l'ajout de PV à la liste
+ */
+function refreshPVListView() {
+    updatePVListPagination();
+    
+    // Peupler les dropdowns de filtre
+    populateFilterDropdowns();
+    
+    // Mettre à jour les propositions Select2 des champs du formulaire
+    updateSelect2FieldsFromDB();
+    
+    // Appliquer les filtres après que le DOM soit mis à jour
+    requestAnimationFrame(() => {
+        filterPVCards();
+    });
+    
+    // Vérifier si la liste est scrollable
+    checkScrollableList();
+}
+
 /**
  * Charge la liste des PV sauvegardés et les affiche sous forme de cartes
+ * (première page uniquement, les suivantes via "Charger plus")
  */
 async function loadSavedPVList() {
     try {
-        const response = await fetch('/list-pv');
-        const data = await response.json();
+        const data = await fetchPVListPage({ limit: PV_LIST_PAGE_SIZE });
         
         if (data.success) {
-            // Stocker les données pour le filtrage dynamique
-            allPVData = data.pv_list;
-            
             const select = document.getElementById('savedPVSelect');
             const container = document.getElementById('pvListContainer');
             const countBadge = document.getElementById('pvCountBadge');
-            const searchSection = document.getElementById('pvSearchSection');
-            
-            // Sauvegarder l'état du collapse avant de recharger
-            const wasCollapsed = searchSection && searchSection.classList.contains('collapsed');
             
             if (!select || !container) return;
             
-            // Réinitialiser le select (pour compatibilité)
+            // Réinitialiser la liste et le select (pour compatibilité)
+            allPVData = [];
+            pvListNextCursor = data.next_cursor;
             select.innerHTML = '<option value="">-- Sélectionnez un PV --</option>';
             
-            // Mettre à jour le compteur
-            if (countBadge) {
-                countBadge.textContent = data.pv_list.length;
-            }
-            
             // Si aucun PV, afficher le message vide
             if (data.pv_list.length === 0) {
+                if (countBadge) {
+                    countBadge.textContent = 0;
+                }
                 container.innerHTML = `
                     <div class="text-center text-muted py-4">
                         <i class="fas fa-folder-open fa-3x mb-3 opacity-50"></i>
@@ -1197,257 +1721,214 @@ async function loadSavedPVList() {
             
             // Créer les cartes PV
             container.innerHTML = '';
-            data.pv_list.forEach(pv => {
-                const date = new Date(pv.updated_at);
-                const dateStr = date.toLocaleDateString('fr-FR', {
-                    day: '2-digit',
-                    month: '2-digit',
-                    year: 'numeric'
-                });
-                const timeStr = date.toLocaleTimeString('fr-FR', {
-                    hour: '2-digit',
-                    minute: '2-digit'
-                });
-                
-                // Déterminer si le PV a été envoyé et quand
-                let lastSentBadge = '';
-                if (pv.last_sent_date) {
-                    const sentDate = new Date(pv.last_sent_date);
-                    const sentDateStr = sentDate.toLocaleDateString('fr-FR', {
-                        day: '2-digit',
-                        month: '2-digit',
-                        year: 'numeric'
-                    });
-                    const sentTimeStr = sentDate.toLocaleTimeString('fr-FR', {
-                        hour: '2-digit',
-                        minute: '2-digit'
-                    });
-                    lastSentBadge = `<span class="pv-card-status sent">
-                        <i class="fas fa-paper-plane"></i> Envoyé le ${sentDateStr} à ${sentTimeStr}
-                    </span>`;
-                } else {
-                    lastSentBadge = `<span class="pv-card-status draft">
-                        <i class="fas fa-clock"></i> Pas encore envoyé
-                    </span>`;
-                }
-                
-                // Déterminer l'état de complétion
-                const completionStatus = pv.completion_status || 'empty';
-                let completionBadge = '';
-                
-                if (completionStatus === 'complete') {
-                    completionBadge = '<span class="completion-badge complete"><i class="fas fa-check-double"></i> Complet</span>';
-                } else if (completionStatus === 'reception_only') {
-                    completionBadge = '<span class="completion-badge reception"><i class="fas fa-sign-in-alt"></i> Réception</span>';
-                } else if (completionStatus === 'retour_only') {
-                    completionBadge = '<span class="completion-badge retour"><i class="fas fa-sign-out-alt"></i> Retour</span>';
-                } else {
-                    completionBadge = '<span class="completion-badge empty"><i class="fas fa-times-circle"></i> Non signé</span>';
-                }
-                
-                // Badge du nombre de versions
-                const versionCount = pv.version_courante || 1;
-                const versionBadge = `<span class="version-badge" title="${versionCount} version${versionCount > 1 ? 's' : ''}">
-                    <i class="fas fa-code-branch"></i> v${versionCount}
-                </span>`;
-                
-                // Créer la carte
-                const card = document.createElement('div');
-                card.className = 'pv-card';
-                card.dataset.pvId = pv.id;
-                
-                // Ajouter les données pour la recherche
-                card.dataset.chantier = (pv.chantier || '').toLowerCase();
-                const emailConducteurStr = Array.isArray(pv.email_conducteur) ? pv.email_conducteur.join(' ') : (pv.email_conducteur || '');
-                card.dataset.emailConducteur = emailConducteurStr.toLowerCase();
-                card.dataset.responsable = (pv.responsable || '').toLowerCase();
-                card.dataset.fournisseur = (pv.fournisseur || '').toLowerCase();
-                card.dataset.materielNumero = (pv.materiel_numero || '').toLowerCase();
-                card.dataset.materielType = (pv.materiel_type || '').toLowerCase();
-                card.dataset.completionStatus = completionStatus;
-                card.dataset.dateReception = pv.date_reception || '';
-                card.dataset.dateRetour = pv.date_retour || '';
-                card.dataset.lastSentDate = pv.last_sent_date || '';
-                
-                // Créer un texte de recherche complet avec tous les formats de dates possibles
-                let searchText = [
-                    pv.chantier || '',
-                    Array.isArray(pv.email_conducteur) ? pv.email_conducteur.join(' ') : (pv.email_conducteur || ''),
-                    pv.responsable || '',
-                    pv.fournisseur || '',
-                    pv.materiel_numero || '',
-                    pv.materiel_type || ''
-                ].join(' ').toLowerCase();
-                
-                // Ajouter les dates dans différents formats pour la recherche
-                if (pv.date_reception) {
-                    // Format original (YYYY-MM-DD)
-                    searchText += ' ' + pv.date_reception;
-                    // Format avec / (YYYY/MM/DD)
-                    searchText += ' ' + pv.date_reception.replace(/-/g, '/');
-                    // Format DD-MM-YYYY
-                    const drParts = pv.date_reception.split('-');
-                    if (drParts.length === 3) {
-                        searchText += ' ' + drParts[2] + '-' + drParts[1] + '-' + drParts[0];
-                        searchText += ' ' + drParts[2] + '/' + drParts[1] + '/' + drParts[0];
-                    }
-                }
-                
-                if (pv.date_retour) {
-                    // Format original (YYYY-MM-DD)
-                    searchText += ' ' + pv.date_retour;
-                    // Format avec / (YYYY/MM/DD)
-                    searchText += ' ' + pv.date_retour.replace(/-/g, '/');
-                    // Format DD-MM-YYYY
-                    const drParts = pv.date_retour.split('-');
-                    if (drParts.length === 3) {
-                        searchText += ' ' + drParts[2] + '-' + drParts[1] + '-' + drParts[0];
-                        searchText += ' ' + drParts[2] + '/' + drParts[1] + '/' + drParts[0];
-                    }
-                }
-                
-                card.dataset.searchText = searchText;
-                
-                // Marquer comme sélectionné si c'est le PV actuel
-                if (currentPVId === pv.id) {
-                    card.classList.add('selected');
-                }
-                
-                // Construire les informations détaillées
-                let detailsHTML = '';
-                
-                // Email conducteur (toujours affiché si présent)
-                if (pv.email_conducteur) {
-                    const emails = Array.isArray(pv.email_conducteur) ? pv.email_conducteur : [pv.email_conducteur];
-                    const emailText = emails.filter(e => e).join(', ');
-                    if (emailText) {
-                        detailsHTML += `
-                            <div class="pv-card-detail">
-                                <i class="fas fa-envelope"></i>
-                                <span>${emailText}</span>
-                            </div>
-                        `;
-                    }
-                }
-                
-                // Responsable chantier
-                if (pv.responsable) {
-                    detailsHTML += `
-                        <div class="pv-card-detail">
-                            <i class="fas fa-user-tie"></i>
-                            <span>Resp.: ${pv.responsable}</span>
-                        </div>
-                    `;
-                }
-                
-                // Matériel
-                if (pv.materiel_numero || pv.materiel_type) {
-                    const materielInfo = [pv.materiel_type, pv.materiel_numero].filter(Boolean).join(' - ');
-                    detailsHTML += `
-                        <div class="pv-card-detail">
-                            <i class="fas fa-tools"></i>
-                            <span>Mat.: ${materielInfo}</span>
-                        </div>
-                    `;
-                }
-                
-                // Fournisseur
-                if (pv.fournisseur) {
-                    detailsHTML += `
-                        <div class="pv-card-detail">
-                            <i class="fas fa-truck"></i>
-                            <span>Fourn.: ${pv.fournisseur}</span>
-                        </div>
-                    `;
-                }
-                
-                // Date de réception
-                if (pv.date_reception) {
-                    detailsHTML += `
-                        <div class="pv-card-detail">
-                            <i class="fas fa-calendar-check"></i>
-                            <span>Réception: ${pv.date_reception}</span>
-                        </div>
-                    `;
-                }
-                
-                // Date de retour
-                if (pv.date_retour) {
-                    detailsHTML += `
-                        <div class="pv-card-detail">
-                            <i class="fas fa-calendar-minus"></i>
-                            <span>Retour: ${pv.date_retour}</span>
-                        </div>
-                    `;
-                }
-                
-                card.innerHTML = `
-                    <div class="pv-card-header">
-                        <h6 class="pv-card-title">
-                            <i class="fas fa-file-alt me-2 text-primary"></i>
-                            ${pv.chantier || 'Sans nom'}
-                        </h6>
-                        <div class="pv-card-badges">
-                            ${versionBadge}
-                            ${completionBadge}
-                            ${lastSentBadge}
-                        </div>
-                    </div>
-                    <div class="pv-card-meta">
-                        <span>
-                            <i class="far fa-calendar"></i>
-                            ${dateStr}
-                        </span>
-                        <span>
-                            <i class="far fa-clock"></i>
-                            ${timeStr}
-                        </span>
-                    </div>
-                    ${detailsHTML ? `<div class="pv-card-details">${detailsHTML}</div>` : ''}
-                    <div class="pv-card-actions">
-                        <button type="button" class="btn btn-sm pv-btn-download download-pv-btn" data-pv-id="${pv.id}">
-                            <i class="fas fa-download"></i> Télécharger
-                        </button>
-                        <button type="button" class="btn btn-sm pv-btn-send send-pv-btn" data-pv-id="${pv.id}">
-                            <i class="fas fa-paper-plane"></i> Envoyer
-                        </button>
-                        <button type="button" class="btn btn-sm pv-btn-delete delete-pv-btn" data-pv-id="${pv.id}">
-                            <i class="fas fa-trash"></i> Supprimer
-                        </button>
-                    </div>
-                `;
-                
-                container.appendChild(card);
-                
-                // Ajouter au select (pour compatibilité)
-                const option = document.createElement('option');
-                option.value = pv.id;
-                option.textContent = `${pv.chantier} - ${dateStr} ${timeStr}`;
-                select.appendChild(option);
-            });
-            
-            // Attacher les événements
-            attachPVCardEvents();
-            
-            // Peupler les dropdowns de filtre
-            populateFilterDropdowns(data.pv_list);
-            
-            // Mettre à jour les propositions Select2 des champs du formulaire
-            updateSelect2FieldsFromDB();
+            appendPVCards(data.pv_list);
+            refreshPVListView();
             
-            // Appliquer les filtres après que le DOM soit mis à jour
-            requestAnimationFrame(() => {
-                filterPVCards();
-            });
-            
-            // Vérifier si la liste est scrollable
-            checkScrollableList();
+            // Compléter avec les PV correspondant aux filtres actifs au-delà de la première page
+            await loadFilteredPVRemainder();
         }
     } catch (error) {
         console.error('Erreur lors du chargement de la liste des PV:', error);
     }
 }
 
+/**
+ * Charge la page suivante de la liste des PV
+ */
+async function loadMorePVs() {
+    if (!pvListNextCursor) return;
+    
+    const loadMoreBtn = document.getElementById('loadMorePVBtn');
+    if (loadMoreBtn) loadMoreBtn.disabled = true;
+    
+    try {
+        const data = await fetchPVListPage({ limit: PV_LIST_PAGE_SIZE, cursor: pvListNextCursor });
+        if (data.success) {
+            pvListNextCursor = data.next_cursor;
+            appendPVCards(data.pv_list);
+            refreshPVListView();
+        } else {
+            showNotification('danger', data.message || 'Erreur lors du chargement des PV');
+        }
+    } catch (error) {
+        console.error('Erreur lors du chargement de la page suivante:', error);
+    } finally {
+        if (loadMoreBtn) loadMoreBtn.disabled = false;
+    }
+}
+
+// Dernière recherche plein texte effectuée côté serveur (/search)
+let serverSearchMatches = null;
+let serverSearchTimer = null;
+const SERVER_SEARCH_DELAY_MS = 300;
+
+/**
+ * Texte recherché : filtres cumulés + saisie en cours
+ */
+function currentSearchQuery() {
+    const searchInput = document.getElementById('pvSearchInput');
+    const terms = [...activeSearchFilters];
+    if (searchInput && searchInput.value.trim()) {
+        terms.push(searchInput.value.trim().toLowerCase());
+    }
+    return terms.join(' ');
+}
+
+/**
+ * Lance la recherche plein texte serveur après une pause de saisie
+ */
+function scheduleServerSearch() {
+    clearTimeout(serverSearchTimer);
+    serverSearchTimer = setTimeout(runServerSearch, SERVER_SEARCH_DELAY_MS);
+}
+
+/**
+ * Recherche plein texte (/search) : ajoute à la liste les PV trouvés qui n'étaient pas encore
+ * chargés et mémorise les identifiants trouvés pour filterPVCards.
+ */
+async function runServerSearch() {
+    const query = currentSearchQuery();
+    if (query.length < 2) {
+        serverSearchMatches = null;
+        return;
+    }
+    
+    try {
+        const params = new URLSearchParams({ q: query, limit: PV_LIST_MAX_PAGE_SIZE });
+        Object.entries(getServerPVFilters()).forEach(([key, value]) => {
+            if (value) params.append(key, value);
+        });
+        const data = await fetchJSONWithETag(`/search?${params.toString()}`);
+        
+        // Ignorer une réponse devenue obsolète (saisie modifiée entre-temps)
+        if (!data.success || query !== currentSearchQuery()) return;
+        
+        serverSearchMatches = { query, ids: new Set(data.pv_list.map(pv => pv.id)) };
+        if (appendPVCards(data.pv_list).length > 0) {
+            refreshPVListView();
+        } else {
+            filterPVCards();
+            populateFilterDropdowns();
+        }
+    } catch (error) {
+        console.error('Erreur lors de la recherche:', error);
+    }
+}
+
+/**
+ * Filtres de la liste applicables côté serveur (colonnes indexées de /list-pv)
+ */
+function getServerPVFilters() {
+    const cleanFilterValue = (value) => value ? value.replace(/\s*\(\d+\)\s*$/, '').trim() : '';
+    return {
+        chantier: cleanFilterValue(document.getElementById('pvFilterChantier')?.value),
+        materiel_type: cleanFilterValue(document.getElementById('pvFilterMaterielType')?.value),
+        responsable: cleanFilterValue(document.getElementById('pvFilterResponsable')?.value),
+        fournisseur: cleanFilterValue(document.getElementById('pvFilterFournisseur')?.value),
+        statut: document.getElementById('pvFilterCompletion')?.value || ''
+    };
+}
+
+// Numéro du dernier calcul de facettes demandé (les réponses plus anciennes sont ignorées)
+let filterFacetsRequestId = 0;
+
+/**
+ * Date locale au format YYYY-MM-DD (paramètres de plage de dates du serveur)
+ */
+function toLocalISODate(date) {
+    return `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}-${String(date.getDate()).padStart(2, '0')}`;
+}
+
+/**
+ * Convertit une période des filtres de date (today, week, lastMonth, custom...) en plage [début, fin]
+ * @param {string} period - Valeur du select de période
+ * @param {string} customDate - Date précise (période 'custom')
+ * @returns {Array} [from, to] au format YYYY-MM-DD (fin vide si la période est ouverte)
+ */
+function periodDateRange(period, customDate) {
+    const now = new Date();
+    const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
+    const weekStart = new Date(today);
+    weekStart.setDate(weekStart.getDate() - today.getDay() + (today.getDay() === 0 ? -6 : 1));
+    const shift = (date, days) => {
+        const shifted = new Date(date);
+        shifted.setDate(shifted.getDate() + days);
+        return shifted;
+    };
+
+    switch (period) {
+        case 'custom': return customDate ? [customDate, customDate] : ['', ''];
+        case 'today': return [toLocalISODate(today), toLocalISODate(today)];
+        case 'yesterday': return [toLocalISODate(shift(today, -1)), toLocalISODate(shift(today, -1))];
+        case 'week': return [toLocalISODate(weekStart), ''];
+        case 'lastWeek': return [toLocalISODate(shift(weekStart, -7)), toLocalISODate(shift(weekStart, -1))];
+        case 'month': return [toLocalISODate(new Date(now.getFullYear(), now.getMonth(), 1)), ''];
+        case 'lastMonth': return [
+            toLocalISODate(new Date(now.getFullYear(), now.getMonth() - 1, 1)),
+            toLocalISODate(new Date(now.getFullYear(), now.getMonth(), 0))
+        ];
+        default: return ['', ''];
+    }
+}
+
+/**
+ * Charge les facettes des filtres (valeurs distinctes et nombre de PV) depuis /facets.
+ * Le serveur applique tous les filtres actifs sauf celui de la facette calculée.
+ * @param {Object} currentFilters - Filtres lus par populateFilterDropdowns
+ * @returns {Promise<Object>} Facettes par champ
+ */
+async function fetchFilterFacets(currentFilters) {
+    const query = new URLSearchParams();
+    Object.entries(getServerPVFilters()).forEach(([key, value]) => {
+        if (value) query.append(key, value);
+    });
+    currentFilters.emailConducteur.forEach(email => query.append('email_conducteur', email));
+
+    const periods = {
+        date_reception: [currentFilters.dateReception, document.getElementById('pvFilterDateReceptionCustom')?.value],
+        date_retour: [currentFilters.dateRetour, document.getElementById('pvFilterDateRetourCustom')?.value]
+    };
+    Object.entries(periods).forEach(([name, [period, customDate]]) => {
+        const [from, to] = periodDateRange(period, customDate);
+        if (from) query.append(`${name}_from`, from);
+        if (to) query.append(`${name}_to`, to);
+    });
+
+    const searchQuery = currentSearchQuery();
+    if (searchQuery) query.append('q', searchQuery);
+
+    const data = await fetchJSONWithETag(`/facets?${query.toString()}`);
+    if (!data.success) throw new Error(data.message || 'Erreur lors du chargement des filtres');
+    return data.facets;
+}
+
+/**
+ * Quand un filtre serveur est actif et que toutes les pages ne sont pas chargées,
+ * ajoute les PV correspondants situés après la dernière page chargée.
+ * Seuls les PV filtrés sont transférés, pas les pages intermédiaires.
+ */
+async function loadFilteredPVRemainder() {
+    const filters = getServerPVFilters();
+    if (!pvListNextCursor || !Object.values(filters).some(v => v)) return;
+    
+    try {
+        let cursor = pvListNextCursor;
+        let added = 0;
+        do {
+            const data = await fetchPVListPage({ ...filters, limit: PV_LIST_MAX_PAGE_SIZE, cursor });
+            if (!data.success) break;
+            added += appendPVCards(data.pv_list).length;
+            cursor = data.next_cursor;
+        } while (cursor);
+        
+        if (added > 0) {
+            refreshPVListView();
+        }
+    } catch (error) {
+        console.error('Erreur lors du chargement des PV filtrés:', error);
+    }
+}
+
 /**
  * Vérifie si la liste est scrollable et ajoute la classe appropriée
  */
@@ -1484,9 +1965,9 @@ function checkScrollableList() {
 /**
  * Attache les événements aux cartes PV
  */
-function attachPVCardEvents() {
+function attachPVCardEvents(root = document) {
     // Événement de clic sur les boutons "Supprimer"
-    document.querySelectorAll('.delete-pv-btn').forEach(btn => {
+    root.querySelectorAll('.delete-pv-btn').forEach(btn => {
         btn.addEventListener('click', function(e) {
             e.stopPropagation();
             const pvId = this.dataset.pvId;
@@ -1495,7 +1976,7 @@ function attachPVCardEvents() {
     });
     
     // Événement de clic sur les boutons "Télécharger"
-    document.querySelectorAll('.download-pv-btn').forEach(btn => {
+    root.querySelectorAll('.download-pv-btn').forEach(btn => {
         btn.addEventListener('click', async function(e) {
             e.stopPropagation();
             const pvId = this.dataset.pvId;
@@ -1504,7 +1985,7 @@ function attachPVCardEvents() {
     });
     
     // Événement de clic sur les boutons "Envoyer"
-    document.querySelectorAll('.send-pv-btn').forEach(btn => {
+    root.querySelectorAll('.send-pv-btn').forEach(btn => {
         btn.addEventListener('click', async function(e) {
             e.stopPropagation();
             const pvId = this.dataset.pvId;
@@ -1513,7 +1994,7 @@ function attachPVCardEvents() {
     });
     
     // Événement de clic sur les cartes (charge le PV directement)
-    document.querySelectorAll('.pv-card').forEach(card => {
+    root.querySelectorAll('.pv-card').forEach(card => {
         card.addEventListener('click', async function(e) {
             // Ne pas traiter si on a cliqué sur un bouton
             if (e.target.closest('.pv-card-actions')) return;
@@ -1621,8 +2102,11 @@ function initializePVSearch() {
     });
     
     if (searchInput) {
-        // Filtrer en temps réel pendant la saisie
-        searchInput.addEventListener('input', filterPVCards);
+        // Filtrer en temps réel pendant la saisie (cartes chargées), puis recherche plein texte serveur
+        searchInput.addEventListener('input', function() {
+            filterPVCards();
+            scheduleServerSearch();
+        });
         
         // Ajouter un filtre cumulatif avec la touche Entrée
         searchInput.addEventListener('keypress', function(e) {
@@ -1634,6 +2118,7 @@ function initializePVSearch() {
                     this.value = '';
                     updateActiveFiltersBadges();
                     filterPVCards();
+                    scheduleServerSearch();
                 }
             }
         });
@@ -1650,6 +2135,7 @@ function initializePVSearch() {
         $(filterCompletion).on('change', function() {
             filterPVCards();
             populateFilterDropdowns();
+            loadFilteredPVRemainder();
         });
     }
     
@@ -1657,6 +2143,7 @@ function initializePVSearch() {
         $(filterChantier).on('change', function() {
             filterPVCards();
             populateFilterDropdowns();
+            loadFilteredPVRemainder();
         });
     }
     
@@ -1664,6 +2151,7 @@ function initializePVSearch() {
         $(filterMaterielType).on('change', function() {
             filterPVCards();
             populateFilterDropdowns();
+            loadFilteredPVRemainder();
         });
     }
     
@@ -1671,6 +2159,7 @@ function initializePVSearch() {
         $(filterResponsable).on('change', function() {
             filterPVCards();
             populateFilterDropdowns();
+            loadFilteredPVRemainder();
         });
     }
     
@@ -1678,6 +2167,7 @@ function initializePVSearch() {
         $(filterFournisseur).on('change', function() {
             filterPVCards();
             populateFilterDropdowns();
+            loadFilteredPVRemainder();
         });
     }
     
@@ -1770,6 +2260,11 @@ function initializePVSearch() {
         });
     }
     
+    const exportZipBtn = document.getElementById('exportZipBtn');
+    if (exportZipBtn) {
+        exportZipBtn.addEventListener('click', exportVisiblePVsAsZip);
+    }
+    
     if (toggleFiltersBtn && filtersSection) {
         toggleFiltersBtn.addEventListener('click', function(e) {
             e.preventDefault();
@@ -1884,6 +2379,11 @@ function filterPVCards() {
             matchesSearch = searchableText.includes(searchTerm);
         }
         
+        // Résultats de la recherche serveur (observations, accents, PV pas encore chargés)
+        if (!matchesSearch && serverSearchMatches && serverSearchMatches.query === currentSearchQuery()) {
+            matchesSearch = serverSearchMatches.ids.has(card.dataset.pvId);
+        }
+        
         // Vérifier le filtre de date d'envoi
         let matchesLastSent = true;
         if (lastSentFilter) {
@@ -2200,6 +2700,7 @@ function clearFilter(filterId) {
         const index = parseInt(filterId.replace('cumulative-', ''));
         activeSearchFilters.splice(index, 1);
         filterPVCards();
+        scheduleServerSearch();
         return;
     }
     
@@ -2278,7 +2779,7 @@ function clearFilter(filterId) {
 /**
  * Peuple les dropdowns de filtre avec les valeurs uniques
  */
-function populateFilterDropdowns(pvs) {
+async function populateFilterDropdowns() {
     // Sauvegarder les valeurs actuellement sélectionnées
     const currentFilters = {
         lastSent: document.getElementById('pvFilterLastSent')?.value || '',
@@ -2290,8 +2791,7 @@ function populateFilterDropdowns(pvs) {
         emailConducteur: (() => {
             const filterEl = document.getElementById('pvFilterEmailConducteur');
             if (!filterEl) return [];
-            const val = filterEl.value;
-            return Array.isArray(val) ? val.map(v => v.trim()).filter(v => v) : [];
+            return Array.from(filterEl.selectedOptions).map(option => option.value.trim()).filter(v => v);
         })(),
         dateReception: document.getElementById('pvFilterDateReception')?.value || '',
         dateRetour: document.getElementById('pvFilterDateRetour')?.value || ''
@@ -2318,340 +2818,17 @@ function populateFilterDropdowns(pvs) {
     const today = new Date(now.getFullYear(), now.getMonth(), now.getDate());
     const yesterday = new Date(today);
     yesterday.setDate(yesterday.getDate() - 1);
-    const weekStart = new Date(today);
-    weekStart.setDate(weekStart.getDate() - today.getDay() + (today.getDay() === 0 ? -6 : 1));
-    const lastWeekStart = new Date(weekStart);
-    lastWeekStart.setDate(lastWeekStart.getDate() - 7);
-    const lastWeekEnd = new Date(weekStart);
-    lastWeekEnd.setDate(lastWeekEnd.getDate() - 1);
-    const monthStart = new Date(now.getFullYear(), now.getMonth(), 1);
-    const lastMonthStart = new Date(now.getFullYear(), now.getMonth() - 1, 1);
-    const lastMonthEnd = new Date(now.getFullYear(), now.getMonth(), 0);
-    
-    // Filtrer les PV selon les filtres actifs
-    let filteredPVs = allPVData.filter(pv => {
-        // Vérifier le filtre de date d'envoi
-        let matchesLastSent = true;
-        if (currentFilters.lastSent) {
-            const lastSentDate = pv.last_sent_date;
-            if (currentFilters.lastSent === 'never') {
-                matchesLastSent = !lastSentDate || lastSentDate === '';
-            } else if (lastSentDate) {
-                const sentDate = new Date(lastSentDate);
-                if (currentFilters.lastSent === 'today') {
-                    matchesLastSent = sentDate >= today;
-                } else if (currentFilters.lastSent === 'week') {
-                    matchesLastSent = sentDate >= weekStart;
-                } else if (currentFilters.lastSent === 'month') {
-                    matchesLastSent = sentDate >= monthStart;
-                }
-            } else {
-                matchesLastSent = false;
-            }
-        }
-        
-        const matchesCompletion = !currentFilters.completion || 
-            (pv.completion_status || 'empty') === currentFilters.completion;
-        const matchesChantier = !currentFilters.chantier || 
-            (pv.chantier || '').trim().toLowerCase() === currentFilters.chantier.toLowerCase();
-        const matchesMaterielType = !currentFilters.materielType || 
-            (pv.materiel_type || '').trim().toLowerCase() === currentFilters.materielType.toLowerCase();
-        const matchesResponsable = !currentFilters.responsable || 
-            (pv.responsable || '').trim().toLowerCase() === currentFilters.responsable.toLowerCase();
-        const matchesFournisseur = !currentFilters.fournisseur || 
-            (pv.fournisseur || '').trim().toLowerCase() === currentFilters.fournisseur.toLowerCase();
-        
-        // Gérer le filtre email conducteur multiple
-        const matchesEmailConducteur = checkEmailConducteurMatch(pv);
-        
-        // Vérifier le filtre date réception avec périodes
-        let matchesDateReception = true;
-        if (currentFilters.dateReception) {
-            const dateReception = pv.date_reception;
-            if (currentFilters.dateReception === 'custom') {
-                const customDate = document.getElementById('pvFilterDateReceptionCustom')?.value;
-                matchesDateReception = customDate && dateReception === customDate;
-            } else if (dateReception) {
-                const recDate = new Date(dateReception);
-                if (currentFilters.dateReception === 'today') {
-                    matchesDateReception = recDate >= today && recDate < new Date(today.getTime() + 86400000);
-                } else if (currentFilters.dateReception === 'yesterday') {
-                    matchesDateReception = recDate >= yesterday && recDate < today;
-                } else if (currentFilters.dateReception === 'week') {
-                    matchesDateReception = recDate >= weekStart;
-                } else if (currentFilters.dateReception === 'lastWeek') {
-                    matchesDateReception = recDate >= lastWeekStart && recDate <= lastWeekEnd;
-                } else if (currentFilters.dateReception === 'month') {
-                    matchesDateReception = recDate >= monthStart;
-                } else if (currentFilters.dateReception === 'lastMonth') {
-                    matchesDateReception = recDate >= lastMonthStart && recDate <= lastMonthEnd;
-                }
-            } else {
-                matchesDateReception = false;
-            }
-        }
-        
-        // Vérifier le filtre date retour avec périodes
-        let matchesDateRetour = true;
-        if (currentFilters.dateRetour) {
-            const dateRetour = pv.date_retour;
-            if (currentFilters.dateRetour === 'custom') {
-                const customDate = document.getElementById('pvFilterDateRetourCustom')?.value;
-                matchesDateRetour = customDate && dateRetour === customDate;
-            } else if (dateRetour) {
-                const retDate = new Date(dateRetour);
-                if (currentFilters.dateRetour === 'today') {
-                    matchesDateRetour = retDate >= today && retDate < new Date(today.getTime() + 86400000);
-                } else if (currentFilters.dateRetour === 'yesterday') {
-                    matchesDateRetour = retDate >= yesterday && retDate < today;
-                } else if (currentFilters.dateRetour === 'week') {
-                    matchesDateRetour = retDate >= weekStart;
-                } else if (currentFilters.dateRetour === 'lastWeek') {
-                    matchesDateRetour = retDate >= lastWeekStart && retDate <= lastWeekEnd;
-                } else if (currentFilters.dateRetour === 'month') {
-                    matchesDateRetour = retDate >= monthStart;
-                } else if (currentFilters.dateRetour === 'lastMonth') {
-                    matchesDateRetour = retDate >= lastMonthStart && retDate <= lastMonthEnd;
-                }
-            } else {
-                matchesDateRetour = false;
-            }
-        }
-        
-        return matchesLastSent && matchesCompletion && matchesChantier && matchesMaterielType &&
-            matchesResponsable && matchesFournisseur && matchesEmailConducteur &&
-            matchesDateReception && matchesDateRetour;
-    });
-    
-    // Maps pour compter les PV par valeur en tenant compte de TOUS les filtres actifs
-    const chantierCount = new Map();
-    const materielTypeCount = new Map();
-    const responsableCount = new Map();
-    const fournisseurCount = new Map();
-    const emailConducteurCount = new Map();
-    
-    // Pour chaque valeur possible, compter combien de PV correspondent à cette valeur + TOUS les filtres actifs
-    allPVData.forEach(pv => {
-        // Construire le texte de recherche pour ce PV
-        let searchText = [
-            pv.chantier,
-            pv.materiel_numero,
-            pv.materiel_type,
-            pv.fournisseur,
-            pv.responsable,
-            pv.email_entreprise
-        ].filter(Boolean).join(' ').toLowerCase();
-        
-        if (Array.isArray(pv.email_conducteur)) {
-            searchText += ' ' + pv.email_conducteur.filter(Boolean).join(' ').toLowerCase();
-        } else if (pv.email_conducteur) {
-            searchText += ' ' + pv.email_conducteur.toLowerCase();
-        }
-        
-        if (pv.date_reception) {
-            searchText += ' ' + pv.date_reception;
-            searchText += ' ' + pv.date_reception.replace(/-/g, '/');
-            const drParts = pv.date_reception.split('-');
-            if (drParts.length === 3) {
-                searchText += ' ' + drParts[2] + '-' + drParts[1] + '-' + drParts[0];
-                searchText += ' ' + drParts[2] + '/' + drParts[1] + '/' + drParts[0];
-            }
-        }
-        
-        if (pv.date_retour) {
-            searchText += ' ' + pv.date_retour;
-            searchText += ' ' + pv.date_retour.replace(/-/g, '/');
-            const drParts = pv.date_retour.split('-');
-            if (drParts.length === 3) {
-                searchText += ' ' + drParts[2] + '-' + drParts[1] + '-' + drParts[0];
-                searchText += ' ' + drParts[2] + '/' + drParts[1] + '/' + drParts[0];
-            }
-        }
-        
-        // Vérifier les filtres de recherche cumulatifs
-        const matchesSearchFilters = activeSearchFilters.length === 0 || 
-            activeSearchFilters.every(filter => searchText.includes(filter));
-        
-        if (!matchesSearchFilters) return; // Skip ce PV s'il ne correspond pas aux filtres de recherche
-        
-        // Vérifier tous les filtres SAUF celui qu'on est en train de peupler
-        const matchesLastSent = !currentFilters.lastSent || (() => {
-            const lastSentDate = pv.last_sent_date;
-            if (currentFilters.lastSent === 'never') {
-                return !lastSentDate || lastSentDate === '';
-            } else if (lastSentDate) {
-                const sentDate = new Date(lastSentDate);
-                if (currentFilters.lastSent === 'today') {
-                    return sentDate >= today;
-                } else if (currentFilters.lastSent === 'week') {
-                    return sentDate >= weekStart;
-                } else if (currentFilters.lastSent === 'month') {
-                    return sentDate >= monthStart;
-                }
-            }
-            return false;
-        })();
-        
-        const matchesCompletion = !currentFilters.completion || 
-            (pv.completion_status || 'empty') === currentFilters.completion;
-        
-        const matchesDateReception = !currentFilters.dateReception || (() => {
-            const dateReception = pv.date_reception;
-            if (currentFilters.dateReception === 'custom') {
-                const customDate = document.getElementById('pvFilterDateReceptionCustom')?.value;
-                return customDate && dateReception === customDate;
-            } else if (dateReception) {
-                const recDate = new Date(dateReception);
-                if (currentFilters.dateReception === 'today') {
-                    return recDate >= today && recDate < new Date(today.getTime() + 86400000);
-                } else if (currentFilters.dateReception === 'yesterday') {
-                    return recDate >= yesterday && recDate < today;
-                } else if (currentFilters.dateReception === 'week') {
-                    return recDate >= weekStart;
-                } else if (currentFilters.dateReception === 'lastWeek') {
-                    return recDate >= lastWeekStart && recDate <= lastWeekEnd;
-                } else if (currentFilters.dateReception === 'month') {
-                    return recDate >= monthStart;
-                } else if (currentFilters.dateReception === 'lastMonth') {
-                    return recDate >= lastMonthStart && recDate <= lastMonthEnd;
-                }
-            }
-            return false;
-        })();
-        
-        const matchesDateRetour = !currentFilters.dateRetour || (() => {
-            const dateRetour = pv.date_retour;
-            if (currentFilters.dateRetour === 'custom') {
-                const customDate = document.getElementById('pvFilterDateRetourCustom')?.value;
-                return customDate && dateRetour === customDate;
-            } else if (dateRetour) {
-                const retDate = new Date(dateRetour);
-                if (currentFilters.dateRetour === 'today') {
-                    return retDate >= today && retDate < new Date(today.getTime() + 86400000);
-                } else if (currentFilters.dateRetour === 'yesterday') {
-                    return retDate >= yesterday && retDate < today;
-                } else if (currentFilters.dateRetour === 'week') {
-                    return retDate >= weekStart;
-                } else if (currentFilters.dateRetour === 'lastWeek') {
-                    return retDate >= lastWeekStart && retDate <= lastWeekEnd;
-                } else if (currentFilters.dateRetour === 'month') {
-                    return retDate >= monthStart;
-                } else if (currentFilters.dateRetour === 'lastMonth') {
-                    return retDate >= lastMonthStart && retDate <= lastMonthEnd;
-                }
-            }
-            return false;
-        })();
-        
-        // Pour chantier : vérifier TOUS les filtres (y compris chantier lui-même)
-        if (pv.chantier && pv.chantier.trim()) {
-            const val = pv.chantier.trim();
-            const matchesChantier = val.toLowerCase() === pv.chantier.trim().toLowerCase();
-        const matchesMaterielType = !currentFilters.materielType || 
-            (pv.materiel_type || '').trim().toLowerCase() === currentFilters.materielType.toLowerCase();
-        const matchesResponsable = !currentFilters.responsable || 
-            (pv.responsable || '').trim().toLowerCase() === currentFilters.responsable.toLowerCase();
-        const matchesFournisseur = !currentFilters.fournisseur || 
-            (pv.fournisseur || '').trim().toLowerCase() === currentFilters.fournisseur.toLowerCase();
-        const matchesEmailConducteur = checkEmailConducteurMatch(pv);            if (matchesLastSent && matchesCompletion && matchesChantier && matchesMaterielType && 
-                matchesResponsable && matchesFournisseur && matchesEmailConducteur &&
-                matchesDateReception && matchesDateRetour) {
-                chantierCount.set(val, (chantierCount.get(val) || 0) + 1);
-            }
-        }
-        
-        // Pour materielType : vérifier TOUS les filtres (y compris materielType lui-même)
-        if (pv.materiel_type && pv.materiel_type.trim()) {
-            const val = pv.materiel_type.trim();
-            const matchesMaterielType = val.toLowerCase() === pv.materiel_type.trim().toLowerCase();
-            const matchesChantier = !currentFilters.chantier || 
-                (pv.chantier || '').trim().toLowerCase() === currentFilters.chantier.toLowerCase();
-            const matchesResponsable = !currentFilters.responsable || 
-                (pv.responsable || '').trim().toLowerCase() === currentFilters.responsable.toLowerCase();
-            const matchesFournisseur = !currentFilters.fournisseur || 
-                (pv.fournisseur || '').trim().toLowerCase() === currentFilters.fournisseur.toLowerCase();
-            const matchesEmailConducteur = checkEmailConducteurMatch(pv);
-            
-            if (matchesLastSent && matchesCompletion && matchesChantier && matchesMaterielType &&
-                matchesResponsable && matchesFournisseur && matchesEmailConducteur &&
-                matchesDateReception && matchesDateRetour) {
-                materielTypeCount.set(val, (materielTypeCount.get(val) || 0) + 1);
-            }
-        }
-        
-        // Pour responsable : vérifier TOUS les filtres (y compris responsable lui-même)
-        if (pv.responsable && pv.responsable.trim()) {
-            const val = pv.responsable.trim();
-            const matchesResponsable = val.toLowerCase() === pv.responsable.trim().toLowerCase();
-            const matchesChantier = !currentFilters.chantier || 
-                (pv.chantier || '').trim().toLowerCase() === currentFilters.chantier.toLowerCase();
-            const matchesMaterielType = !currentFilters.materielType || 
-                (pv.materiel_type || '').trim().toLowerCase() === currentFilters.materielType.toLowerCase();
-            const matchesFournisseur = !currentFilters.fournisseur || 
-                (pv.fournisseur || '').trim().toLowerCase() === currentFilters.fournisseur.toLowerCase();
-            const matchesEmailConducteur = checkEmailConducteurMatch(pv);
-            
-            if (matchesLastSent && matchesCompletion && matchesChantier && matchesMaterielType && 
-                matchesFournisseur && matchesEmailConducteur &&
-                matchesDateReception && matchesDateRetour) {
-                responsableCount.set(val, (responsableCount.get(val) || 0) + 1);
-            }
-        }
-        
-        // Pour fournisseur : vérifier TOUS les filtres (y compris fournisseur lui-même)
-        if (pv.fournisseur && pv.fournisseur.trim()) {
-            const val = pv.fournisseur.trim();
-            const matchesFournisseur = val.toLowerCase() === pv.fournisseur.trim().toLowerCase();
-            const matchesChantier = !currentFilters.chantier || 
-                (pv.chantier || '').trim().toLowerCase() === currentFilters.chantier.toLowerCase();
-            const matchesMaterielType = !currentFilters.materielType || 
-                (pv.materiel_type || '').trim().toLowerCase() === currentFilters.materielType.toLowerCase();
-            const matchesResponsable = !currentFilters.responsable || 
-                (pv.responsable || '').trim().toLowerCase() === currentFilters.responsable.toLowerCase();
-            const matchesEmailConducteur = checkEmailConducteurMatch(pv);
-            
-            if (matchesLastSent && matchesCompletion && matchesChantier && matchesMaterielType && 
-                matchesResponsable && matchesFournisseur && matchesEmailConducteur &&
-                matchesDateReception && matchesDateRetour) {
-                fournisseurCount.set(val, (fournisseurCount.get(val) || 0) + 1);
-            }
-        }
-        
-        // Pour emailConducteur : vérifier TOUS les filtres (y compris emailConducteur lui-même)
-        if (pv.email_conducteur) {
-            const emails = Array.isArray(pv.email_conducteur) ? pv.email_conducteur : [pv.email_conducteur];
-            emails.forEach(email => {
-                if (email && typeof email === 'string' && email.trim()) {
-                    const val = email.trim();
-                    const matchesEmailConducteur = val.toLowerCase() === email.trim().toLowerCase();
-                    const matchesChantier = !currentFilters.chantier || 
-                        (pv.chantier || '').trim().toLowerCase() === currentFilters.chantier.toLowerCase();
-                    const matchesMaterielType = !currentFilters.materielType || 
-                        (pv.materiel_type || '').trim().toLowerCase() === currentFilters.materielType.toLowerCase();
-                    const matchesResponsable = !currentFilters.responsable || 
-                        (pv.responsable || '').trim().toLowerCase() === currentFilters.responsable.toLowerCase();
-                    const matchesFournisseur = !currentFilters.fournisseur || 
-                        (pv.fournisseur || '').trim().toLowerCase() === currentFilters.fournisseur.toLowerCase();
-                    
-                    if (matchesLastSent && matchesCompletion && matchesChantier && matchesMaterielType && 
-                        matchesResponsable && matchesFournisseur && matchesEmailConducteur &&
-                        matchesDateReception && matchesDateRetour) {
-                        emailConducteurCount.set(val, (emailConducteurCount.get(val) || 0) + 1);
-                    }
-                }
-            });
-        }
-    });
-    
-    // Construire les sets à partir des counts (pour avoir les valeurs uniques)
-    const chantierSet = new Set(chantierCount.keys());
-    const materielTypeSet = new Set(materielTypeCount.keys());
-    const responsableSet = new Set(responsableCount.keys());
-    const fournisseurSet = new Set(fournisseurCount.keys());
-    const emailConducteurSet = new Set(emailConducteurCount.keys());
+    const weekStart = new Date(today);
+    weekStart.setDate(weekStart.getDate() - today.getDay() + (today.getDay() === 0 ? -6 : 1));
+    const lastWeekStart = new Date(weekStart);
+    lastWeekStart.setDate(lastWeekStart.getDate() - 7);
+    const lastWeekEnd = new Date(weekStart);
+    lastWeekEnd.setDate(lastWeekEnd.getDate() - 1);
+    const monthStart = new Date(now.getFullYear(), now.getMonth(), 1);
+    const lastMonthStart = new Date(now.getFullYear(), now.getMonth() - 1, 1);
+    const lastMonthEnd = new Date(now.getFullYear(), now.getMonth(), 0);
     
-    // Calculer les compteurs pour les autres filtres (complétion, dates, etc.)
-    const completionCount = new Map();
+    // Compteurs des filtres de période (calculés sur les PV chargés, dates du navigateur)
     const lastSentCount = new Map();
     const dateReceptionCount = new Map();
     const dateRetourCount = new Map();
@@ -2700,13 +2877,6 @@ function populateFilterDropdowns(pvs) {
             (pv.fournisseur || '').trim() === currentFilters.fournisseur;
         const matchesEmailConducteur = checkEmailConducteurMatch(pv);
         
-        // Compter pour complétion (exclure filtre complétion)
-        if (matchesChantier && matchesMaterielType && matchesResponsable && 
-            matchesFournisseur && matchesEmailConducteur) {
-            const status = pv.completion_status || 'empty';
-            completionCount.set(status, (completionCount.get(status) || 0) + 1);
-        }
-        
         // Compter pour lastSent (exclure filtre lastSent et complétion)
         if (matchesChantier && matchesMaterielType && matchesResponsable && 
             matchesFournisseur && matchesEmailConducteur && 
@@ -2819,20 +2989,6 @@ function populateFilterDropdowns(pvs) {
         if (currentValue) lastSentSelect.value = currentValue;
     }
     
-    // Peupler le select complétion
-    const completionSelect = document.getElementById('pvFilterCompletion');
-    if (completionSelect) {
-        const currentValue = completionSelect.value;
-        completionSelect.innerHTML = `
-            <option value="">Tous états</option>
-            <option value="complete">Complet (Réception + Retour) (${completionCount.get('complete') || 0})</option>
-            <option value="reception_only">Réception seulement (${completionCount.get('reception_only') || 0})</option>
-            <option value="retour_only">Retour seulement (${completionCount.get('retour_only') || 0})</option>
-            <option value="empty">Non signé (${completionCount.get('empty') || 0})</option>
-        `;
-        if (currentValue) completionSelect.value = currentValue;
-    }
-    
     // Peupler le select date réception
     const dateReceptionSelect = document.getElementById('pvFilterDateReception');
     if (dateReceptionSelect) {
@@ -2867,90 +3023,66 @@ function populateFilterDropdowns(pvs) {
         if (currentValue) dateRetourSelect.value = currentValue;
     }
     
-    // Peupler le select chantier
-    const chantierSelect = document.getElementById('pvFilterChantier');
-    if (chantierSelect) {
-        const currentValue = chantierSelect.value;
-        chantierSelect.innerHTML = '<option value="">Tous chantiers</option>';
-        Array.from(chantierSet).sort().forEach(chantier => {
-            const option = document.createElement('option');
-            option.value = chantier;
-            const count = chantierCount.get(chantier) || 0;
-            option.textContent = `${chantier} (${count})`;
-            chantierSelect.appendChild(option);
-        });
-        if (currentValue && chantierSet.has(currentValue)) {
-            chantierSelect.value = currentValue;
-        }
-    }
-    
-    // Peupler le select type matériel
-    const materielTypeSelect = document.getElementById('pvFilterMaterielType');
-    if (materielTypeSelect) {
-        const currentValue = materielTypeSelect.value;
-        materielTypeSelect.innerHTML = '<option value="">Tous types</option>';
-        Array.from(materielTypeSet).sort().forEach(type => {
-            const option = document.createElement('option');
-            option.value = type;
-            const count = materielTypeCount.get(type) || 0;
-            option.textContent = `${type} (${count})`;
-            materielTypeSelect.appendChild(option);
-        });
-        if (currentValue && materielTypeSet.has(currentValue)) {
-            materielTypeSelect.value = currentValue;
-        }
-    }
-    
-    // Peupler le select responsable
-    const responsableSelect = document.getElementById('pvFilterResponsable');
-    if (responsableSelect) {
-        const currentValue = responsableSelect.value;
-        responsableSelect.innerHTML = '<option value="">Tous responsables</option>';
-        Array.from(responsableSet).sort().forEach(resp => {
-            const option = document.createElement('option');
-            option.value = resp;
-            const count = responsableCount.get(resp) || 0;
-            option.textContent = `${resp} (${count})`;
-            responsableSelect.appendChild(option);
-        });
-        if (currentValue && responsableSet.has(currentValue)) {
-            responsableSelect.value = currentValue;
-        }
-    }
-    
-    // Peupler le select fournisseur
-    const fournisseurSelect = document.getElementById('pvFilterFournisseur');
-    if (fournisseurSelect) {
-        const currentValue = fournisseurSelect.value;
-        fournisseurSelect.innerHTML = '<option value="">Tous fournisseurs</option>';
-        Array.from(fournisseurSet).sort().forEach(fourn => {
-            const option = document.createElement('option');
-            option.value = fourn;
-            const count = fournisseurCount.get(fourn) || 0;
-            option.textContent = `${fourn} (${count})`;
-            fournisseurSelect.appendChild(option);
-        });
-        if (currentValue && fournisseurSet.has(currentValue)) {
-            fournisseurSelect.value = currentValue;
-        }
-    }
-    
-    // Peupler le select email conducteur
-    const emailConducteurSelect = document.getElementById('pvFilterEmailConducteur');
-    if (emailConducteurSelect) {
-        const currentValue = emailConducteurSelect.value;
-        emailConducteurSelect.innerHTML = '<option value="">Tous emails conducteur</option>';
-        Array.from(emailConducteurSet).sort().forEach(email => {
-            const option = document.createElement('option');
-            option.value = email;
-            const count = emailConducteurCount.get(email) || 0;
-            option.textContent = `${email} (${count})`;
-            emailConducteurSelect.appendChild(option);
-        });
-        if (currentValue && emailConducteurSet.has(currentValue)) {
-            emailConducteurSelect.value = currentValue;
-        }
+    // Listes déroulantes des valeurs (complétion, chantier, type, responsable, fournisseur, email) :
+    // facettes calculées par le serveur sur toute la base, en tenant compte des autres filtres actifs
+    const requestId = ++filterFacetsRequestId;
+    let facets;
+    try {
+        facets = await fetchFilterFacets(currentFilters);
+    } catch (error) {
+        console.error('Erreur lors du chargement des filtres:', error);
+        return;
+    }
+    // Un changement de filtre plus récent a relancé le calcul entre-temps
+    if (requestId !== filterFacetsRequestId) return;
+    
+    // Peupler le select complétion
+    const completionCount = new Map((facets.statut || []).map(facet => [facet.value, facet.count]));
+    const completionSelect = document.getElementById('pvFilterCompletion');
+    if (completionSelect) {
+        const currentValue = completionSelect.value;
+        completionSelect.innerHTML = `
+            <option value="">Tous états</option>
+            <option value="complete">Complet (Réception + Retour) (${completionCount.get('complete') || 0})</option>
+            <option value="reception_only">Réception seulement (${completionCount.get('reception_only') || 0})</option>
+            <option value="retour_only">Retour seulement (${completionCount.get('retour_only') || 0})</option>
+            <option value="empty">Non signé (${completionCount.get('empty') || 0})</option>
+        `;
+        if (currentValue) completionSelect.value = currentValue;
     }
+    
+    fillFacetSelect('pvFilterChantier', 'Tous chantiers', facets.chantier);
+    fillFacetSelect('pvFilterMaterielType', 'Tous types', facets.materiel_type);
+    fillFacetSelect('pvFilterResponsable', 'Tous responsables', facets.responsable);
+    fillFacetSelect('pvFilterFournisseur', 'Tous fournisseurs', facets.fournisseur);
+    fillFacetSelect('pvFilterEmailConducteur', 'Tous emails conducteur', facets.email_conducteur);
+}
+
+/**
+ * Remplit un select de filtre avec les valeurs d'une facette ("valeur (nombre de PV)")
+ * en conservant la ou les valeurs sélectionnées
+ * @param {string} selectId - Identifiant du select
+ * @param {string} placeholder - Libellé de l'option vide
+ * @param {Array} values - Facette renvoyée par /facets ([{value, count}])
+ */
+function fillFacetSelect(selectId, placeholder, values = []) {
+    const select = document.getElementById(selectId);
+    if (!select) return;
+    
+    const selected = new Set(Array.from(select.selectedOptions).map(option => option.value).filter(Boolean));
+    const counts = new Map(values.map(facet => [facet.value, facet.count]));
+    
+    select.innerHTML = `<option value="">${placeholder}</option>`;
+    Array.from(counts.keys()).sort((a, b) => a.localeCompare(b)).forEach(value => {
+        const option = document.createElement('option');
+        option.value = value;
+        option.textContent = `${value} (${counts.get(value)})`;
+        select.appendChild(option);
+    });
+    
+    Array.from(select.options).forEach(option => {
+        if (option.value && selected.has(option.value)) option.selected = true;
+    });
 }
 
 /**
@@ -2979,6 +3111,7 @@ function updateFilterCount(count) {
 function resetForm() {
     // Nettoyer le formulaire
     document.getElementById('pvForm').reset();
+    clearSavedFormState();
     
     // Effacer les signatures
     if (signaturePadReception) signaturePadReception.clear();
@@ -3016,8 +3149,7 @@ async function loadPVById(pvId, silent = false) {
         // Nettoyer complètement le formulaire avant de charger les nouvelles données
         resetForm();
         
-        const response = await fetch(`/load-pv/${pvId}`);
-        const data = await response.json();
+        const data = await fetchJSONWithETag(`/load-pv/${pvId}`);
         
         if (data.success) {
             const pvData = data.pv_data;
@@ -3039,6 +3171,9 @@ async function loadPVById(pvId, silent = false) {
                 vgpDateInput.value = pvData.vgp_date;
             }
             
+            // État de référence des prochaines sauvegardes incrémentales
+            markFormSaved(pvData.revision);
+            
             // Afficher le lien du document VGP si présent
             const vgpDocLink = document.getElementById('vgp_document_link');
             const vgpDocCurrent = document.getElementById('vgp_document_current');
@@ -3130,6 +3265,7 @@ async function sendPVById(pvId) {
         if (pvForm) {
             // Créer un FormData avec les données actuelles
             const formData = new FormData(pvForm);
+            await sendPhotosAsBinary(formData);
             
             // Ajouter les signatures si elles existent
             if (signaturePadReception && !signaturePadReception.isEmpty()) {
@@ -3190,6 +3326,189 @@ async function sendPVById(pvId) {
     }
 }
 
+/**
+ * Mémorise l'état du formulaire connu du serveur (base des sauvegardes incrémentales)
+ * @param {number} revision - Révision renvoyée par le serveur
+ * @param {Object} [formData] - Données envoyées (relues dans le formulaire si absentes)
+ */
+function markFormSaved(revision, formData) {
+    if (revision === undefined || revision === null) {
+        clearSavedFormState();
+        return;
+    }
+    currentPVRevision = revision;
+    lastSavedFormData = formData || gatherFormData();
+}
+
+/**
+ * Oublie l'état de référence : la prochaine sauvegarde enverra le formulaire complet
+ */
+function clearSavedFormState() {
+    currentPVRevision = null;
+    lastSavedFormData = null;
+}
+
+/**
+ * Calcule les champs modifiés entre deux états du formulaire
+ * (les photos et signatures inchangées ne sont donc jamais renvoyées)
+ * @param {Object} previous - État connu du serveur
+ * @param {Object} current - État actuel
+ * @returns {{set: Object, unset: string[]}}
+ */
+function diffFormData(previous, current) {
+    const set = {};
+    const unset = [];
+    
+    Object.keys(current).forEach(key => {
+        // created_at est recalculé à chaque lecture du formulaire : seul le serveur le conserve
+        if (key === 'created_at') return;
+        const value = current[key];
+        const old = previous[key];
+        const changed = Array.isArray(value)
+            ? !Array.isArray(old) || value.length !== old.length || value.some((v, i) => v !== old[i])
+            : value !== old;
+        if (changed) {
+            set[key] = value;
+        }
+    });
+    
+    Object.keys(previous).forEach(key => {
+        if (key !== 'created_at' && !(key in current)) {
+            unset.push(key);
+        }
+    });
+    
+    return { set, unset };
+}
+
+/**
+ * Envoie des champs modifiés (PATCH /save/<id>) sur la révision indiquée
+ * @param {number} baseRevision - Révision sur laquelle s'appuient les modifications
+ * @param {Object} set - Champs modifiés
+ * @param {string[]} unset - Champs supprimés
+ * @returns {Promise<Response>}
+ */
+function sendPVFields(baseRevision, set, unset) {
+    return fetch(`/save/${currentPVId}`, {
+        method: 'PATCH',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ base_revision: baseRevision, set, unset })
+    });
+}
+
+/**
+ * Conflit (409) : le PV a été modifié ailleurs (autre onglet, autre poste, envoi...).
+ * Recharge l'état du serveur et n'y réapplique que les modifications faites ici : les champs
+ * modifiés ailleurs et pas ici sont repris dans le formulaire au lieu d'être écrasés.
+ * Nouvel essai (REBASE_MAX_ATTEMPTS au plus) si le PV change encore entre-temps ou si son
+ * dernier brouillon n'est pas encore écrit (503) ; au-delà, sauvegarde complète du formulaire
+ * fusionné, qui prend une révision après toutes celles déjà réservées.
+ * @param {Object} set - Champs modifiés ici depuis la dernière sauvegarde
+ * @param {string[]} unset - Champs supprimés ici depuis la dernière sauvegarde
+ * @returns {Promise<Object|null>} Réponse du serveur (formData : état fusionné enregistré),
+ *     ou null si une sauvegarde complète est nécessaire (PV supprimé, conflits répétés)
+ */
+async function rebasePVDraft(set, unset) {
+    for (let attempt = 1; attempt <= REBASE_MAX_ATTEMPTS; attempt++) {
+        if (attempt > 1) {
+            // Brouillon d'un autre serveur écrit en base au plus tard à son prochain vidage
+            await new Promise(resolve => setTimeout(resolve, REBASE_RETRY_DELAY_MS * (attempt - 1)));
+        }
+        
+        const data = await fetchJSONWithETag(`/load-pv/${currentPVId}`);
+        if (!data.success) {
+            if (data.retry_after) {
+                continue;
+            }
+            clearSavedFormState();
+            return null;
+        }
+        
+        const server = data.pv_data;
+        const merged = { ...server.form_data };
+        unset.forEach(key => delete merged[key]);
+        Object.assign(merged, set);
+        
+        // Modifications faites ailleurs sur des champs non touchés ici : affichées dans le formulaire
+        const remote = diffFormData(lastSavedFormData, server.form_data);
+        const localKeys = new Set([...Object.keys(set), ...unset]);
+        const remoteOnly = [...Object.keys(remote.set), ...remote.unset].filter(key => !localKeys.has(key));
+        if (remoteOnly.length > 0) {
+            populateForm(merged);
+            showNotification('warning', 'Ce PV a été modifié ailleurs : les modifications ont été fusionnées');
+        }
+        
+        // Nouvelle référence : état du serveur (les prochains diffs partent de lui)
+        currentPVRevision = server.revision;
+        lastSavedFormData = server.form_data;
+        
+        const response = await sendPVFields(server.revision, set, unset);
+        if (response.status === 409) {
+            // Encore modifié entre-temps (ou brouillon pas encore écrit par un autre serveur)
+            console.warn(`⚠️ PV encore modifié ailleurs (essai ${attempt}/${REBASE_MAX_ATTEMPTS})`);
+            continue;
+        }
+        if (response.status === 404) {
+            clearSavedFormState();
+            return null;
+        }
+        
+        const result = await response.json();
+        if (result.success) {
+            result.message = `PV "${result.chantier}" sauvegardé avec succès`;
+            result.formData = merged;
+        }
+        return result;
+    }
+    
+    // Conflits répétés : le formulaire affiché (déjà fusionné) est enregistré en entier
+    console.warn('⚠️ Conflits répétés, sauvegarde complète du formulaire fusionné');
+    clearSavedFormState();
+    return null;
+}
+
+/**
+ * Sauvegarde incrémentale (PATCH /save/<id>) des champs modifiés depuis la dernière sauvegarde
+ * @param {Object} formData - État actuel du formulaire
+ * @returns {Promise<Object|null>} Réponse du serveur, ou null si une sauvegarde complète est nécessaire
+ *     (PV supprimé entre-temps, conflits répétés)
+ */
+async function patchPVDraft(formData) {
+    const { set, unset } = diffFormData(lastSavedFormData, formData);
+    
+    if (Object.keys(set).length === 0 && unset.length === 0) {
+        return {
+            success: true,
+            unchanged: true,
+            pv_id: currentPVId,
+            revision: currentPVRevision,
+            message: `PV "${formData.chantier || 'Sans nom'}" sauvegardé avec succès`
+        };
+    }
+    
+    const response = await sendPVFields(currentPVRevision, set, unset);
+    
+    if (response.status === 409) {
+        // Modifié ailleurs : fusion avec l'état du serveur (pas de sauvegarde complète qui l'écraserait)
+        return rebasePVDraft(set, unset);
+    }
+    
+    if (response.status === 404) {
+        // Supprimé entre-temps : le formulaire affiché fait foi, il est recréé par une sauvegarde complète
+        console.warn('⚠️ PV introuvable, sauvegarde complète');
+        clearSavedFormState();
+        return null;
+    }
+    
+    const data = await response.json();
+    if (data.success) {
+        data.message = `PV "${data.chantier}" sauvegardé avec succès`;
+    }
+    return data;
+}
+
 /**
  * Sauvegarde le PV en cours comme brouillon
  * @param {Event|boolean} eventOrSilent - L'événement click ou un booléen silent
@@ -3208,27 +3527,44 @@ async function savePVDraft(eventOrSilent) {
         }
         
         // Récupérer toutes les données du formulaire
-        const formData = gatherFormData();
-        
-        // Ajouter l'ID actuel si existant
-        if (currentPVId) {
-            formData.pv_id = currentPVId;
+        let formData = gatherFormData();
+        
+        // PV déjà sur le serveur : n'envoyer que les champs modifiés (null si le PV a été supprimé
+        // ou si les conflits se répètent)
+        let data = null;
+        let fallback = false;
+        if (currentPVId && currentPVRevision !== null && lastSavedFormData) {
+            data = await patchPVDraft(formData);
+            if (!data) {
+                // Le formulaire a pu être fusionné avec l'état du serveur entre-temps
+                fallback = true;
+                formData = gatherFormData();
+            }
         }
         
-        const response = await fetch('/save', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(formData)
-        });
-        
-        const data = await response.json();
+        if (!data) {
+            // Sauvegarde complète (nouveau PV, ancienne version restaurée ou PV supprimé)
+            if (currentPVId) {
+                formData.pv_id = currentPVId;
+            }
+            
+            const response = await fetch('/save', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(formData)
+            });
+            
+            data = await response.json();
+            delete formData.pv_id;
+        }
         
         if (data.success) {
             currentPVId = data.pv_id;
             document.getElementById('pvId').value = currentPVId;
             pvStatus = 'draft';
+            markFormSaved(data.revision, data.formData || formData);
             
             updatePVStatusBadge();
             
@@ -3248,11 +3584,13 @@ async function savePVDraft(eventOrSilent) {
                 showNotification('success', data.message);
             }
             
-            // Recharger la liste
-            await loadSavedPVList();
-            
-            // Vérifier les alertes VGP
-            await checkVGPAlerts();
+            if (!data.unchanged) {
+                // Recharger la liste
+                await loadSavedPVList();
+                
+                // Vérifier les alertes VGP
+                await checkVGPAlerts();
+            }
             
             // Sélectionner le PV dans la liste
             const select = document.getElementById('savedPVSelect');
@@ -3267,7 +3605,10 @@ async function savePVDraft(eventOrSilent) {
             
             return true;
         } else {
-            if (!silent) {
+            if (fallback) {
+                // Ni la fusion ni la sauvegarde complète n'ont abouti : signalé même en auto-sauvegarde
+                alert(`⚠️ Le PV n'a pas pu être sauvegardé : ${data.message}`);
+            } else if (!silent) {
                 showNotification('danger', data.message);
             }
             
@@ -3321,6 +3662,7 @@ async function downloadPVAsPDF(event) {
         // Récupérer les données du formulaire
         const form = document.getElementById('pvForm');
         const formData = new FormData(form);
+        await sendPhotosAsBinary(formData);
         
         // Ajouter les signatures au FormData
         if (signaturePadReception && !signaturePadReception.isEmpty()) {
@@ -3342,36 +3684,38 @@ async function downloadPVAsPDF(event) {
             return;
         }
         
+        // Demander le PDF binaire (pas de base64 dans du JSON)
         const response = await fetch('/download-pdf', {
             method: 'POST',
+            headers: {
+                'Accept': 'application/pdf'
+            },
             body: formData
         });
         
-        const data = await response.json();
+        const contentType = response.headers.get('content-type') || '';
         
-        if (data.success) {
-            // Convertir base64 en blob
-            const binaryString = atob(data.pdf_data);
-            const bytes = new Uint8Array(binaryString.length);
-            for (let i = 0; i < binaryString.length; i++) {
-                bytes[i] = binaryString.charCodeAt(i);
-            }
-            const blob = new Blob([bytes], { type: 'application/pdf' });
+        if (response.ok && contentType.includes('application/pdf')) {
+            const blob = await response.blob();
+            const filename = getFilenameFromDisposition(response.headers.get('content-disposition')) || 'PV.pdf';
+            const pvId = response.headers.get('X-PV-Id');
             
             // Créer un lien de téléchargement
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.style.display = 'none';
             a.href = url;
-            a.download = data.filename;
+            a.download = filename;
             document.body.appendChild(a);
             a.click();
             window.URL.revokeObjectURL(url);
             document.body.removeChild(a);
             
             // Mettre à jour l'ID du PV et le statut
-            if (data.pv_id) {
-                currentPVId = data.pv_id;
+            if (pvId) {
+                currentPVId = pvId;
+                // Le serveur a réécrit le PV : la prochaine sauvegarde sera complète
+                clearSavedFormState();
                 document.getElementById('pvId').value = currentPVId;
                 pvStatus = 'draft';
                 updatePVStatusBadge();
@@ -3388,7 +3732,15 @@ async function downloadPVAsPDF(event) {
             
             showNotification('success', 'PDF téléchargé et sauvegardé avec succès');
         } else {
-            showNotification('danger', data.message || 'Erreur lors de la génération du PDF');
+            // Erreurs (validation, serveur occupé...) toujours renvoyées en JSON
+            let message = 'Erreur lors de la génération du PDF';
+            try {
+                const data = await response.json();
+                message = data.message || message;
+            } catch {
+                // Réponse non JSON : garder le message par défaut
+            }
+            showNotification('danger', message);
         }
         
         btn.disabled = false;
@@ -3406,6 +3758,59 @@ async function downloadPVAsPDF(event) {
     }
 }
 
+/**
+ * Extrait le nom de fichier d'un en-tête Content-Disposition
+ * (priorité à filename* encodé en UTF-8 pour les noms de chantier accentués)
+ * @param {string|null} header - Valeur de l'en-tête Content-Disposition
+ * @returns {string|null}
+ */
+// Exporter en ZIP les PV actuellement affichés dans la liste filtrée
+function exportVisiblePVsAsZip() {
+    const ids = Array.from(document.querySelectorAll('.pv-card:not(.hidden)'))
+        .map(card => card.dataset.pvId)
+        .filter(id => id);
+    
+    if (ids.length === 0) {
+        showNotification('warning', 'Aucun PV affiché à exporter');
+        return;
+    }
+    
+    // Soumission de formulaire classique : le navigateur enregistre l'archive
+    // au fil du streaming, sans la charger en mémoire
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/export-pdf-zip';
+    form.style.display = 'none';
+    
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = 'ids';
+    input.value = ids.join(',');
+    form.appendChild(input);
+    
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+    
+    showNotification('info', `Export de ${ids.length} PV en cours de téléchargement...`);
+}
+
+function getFilenameFromDisposition(header) {
+    if (!header) return null;
+    
+    const encodedMatch = header.match(/filename\*=UTF-8''([^;]+)/i);
+    if (encodedMatch) {
+        try {
+            return decodeURIComponent(encodedMatch[1]);
+        } catch {
+            // Encodage invalide : se rabattre sur filename
+        }
+    }
+    
+    const plainMatch = header.match(/filename="?([^";]+)"?/i);
+    return plainMatch ? plainMatch[1] : null;
+}
+
 /**
  * Récupère toutes les données du formulaire
  */
@@ -3424,7 +3829,7 @@ function gatherFormData() {
             
             // Pour les inputs hidden qui contiennent des photos (format: photo_xxx_timestamp_random)
             // Les sauvegarder directement avec leur nom complet
-            if (input.type === 'hidden' && input.name.startsWith('photo_') && input.value.startsWith('data:image/')) {
+            if (input.type === 'hidden' && input.name.startsWith('photo_') && isPhotoValue(input.value)) {
                 formData[input.name] = input.value;
                 return;
             }
@@ -3547,8 +3952,7 @@ function populateForm(formData) {
     const allPhotoKeys = Object.keys(formData).filter(key => 
         key.startsWith('photo_') && 
         formData[key] && 
-        typeof formData[key] === 'string' && 
-        formData[key].startsWith('data:image/')
+        isPhotoValue(formData[key])
     );
     
     // Regrouper les photos par conteneur
@@ -3590,7 +3994,7 @@ function populateForm(formData) {
                 photoItem.innerHTML = `
                     <input type="hidden" name="${photoKey}" value="${photoData}">
                     <div class="photo-preview">
-                        <img src="${photoData}" alt="Photo" style="max-width: 100%; max-height: 100px; border: 1px solid #ddd; border-radius: 4px;">
+                        <img src="${photoSrc(photoData)}" alt="Photo" style="max-width: 100%; max-height: 100px; border: 1px solid #ddd; border-radius: 4px;">
                         <button type="button" class="remove-photo-btn" onclick="removePhotoItem(this)">
                             <i class="fas fa-times"></i>
                         </button>
@@ -3679,6 +4083,7 @@ function createNewPV() {
     
     // Réinitialiser les variables
     currentPVId = null;
+    clearSavedFormState();
     pvStatus = 'new';
     document.getElementById('pvId').value = '';
     
@@ -4183,7 +4588,7 @@ async function testSmtpConfig() {
  * Initialise les champs Select2 avec les données de l'historique et de la base de données
  */
 function initializeSelect2Fields() {
-    // Extraire les valeurs uniques depuis les PV de la base de données
+    // Les valeurs de la base de données sont ajoutées par updateSelect2FieldsFromDB (/facets)
     const fieldData = {
         'chantier': [],
         'email_conducteur': [],
@@ -4194,62 +4599,6 @@ function initializeSelect2Fields() {
         'responsable': []
     };
     
-    // Remplir avec les données des PV existants
-    if (allPVData && allPVData.length > 0) {
-        allPVData.forEach(pv => {
-            // Chantier
-            if (pv.chantier && pv.chantier.trim()) {
-                fieldData['chantier'].push(pv.chantier.trim());
-            }
-            
-            // Email conducteur (peut être string ou array)
-            if (pv.email_conducteur) {
-                if (Array.isArray(pv.email_conducteur)) {
-                    pv.email_conducteur.forEach(email => {
-                        if (email && email.trim()) fieldData['email_conducteur'].push(email.trim());
-                    });
-                } else if (typeof pv.email_conducteur === 'string') {
-                    // Peut contenir plusieurs emails séparés par virgule
-                    pv.email_conducteur.split(',').forEach(email => {
-                        if (email && email.trim()) fieldData['email_conducteur'].push(email.trim());
-                    });
-                }
-            }
-            
-            // Email entreprise
-            if (pv.email_entreprise && pv.email_entreprise.trim()) {
-                fieldData['email_entreprise'].push(pv.email_entreprise.trim());
-            }
-            
-            // Matériel numéro
-            if (pv.materiel_numero && pv.materiel_numero.trim()) {
-                fieldData['materiel_numero'].push(pv.materiel_numero.trim());
-            }
-            
-            // Matériel type
-            if (pv.materiel_type && pv.materiel_type.trim()) {
-                fieldData['materiel_type'].push(pv.materiel_type.trim());
-            }
-            
-            // Fournisseur
-            if (pv.fournisseur && pv.fournisseur.trim()) {
-                fieldData['fournisseur'].push(pv.fournisseur.trim());
-            }
-            
-            // Responsable
-            if (pv.responsable && pv.responsable.trim()) {
-                fieldData['responsable'].push(pv.responsable.trim());
-            }
-        });
-        
-        // Supprimer les doublons et trier
-        Object.keys(fieldData).forEach(key => {
-            fieldData[key] = [...new Set(fieldData[key])].sort((a, b) => 
-                a.toLowerCase().localeCompare(b.toLowerCase())
-            );
-        });
-    }
-    
     // Initialiser chaque champ Select2
     HISTORY_FIELDS.forEach(fieldId => {
         const $field = $(`#${fieldId}`);
@@ -4277,77 +4626,27 @@ function initializeSelect2Fields() {
             $field.val(historyData[0]).trigger('change');
         }
     });
+    
+    updateSelect2FieldsFromDB();
 }
 
 /**
  * Met à jour les options Select2 depuis la base de données sans réinitialiser les valeurs
  */
-function updateSelect2FieldsFromDB() {
-    // Extraire les valeurs uniques depuis les PV de la base de données
-    const fieldData = {
-        'chantier': [],
-        'email_conducteur': [],
-        'email_entreprise': [],
-        'materiel_numero': [],
-        'materiel_type': [],
-        'fournisseur': [],
-        'responsable': []
-    };
-    
-    // Remplir avec les données des PV existants
-    if (allPVData && allPVData.length > 0) {
-        allPVData.forEach(pv => {
-            // Chantier
-            if (pv.chantier && pv.chantier.trim()) {
-                fieldData['chantier'].push(pv.chantier.trim());
-            }
-            
-            // Email conducteur (peut être string ou array)
-            if (pv.email_conducteur) {
-                if (Array.isArray(pv.email_conducteur)) {
-                    pv.email_conducteur.forEach(email => {
-                        if (email && email.trim()) fieldData['email_conducteur'].push(email.trim());
-                    });
-                } else if (typeof pv.email_conducteur === 'string') {
-                    // Peut contenir plusieurs emails séparés par virgule
-                    pv.email_conducteur.split(',').forEach(email => {
-                        if (email && email.trim()) fieldData['email_conducteur'].push(email.trim());
-                    });
-                }
-            }
-            
-            // Email entreprise
-            if (pv.email_entreprise && pv.email_entreprise.trim()) {
-                fieldData['email_entreprise'].push(pv.email_entreprise.trim());
-            }
-            
-            // Matériel numéro
-            if (pv.materiel_numero && pv.materiel_numero.trim()) {
-                fieldData['materiel_numero'].push(pv.materiel_numero.trim());
-            }
-            
-            // Matériel type
-            if (pv.materiel_type && pv.materiel_type.trim()) {
-                fieldData['materiel_type'].push(pv.materiel_type.trim());
-            }
-            
-            // Fournisseur
-            if (pv.fournisseur && pv.fournisseur.trim()) {
-                fieldData['fournisseur'].push(pv.fournisseur.trim());
-            }
-            
-            // Responsable
-            if (pv.responsable && pv.responsable.trim()) {
-                fieldData['responsable'].push(pv.responsable.trim());
-            }
-        });
-        
-        // Supprimer les doublons et trier
-        Object.keys(fieldData).forEach(key => {
-            fieldData[key] = [...new Set(fieldData[key])].sort((a, b) => 
-                a.toLowerCase().localeCompare(b.toLowerCase())
-            );
+async function updateSelect2FieldsFromDB() {
+    // Valeurs distinctes de la base de données, calculées par le serveur (/facets)
+    const fieldData = {};
+    try {
+        const data = await fetchJSONWithETag(`/facets?fields=${SELECT2_FACET_FIELDS.join(',')}`);
+        if (!data.success) throw new Error(data.message || 'Erreur lors du chargement des suggestions');
+        SELECT2_FACET_FIELDS.forEach(fieldId => {
+            fieldData[fieldId] = (data.facets[fieldId] || [])
+                .map(facet => facet.value)
+                .sort((a, b) => a.toLowerCase().localeCompare(b.toLowerCase()));
         });
+    } catch (error) {
+        console.error('Erreur lors du chargement des suggestions:', error);
+        return;
     }
     
     // Mettre à jour chaque champ Select2
@@ -4887,6 +5186,10 @@ async function uploadVGPDocument(pvId, file) {
     }
 }
 
+// Validité d'une VGP et délai d'alerte (jours) : valeurs du serveur, reçues avec /vgp/summary
+let vgpValidityDays = 180;
+let vgpWarningDays = 21;
+
 /**
  * Calcule le statut VGP basé sur la date
  * @param {string} vgpDate - Date au format YYYY-MM-DD
@@ -4901,13 +5204,13 @@ function calculateVGPStatus(vgpDate) {
     const today = new Date();
     today.setHours(0, 0, 0, 0);
     
-    // VGP valide 6 mois (180 jours)
+    // VGP valide 6 mois (180 jours par défaut)
     const expiryDate = new Date(vgp);
-    expiryDate.setDate(expiryDate.getDate() + 180);
+    expiryDate.setDate(expiryDate.getDate() + vgpValidityDays);
     
-    // Alerte 3 semaines avant (21 jours)
+    // Alerte 3 semaines avant (21 jours par défaut)
     const warningDate = new Date(expiryDate);
-    warningDate.setDate(warningDate.getDate() - 21);
+    warningDate.setDate(warningDate.getDate() - vgpWarningDays);
     
     const daysRemaining = Math.ceil((expiryDate - today) / (1000 * 60 * 60 * 24));
     
@@ -4992,30 +5295,52 @@ function initializeVGP() {
     }
 }
 
+/**
+ * Charge le nombre de PV par statut VGP (calculé par le serveur sur vgp_date)
+ * et les fenêtres de validité et d'alerte configurées
+ * @returns {Promise<Object>} Compteurs {expired, warning, valid, none}
+ */
+async function fetchVGPSummary() {
+    const data = await fetchJSONWithETag('/vgp/summary');
+    if (!data.success) throw new Error(data.message || 'Erreur lors du calcul des statuts VGP');
+    vgpValidityDays = data.validity_days;
+    vgpWarningDays = data.warning_days;
+    return data.counts;
+}
+
+/**
+ * Charge tous les PV d'un statut VGP (toutes les pages de /vgp/items)
+ * @param {string} status - expired, warning, valid ou none
+ * @returns {Promise<Array>} Éléments {pv, vgpStatus} pour populateVGPTable
+ */
+async function fetchVGPItems(status) {
+    let items = [];
+    let offset = 0;
+    do {
+        const data = await fetchJSONWithETag(`/vgp/items?status=${status}&limit=${PV_LIST_MAX_PAGE_SIZE}&offset=${offset}`);
+        if (!data.success) throw new Error(data.message || 'Erreur lors du chargement des PV VGP');
+        items = items.concat(data.items.map(pv => ({
+            pv,
+            vgpStatus: {
+                status,
+                daysRemaining: pv.vgp_days_remaining,
+                expiryDate: pv.vgp_expiry_date ? new Date(pv.vgp_expiry_date) : null
+            }
+        })));
+        offset = data.next_offset;
+    } while (offset !== null);
+    return items;
+}
+
 /**
  * Vérifie et affiche les alertes VGP au chargement
  */
 async function checkVGPAlerts() {
     try {
-        const response = await fetch('/list-pv');
-        const data = await response.json();
-        
-        if (!data.success) return;
-        
-        const pvList = data.pv_list;
-        
-        // Compter les VGP échues et à renouveler
-        let expiredCount = 0;
-        let warningCount = 0;
-        
-        pvList.forEach(pv => {
-            const vgpStatus = calculateVGPStatus(pv.vgp_date);
-            if (vgpStatus.status === 'expired') {
-                expiredCount++;
-            } else if (vgpStatus.status === 'warning') {
-                warningCount++;
-            }
-        });
+        // Compteurs calculés par le serveur : aucune liste de PV n'est téléchargée
+        const counts = await fetchVGPSummary();
+        const expiredCount = counts.expired;
+        const warningCount = counts.warning;
         
         // Afficher l'alerte si nécessaire
         const alertBanner = document.getElementById('vgpAlertBanner');
@@ -5064,28 +5389,10 @@ async function openVGPAdminModal() {
     const modal = new bootstrap.Modal(document.getElementById('vgpAdminModal'));
     
     try {
-        // Charger tous les PV
-        const response = await fetch('/list-pv');
-        const data = await response.json();
-        
-        if (!data.success) {
-            throw new Error(data.message || 'Erreur lors du chargement');
-        }
-        
-        const pvList = data.pv_list;
-        
-        // Catégoriser les PV par statut VGP
-        const categories = {
-            expired: [],
-            warning: [],
-            valid: [],
-            none: []
-        };
-        
-        pvList.forEach(pv => {
-            const vgpStatus = calculateVGPStatus(pv.vgp_date);
-            categories[vgpStatus.status].push({ pv, vgpStatus });
-        });
+        // PV classés par statut VGP côté serveur (une requête par catégorie)
+        const statuses = ['expired', 'warning', 'valid', 'none'];
+        const lists = await Promise.all(statuses.map(fetchVGPItems));
+        const categories = Object.fromEntries(statuses.map((status, index) => [status, lists[index]]));
         
         // Remplir les tableaux
         populateVGPTable('vgpExpiredList', categories.expired, 'expired');
@@ -5374,8 +5681,7 @@ function initializeVersionControls() {
  */
 async function loadPVVersions(pvId) {
     try {
-        const response = await fetch(`/pv-versions/${pvId}`);
-        const data = await response.json();
+        const data = await fetchJSONWithETag(`/pv-versions/${pvId}`);
         
         if (!data.success) {
             console.error('Erreur lors du chargement des versions');
@@ -5474,8 +5780,7 @@ async function loadPVVersion(pvId, versionNumber) {
         localStorage.setItem('currentPVVersion', versionNumber);
         
         // Vérifier d'abord si c'est une version antérieure
-        const response = await fetch(`/load-pv-version/${pvId}/${versionNumber}`);
-        const data = await response.json();
+        const data = await fetchJSONWithETag(`/load-pv-version/${pvId}/${versionNumber}`);
         
         if (!data.success) {
             alert(data.message || 'Erreur lors du chargement de la version');
@@ -5659,6 +5964,13 @@ function populateFormWithPVData(pvData) {
         vgpDateInput.value = pvData.vgp_date;
     }
     
+    // Version courante : base des sauvegardes incrémentales ; ancienne version : prochaine sauvegarde complète
+    if (pvData.is_current_version && pvData.revision) {
+        markFormSaved(pvData.revision);
+    } else {
+        clearSavedFormState();
+    }
+    
     // Afficher le lien du document VGP si présent
     const vgpDocLink = document.getElementById('vgp_document_link');
     const vgpDocCurrent = document.getElementById('vgp_document_current');
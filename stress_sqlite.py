@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Test de concurrence SQLite : écritures et lectures parallèles sur plusieurs workers
+
+Simule un déploiement gunicorn : N processus (workers) avec chacun plusieurs threads
+qui enchaînent des sauvegardes (POST /save sur des PV existants, lecture puis écriture)
+et des lectures (/list-pv, /load-pv). Travaille sur une copie de instance/pvs.db.
+
+Chaque mode est exécuté dans des processus neufs :
+- production : profil de setup_db.init_db (WAL, busy_timeout, BEGIN IMMEDIATE pour les écritures)
+- legacy     : SQLITE_PRODUCTION_MODE=0 (journal rollback, réglages par défaut)
+
+Avec --long-operations, un scénario supplémentaire fait tourner des sauvegardes pendant les
+opérations longues : /submit, /download-pdf, l'export ZIP (traitement des images ralenti de
+--slow-seconds, entre les lectures et l'enregistrement) et l'envoi des emails vers un relais
+SMTP local lent. busy_timeout y est réduit à 1 s : une opération qui garderait le verrou
+d'écriture pendant son traitement fait échouer les sauvegardes en « database is locked ».
+
+Usage :
+    python stress_sqlite.py                          # mode production
+    python stress_sqlite.py --compare                # production puis legacy
+    python stress_sqlite.py --workers 4 --threads 4 --duration 15 --write-ratio 0.3
+    python stress_sqlite.py --long-operations --slow-seconds 3
+
+Code de sortie 1 si le mode production (ou le scénario des opérations longues) rencontre
+une erreur de verrouillage.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from queue import Empty
+from statistics import median
+
+SOURCE_DB = Path(__file__).parent / 'instance' / 'pvs.db'
+HOT_PV_COUNT = 20  # Les écritures se concentrent sur quelques PV (cas le plus défavorable)
+LONG_BUSY_TIMEOUT_MS = 1000  # Scénario des opérations longues : attente du verrou plus courte que le traitement
+
+
+def percentile(values, ratio):
+    """Percentile simple (valeurs triées)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def _client_loop(client, pv_forms, deadline, write_ratio, seed, results):
+    """Boucle d'un thread : mélange de sauvegardes et de lectures jusqu'à l'échéance."""
+    rng = random.Random(seed)
+    pv_ids = list(pv_forms)
+
+    while time.perf_counter() < deadline:
+        pv_id = rng.choice(pv_ids)
+        started = time.perf_counter()
+
+        if rng.random() < write_ratio:
+            kind = 'write'
+            payload = dict(pv_forms[pv_id], pv_id=pv_id)
+            payload['observations_reception'] = f"Stress {seed} {started:.6f}"
+            response = client.post('/save', json=payload)
+        elif rng.random() < 0.5:
+            kind = 'read'
+            response = client.get('/list-pv?limit=50')
+        else:
+            kind = 'read'
+            response = client.get(f'/load-pv/{pv_id}')
+
+        elapsed = time.perf_counter() - started
+        results[kind].append(elapsed)
+
+        if response.status_code >= 500:
+            message = (response.get_json(silent=True) or {}).get('message', '')
+            key = 'locked' if 'locked' in message or 'busy' in message else 'errors'
+            results[key].append(message[:120])
+
+
+def _initialize():
+    """Démarrage unique de l'application (schéma, triggers, mode de journal) avant les workers."""
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server  # noqa: F401
+
+
+def _worker(worker_index, threads, duration, write_ratio, queue):
+    """Processus worker : importe l'application comme gunicorn puis lance ses threads."""
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+        from setup_db import db, PV
+
+    with server.app.app_context():
+        rows = (PV.query.order_by(PV.date_mise_a_jour.desc()).limit(HOT_PV_COUNT).all())
+        pv_forms = {pv.id: dict(pv.get_data().get('form_data', {}), chantier=pv.chantier) for pv in rows}
+        db.session.remove()
+
+    results = {'write': [], 'read': [], 'locked': [], 'errors': []}
+    deadline = time.perf_counter() + duration
+    workers = [
+        threading.Thread(
+            target=_client_loop,
+            args=(server.app.test_client(), pv_forms, deadline, write_ratio, worker_index * 100 + i, results)
+        )
+        for i in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    queue.put(results)
+
+
+def _copy_database(workdir):
+    """Copie cohérente de la base (intègre un éventuel fichier -wal de la base source)."""
+    db_path = workdir / 'pvs.db'
+    source = sqlite3.connect(SOURCE_DB)
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    source.close()
+    target.execute("PRAGMA journal_mode=DELETE")
+    target.close()
+    return db_path
+
+
+def _long_operations_worker(workdir, duration, slow_seconds, queue):
+    """
+    Processus du scénario des opérations longues : sauvegardes en continu pendant
+    /submit, /download-pdf, l'export ZIP et l'envoi des emails.
+    """
+    import contextlib
+    import io
+    import json
+
+    results = {'write': [], 'submit': [], 'download': [], 'export': [], 'locked': [], 'errors': []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+        from mailer import MailSender
+        from pdf_render import get_render_pool
+        from setup_db import db, PV
+        from smtp_local import LocalSMTPServer
+        from sqlalchemy import event
+
+        # Toute erreur de verrouillage, y compris celles que la route absorbe (/download-pdf)
+        # ou qui surviennent dans le thread d'envoi des emails
+        def on_error(context):
+            message = str(context.original_exception)
+            if 'locked' in message or 'busy' in message:
+                results['locked'].append(message[:120])
+
+        with server.app.app_context():
+            event.listen(db.engine, 'handle_error', on_error)
+            rows = PV.query.order_by(PV.date_mise_a_jour.desc()).limit(HOT_PV_COUNT).all()
+            pv_forms = {pv.id: dict(pv.get_data().get('form_data', {}), chantier=pv.chantier) for pv in rows}
+            db.session.remove()
+        pv_ids = list(pv_forms)
+
+        # Traitement long entre les lectures et l'enregistrement (images, puis rendu)
+        optimize = server.optimize_form_images
+
+        def slow_optimize(form_data, photo_fields):
+            time.sleep(slow_seconds)
+            return optimize(form_data, photo_fields)
+
+        server.optimize_form_images = slow_optimize
+
+        # Relais SMTP local lent
+        smtp = LocalSMTPServer(('127.0.0.1', 0), workdir / 'mails', delay=slow_seconds)
+        threading.Thread(target=smtp.serve_forever, daemon=True).start()
+        smtp_config = {'smtp_server': '127.0.0.1', 'smtp_port': smtp.server_address[1], 'smtp_starttls': False,
+                       'smtp_auth': False, 'smtp_from_address': 'pv@localhost'}
+        server.load_smtp_config = lambda: smtp_config
+        # start_mail_sender ne démarre pas l'envoi dans un processus enfant : démarrage explicite
+        sender = MailSender(server.app, server.load_smtp_config)
+        sender.start()
+
+        deadline = time.perf_counter() + duration
+
+        def record(kind, started, response, ok):
+            results[kind].append(time.perf_counter() - started)
+            if not ok:
+                body = response.get_data(as_text=True)
+                message = (response.get_json(silent=True) or {}).get('message', body[:120])
+                if 'locked' not in message and 'busy' not in message:
+                    results['errors'].append(f"{kind} : HTTP {response.status_code} {message[:100]}")
+
+        def writer(seed):
+            rng = random.Random(seed)
+            client = server.app.test_client()
+            while time.perf_counter() < deadline:
+                pv_id = rng.choice(pv_ids)
+                payload = dict(pv_forms[pv_id], pv_id=pv_id, observations_reception=f"Stress {seed} {time.perf_counter()}")
+                started = time.perf_counter()
+                response = client.post('/save', json=payload)
+                record('write', started, response, response.status_code < 400)
+
+        def long_operation(kind, seed):
+            rng = random.Random(seed)
+            client = server.app.test_client()
+            while time.perf_counter() < deadline:
+                pv_id = rng.choice(pv_ids)
+                form = {'pv_id': pv_id, 'chantier': pv_forms[pv_id]['chantier'] or 'Stress',
+                        'email_conducteur': 'conducteur@example.com',
+                        'observations_retour': f"Stress {kind} {time.perf_counter()}"}
+                started = time.perf_counter()
+                if kind == 'submit':
+                    response = client.post('/submit', data=form, headers={'Accept': 'application/json'})
+                    ok = response.status_code == 200 and response.is_json
+                elif kind == 'download':
+                    response = client.post('/download-pdf', data=form, headers={'Accept': 'application/pdf'})
+                    ok = response.status_code == 200
+                else:
+                    response = client.post('/export-pdf-zip', json={'ids': rng.sample(pv_ids, 3)})
+                    response.get_data()
+                    ok = response.status_code == 200
+                record(kind, started, response, ok)
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(2)]
+        threads += [threading.Thread(target=long_operation, args=(kind, i))
+                    for i, kind in enumerate(('submit', 'download', 'export'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Derniers emails : le relais lent répond après slow_seconds
+        time.sleep(slow_seconds + 1)
+        with server.app.app_context():
+            results['emails_sent'] = sender.stats()['sent']
+        sender.stop()
+        smtp.shutdown()
+        get_render_pool().shutdown()
+
+    queue.put(json.loads(json.dumps(results)))
+
+
+def run_long_operations(args):
+    """
+    Scénario des opérations longues (processus neuf, copie fraîche de la base).
+
+    Returns:
+        dict: Résumé (opérations par type, emails envoyés, erreurs)
+    """
+    workdir = Path(tempfile.mkdtemp(prefix='stress_sqlite_long_'))
+    db_path = _copy_database(workdir)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQLITE_PRODUCTION_MODE'] = '1'
+    os.environ['SQLITE_BUSY_TIMEOUT_MS'] = str(LONG_BUSY_TIMEOUT_MS)
+    os.environ['MAIL_POLL_INTERVAL'] = '0.2'
+    os.environ['DRAFT_BUFFER_ENABLED'] = '0'
+    os.environ['PDF_CACHE_MAX_BYTES'] = '0'  # Chaque PDF est rendu (pas de réponse depuis le cache)
+
+    print(f"\n🐢 Opérations longues : sauvegardes pendant /submit, /download-pdf, l'export ZIP et l'envoi "
+          f"des emails ({args.slow_seconds:g}s de traitement, busy_timeout {LONG_BUSY_TIMEOUT_MS} ms), "
+          f"{args.duration}s...")
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_long_operations_worker,
+                              args=(workdir, args.duration, args.slow_seconds, queue))
+    process.start()
+    try:
+        results = queue.get(timeout=args.duration + 10 * args.slow_seconds + 60)
+    except Empty:
+        results = {'errors': ["processus arrêté sur une erreur (voir la sortie ci-dessus)"]}
+    process.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        'mode': 'long-operations',
+        'counts': {kind: len(results.get(kind, [])) for kind in ('write', 'submit', 'download', 'export')},
+        'emails_sent': results.get('emails_sent', 0),
+        'locked': len(results.get('locked', [])),
+        'errors': list(results.get('errors', [])),
+        'write_p95_ms': percentile(results.get('write', []), 0.95) * 1000,
+    }
+    if not all(summary['counts'].values()) or not summary['emails_sent']:
+        summary['errors'].append("scénario incomplet : augmenter --duration")
+
+    status = '✅' if not summary['locked'] and not summary['errors'] else '❌'
+    counts = summary['counts']
+    print(f"{status} {counts['write']} sauvegarde(s), {counts['submit']} envoi(s), {counts['download']} "
+          f"téléchargement(s), {counts['export']} export(s), {summary['emails_sent']} email(s) : "
+          f"{summary['locked']} erreur(s) de verrouillage, {len(summary['errors'])} autre(s) erreur(s)")
+    print(f"   Sauvegarde p95 : {summary['write_p95_ms']:.1f} ms")
+    for sample in (results.get('locked', []) + summary['errors'])[:3]:
+        print(f"   ⚠️  {sample}")
+    return summary
+
+
+def run_mode(mode, args):
+    """
+    Exécute le test dans un mode donné sur une copie fraîche de la base.
+
+    Returns:
+        dict: Résumé (opérations, erreurs, latences)
+    """
+    workdir = Path(tempfile.mkdtemp(prefix='stress_sqlite_'))
+    db_path = _copy_database(workdir)
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQLITE_PRODUCTION_MODE'] = '1' if mode == 'production' else '0'
+    os.environ['MAIL_SENDER_ENABLED'] = '0'
+    os.environ['DRAFT_BUFFER_ENABLED'] = '0'  # Chaque /save mesuré écrit en base (pas de tampon en mémoire)
+
+    context = multiprocessing.get_context('spawn')
+
+    # Le démarrage simultané des workers est couvert par init_db ; on le sort ici de la mesure
+    initializer = context.Process(target=_initialize)
+    initializer.start()
+    initializer.join()
+
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(i, args.threads, args.duration, args.write_ratio, queue))
+        for i in range(args.workers)
+    ]
+
+    print(f"\n🔄 Mode {mode} : {args.workers} worker(s) × {args.threads} thread(s), {args.duration}s...")
+    for process in processes:
+        process.start()
+    merged = {'write': [], 'read': [], 'locked': [], 'errors': []}
+    received = 0
+    while received < len(processes):
+        try:
+            results = queue.get(timeout=5)
+        except Empty:
+            if all(not process.is_alive() for process in processes):
+                break
+            continue
+        received += 1
+        for key, values in results.items():
+            merged[key].extend(values)
+    for process in processes:
+        process.join()
+
+    crashed = len(processes) - received
+    if crashed:
+        merged['errors'].append(f"{crashed} worker(s) arrêté(s) sur une erreur (voir la sortie ci-dessus)")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        'mode': mode,
+        'writes': len(merged['write']),
+        'reads': len(merged['read']),
+        'locked': len(merged['locked']),
+        'errors': len(merged['errors']),
+        'write_p50_ms': median(merged['write']) * 1000 if merged['write'] else 0.0,
+        'write_p95_ms': percentile(merged['write'], 0.95) * 1000,
+        'read_p50_ms': median(merged['read']) * 1000 if merged['read'] else 0.0,
+        'read_p95_ms': percentile(merged['read'], 0.95) * 1000,
+        'samples': (merged['locked'] + merged['errors'])[:3],
+    }
+
+    status = '✅' if not summary['locked'] and not summary['errors'] else '❌'
+    print(f"{status} {summary['writes']} écriture(s), {summary['reads']} lecture(s) : "
+          f"{summary['locked']} erreur(s) de verrouillage, {summary['errors']} autre(s) erreur(s)")
+    print(f"   Écriture p50/p95 : {summary['write_p50_ms']:.1f} / {summary['write_p95_ms']:.1f} ms")
+    print(f"   Lecture  p50/p95 : {summary['read_p50_ms']:.1f} / {summary['read_p95_ms']:.1f} ms")
+    for sample in summary['samples']:
+        print(f"   ⚠️  {sample}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Test de concurrence SQLite (écritures et lectures parallèles)')
+    parser.add_argument('--workers', type=int, default=4, help='Nombre de processus (workers gunicorn)')
+    parser.add_argument('--threads', type=int, default=4, help='Threads par worker')
+    parser.add_argument('--duration', type=float, default=10.0, help='Durée de chaque mode (secondes)')
+    parser.add_argument('--write-ratio', type=float, default=0.3, help='Proportion de sauvegardes')
+    parser.add_argument('--compare', action='store_true', help='Exécuter aussi le mode legacy (sans WAL)')
+    parser.add_argument('--long-operations', action='store_true',
+                        help='Exécuter aussi le scénario des opérations longues (PDF, export, emails)')
+    parser.add_argument('--slow-seconds', type=float, default=2.0,
+                        help='Durée du traitement et du relais SMTP dans le scénario des opérations longues')
+    args = parser.parse_args()
+
+    if not SOURCE_DB.exists():
+        print(f"❌ Erreur : La base de données {SOURCE_DB} n'existe pas.")
+        sys.exit(2)
+
+    modes = ['production', 'legacy'] if args.compare else ['production']
+    summaries = [run_mode(mode, args) for mode in modes]
+
+    production = summaries[0]
+    failed = production['locked'] or production['errors']
+    if args.long_operations:
+        long_operations = run_long_operations(args)
+        failed = failed or long_operations['locked'] or long_operations['errors']
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
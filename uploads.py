@@ -0,0 +1,212 @@
+"""
+Envoi des photos par morceaux, reprenable après une coupure réseau (4G de chantier)
+
+- POST /uploads : ouverture d'une session (taille, SHA-256, type MIME). Une photo déjà
+  présente dans la table blobs est acquittée immédiatement ; une session en cours pour la
+  même photo est reprise (rechargement de la page)
+- PUT /uploads/<id> : un morceau, à la position annoncée (en-tête Upload-Offset). Le serveur
+  répond avec la position confirmée ; une position différente de la sienne est refusée (409)
+  et le client reprend à la position renvoyée. Empreinte du morceau facultative (X-Chunk-SHA256)
+- GET /uploads/<id> : position confirmée, pour reprendre après une coupure
+- Le dernier morceau déclenche la vérification du SHA-256 de la photo complète ; la photo
+  rejoint alors la table blobs et le formulaire y fait référence (blob:<sha256>) au lieu
+  d'embarquer les octets
+
+Les morceaux sont écrits dans un fichier partiel (UPLOAD_TMP_DIR) ; la position confirmée
+est en base, dans la même transaction d'écriture que le morceau (les envois concurrents
+d'une même session sont sérialisés par le verrou d'écriture SQLite).
+"""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+import hashlib
+import os
+import re
+import uuid
+
+from PIL import Image
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from setup_db import db, Blob, UploadSession, BLOB_MIME_TYPES
+
+# Configuration (surchargeable par variables d'environnement)
+UPLOAD_TMP_DIR = Path(os.environ.get('UPLOAD_TMP_DIR', Path(__file__).parent / 'instance' / 'uploads'))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_MB', '20')) * 1024 * 1024
+UPLOAD_SESSION_TTL_HOURS = float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24'))
+
+# Un morceau peut dépasser la taille conseillée (client configuré autrement), dans cette limite
+UPLOAD_CHUNK_MAX = 4 * UPLOAD_CHUNK_SIZE
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    """Erreur d'envoi renvoyée au client (code HTTP et position confirmée)."""
+
+    def __init__(self, message, status_code=400, offset=None):
+        self.message = message
+        self.status_code = status_code
+        self.offset = offset
+        super().__init__(message)
+
+
+def part_path(upload_id):
+    """Fichier partiel d'une session."""
+    return UPLOAD_TMP_DIR / f'{upload_id}.part'
+
+
+def purge_expired_uploads():
+    """
+    Supprime les sessions inactives depuis UPLOAD_SESSION_TTL_HOURS et leurs fichiers partiels.
+
+    Returns:
+        int: Nombre de sessions supprimées
+    """
+    limit = datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    expired = UploadSession.query.filter(UploadSession.date_mise_a_jour < limit).all()
+    for session in expired:
+        part_path(session.id).unlink(missing_ok=True)
+        db.session.delete(session)
+    return len(expired)
+
+
+def create_upload(sha256, size, mime):
+    """
+    Ouvre (ou reprend) l'envoi d'une photo.
+
+    Args:
+        sha256: Empreinte SHA-256 hexadécimale de la photo complète
+        size: Taille en octets
+        mime: Type MIME annoncé (BLOB_MIME_TYPES)
+
+    Returns:
+        UploadSession: Session (status complete si la photo est déjà en base)
+
+    Raises:
+        UploadError: Paramètres invalides
+    """
+    sha256 = str(sha256 or '').lower()
+    if not SHA256_PATTERN.match(sha256):
+        raise UploadError('Empreinte SHA-256 invalide')
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        raise UploadError('Taille invalide')
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadError(f'Photo trop volumineuse (maximum {UPLOAD_MAX_BYTES // (1024 * 1024)} Mo)', 413)
+    if mime not in BLOB_MIME_TYPES:
+        raise UploadError('Seules les images JPEG, PNG, WebP et GIF sont acceptées')
+
+    purge_expired_uploads()
+
+    # Envoi interrompu de la même photo (page rechargée) : reprise à la position confirmée
+    session = UploadSession.query.filter_by(sha256=sha256, size=size, status='pending') \
+        .order_by(UploadSession.received.desc()).first()
+    if session is not None:
+        db.session.commit()
+        return session
+
+    session = UploadSession(id=str(uuid.uuid4()), sha256=sha256, mime=mime, size=size)
+    if db.session.query(Blob.hash).filter_by(hash=sha256).first():
+        # Photo déjà reçue (autre PV, autre envoi) : rien à transférer
+        session.received = size
+        session.status = 'complete'
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def get_upload(upload_id):
+    """
+    Returns:
+        UploadSession: Session demandée
+
+    Raises:
+        UploadError: Session introuvable (expirée)
+    """
+    session = db.session.get(UploadSession, upload_id)
+    if session is None:
+        raise UploadError('Envoi introuvable ou expiré', 404)
+    return session
+
+
+def write_chunk(upload_id, offset, data, chunk_sha256=None):
+    """
+    Écrit un morceau à la position confirmée de la session.
+
+    Args:
+        upload_id: Identifiant de la session
+        offset: Position du morceau annoncée par le client
+        data: Octets du morceau
+        chunk_sha256: Empreinte du morceau (facultative)
+
+    Returns:
+        UploadSession: Session à jour (complete après le dernier morceau vérifié)
+
+    Raises:
+        UploadError: Session introuvable (404), position inattendue (409),
+            morceau ou photo invalide (400, avec la position à partir de laquelle reprendre)
+    """
+    session = get_upload(upload_id)
+
+    if session.status == 'complete':
+        # Acquittement du dernier morceau perdu : le client renvoie un morceau déjà écrit
+        return session
+    if offset != session.received:
+        raise UploadError('Position inattendue', 409, session.received)
+    if not data:
+        raise UploadError('Morceau vide', 400, session.received)
+    if len(data) > UPLOAD_CHUNK_MAX or offset + len(data) > session.size:
+        raise UploadError('Morceau trop grand', 400, session.received)
+    if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise UploadError('Morceau altéré pendant le transfert', 400, session.received)
+
+    # Écriture à la position confirmée : une fin de fichier non confirmée (coupure) est écrasée
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    path = part_path(session.id)
+    with open(path, 'r+b' if path.exists() else 'w+b') as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+    session.received = offset + len(data)
+
+    if session.received == session.size:
+        _complete_upload(session, path)
+
+    db.session.commit()
+    if session.status == 'complete':
+        path.unlink(missing_ok=True)
+    return session
+
+
+def _complete_upload(session, path):
+    """Vérifie la photo complète et l'ajoute à la table blobs (dans la transaction du morceau)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    error = None
+    if digest.hexdigest() != session.sha256:
+        error = 'Somme de contrôle invalide : envoi à reprendre depuis le début'
+    else:
+        try:
+            with Image.open(path) as image:
+                mime = Image.MIME.get(image.format)
+            if mime not in BLOB_MIME_TYPES:
+                error = f"Format d'image non accepté ({image.format}) : JPEG, PNG, WebP ou GIF"
+        except (OSError, ValueError):
+            error = "Le fichier reçu n'est pas une image lisible"
+
+    if error:
+        # Contenu inutilisable : la session repart de zéro
+        session.received = 0
+        path.unlink(missing_ok=True)
+        db.session.commit()
+        raise UploadError(error, 400, 0)
+
+    db.session.execute(sqlite_insert(Blob).values(
+        hash=session.sha256, mime=mime, size=session.size,
+        data=path.read_bytes(), date_creation=datetime.utcnow()
+    ).on_conflict_do_nothing())
+    session.mime = mime
+    session.status = 'complete'